@@ -2,12 +2,20 @@ import asyncio
 import json
 import logging
 import os
+import weakref
 import aiohttp
-from typing import Dict, List, Any
+from typing import Any, Dict, List, Optional
 from langchain_core.tools import BaseTool
+from utils.cancellation import CancellationToken, OperationCancelled, cap_timeout
 
 logger = logging.getLogger("MultiServerMCPClient")
 
+# 联网搜索的超时上限（秒），带截止时间的请求再限制在剩余时间内
+WEB_SEARCH_TIMEOUT_SECONDS = float(os.getenv("WEB_SEARCH_TIMEOUT_SECONDS", "20"))
+# 外部HTTP工具共享连接池的连接数上限与空闲连接保活时间
+HTTP_TOOL_MAX_CONNECTIONS = int(os.getenv("HTTP_TOOL_MAX_CONNECTIONS", "50"))
+HTTP_TOOL_KEEPALIVE_SECONDS = float(os.getenv("HTTP_TOOL_KEEPALIVE_SECONDS", "30"))
+
 
 class MCPTool(BaseTool):
     """简化的工具占位，符合 ToolRegistry 下游工具接口。"""
@@ -27,11 +35,16 @@ class MultiServerMCPClient:
     - 从 tools/config.json 读取工具列表作为“发现的工具”。
     - invoke() 直接调用本地的 kb_tools/db_tools 函数（绕过 FastMCP 进程与协议）。
     这样即可与现有 ToolRegistry 兼容，无需启动子进程。
+    进程内共享一个实例（utils.client_pool.get_mcp_client）：工具配置在 get_tools() 时读取一次并缓存，
+    外部HTTP工具按事件循环复用 aiohttp 会话与连接。
     """
 
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.tools: Dict[str, MCPTool] = {}
+        self._tool_configs: Optional[Dict[str, Dict[str, Any]]] = None
+        self._http_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = \
+            weakref.WeakKeyDictionary()
 
         # 延迟导入，避免无用依赖
         from ToolOrchestrator.core.config import settings  # type: ignore
@@ -51,6 +64,7 @@ class MultiServerMCPClient:
             logger.error(f"读取工具配置失败: {e}")
             cfg_list = []
 
+        self._tool_configs = {item.get("name"): item for item in cfg_list if item.get("name")}
         discovered: Dict[str, MCPTool] = {}
         for item in cfg_list:
             if not item.get("enabled", False):
@@ -64,29 +78,38 @@ class MultiServerMCPClient:
         logger.info(f"Discovered local tools: {list(self.tools.keys())}")
         return list(discovered.values())
 
-    async def invoke(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def invoke(self, tool_name: str, args: Dict[str, Any],
+                     cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """
+        调用工具。cancel_token 被取消时，排队中的检索不再执行、数据库查询立即中断，
+        并抛出 OperationCancelled（不会被包装为错误结果）。
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         if tool_name not in self.tools:
             return {"status": "error", "reason": f"Tool not found: {tool_name}"}
 
         # 检查是否是外部HTTP工具
         tool_config = self._get_tool_config(tool_name)
         if tool_config and tool_config.get("source") == "external_http":
-            return await self._invoke_external_http_tool(tool_name, args, tool_config)
+            return await self._invoke_external_http_tool(tool_name, args, tool_config, cancel_token)
 
         # 统一适配参数并调用本地实现
+        # 知识库/联网搜索工具为同步阻塞函数，放到线程中执行，避免阻塞事件循环
+        _sync_call = asyncio.to_thread
         try:
             if tool_name == "create_collection":
-                return {"status": "ok", "result": self._kb.create(args.get("collection_name"))}
+                return {"status": "ok", "result": await _sync_call(self._kb.create, args.get("collection_name"))}
             if tool_name == "delete_collection":
-                return {"status": "ok", "result": self._kb.delete(args.get("collection_name"))}
+                return {"status": "ok", "result": await _sync_call(self._kb.delete, args.get("collection_name"))}
             if tool_name == "create_file":
-                return {"status": "ok", "result": self._kb.add_file(args.get("file_path"), args.get("collection_name"))}
+                return {"status": "ok", "result": await _sync_call(self._kb.add_file, args.get("file_path"), args.get("collection_name"))}
             if tool_name == "delete_file":
-                return {"status": "ok", "result": self._kb.deletefile(args.get("file_path"), args.get("collection_name"))}
+                return {"status": "ok", "result": await _sync_call(self._kb.deletefile, args.get("file_path"), args.get("collection_name"))}
             if tool_name == "ask":
-                return {"status": "ok", "result": self._kb.ask(args.get("question"), kb_name=args.get("collection_name"))}
+                return {"status": "ok", "result": await _sync_call(self._kb.ask, args.get("question"), kb_name=args.get("collection_name"))}
             if tool_name == "retrieve":
-                return {"status": "ok", "result": self._kb.retrieve(args.get("collection_name"), args.get("question"), args.get("k", 5))}
+                return {"status": "ok", "result": await _sync_call(self._kb.retrieve, args.get("collection_name"), args.get("question"), args.get("k", 5), cancel_token)}
 
             # DB 工具为异步函数，使用事件循环运行
             async def _db_call(coro):
@@ -97,25 +120,31 @@ class MultiServerMCPClient:
             if tool_name == "get_tables_schema":
                 return {"status": "ok", "result": await _db_call(self._db.get_tables_schema(args.get("table_names", [])))}
             if tool_name == "read_sql_query":
-                return {"status": "ok", "result": await _db_call(self._db.read_sql_query(args.get("table_queries", [])))}
+                return {"status": "ok", "result": await _db_call(self._db.read_sql_query(args.get("table_queries", []), cancel_token=cancel_token))}
             if tool_name == "read_query_for_sensor_readings":
-                return {"status": "ok", "result": await _db_call(self._db.read_query_for_sensor_readings(args.get("table_queries", [])))}
+                return {"status": "ok", "result": await _db_call(self._db.read_query_for_sensor_readings(args.get("table_queries", []), cancel_token=cancel_token))}
 
             # 联网搜索工具
             if tool_name == "web_search":
-                return {"status": "ok", "result": self._web_search.web_search(
+                return {"status": "ok", "result": await _sync_call(
+                    self._web_search.web_search,
                     args.get("query"), 
                     args.get("max_results", 3),
-                    args.get("search_depth", "basic")
+                    args.get("search_depth", "basic"),
+                    cap_timeout(cancel_token, WEB_SEARCH_TIMEOUT_SECONDS)
                 )}
 
             return {"status": "error", "reason": f"Unknown tool: {tool_name}"}
+        except OperationCancelled:
+            raise
         except Exception as e:
             logger.error(f"Local tool invoke error: {e}")
             return {"status": "error", "reason": str(e)}
 
     def _get_tool_config(self, tool_name: str) -> Dict[str, Any]:
-        """获取工具的完整配置信息"""
+        """获取工具的完整配置信息（优先使用 get_tools() 时缓存的配置）"""
+        if self._tool_configs is not None:
+            return self._tool_configs.get(tool_name, {})
         try:
             with open(self._tools_config_path, "r", encoding="utf-8") as f:
                 cfg_list = json.load(f)
@@ -128,12 +157,13 @@ class MultiServerMCPClient:
             logger.error(f"读取工具配置失败: {e}")
             return {}
 
-    async def _invoke_external_http_tool(self, tool_name: str, args: Dict[str, Any], tool_config: Dict[str, Any]) -> Dict[str, Any]:
-        """调用外部HTTP工具"""
+    async def _invoke_external_http_tool(self, tool_name: str, args: Dict[str, Any], tool_config: Dict[str, Any],
+                                         cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """调用外部HTTP工具，超时取工具配置与请求剩余时间的较小值"""
         endpoint_url = tool_config.get("endpoint_url")
         method = tool_config.get("method", "POST").upper()
         headers = tool_config.get("headers", {})
-        timeout = tool_config.get("timeout", 30)
+        timeout = cap_timeout(cancel_token, tool_config.get("timeout", 30))
         
         if not endpoint_url:
             return {"status": "error", "reason": f"No endpoint_url configured for tool {tool_name}"}
@@ -145,25 +175,27 @@ class MultiServerMCPClient:
             "timestamp": asyncio.get_event_loop().time()
         }
         
-        # 设置默认的Content-Type
+        # 设置默认的Content-Type（复制一份，不修改缓存的工具配置）
+        headers = dict(headers)
         if "Content-Type" not in headers:
             headers["Content-Type"] = "application/json"
         
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-                if method == "POST":
-                    async with session.post(endpoint_url, json=request_data, headers=headers) as response:
-                        return await self._handle_http_response(response, tool_name)
-                elif method == "PUT":
-                    async with session.put(endpoint_url, json=request_data, headers=headers) as response:
-                        return await self._handle_http_response(response, tool_name)
-                elif method == "GET":
-                    # GET请求将参数放在查询字符串中
-                    params = {"tool_data": json.dumps(request_data)}
-                    async with session.get(endpoint_url, params=params, headers=headers) as response:
-                        return await self._handle_http_response(response, tool_name)
-                else:
-                    return {"status": "error", "reason": f"Unsupported HTTP method: {method}"}
+            session = self._http_session()
+            request_timeout = aiohttp.ClientTimeout(total=timeout)
+            if method == "POST":
+                async with session.post(endpoint_url, json=request_data, headers=headers, timeout=request_timeout) as response:
+                    return await self._handle_http_response(response, tool_name)
+            elif method == "PUT":
+                async with session.put(endpoint_url, json=request_data, headers=headers, timeout=request_timeout) as response:
+                    return await self._handle_http_response(response, tool_name)
+            elif method == "GET":
+                # GET请求将参数放在查询字符串中
+                params = {"tool_data": json.dumps(request_data)}
+                async with session.get(endpoint_url, params=params, headers=headers, timeout=request_timeout) as response:
+                    return await self._handle_http_response(response, tool_name)
+            else:
+                return {"status": "error", "reason": f"Unsupported HTTP method: {method}"}
                     
         except asyncio.TimeoutError:
             logger.error(f"HTTP request timeout for tool {tool_name}")
@@ -196,6 +228,20 @@ class MultiServerMCPClient:
                 "reason": f"Invalid JSON response: {error_text}"
             }
 
+    def _http_session(self) -> aiohttp.ClientSession:
+        """当前事件循环上共享的 aiohttp 会话（keep-alive 连接池）"""
+        loop = asyncio.get_running_loop()
+        session = self._http_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_TOOL_MAX_CONNECTIONS,
+                                             keepalive_timeout=HTTP_TOOL_KEEPALIVE_SECONDS)
+            session = aiohttp.ClientSession(connector=connector)
+            self._http_sessions[loop] = session
+        return session
+
     async def close(self):
-        # 无子进程可关闭，直接返回
+        # 无子进程可关闭；关闭当前事件循环上的HTTP会话
+        session = self._http_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
         self.tools.clear()
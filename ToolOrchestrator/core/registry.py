@@ -6,9 +6,10 @@
 import json
 import functools
 import logging
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, List, Optional
 
 from .security import security_validator, SecurityResult
+from .result_cache import ToolResultCache, tool_result_cache
 from ToolOrchestrator.client.client import MultiServerMCPClient
 
 logger = logging.getLogger("ToolRegistry")
@@ -17,9 +18,13 @@ logger = logging.getLogger("ToolRegistry")
 class ToolRegistry:
     """工具注册表 - 集中处理安全审查"""
 
-    def __init__(self, mcp_client_config: dict):
+    def __init__(self, mcp_client_config: dict, mcp_client: Optional[MultiServerMCPClient] = None,
+                 result_cache: Optional[ToolResultCache] = None):
         self._tools: Dict[str, dict] = {}
-        self.mcp_client = MultiServerMCPClient(mcp_client_config)
+        # 确定性工具（config.json 中 cacheable 为 true）的结果缓存，默认使用进程内共享的缓存
+        self.result_cache = result_cache or tool_result_cache
+        # 可传入进程内共享的客户端，避免重复加载工具模块与配置
+        self.mcp_client = mcp_client or MultiServerMCPClient(mcp_client_config)
         self.downstream_tools = []
 
     async def initialize_connections(self):
@@ -71,13 +76,28 @@ class ToolRegistry:
             # 清理内部参数
             clean_kwargs = self._clean_internal_params(kwargs)
 
+            # 结果缓存：安全检查之后再查找，命中缓存的调用同样受权限与参数检查约束
+            tool_config = self._tools.get(tool_name) or {}
+            cache_ttl = self.result_cache.ttl_for(tool_config)
+            if cache_ttl > 0:
+                hit, cached = self.result_cache.get(tool_name, clean_kwargs)
+                if hit:
+                    logger.info(f"工具 {tool_name} 命中结果缓存")
+                    return cached
+
             # 调用实际工具
             try:
-                return await self._create_mcp_handler(tool_name)(**clean_kwargs)
+                result = await self._create_mcp_handler(tool_name)(**clean_kwargs)
             except Exception as e:
                 logger.error(f"工具 {tool_name} 执行失败: {e}")
                 return {"status": "error", "reason": f"工具执行失败: {str(e)}"}
 
+            if cache_ttl > 0:
+                self.result_cache.put(tool_name, clean_kwargs, result, cache_ttl)
+            if tool_config.get("invalidates") and isinstance(result, dict) and result.get("status") == "ok":
+                self.invalidate_cache(tool_config["invalidates"])
+            return result
+
         return secure_handler
 
     def _create_mcp_handler(self, tool_name: str) -> Callable:
@@ -125,6 +145,12 @@ class ToolRegistry:
 
             logger.info(f"工具 {name} 注册成功")
 
+    def invalidate_cache(self, tool_names: Optional[List[str]] = None) -> int:
+        """使指定工具（默认全部）的结果缓存失效，例如数据库结构变更后；返回删除的条目数"""
+        removed = self.result_cache.invalidate(tool_names)
+        logger.info(f"工具结果缓存失效: {tool_names or '全部'}，删除 {removed} 条")
+        return removed
+
     def get_tool_handler(self, name: str) -> Callable:
         """获取工具处理器"""
         tool = self._tools.get(name)
@@ -0,0 +1,153 @@
+# core/result_cache.py
+"""
+确定性工具的结果缓存
+list_sql_tables / get_tables_schema 等工具在数小时内返回相同的数据，DataAgent 几乎每次对话开始都会调用，
+每次都要新建数据库连接。在 tools/config.json 中为工具声明：
+
+    "cacheable": true,          是否缓存该工具的结果
+    "cache_ttl_seconds": 3600,  缓存有效期（未设置时为 TOOL_CACHE_TTL_SECONDS）
+    "invalidates": ["..."]      该工具成功执行后使哪些工具的缓存失效（如修改数据/知识库的工具）
+
+- 键：工具名 + 规范化参数（键排序、紧凑 JSON），参数顺序、空白不同的调用命中同一条缓存
+- 只缓存成功的结果（status 为 ok 且结果中没有 error）
+- 容量：LRU，最多 TOOL_CACHE_MAX_ENTRIES 条；按工具统计命中/未命中/失效次数
+- 缓存查找在安全检查之后进行，命中缓存的调用同样经过权限与参数检查
+
+缓存为进程内缓存，多 worker 部署时每个进程各自缓存；数据库结构变更后可调用 invalidate() 立即失效。
+"""
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TOOL_CACHE_TTL_SECONDS = float(os.getenv("TOOL_CACHE_TTL_SECONDS", "3600"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "256"))
+
+
+def canonical_arguments(arguments: Dict[str, Any]) -> str:
+    """规范化参数：键排序的紧凑 JSON，字符串去掉首尾空白"""
+    def _normalize(value: Any) -> Any:
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, dict):
+            return {str(k): _normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [_normalize(v) for v in value]
+        return value
+    return json.dumps(_normalize(arguments or {}), ensure_ascii=False, sort_keys=True,
+                      separators=(",", ":"), default=str)
+
+
+def is_cacheable_result(result: Any) -> bool:
+    """只缓存成功的结果"""
+    if not isinstance(result, dict) or result.get("status", "ok") != "ok" or "error" in result:
+        return False
+    inner = result.get("result")
+    return not (isinstance(inner, dict) and inner.get("error"))
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+
+
+@dataclass
+class ToolCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    invalidations: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class ToolResultCache:
+    """线程安全的 LRU + TTL 工具结果缓存"""
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+                 default_ttl_seconds: float = TOOL_CACHE_TTL_SECONDS,
+                 enabled: bool = TOOL_CACHE_ENABLED,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.default_ttl_seconds = default_ttl_seconds
+        self.enabled = enabled
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._stats: Dict[str, ToolCacheStats] = {}
+        self._lock = threading.Lock()
+
+    def _tool_stats(self, tool_name: str) -> ToolCacheStats:
+        return self._stats.setdefault(tool_name, ToolCacheStats())
+
+    def ttl_for(self, tool_config: Optional[Dict[str, Any]]) -> float:
+        """工具的缓存有效期；未声明 cacheable 或缓存关闭时为 0"""
+        if not self.enabled or not tool_config or not tool_config.get("cacheable"):
+            return 0.0
+        return float(tool_config.get("cache_ttl_seconds", self.default_ttl_seconds))
+
+    def get(self, tool_name: str, arguments: Dict[str, Any]) -> Tuple[bool, Any]:
+        """返回 (是否命中, 结果副本)"""
+        key = (tool_name, canonical_arguments(arguments))
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            stats = self._tool_stats(tool_name)
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    del self._entries[key]
+                stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            stats.hits += 1
+            value = entry.value
+        # 返回副本，调用方修改结果不影响缓存
+        return True, copy.deepcopy(value)
+
+    def put(self, tool_name: str, arguments: Dict[str, Any], result: Any, ttl_seconds: float) -> bool:
+        if ttl_seconds <= 0 or not is_cacheable_result(result):
+            return False
+        key = (tool_name, canonical_arguments(arguments))
+        entry = _Entry(copy.deepcopy(result), self._clock() + ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._tool_stats(tool_name).stores += 1
+        return True
+
+    def invalidate(self, tool_names: Optional[Iterable[str]] = None) -> int:
+        """使指定工具（默认全部）的缓存失效，返回删除的条目数"""
+        names = None if tool_names is None else set(tool_names)
+        with self._lock:
+            keys = [key for key in self._entries if names is None or key[0] in names]
+            for key in keys:
+                del self._entries[key]
+                self._tool_stats(key[0]).invalidations += 1
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "tools": {name: stats.as_dict() for name, stats in self._stats.items()},
+            }
+
+
+tool_result_cache = ToolResultCache()
@@ -0,0 +1,517 @@
+"""
+数据库访问层
+db_tools 原先每次工具调用都 aiomysql.connect() 再 close()，对远端 RDS 每次都要付出 TCP 建连与认证的开销。
+这里提供进程内共享、带连接池的异步数据库后端：
+
+- mysql（默认）：aiomysql 连接池，按事件循环各建一个池（aiomysql 的池绑定创建时的事件循环），
+  最小/最大连接数 DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE，连接超过 DB_POOL_RECYCLE_SECONDS 后重建，
+  空闲超过 DB_POOL_PING_IDLE_SECONDS 的连接借出前先 ping（断开则重连）
+- sqlite：本地 SQLite 文件（DB_SQLITE_PATH，默认 dataprocess/csv_sql.py 生成的 sensor_data.db），只读打开，
+  查询在线程中执行；用于离线测试与基准
+
+每条查询有超时（DB_QUERY_TIMEOUT_SECONDS，不超过请求剩余时间）；超时或取消的连接直接丢弃，不放回池中。
+DB_BACKEND 选择后端，MySQL 连接信息来自 MYSQL_HOST / MYSQL_PORT / MYSQL_USER / MYSQL_PASSWORD / MYSQL_DATABASE，
+连接池使用情况见 db_pool_stats()（/metrics 的 db_pool）。
+
+    async with get_db_backend().connection(cancel_token) as conn:
+        rows = await conn.fetch("SELECT ...")
+        page = await conn.fetch_page("SELECT ...", limit=500)    # 服务端游标，最多读取 limit + 1 行
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+
+from utils.cancellation import CancellationToken, OperationCancelled, cap_timeout, run_cancellable
+from utils.lazy import lazy_import
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 首次查询时才导入数据库驱动
+aiomysql = lazy_import("aiomysql")
+
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_RECYCLE_SECONDS = float(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PING_IDLE_SECONDS = float(os.getenv("DB_POOL_PING_IDLE_SECONDS", "30"))
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "30"))
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH", "sensor_data.db")
+# 分页读取时跳过 offset 之前的行，每批读取的行数
+DB_FETCH_BATCH_ROWS = int(os.getenv("DB_FETCH_BATCH_ROWS", "1000"))
+
+# 连接信息从环境变量读取，不写入代码
+MYSQL_CONFIG = {
+    "host": os.getenv("MYSQL_HOST", "127.0.0.1"),
+    "port": int(os.getenv("MYSQL_PORT", "3306")),
+    "user": os.getenv("MYSQL_USER", "root"),
+    "password": os.getenv("MYSQL_PASSWORD", ""),
+    "db": os.getenv("MYSQL_DATABASE", "cognitive"),
+    # 数据库不可达时建连最多等待的秒数（aiomysql 默认 60 秒）
+    "connect_timeout": float(os.getenv("MYSQL_CONNECT_TIMEOUT_SECONDS", "5")),
+}
+
+
+class QueryTimeout(Exception):
+    """单条查询超过超时时间"""
+
+
+class PoolStats:
+    """连接池使用情况（线程安全计数）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.created = 0
+        self.discarded = 0
+        self.health_checks = 0
+        self.health_check_failures = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def on_acquire(self, waited: float) -> None:
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def on_release(self, discarded: bool) -> None:
+        with self._lock:
+            self.in_use -= 1
+            if discarded:
+                self.discarded += 1
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "created": self.created,
+                "discarded": self.discarded,
+                "health_checks": self.health_checks,
+                "health_check_failures": self.health_check_failures,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / self.acquired * 1000, 2) if self.acquired else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+
+
+@dataclass
+class ResultPage:
+    """一页查询结果：列名、行（元组）以及 limit 之后是否还有更多行"""
+    columns: List[str]
+    rows: List[tuple]
+    has_more: bool
+
+
+class DBConnection:
+    """从池中借出的连接；超时或取消后标记为 broken，归还时丢弃"""
+
+    def __init__(self, backend: "DatabaseBackend", raw: Any, cancel_token: Optional[CancellationToken]):
+        self.backend = backend
+        self.raw = raw
+        self.cancel_token = cancel_token
+        self.broken = False
+
+    async def fetch(self, sql: str, *, dict_rows: bool = True, timeout: Optional[float] = None) -> List[Any]:
+        """执行查询并返回全部行（dict_rows=False 时为元组）"""
+        return await self._guarded(self.backend._execute(self.raw, sql, dict_rows), timeout)
+
+    async def fetch_page(self, sql: str, *, limit: int, offset: int = 0,
+                         timeout: Optional[float] = None) -> ResultPage:
+        """
+        用服务端游标逐批读取，跳过前 offset 行后最多返回 limit 行，不把整个结果集读入内存
+        结果未读完时（has_more）连接上留有未读数据，归还时丢弃该连接
+        """
+        page, discard = await self._guarded(self.backend._execute_page(self.raw, sql, offset, limit), timeout)
+        if discard:
+            self.broken = True
+        return page
+
+    async def _guarded(self, awaitable: Awaitable[Any], timeout: Optional[float]) -> Any:
+        timeout = cap_timeout(self.cancel_token, timeout or self.backend.query_timeout)
+        try:
+            return await run_cancellable(asyncio.wait_for(awaitable, timeout), self.cancel_token)
+        except asyncio.TimeoutError:
+            self.broken = True
+            self.backend.pool_stats.incr("timeouts")
+            self.backend._interrupt(self.raw)
+            raise QueryTimeout(f"查询超时（{timeout:.0f}s）")
+        except (OperationCancelled, asyncio.CancelledError):
+            self.broken = True
+            self.backend._interrupt(self.raw)
+            raise
+
+
+class DatabaseBackend:
+    """数据库后端接口：连接池 + 方言相关的结构查询"""
+
+    name = "base"
+
+    def __init__(self, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE,
+                 query_timeout: float = DB_QUERY_TIMEOUT_SECONDS,
+                 ping_idle_seconds: float = DB_POOL_PING_IDLE_SECONDS):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.query_timeout = query_timeout
+        self.ping_idle_seconds = ping_idle_seconds
+        self.pool_stats = PoolStats()
+
+    @asynccontextmanager
+    async def connection(self, cancel_token: Optional[CancellationToken] = None) -> AsyncIterator[DBConnection]:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        started = time.perf_counter()
+        raw = await run_cancellable(self._acquire(), cancel_token)
+        self.pool_stats.on_acquire(time.perf_counter() - started)
+        conn = DBConnection(self, raw, cancel_token)
+        try:
+            yield conn
+        except BaseException:
+            conn.broken = True
+            raise
+        finally:
+            discard = conn.broken
+            self.pool_stats.on_release(discard)
+            await self._release(raw, discard)
+
+    # 以下由具体后端实现
+    async def _acquire(self) -> Any:
+        raise NotImplementedError
+
+    async def _release(self, raw: Any, discard: bool) -> None:
+        raise NotImplementedError
+
+    async def _execute(self, raw: Any, sql: str, dict_rows: bool) -> List[Any]:
+        raise NotImplementedError
+
+    async def _execute_page(self, raw: Any, sql: str, offset: int, limit: int) -> Tuple[ResultPage, bool]:
+        """返回 (结果页, 是否需要丢弃连接)"""
+        raise NotImplementedError
+
+    def _interrupt(self, raw: Any) -> None:
+        """中断连接上正在执行的查询（超时/取消时调用）"""
+
+    async def list_tables(self, conn: DBConnection) -> List[str]:
+        raise NotImplementedError
+
+    async def table_schema(self, conn: DBConnection, table: str) -> List[Any]:
+        raise NotImplementedError
+
+    async def describe_database(self, conn: DBConnection) -> List[Dict[str, Any]]:
+        """[{"name", "rows", "columns": [{"name", "type", "key"}]}]"""
+        raise NotImplementedError
+
+    async def estimate_rows(self, conn: DBConnection, sql: str) -> Optional[int]:
+        """查询结果总行数的估计，无法估计时返回 None"""
+        return None
+
+    def pool_size(self) -> Dict[str, int]:
+        return {}
+
+    async def close(self) -> None:
+        """关闭当前事件循环上的连接"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "min_size": self.min_size, "max_size": self.max_size,
+                **self.pool_size(), **self.pool_stats.snapshot()}
+
+
+class MySQLBackend(DatabaseBackend):
+    """aiomysql 连接池，按事件循环各建一个"""
+
+    name = "mysql"
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, recycle_seconds: float = DB_POOL_RECYCLE_SECONDS,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.config = dict(config or MYSQL_CONFIG)
+        self.recycle_seconds = recycle_seconds
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Future]" = weakref.WeakKeyDictionary()
+        self._last_used: "weakref.WeakKeyDictionary[Any, float]" = weakref.WeakKeyDictionary()
+
+    async def _pool(self):
+        loop = asyncio.get_running_loop()
+        future = self._pools.get(loop)
+        if future is None:
+            future = self._pools[loop] = asyncio.ensure_future(aiomysql.create_pool(
+                minsize=self.min_size, maxsize=self.max_size, pool_recycle=int(self.recycle_seconds), **self.config))
+            logger.info(f"创建数据库连接池: minsize={self.min_size}, maxsize={self.max_size}")
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # 建池失败（网络/认证），下次重新创建
+            if self._pools.get(loop) is future:
+                del self._pools[loop]
+            raise
+
+    async def _acquire(self):
+        pool = await self._pool()
+        conn = await pool.acquire()
+        if conn not in self._last_used:
+            self.pool_stats.incr("created")
+        elif time.monotonic() - self._last_used[conn] > self.ping_idle_seconds:
+            self.pool_stats.incr("health_checks")
+            try:
+                await conn.ping(reconnect=True)
+            except Exception as e:
+                self.pool_stats.incr("health_check_failures")
+                logger.warning(f"数据库连接健康检查失败，重新建立连接: {e}")
+                conn.close()
+                pool.release(conn)
+                conn = await pool.acquire()
+        return conn
+
+    async def _release(self, raw, discard: bool) -> None:
+        if discard:
+            raw.close()
+        else:
+            self._last_used[raw] = time.monotonic()
+        pool = await self._pool()
+        pool.release(raw)
+
+    async def _execute(self, raw, sql: str, dict_rows: bool) -> List[Any]:
+        async with raw.cursor(aiomysql.DictCursor if dict_rows else aiomysql.Cursor) as cursor:
+            await cursor.execute(sql)
+            return list(await cursor.fetchall())
+
+    async def _execute_page(self, raw, sql: str, offset: int, limit: int) -> Tuple[ResultPage, bool]:
+        # SSCursor：结果按需从网络读取，客户端不缓存整个结果集
+        cursor = await raw.cursor(aiomysql.SSCursor)
+        await cursor.execute(sql)
+        columns = [d[0] for d in cursor.description or ()]
+        skipped = 0
+        while skipped < offset:
+            batch = await cursor.fetchmany(min(DB_FETCH_BATCH_ROWS, offset - skipped))
+            if not batch:
+                break
+            skipped += len(batch)
+        rows = list(await cursor.fetchmany(limit + 1))
+        if len(rows) > limit:
+            # 关闭未读完的 SSCursor 需要读完剩余结果，直接丢弃连接
+            return ResultPage(columns, rows[:limit], True), True
+        await cursor.close()
+        return ResultPage(columns, rows, False), False
+
+    def _interrupt(self, raw) -> None:
+        # 关闭底层连接，服务端的查询随之中止
+        raw.close()
+
+    async def estimate_rows(self, conn: DBConnection, sql: str) -> Optional[int]:
+        # EXPLAIN 只读取优化器的行数估计，不执行查询
+        plan = await conn.fetch(f"EXPLAIN {sql.strip().rstrip(';')}")
+        estimates = [int(row["rows"]) for row in plan if row.get("rows") is not None]
+        return max(estimates) if estimates else None
+
+    async def list_tables(self, conn: DBConnection) -> List[str]:
+        return [row[0] for row in await conn.fetch("SHOW TABLES;", dict_rows=False)]
+
+    async def table_schema(self, conn: DBConnection, table: str) -> List[Any]:
+        return await conn.fetch(f"DESCRIBE {table};", dict_rows=False)
+
+    async def describe_database(self, conn: DBConnection) -> List[Dict[str, Any]]:
+        rows = await conn.fetch(
+            "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME;", dict_rows=False)
+        tables = {name: {"name": name, "rows": count, "columns": []} for name, count in rows}
+        columns = await conn.fetch(
+            "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION;", dict_rows=False)
+        for table, column, column_type, key in columns:
+            if table in tables:
+                if isinstance(column_type, bytes):
+                    column_type = column_type.decode("utf-8", errors="ignore")
+                tables[table]["columns"].append({"name": column, "type": column_type, "key": key or ""})
+        return list(tables.values())
+
+    def pool_size(self) -> Dict[str, int]:
+        size = free = 0
+        for future in list(self._pools.values()):
+            if future.done() and not future.cancelled() and future.exception() is None:
+                pool = future.result()
+                size += pool.size
+                free += pool.freesize
+        return {"pools": len(self._pools), "size": size, "free": free}
+
+    async def close(self) -> None:
+        future = self._pools.pop(asyncio.get_running_loop(), None)
+        if future is not None and future.done() and future.exception() is None:
+            pool = future.result()
+            pool.close()
+            await pool.wait_closed()
+
+
+class SQLiteBackend(DatabaseBackend):
+    """本地 SQLite 文件（只读），查询在线程中执行；同时借出的连接不超过 max_size 个"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DB_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = os.path.abspath(path)
+        self._idle: List[Any] = []
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        # 后端在多个事件循环间共享，用线程信号量限制借出数，等待时轮询让出事件循环
+        self._slots = threading.BoundedSemaphore(self.max_size)
+
+    def _connect(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"SQLite 数据库不存在: {self.path}")
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    async def _acquire(self):
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(0.005)
+        try:
+            return await self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _checkout(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = await asyncio.to_thread(self._connect)
+            self.pool_stats.incr("created")
+        elif time.monotonic() - self._last_used.get(id(conn), 0.0) > self.ping_idle_seconds:
+            self.pool_stats.incr("health_checks")
+            try:
+                await asyncio.to_thread(conn.execute, "SELECT 1")
+            except sqlite3.Error:
+                self.pool_stats.incr("health_check_failures")
+                self._last_used.pop(id(conn), None)
+                conn = await asyncio.to_thread(self._connect)
+        return conn
+
+    async def _release(self, raw, discard: bool) -> None:
+        try:
+            with self._lock:
+                if not discard:
+                    self._last_used[id(raw)] = time.monotonic()
+                    self._idle.append(raw)
+                    return
+                self._last_used.pop(id(raw), None)
+            raw.close()
+        finally:
+            self._slots.release()
+
+    async def _execute(self, raw, sql: str, dict_rows: bool) -> List[Any]:
+        def _run():
+            rows = raw.execute(sql).fetchall()
+            return [dict(row) if dict_rows else tuple(row) for row in rows]
+        return await asyncio.to_thread(_run)
+
+    async def _execute_page(self, raw, sql: str, offset: int, limit: int) -> Tuple[ResultPage, bool]:
+        def _run():
+            cursor = raw.execute(sql)
+            try:
+                columns = [d[0] for d in cursor.description or ()]
+                skipped = 0
+                while skipped < offset:
+                    batch = cursor.fetchmany(min(DB_FETCH_BATCH_ROWS, offset - skipped))
+                    if not batch:
+                        break
+                    skipped += len(batch)
+                rows = [tuple(row) for row in cursor.fetchmany(limit + 1)]
+            finally:
+                cursor.close()
+            return ResultPage(columns, rows[:limit], len(rows) > limit), False
+        return await asyncio.to_thread(_run)
+
+    def _interrupt(self, raw) -> None:
+        raw.interrupt()
+
+    async def estimate_rows(self, conn: DBConnection, sql: str) -> Optional[int]:
+        # 本地库数据量小，直接精确计数
+        rows = await conn.fetch(f"SELECT COUNT(*) FROM ({sql.strip().rstrip(';')})", dict_rows=False)
+        return int(rows[0][0])
+
+    async def list_tables(self, conn: DBConnection) -> List[str]:
+        rows = await conn.fetch("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                "AND name NOT LIKE 'sqlite_%' ORDER BY name;", dict_rows=False)
+        return [row[0] for row in rows]
+
+    async def table_schema(self, conn: DBConnection, table: str) -> List[Any]:
+        # 与 MySQL 的 DESCRIBE 对齐: Field, Type, Null, Key, Default, Extra
+        rows = await conn.fetch(f"PRAGMA table_info({table});", dict_rows=False)
+        if not rows:
+            raise ValueError(f"表不存在: {table}")
+        return [(name, col_type, "NO" if notnull else "YES", "PRI" if pk else "", default, "")
+                for _, name, col_type, notnull, default, pk in rows]
+
+    async def describe_database(self, conn: DBConnection) -> List[Dict[str, Any]]:
+        tables = []
+        for table in await self.list_tables(conn):
+            schema = await self.table_schema(conn, table)
+            count = (await conn.fetch(f'SELECT COUNT(*) FROM "{table}";', dict_rows=False))[0][0]
+            tables.append({"name": table, "rows": count,
+                           "columns": [{"name": row[0], "type": row[1], "key": row[3]} for row in schema]})
+        return tables
+
+    def pool_size(self) -> Dict[str, int]:
+        with self._lock:
+            free = len(self._idle)
+        return {"size": free + self.pool_stats.in_use, "free": free}
+
+    async def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._last_used.clear()
+        for conn in idle:
+            conn.close()
+
+
+_backend: Optional[DatabaseBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_db_backend(name: Optional[str] = None, **kwargs) -> DatabaseBackend:
+    name = (name or DB_BACKEND).lower()
+    if name == "mysql":
+        return MySQLBackend(**kwargs)
+    if name == "sqlite":
+        return SQLiteBackend(**kwargs)
+    raise ValueError(f"不支持的数据库后端: {name}（可选: mysql, sqlite）")
+
+
+def get_db_backend() -> DatabaseBackend:
+    """进程内共享的数据库后端（DB_BACKEND）"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_db_backend()
+                logger.info(f"数据库后端: {_backend.name}")
+    return _backend
+
+
+def set_db_backend(backend: Optional[DatabaseBackend]) -> None:
+    """替换进程内的数据库后端（测试/基准使用）；None 表示下次按 DB_BACKEND 重新创建"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def db_pool_stats() -> Dict[str, Any]:
+    backend = _backend
+    return backend.stats() if backend is not None else {"backend": DB_BACKEND, "initialized": False}
@@ -1,18 +1,25 @@
 import asyncio
-import aiomysql
 import logging
-from datetime import datetime, date
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
 from decimal import Decimal
-from utils.logger import get_logger
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from utils.cancellation import OperationCancelled
+from utils.logger import get_logger, payload
+from ToolOrchestrator.tools.db_backend import MYSQL_CONFIG, get_db_backend
 
 logger = get_logger(__name__)
 
-DB_CONFIG = {
-    "host": "rm-0iwx9y9q368yc877wbo.mysql.japan.rds.aliyuncs.com",
-    "user": "root",
-    "password": "Root155017",
-    "db": "cognitive"
-}
+DB_CONFIG = MYSQL_CONFIG
+
+# 单条查询最多返回给 agent 的行数，超出部分通过续页令牌（continuation）按需获取
+SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", "500"))
+SQL_CONTINUATION_TTL_SECONDS = float(os.getenv("SQL_CONTINUATION_TTL_SECONDS", "600"))
+SQL_CONTINUATION_MAX_ENTRIES = int(os.getenv("SQL_CONTINUATION_MAX_ENTRIES", "256"))
 
 def convert_to_json_serializable(obj):
     """将数据库查询结果中的特殊类型转换为JSON可序列化的类型"""
@@ -29,39 +36,101 @@ def convert_to_json_serializable(obj):
     else:
         return obj
 
+
+def _column_converter(values: Sequence[Any]) -> Optional[Callable[[Any], Any]]:
+    """按列的第一个非空值确定该列的转换函数（驱动返回的同一列类型一致）；无需转换时返回 None"""
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, (datetime, date)):
+        return lambda v: v.isoformat()
+    if isinstance(sample, Decimal):
+        return float
+    if isinstance(sample, bytes):
+        return lambda v: v.decode('utf-8', errors='ignore')
+    if isinstance(sample, timedelta):
+        return str
+    return None
+
+
+def rows_to_records(columns: List[str], rows: List[tuple]) -> List[dict]:
+    """
+    把元组行转换为可 JSON 序列化的字典列表：按列确定一次转换函数，只转换 Decimal/日期等特殊类型的列
+    重名列（如联表查询的两个 id）依次加后缀 _2、_3
+    """
+    if not rows:
+        return []
+    seen = {}
+    names = []
+    for column in columns:
+        seen[column] = seen.get(column, 0) + 1
+        names.append(column if seen[column] == 1 else f"{column}_{seen[column]}")
+    data = [list(values) for values in zip(*rows)]
+    for i, values in enumerate(data):
+        convert = _column_converter(values)
+        if convert is not None:
+            data[i] = [None if v is None else convert(v) for v in values]
+    return [dict(zip(names, row)) for row in zip(*data)]
+
+
+class ContinuationStore:
+    """
+    续页令牌：令牌只是随机字符串，查询语句与偏移量保存在进程内（LRU + TTL），
+    agent 无法通过伪造令牌绕过 SQL 安全检查；令牌与签发它的工具绑定
+    """
+
+    def __init__(self, ttl_seconds: float = SQL_CONTINUATION_TTL_SECONDS,
+                 max_entries: int = SQL_CONTINUATION_MAX_ENTRIES, clock: Callable[[], float] = time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[str, str, int, Optional[int], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def issue(self, tool_name: str, query: str, offset: int, total_estimate: Optional[int]) -> str:
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            self._entries[token] = (tool_name, query, offset, total_estimate, self._clock() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def resolve(self, tool_name: str, token: str) -> Optional[Tuple[str, int, Optional[int]]]:
+        """返回 (query, offset, total_estimate)；令牌无效、过期或不属于该工具时返回 None"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[4] <= self._clock():
+                self._entries.pop(token, None)
+                return None
+            if entry[0] != tool_name:
+                return None
+            self._entries.move_to_end(token)
+            return entry[1], entry[2], entry[3]
+
+
+continuation_store = ContinuationStore()
+
 async def list_sql_tables() -> dict:
     """列出数据库中所有表名"""
-    conn = None
     logger.info("调用工具: list_sql_tables()")
+    backend = get_db_backend()
     try:
-        conn = await aiomysql.connect(**DB_CONFIG)
-        async with conn.cursor() as cursor:
-            await cursor.execute("SHOW TABLES;")
-            result = await cursor.fetchall()
-            tables = [row[0] for row in result]
+        async with backend.connection() as conn:
+            tables = await backend.list_tables(conn)
             logger.info(f"✅ 查询到的表: {tables}")
             return {"tables": tables}
     except Exception as e:
         logger.error(f"❌ list_sql_tables 出错: {e}", exc_info=True)
         return {"error": f"数据库连接失败: {str(e)}"}
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("数据库连接已关闭。")
 
 async def get_tables_schema(table_names: list) -> dict:
     """获取指定表的字段结构"""
-    conn = None
     logger.info(f"调用工具: get_tables_schema(table_names={table_names})")
+    backend = get_db_backend()
     try:
-        conn = await aiomysql.connect(**DB_CONFIG)
-        async with conn.cursor() as cursor:
+        async with backend.connection() as conn:
             result = {}
             for table in table_names:
                 logger.debug(f"正在获取表结构: {table}")
-                await cursor.execute(f"DESCRIBE {table};")
-                schema = await cursor.fetchall()
-                result[table] = schema
+                result[table] = await backend.table_schema(conn, table)
             
             # 转换为JSON可序列化的格式
             serializable_result = convert_to_json_serializable(result)
@@ -71,45 +140,107 @@ async def get_tables_schema(table_names: list) -> dict:
     except Exception as e:
         logger.error(f"❌ get_tables_schema 出错: {e}", exc_info=True)
         return {"error": f"数据库连接失败: {str(e)}"}
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("数据库连接已关闭。")
-
-async def read_query_for_sensor_readings(table_queries: list) -> dict:
-    """执行多条 SQL 查询语句并返回结果"""
-    conn = None
-    logger.info(f"调用工具: read_query_for_sensor_readings(table_queries={table_queries})")
+
+async def _estimate_total(backend, query: str, cancel_token=None) -> Optional[int]:
+    """结果被截断时估计总行数；估计失败不影响查询结果"""
     try:
-        conn = await aiomysql.connect(**DB_CONFIG)
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            results = []
-            for item in table_queries:
-                query = item.get("query")
-                logger.info(f"执行 SQL 查询: {query}")
-                if not query:
-                    msg = "缺少 query 字段"
-                    logger.warning(f"⚠️ {msg}")
-                    results.append({"error": msg})
+        async with backend.connection(cancel_token) as conn:
+            return await backend.estimate_rows(conn, query)
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"估计查询总行数失败: {e}")
+        return None
+
+
+async def _run_read_queries(tool_name: str, table_queries: list, cancel_token=None,
+                            max_rows: int = SQL_RESULT_MAX_ROWS) -> dict:
+    """
+    依次执行多条只读查询，单条失败不影响其他查询
+    每条查询从连接池借出连接：超时/出错的连接被丢弃，后续查询换用新的连接
+    每条查询经服务端游标最多读取 max_rows 行；超出时结果标记 truncated，附总行数估计与续页令牌，
+    以 {"continuation": 令牌} 作为查询项再次调用即可获取后续的行
+    """
+    logger.info("调用工具: %s(table_queries=%s)", tool_name, payload(table_queries))
+    backend = get_db_backend()
+    try:
+        results = []
+        for item in table_queries:
+            token = item.get("continuation")
+            offset, total_estimate = 0, None
+            if token:
+                resolved = continuation_store.resolve(tool_name, token)
+                if resolved is None:
+                    msg = "续页令牌无效或已过期，请重新执行查询"
+                    logger.warning(f"⚠️ {msg}: {token}")
+                    results.append({"continuation": token, "error": msg})
                     continue
+                query, offset, total_estimate = resolved
+            else:
+                query = item.get("query")
+            logger.info(f"执行 SQL 查询: {query}" + (f"（从第 {offset + 1} 行起）" if offset else ""))
+            if not query:
+                msg = "缺少 query 字段"
+                logger.warning(f"⚠️ {msg}")
+                results.append({"error": msg})
+                continue
+            async with backend.connection(cancel_token) as conn:
                 try:
-                    await cursor.execute(query)
-                    rows = await cursor.fetchall()
-                    logger.info(f"✅ 查询成功: 返回 {len(rows)} 条记录")
-                    
-                    # 转换为JSON可序列化的格式
-                    serializable_rows = convert_to_json_serializable(rows)
-                    
-                    results.append({"query": query, "rows": serializable_rows})
+                    page = await conn.fetch_page(query, limit=max_rows, offset=offset)
+                except OperationCancelled:
+                    raise
                 except Exception as e:
                     logger.error(f"❌ 执行 SQL 出错: {query} | 错误: {e}", exc_info=True)
                     results.append({"query": query, "error": str(e)})
-            logger.info(f"📦 查询结果汇总: {results}")
-            return {"results": results}
+                    continue
+            # 转换为JSON可序列化的格式
+            entry = {"query": query, "rows": rows_to_records(page.columns, page.rows)}
+            if offset:
+                entry["offset"] = offset
+            if page.has_more:
+                if total_estimate is None:
+                    total_estimate = await _estimate_total(backend, query, cancel_token)
+                entry["truncated"] = True
+                entry["total_rows_estimate"] = total_estimate
+                entry["continuation"] = continuation_store.issue(tool_name, query, offset + len(page.rows),
+                                                                 total_estimate)
+            logger.info(f"✅ 查询成功: 返回 {len(page.rows)} 条记录" + ("（已截断）" if page.has_more else ""))
+            results.append(entry)
+        logger.info("📦 查询结果汇总: %s", payload(results))
+        return {"results": results}
+    except OperationCancelled:
+        logger.info(f"{tool_name} 已取消，已丢弃数据库连接")
+        raise
+    except Exception as e:
+        logger.error(f"❌ {tool_name} 出错: {e}", exc_info=True)
+        return {"error": f"数据库连接失败: {str(e)}"}
+
+
+async def read_query_for_sensor_readings(table_queries: list, cancel_token=None) -> dict:
+    """
+    执行多条 SQL 查询语句并返回结果，每条最多 SQL_RESULT_MAX_ROWS 行（超出时附续页令牌）
+    cancel_token: 可选的取消令牌，取消后立即中断连接/查询并关闭数据库连接
+    """
+    return await _run_read_queries("read_query_for_sensor_readings", table_queries, cancel_token)
+
+
+async def read_sql_query(table_queries: list, cancel_token=None) -> dict:
+    """执行任意表上的只读 SQL 查询（SQL 安全检查在 ToolRegistry 中完成）"""
+    return await _run_read_queries("read_sql_query", table_queries, cancel_token)
+
+
+async def describe_database() -> dict:
+    """
+    一次性获取当前库所有表的字段与行数估计（MySQL 读取 information_schema，不扫描数据），供数据库结构目录使用
+    返回 {"tables": [{"name", "rows", "columns": [{"name", "type", "key"}]}]}
+    """
+    logger.info("调用工具: describe_database()")
+    backend = get_db_backend()
+    try:
+        async with backend.connection() as conn:
+            tables = convert_to_json_serializable(await backend.describe_database(conn))
+            logger.info(f"✅ 获取数据库结构: {len(tables)} 张表")
+            return {"tables": tables}
     except Exception as e:
-        logger.error(f"❌ read_query_for_sensor_readings 出错: {e}", exc_info=True)
+        logger.error(f"❌ describe_database 出错: {e}", exc_info=True)
         return {"error": f"数据库连接失败: {str(e)}"}
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("数据库连接已关闭。")
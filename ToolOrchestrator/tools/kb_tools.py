@@ -6,12 +6,16 @@
 3. 链接默认agent进行对话
 """
 from rag.lang_rag import LangRAG
-from langchain_openai import ChatOpenAI
 import os
 from dotenv import load_dotenv
 load_dotenv()
 import logging
 from models.collection_manager import collection_manager
+from utils.lazy import lazy_import
+from utils.logger import payload
+
+ChatOpenAI = lazy_import("langchain_openai", "ChatOpenAI")
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -19,10 +23,11 @@ logging.basicConfig(
 logger = logging.getLogger("Default_KB_QA")
 logger.setLevel(logging.INFO)
 
-def create(kb_name: str):
+def create(kb_name: str, progress=None, start_at: int = 0):
     """
     新建知识库+首次上传文件夹
     首先必须确保原始文件夹里存在已经上传的文件
+    progress/start_at: 入库进度回调与续传位置，见 LangRAG.add_file
     """
     kb_path = os.path.join("data/raw_data",kb_name)
     if not os.path.exists(kb_path):
@@ -39,7 +44,7 @@ def create(kb_name: str):
         persist_path="data/vector_data",
         collection_name=kb_name
     )
-    kb.initialize_from_folder(kb_path)
+    kb.initialize_from_folder(kb_path, progress=progress, start_at=start_at)
     logger.info(f"知识库{kb_name}创建完成")
     kb.release()
     return kb
@@ -64,7 +69,7 @@ def ask(question: str, k: int = 5, kb_name: str="all_data", model: str="gpt-4o-m
 
     llm = ChatOpenAI(model=model, temperature=0.4, max_tokens=None)
     contexts = kb.retrieve(question, k=k)
-    logger.info(f"检索到的是{contexts}")
+    logger.info("检索到的是: %s", payload(contexts))
     if not contexts:
         answer = "抱歉，知识库中未找到相关信息。"
         logger.info(f"回答: {answer}")
@@ -100,16 +105,19 @@ def ask(question: str, k: int = 5, kb_name: str="all_data", model: str="gpt-4o-m
     logger.info(f"回答: {answer}")
     return answer
 
-def retrieve(collection_name: str, question: str, k: int = 5):
+def retrieve(collection_name: str, question: str, k: int = 5, cancel_token=None):
     """
     直接检索 top-k 语义片段（不经 LLM）。
     返回结构化结果，包含片段文本与来源文件名及 chunk_id。
+    cancel_token: 可选的取消令牌，请求被放弃时跳过排队中的检索。
     """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
     kb = LangRAG(
         persist_path="data/vector_data",
         collection_name=collection_name,
     )
-    docs = kb.retrieve(question, k=k)
+    docs = kb.retrieve(question, k=k, cancel_token=cancel_token)
 
     def _extract_source(meta: dict):
         try:
@@ -133,12 +141,12 @@ def get_kb_list():
         collection_name = "all_data"
     )
     return kb_list.get_kb_list()
-def add_file(file_name: str, kb_name: str="all_data"):
+def add_file(file_name: str, kb_name: str="all_data", progress=None, start_at: int = 0):
     kb = LangRAG(
         persist_path = "data/vector_data",
         collection_name = kb_name
     )
-    kb.add_file(file_name)
+    kb.add_file(file_name, progress=progress, start_at=start_at)
     return True
 def deletefile(file_name: str, kb_name: str="all_data"):
     kb = LangRAG(
@@ -4,19 +4,22 @@
 """
 import logging
 import os
-from typing import List, Dict, Any
-from tavily import TavilyClient
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from utils.lazy import lazy_import
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+TavilyClient = lazy_import("tavily", "TavilyClient")
+
 # 从环境变量获取 API Key，提高安全性
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "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")
 
 
-def web_search(query: str, max_results: int = 3, search_depth: str = "basic") -> List[Dict[str, Any]]:
+def web_search(query: str, max_results: int = 3, search_depth: str = "basic",
+               timeout: Optional[float] = None) -> List[Dict[str, Any]]:
     """
     通过 Tavily API 进行联网搜索
     
@@ -24,6 +27,7 @@ def web_search(query: str, max_results: int = 3, search_depth: str = "basic") ->
         query: 搜索查询字符串
         max_results: 返回的最大结果数量，默认为3
         search_depth: 搜索深度，可选值: "basic" 或 "advanced"，默认为 "basic"
+        timeout: 请求超时（秒），默认使用 Tavily 客户端的超时
     
     Returns:
         包含搜索结果的列表，每个结果包含 title, url, content, score 等字段
@@ -34,11 +38,13 @@ def web_search(query: str, max_results: int = 3, search_depth: str = "basic") ->
         tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
         
         # 调用 Tavily API
+        search_kwargs = {"timeout": max(1, int(timeout))} if timeout is not None else {}
         response = tavily_client.search(
             query=query,
             max_results=max_results,
             search_depth=search_depth,
-            include_answer=True
+            include_answer=True,
+            **search_kwargs
         )
         
         results = response.get("results", [])
@@ -1,8 +1,13 @@
 from __future__ import annotations
 import asyncio
-from typing import Any, Dict, Generator, Optional
+from typing import Any, AsyncGenerator, Dict, Generator, Optional, Tuple
 from pydantic import BaseModel, Field
+from agents.data_agent import DataAgent
 from agents.single_agent import SingleAgent
+from models.collection_manager import collection_manager
+from utils.cancellation import DEADLINE_EXCEEDED_MESSAGE, CancellationToken
+from utils.event_loop import background_loop
+from utils.answer_cache import ANSWER_CACHE_ENABLED, AnswerRecorder, answer_cache, make_cache_key
 from utils.logger import get_logger
 logger = get_logger(__name__)
 
@@ -23,6 +28,15 @@ class SingleTurnConfig(BaseModel):
     max_steps: Optional[int] = 4
 
 
+class DataAgentConfig(BaseModel):
+    """
+    对于 data 模式（DataAgent：ReAct + MCP 工具调用）进行配置
+    """
+    system_prompt: Optional[str] = None  # 为空时使用 DataAgent 默认系统提示
+    model: Optional[str] = None  # 为空时使用 DataAgent 默认模型
+    max_steps: Optional[int] = 8
+
+
 class OrchestrationConfig(BaseModel):
     """
     对于传入的参数进行配置解析
@@ -31,8 +45,13 @@ class OrchestrationConfig(BaseModel):
     mode: str = "auto"
     rag: RAGConfig = Field(default_factory=RAGConfig)
     single: SingleTurnConfig = Field(default_factory=SingleTurnConfig)
+    data: DataAgentConfig = Field(default_factory=DataAgentConfig)
+    # 是否使用完整答案缓存（重复问题直接回放）
+    use_cache: bool = True
+    # 请求级截止时间（秒）；SSE 请求的截止时间由服务端在创建运行时设置，此处用于直接调用 main()/amain()
+    deadline_seconds: Optional[float] = None
 
-def _run_single(query: str, cfg) -> Generator[Dict[str, Any], None, str]:
+def _run_single(query: str, cfg, cancel_token: Optional[CancellationToken] = None) -> Generator[Dict[str, Any], None, str]:
     """
     执行 SingleAgent 并返回结果。
     使用简化的方式直接调用agent.run()获取最终答案。
@@ -47,27 +66,171 @@ def _run_single(query: str, cfg) -> Generator[Dict[str, Any], None, str]:
         max_steps=cfg.single.max_steps
     )
 
-    result = agent.run(query)        
+    result = agent.run(query, cancel_token=cancel_token)
     for event in result:
         yield event
 
 
-def main(query: str, config: Dict[str, Any] | None = None) -> Generator[Dict[str, Any], None, str]:
+async def _arun_single(query: str, cfg, cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    _run_single 的异步版本，供 ASGI 服务使用。
+    """
+    logger.info("=== 启动 SingleAgent 单轮运行(async) ===")
+    logger.info(f"用户输入: {query}")
+
+    agent = SingleAgent(
+        system_prompt=cfg.single.system_prompt,
+        model=cfg.single.model,
+        max_steps=cfg.single.max_steps
+    )
+
+    async for event in agent.arun(query, cancel_token=cancel_token):
+        yield event
+
+
+def _new_data_agent(cfg) -> DataAgent:
+    agent = DataAgent(system_prompt=cfg.data.system_prompt, max_steps=cfg.data.max_steps)
+    if cfg.data.model:
+        agent.model = cfg.data.model
+    return agent
+
+
+def _run_data(query: str, cfg, cancel_token: Optional[CancellationToken] = None) -> Generator[Dict[str, Any], None, str]:
+    """
+    执行 DataAgent（data 模式）的流式运行：工具调用进度与回答增量随产生随输出，事件格式与 SingleAgent 相同
+    """
+    logger.info("=== 启动 DataAgent 流式运行 ===")
+    logger.info(f"用户输入: {query}")
+    agent = _new_data_agent(cfg)
+    yield from background_loop.iterate(agent.run_stream(query, cancel_token=cancel_token), cancel_token)
+
+
+async def _arun_data(query: str, cfg, cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    _run_data 的异步版本，供 ASGI 服务使用。
+    """
+    logger.info("=== 启动 DataAgent 流式运行(async) ===")
+    logger.info(f"用户输入: {query}")
+    agent = _new_data_agent(cfg)
+    async for event in agent.run_stream(query, cancel_token=cancel_token):
+        yield event
+
+
+def _parse_config(config: Dict[str, Any] | None) -> OrchestrationConfig:
+    cfg = OrchestrationConfig.model_validate(config or {})
+    logger.info(f"Orchestration mode={cfg.mode}")
+    if cfg.mode not in ("single", "auto", "roleplay", "data"):
+        raise ValueError(f"Invalid mode: {cfg.mode}. Supported modes: 'single', 'auto', 'roleplay', 'data'")
+    return cfg
+
+
+def _with_deadline(cfg: OrchestrationConfig,
+                   cancel_token: Optional[CancellationToken]) -> Tuple[CancellationToken, bool]:
+    """返回 (令牌, 是否由本函数设置了截止时间)；调用方未提供令牌时新建一个"""
+    token = cancel_token or CancellationToken()
+    if token.deadline is None and not token.cancelled and cfg.deadline_seconds:
+        token.set_deadline(cfg.deadline_seconds)
+        return token, True
+    return token, False
+
+
+def _deadline_error(cancel_token: CancellationToken) -> Dict[str, Any]:
+    logger.warning(f"请求超过截止时间，已终止: reason={cancel_token.reason}")
+    return {
+        "type": "error",
+        "content": DEADLINE_EXCEEDED_MESSAGE
+    }
+
+
+def _answer_cache_key(query: str, cfg: OrchestrationConfig) -> Optional[str]:
+    """答案缓存键：规范化问题 + 影响答案的配置字段 + 所检索集合的版本号；不使用缓存时返回 None"""
+    if not (ANSWER_CACHE_ENABLED and cfg.use_cache):
+        return None
+    collection_name = SingleAgent.DEFAULT_COLLECTION
+    if cfg.mode == "data":
+        return make_cache_key(query, {
+            "mode": cfg.mode,
+            "model": cfg.data.model,
+            "system_prompt": cfg.data.system_prompt,
+            "max_steps": cfg.data.max_steps,
+            "collection_name": collection_name,
+            "collection_version": collection_manager.get_collection_version(collection_name),
+        })
+    return make_cache_key(query, {
+        "mode": cfg.mode,
+        "model": cfg.single.model,
+        "system_prompt": cfg.single.system_prompt,
+        "collection_name": collection_name,
+        "k": SingleAgent.DEFAULT_TOPK,
+        "collection_version": collection_manager.get_collection_version(collection_name),
+    })
+
+
+def main(query: str, config: Dict[str, Any] | None = None,
+         cancel_token: Optional[CancellationToken] = None) -> Generator[Dict[str, Any], None, str]:
     """
     配置解析、进行任务模式选择、生成流式输出
     
     Args:
         query: 用户查询
-        config: 配置字典，支持mode字段（"single"或"auto"，默认使用single模式）
+        config: 配置字典，支持mode字段（"single"或"auto"，默认使用single模式；"data" 使用 DataAgent 流式运行）
+        cancel_token: 取消令牌，客户端断开或超过截止时间时被取消，agent 随之停止
     
     Yields:
         包含过程信息和最终答案的字典
     """
-    cfg = OrchestrationConfig.model_validate(config or {})
-    logger.info(f"Orchestration mode={cfg.mode}")
-    
-    # 支持 "single" 、 "auto" 和 "roleplay" 模式（都使用single agent）
-    if cfg.mode in ("single", "auto", "roleplay"):
-        return (yield from _run_single(query, cfg))
-    else:
-        raise ValueError(f"Invalid mode: {cfg.mode}. Supported modes: 'single', 'auto', 'roleplay'")
+    # 支持 "single" 、 "auto" 和 "roleplay" 模式（都使用single agent），以及 "data" 模式（DataAgent）
+    cfg = _parse_config(config)
+    cache_key = _answer_cache_key(query, cfg)
+    cached = answer_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info(f"答案缓存命中，回放 {len(cached.deltas)} 个增量")
+        yield from cached.replay()
+        return
+
+    cancel_token, owns_deadline = _with_deadline(cfg, cancel_token)
+    recorder = AnswerRecorder()
+    try:
+        run = _run_data if cfg.mode == "data" else _run_single
+        for event in run(query, cfg, cancel_token):
+            recorder.observe(event)
+            yield event
+        if cancel_token.deadline_exceeded:
+            yield _deadline_error(cancel_token)
+            return
+    finally:
+        if owns_deadline:
+            cancel_token.clear_deadline()
+    if cache_key:
+        answer_cache.put(cache_key, recorder)
+
+
+async def amain(query: str, config: Dict[str, Any] | None = None,
+                cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    main() 的异步生成器版本，事件格式相同，供 ASGI 服务使用。
+    """
+    cfg = _parse_config(config)
+    cache_key = _answer_cache_key(query, cfg)
+    cached = answer_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info(f"答案缓存命中，回放 {len(cached.deltas)} 个增量")
+        for event in cached.replay():
+            yield event
+        return
+
+    cancel_token, owns_deadline = _with_deadline(cfg, cancel_token)
+    recorder = AnswerRecorder()
+    try:
+        arun = _arun_data if cfg.mode == "data" else _arun_single
+        async for event in arun(query, cfg, cancel_token):
+            recorder.observe(event)
+            yield event
+        if cancel_token.deadline_exceeded:
+            yield _deadline_error(cancel_token)
+            return
+    finally:
+        if owns_deadline:
+            cancel_token.clear_deadline()
+    if cache_key:
+        answer_cache.put(cache_key, recorder)
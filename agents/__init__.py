@@ -1,4 +1,5 @@
-from .core_schema import AgentState, Message, Memory
+from .core_schema import AgentState, Message
+from .memory import Memory
 from .core_base import CoreBaseAgent
 from .react_agent import ReActAgent
 from .mcp_toolcall_agent import MCPToolCallAgent
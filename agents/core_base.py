@@ -3,7 +3,8 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
 from typing import List, Optional
-from .core_schema import AgentState, Memory, Message
+from .core_schema import AgentState, Message
+from .memory import Memory
 
 
 class CoreBaseAgent(ABC):
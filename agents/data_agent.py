@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import Any, Dict, List, Optional
 from .mcp_toolcall_agent import MCPToolCallAgent
 from utils.logger import get_logger
+from utils.schema_catalog import schema_catalog
 logger = get_logger(__name__)
 
 class DataAgent(MCPToolCallAgent):
@@ -10,10 +11,15 @@ class DataAgent(MCPToolCallAgent):
     - 继承 MCPToolCallAgent：沿用 OpenAI tools 决策 + MCP 执行
     - 约束工具集合：仅暴露 KB / DB 相关工具
     - 默认系统提示：规范回答格式与使用工具策略
+    - 数据库结构目录已加载时，把结构摘要附在系统提示后，模型第一轮即可直接编写 SQL
     """
 
     name: str = "data-agent"
     description: Optional[str] = "Analyze KB and DB via MCP toolcalls"
+    SCHEMA_PROMPT = (
+        "\n\n数据库结构已预先获取如下，可直接编写只读 SQL 并调用 read_sql_query 查询，"
+        "无需再调用 list_sql_tables、get_tables_schema（下面未列出字段的表除外）：\n{digest}"
+    )
 
     def __init__(self, *, system_prompt: Optional[str] = None, **kwargs) -> None:
         default_system = (
@@ -26,6 +32,13 @@ class DataAgent(MCPToolCallAgent):
             "对于retriever工具如果检索到相关信息了则不重复检索，尽量针对相同的问题只进行单次的检索。"
         )
         super().__init__(system_prompt=system_prompt or default_system, **kwargs)
+        self._base_system_prompt = self.system_prompt
+
+    async def run(self, request: Optional[str] = None) -> str:
+        await schema_catalog.ensure_loaded()
+        digest = schema_catalog.digest()
+        self.system_prompt = self._base_system_prompt + (self.SCHEMA_PROMPT.format(digest=digest) if digest else "")
+        return await super().run(request)
 
     async def _ensure_tools_ready(self):
         # 使用父类加载所有工具后，筛选只保留 KB/DB 工具
@@ -1,17 +1,21 @@
 from __future__ import annotations
 import dotenv
 dotenv.load_dotenv()
+import asyncio
 import json
 import os
-from typing import Any, Dict, List, Optional
+import random
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 import time
 from ToolOrchestrator.core.config import settings
-from openai import OpenAI
 from openai import APIError, APITimeoutError, RateLimitError
 from ToolOrchestrator.core.registry import ToolRegistry
 from utils.global_tool_manager import global_tool_manager
 from .react_agent import ReActAgent
 from .core_schema import AgentState, Message
+from utils.cancellation import CancellationToken, OperationCancelled, cap_timeout, run_cancellable
+from utils.client_pool import llm_client_pool
 from utils.logger import get_logger
 logger = get_logger(__name__)
 
@@ -26,6 +30,8 @@ class MCPToolCallAgent(ReActAgent):
 
     - think(): 使用 Chat Completions 的 tools 模式，让 LLM 自动选择 MCP 工具
     - act(): 通过 ToolRegistry 调用 MCP 工具，写入 tool 消息
+    - LLM 调用与重试退避均为异步，多个 agent 可在同一事件循环上交错运行
+    - run_stream(): 流式运行，产出工具进度与回答增量，事件格式与 SingleAgent.run 相同
     """
 
     name: str = "mcp-toolcall-agent"
@@ -35,19 +41,208 @@ class MCPToolCallAgent(ReActAgent):
     max_retries: int = 3  # 最大重试次数（含首次共 1+max_retries 次尝试）
     request_timeout_seconds: float = 120.0  # 单次请求超时时间
     initial_retry_backoff_seconds: float = 0.8  # 指数退避初始等待
+    retry_jitter_ratio: float = 0.5  # 退避等待额外叠加的随机抖动比例
     max_tool_calls: int = 6  # 最大工具调用次数，避免过度检索
+    max_parallel_tool_calls: int = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))  # 同一轮内并发执行的工具调用上限
+    tool_timeout_seconds: float = float(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "60"))  # 单个工具调用的默认超时
     info_sufficient_threshold: int = 3  # 判断信息充足的工具调用次数阈值
+    # 返回数据、需要随后生成自然语言回答的工具
+    DATA_TOOLS = ("retrieve", "read_sql_query", "list_sql_tables", "get_tables_schema")
+    LLM_UNAVAILABLE_MESSAGE = "抱歉，当前大模型接口暂时不可用，请稍后重试或缩小问题范围。"
     
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         api_key = os.environ.get("OPENAI_API_KEY") or os.environ.get("GPT_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY/GPT_API_KEY 未配置")
-        self._client = OpenAI(api_key=api_key)
+        # LLM 客户端按需从进程级客户端池借用（见 _client），请求之间复用 keep-alive 连接
+        self._api_key = api_key
         self._registry = None 
         self._tools_param_cache: Optional[List[Dict[str, Any]]] = None
         self.tool_calls: List[ToolCall] = []
         self._log = logger
+        # 请求级取消令牌：其截止时间限制每次 LLM 请求的超时与重试次数
+        self.cancel_token: Optional[CancellationToken] = None
+        # run_stream 期间的事件队列；为 None 时按普通 run() 运行
+        self._event_queue: Optional[asyncio.Queue] = None
+        self._streamed_answer = False
+
+    @property
+    def _client(self):
+        """从进程级客户端池借用当前事件循环上的 AsyncOpenAI 客户端，等待模型期间不阻塞事件循环"""
+        return llm_client_pool.get_async(api_key=self._api_key)
+
+    def _retry_delay(self, attempt_index: int) -> float:
+        """第 attempt_index 次失败后的等待：指数退避，再叠加最多 retry_jitter_ratio 比例的随机抖动，避免并发请求同时重试"""
+        delay = self.initial_retry_backoff_seconds * (2 ** (attempt_index - 1))
+        return delay + random.uniform(0, delay * self.retry_jitter_ratio)
+
+    async def _chat_completion(self, **kwargs) -> Optional[Any]:
+        """
+        调用 Chat Completions（带超时与指数退避重试）；重试用尽或剩余时间不足时返回 None，由调用方降级。
+        退避期间使用 asyncio.sleep，同一事件循环上的其他 agent 照常运行；令牌取消时立即抛出 OperationCancelled。
+        """
+        attempt_index: int = 0
+        last_error: Optional[Exception] = None
+        while attempt_index <= self.max_retries:
+            if self.cancel_token is not None:
+                self.cancel_token.raise_if_cancelled()
+            try:
+                return await run_cancellable(self._client.chat.completions.create(
+                    timeout=cap_timeout(self.cancel_token, self.request_timeout_seconds),
+                    **kwargs,
+                ), self.cancel_token)
+            except (APITimeoutError,) as e:
+                last_error = e
+                self._log.warning("OpenAI 请求超时，last_error: %s，第 %s 次尝试", last_error, attempt_index + 1)
+            except (RateLimitError,) as e:
+                last_error = e
+                self._log.warning("OpenAI 触发限流，last_error: %s，第 %s 次尝试", last_error, attempt_index + 1)
+            except (APIError,) as e:
+                last_error = e
+                # 对于可重试的 5xx 错误继续重试
+                if getattr(e, "status_code", 500) >= 500:
+                    self._log.warning("OpenAI 服务端错误(%s)，第 %s 次尝试", getattr(e, "status_code", None), attempt_index + 1)
+                else:
+                    # 4xx 多为不可恢复，直接终止重试
+                    self._log.error("OpenAI API 错误：%s，停止重试", e)
+                    raise
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                # 未知异常不重试，向上抛出
+                self._log.error("调用 OpenAI 未知异常：%s", e)
+                raise
+
+            attempt_index += 1
+            if attempt_index > self.max_retries:
+                break
+            sleep_seconds = self._retry_delay(attempt_index)
+            remaining = self.cancel_token.remaining() if self.cancel_token is not None else None
+            if remaining is not None and remaining <= sleep_seconds:
+                # 剩余时间不足以再试一次，直接降级
+                self._log.warning("请求剩余时间 %.1fs 不足以重试，停止重试", remaining)
+                break
+            await run_cancellable(asyncio.sleep(sleep_seconds), self.cancel_token)
+        self._log.error("OpenAI 请求重试用尽，last_error: %s", last_error)
+        return None
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        """流式运行（run_stream）时把进度/答案增量事件交给调用方；普通 run() 时忽略"""
+        if self._event_queue is not None:
+            self._event_queue.put_nowait(event)
+
+    async def _chat_message(self, **kwargs) -> Optional[Any]:
+        """
+        返回模型的 assistant 消息（带 content 与 tool_calls）；重试用尽时返回 None。
+        流式运行时以 stream=True 请求，文本增量随到随发（status: stream），工具调用增量在本地拼装。
+        """
+        if self._event_queue is None:
+            resp = await self._chat_completion(**kwargs)
+            return resp.choices[0].message if resp is not None else None
+
+        stream = await self._chat_completion(stream=True, **kwargs)
+        if stream is None:
+            return None
+        content_parts: List[str] = []
+        calls: Dict[int, Dict[str, str]] = {}
+        try:
+            async for chunk in stream:
+                if self.cancel_token is not None:
+                    self.cancel_token.raise_if_cancelled()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    # 模型决定调用工具时通常不输出文本；若先输出了说明文字，也作为回答的一部分发送
+                    self._publish({"status": "stream", "content": delta.content})
+                    self._streamed_answer = True
+                for tc in delta.tool_calls or []:
+                    call = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function is not None:
+                        call["name"] += tc.function.name or ""
+                        call["arguments"] += tc.function.arguments or ""
+        finally:
+            await stream.close()
+        tool_calls = [ToolCall(call["id"], call["name"], call["arguments"] or "{}") for _, call in sorted(calls.items())]
+        return SimpleNamespace(content="".join(content_parts), tool_calls=tool_calls or None)
+
+    def _final_answer(self) -> str:
+        """最后一条自然语言 assistant 回答（跳过工具调用消息与内部标记）"""
+        for m in reversed(self.messages):
+            if m.role != "assistant" or not m.content or m.tool_calls:
+                continue
+            content = m.content.strip()
+            if content in ("[tools] executing", "[tools_executed]", "Thinking complete - no action needed"):
+                continue
+            return content
+        return ""
+
+    def _data_rows(self) -> int:
+        """本次运行中数据库查询工具返回的总行数（供答案缓存判断是否使用了实时数据）"""
+        rows = 0
+        for m in self.messages:
+            if m.role != "tool" or m.name not in ("read_sql_query", "read_query_for_sensor_readings"):
+                continue
+            try:
+                result = json.loads(m.content or "").get("result") or {}
+                rows += sum(len(item.get("rows") or []) for item in result.get("results", []) if isinstance(item, dict))
+            except (ValueError, AttributeError, TypeError):
+                continue
+        return rows
+
+    async def run_stream(self, request: str,
+                         cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式运行，事件格式与 SingleAgent.run 相同：
+        - {"status": "tool", "content": {"name", "state": started/finished/failed, "elapsed"}} 工具调用进度
+        - {"status": "stream", "content": 增量} 最终回答的文本增量（模型输出时即发送）
+        - {"status": "meta", ...} 运行元信息；{"status": "final"} 结束；出错时 {"type": "error"}
+        cancel_token 被取消时停止运行，不再产出事件。
+        """
+        self.cancel_token = cancel_token
+        self._event_queue = asyncio.Queue()
+        self._streamed_answer = False
+        done = object()
+        queue = self._event_queue
+
+        async def _drive():
+            try:
+                await self.run(request)
+            finally:
+                queue.put_nowait(done)
+
+        task = asyncio.ensure_future(_drive())
+        try:
+            while True:
+                event = await queue.get()
+                if event is done:
+                    break
+                yield event
+            await task
+        except OperationCancelled:
+            self._log.info("请求已取消，终止运行")
+            return
+        except Exception as e:
+            self._log.error(f"{self.name} 运行失败: {e}")
+            yield {"type": "error", "content": f"抱歉，生成答案时出错: {e}"}
+            return
+        finally:
+            if not task.done():
+                task.cancel()
+            self._event_queue = None
+
+        if not self._streamed_answer:
+            # 回答未经流式输出（降级提示、重复回答等），整段发送
+            answer = self._final_answer()
+            if answer:
+                yield {"status": "stream", "content": answer}
+        yield {"status": "meta", "content": {"sensor_rows": self._data_rows(),
+                                             "tool_calls": self.memory.count("tool")}}
+        yield {"status": "final", "content": "查询处理结束"}
 
     def _has_data_tool_result(self, content: str) -> bool:
         """检测是否是数据获取工具的结果"""
@@ -99,49 +294,22 @@ class MCPToolCallAgent(ReActAgent):
         self._tools_param_cache = tools_param
         self._log.info(f"已准备 {len(tools_param)} 个工具供LLM调用")
 
-    def _to_chat_messages(self) -> List[Dict[str, Any]]:
-        msgs: List[Dict[str, Any]] = []
-        for m in self.messages:
-            if m.role == "tool":
-                # 为满足 OpenAI 对 tool 消息的约束：必须紧随带有 tool_calls 的 assistant 消息之后
-                # 若历史消息中没有保存带 tool_calls 的 assistant，则根据最近一次 self.tool_calls 构造一条虚拟的 assistant 消息
-                need_insert_tool_calls = True
-                if msgs:
-                    last = msgs[-1]
-                    if last.get("role") == "assistant" and last.get("tool_calls"):
-                        need_insert_tool_calls = False
-
-                if need_insert_tool_calls and self.tool_calls:
-                    tool_calls_payload: List[Dict[str, Any]] = [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments or "{}",
-                            },
-                        }
-                        for tc in self.tool_calls
-                    ]
-                    msgs.append({
-                        "role": "assistant",
-                        "content": None,
-                        "tool_calls": tool_calls_payload,
-                    })
+    @staticmethod
+    def _tool_calls_payload(tool_calls: List[ToolCall]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": tc.id,
+                "type": "function",
+                "function": {"name": tc.function.name, "arguments": tc.function.arguments or "{}"},
+            }
+            for tc in tool_calls
+        ]
 
-                msgs.append({
-                    "role": "tool",
-                    "content": m.content or "",
-                    "tool_call_id": m.tool_call_id,
-                })
-            elif m.role == "assistant":
-                # 保留 assistant 消息上的 tool_calls，确保后续 tool 消息的 tool_call_id 能被正确匹配
-                payload: Dict[str, Any] = {"role": "assistant", "content": m.content or ""}
-                if m.tool_calls:
-                    payload["tool_calls"] = m.tool_calls
-                msgs.append(payload)
-            elif m.role in ("user", "system"):
-                msgs.append({"role": m.role, "content": m.content or ""})
+    def _to_chat_messages(self) -> List[Dict[str, Any]]:
+        """对话记忆增量维护的 OpenAI 消息列表；超出 MEMORY_TOKEN_BUDGET 时较早的工具结果已替换为摘要"""
+        msgs = self.memory.to_chat_messages(self._tool_calls_payload(self.tool_calls))
+        if self.memory.compacted:
+            self._log.debug(f"对话消息 {len(msgs)} 条，约 {self.memory.wire_tokens} tokens，已压缩 {self.memory.compacted} 条工具结果")
         return msgs
 
     async def think(self) -> bool:
@@ -150,7 +318,7 @@ class MCPToolCallAgent(ReActAgent):
             return False
             
         # 检查是否已经进行了太多轮工具调用
-        tool_call_count = len([m for m in self.messages if m.role == "tool"])
+        tool_call_count = self.memory.count("tool")
 
         # 检查是否已经有总结请求在最近的消息中
         recent_user_messages = [m for m in self.messages[-3:] if m.role == "user"]
@@ -183,51 +351,17 @@ class MCPToolCallAgent(ReActAgent):
             chat_messages = [{"role": "system", "content": self.system_prompt}] + chat_messages
 
         # 让 LLM 决定是否要调用工具（带超时与指数退避重试）
-        attempt_index: int = 0
-        last_error: Optional[Exception] = None
-        while attempt_index <= self.max_retries:
-            try:
-                resp = self._client.chat.completions.create(
-                    model=self.model,
-                    messages=chat_messages,
-                    tools=self._tools_param_cache,  # type: ignore
-                    tool_choice="auto",
-                    timeout=self.request_timeout_seconds,
-                )
-                break
-            except (APITimeoutError,) as e:
-                last_error = e
-                self._log.warning("OpenAI 请求超时，last_error: %s，第 %s 次尝试", last_error, attempt_index + 1)
-            except (RateLimitError,) as e:
-                last_error = e
-                self._log.warning("OpenAI 触发限流，last_error: %s，第 %s 次尝试", last_error, attempt_index + 1)
-            except (APIError,) as e:
-                last_error = e
-                # 对于可重试的 5xx 错误继续重试
-                if getattr(e, "status_code", 500) >= 500:
-                    self._log.warning("OpenAI 服务端错误(%s)，第 %s 次尝试", getattr(e, "status_code", None), attempt_index + 1)
-                else:
-                    # 4xx 多为不可恢复，直接终止重试
-                    self._log.error("OpenAI API 错误：%s，停止重试", e)
-                    raise
-            except Exception as e:
-                # 未知异常不重试，向上抛出
-                self._log.error("调用 OpenAI 未知异常：%s", e)
-                raise
-
-            attempt_index += 1
-            if attempt_index > self.max_retries:
-                # 重试用尽，进行降级，并终止循环
-                fallback = "抱歉，当前大模型接口暂时不可用，请稍后重试或缩小问题范围。"
-                self.memory.add(Message.assistant(fallback))
-                self.state = AgentState.FINISHED
-                return False
-            # 指数退避
-            sleep_seconds = self.initial_retry_backoff_seconds * (2 ** (attempt_index - 1))
-            time.sleep(sleep_seconds)
-
-        choice = resp.choices[0]
-        msg = choice.message
+        msg = await self._chat_message(
+            model=self.model,
+            messages=chat_messages,
+            tools=self._tools_param_cache,  # type: ignore
+            tool_choice="auto",
+        )
+        if msg is None:
+            # 重试用尽，进行降级
+            self.memory.add(Message.assistant(self.LLM_UNAVAILABLE_MESSAGE))
+            self.state = AgentState.FINISHED
+            return False
 
         content = msg.content or ""
         tool_calls = msg.tool_calls or []
@@ -240,15 +374,8 @@ class MCPToolCallAgent(ReActAgent):
                 for tc in tool_calls
             ]
             # 将带工具调用的assistant消息写入记忆（包含 tool_calls，满足 OpenAI 约束）
-            tool_calls_payload: List[Dict[str, Any]] = [
-                {
-                    "id": tc.id,
-                    "type": "function",
-                    "function": {"name": tc.function.name, "arguments": tc.function.arguments or "{}"},
-                }
-                for tc in self.tool_calls
-            ]
-            self.memory.add(Message(role="assistant", content=content or "[tools] executing", tool_calls=tool_calls_payload))
+            self.memory.add(Message(role="assistant", content=content or "[tools] executing",
+                                    tool_calls=self._tool_calls_payload(self.tool_calls)))
             return True
         else:
             # 没有工具调用
@@ -259,7 +386,7 @@ class MCPToolCallAgent(ReActAgent):
                 return False
             else:
                 # 无内容且无工具调用，检查是否需要生成最终答案
-                tool_call_count = len([m for m in self.messages if m.role == "tool"])
+                tool_call_count = self.memory.count("tool")
 
                 # 检查是否刚完成了检索工具调用
                 recent_tool_calls = [m for m in self.messages[-5:] if m.role == "tool"]
@@ -382,12 +509,15 @@ class MCPToolCallAgent(ReActAgent):
                     total_chars = sum(len(m["content"]) for m in filtered_messages)
                     self._log.info(f"构建的精简上下文: {len(filtered_messages)}条消息, 总字符数: {total_chars}")
 
-                    completion = self._client.chat.completions.create(
+                    completion = await self._chat_message(
                         model=self.model,
                         messages=filtered_messages,
-                        max_completion_tokens=4096
+                        max_completion_tokens=4096,
                     )
-                    response_content = completion.choices[0].message.content.strip()
+                    if completion is None:
+                        response_content = self.LLM_UNAVAILABLE_MESSAGE
+                    else:
+                        response_content = (completion.content or "").strip()
 
                     # 添加到消息历史
                     self.memory.add(Message.assistant(response_content))
@@ -397,6 +527,8 @@ class MCPToolCallAgent(ReActAgent):
                     self.state = AgentState.FINISHED
                     return response_content
 
+                except OperationCancelled:
+                    raise
                 except Exception as e:
                     self._log.exception("调用LLM生成最终回答失败")
                     return f"生成最终回答时出错: {e}"
@@ -420,38 +552,35 @@ class MCPToolCallAgent(ReActAgent):
         results: List[str] = []
         has_retrieve_calls = False
 
-        for tc in self.tool_calls:
+        # 同一轮的工具调用由模型一次性给出、互不依赖，并发执行（受 max_parallel_tool_calls 限制），
+        # 本轮耗时取决于最慢的工具；观察结果仍按原调用顺序写入记忆，满足 OpenAI 对 tool 消息顺序的约束
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel_tool_calls))
+
+        async def _bounded(tc: ToolCall) -> Tuple[str, float]:
+            async with semaphore:
+                self._publish({"status": "tool", "content": {"name": tc.function.name, "state": "started"}})
+                started = time.perf_counter()
+                observation = await self._execute_tool_call(tc)
+                elapsed = time.perf_counter() - started
+                self._publish({"status": "tool", "content": {
+                    "name": tc.function.name,
+                    "state": "failed" if observation.startswith("Error:") else "finished",
+                    "elapsed": round(elapsed, 3),
+                }})
+                return observation, elapsed
+
+        turn_started = time.perf_counter()
+        outcomes = await run_cancellable(asyncio.gather(*(_bounded(tc) for tc in self.tool_calls)), self.cancel_token)
+        if len(self.tool_calls) > 1:
+            durations = ", ".join(f"{tc.function.name}={elapsed:.2f}s" for tc, (_, elapsed) in zip(self.tool_calls, outcomes))
+            self._log.info(f"本轮 {len(self.tool_calls)} 个工具并发执行完成，耗时 {time.perf_counter() - turn_started:.2f}s（{durations}）")
+
+        for tc, (observation, _) in zip(self.tool_calls, outcomes):
             name = tc.function.name
-            try:
-                args = json.loads(tc.function.arguments or "{}")
-            except Exception:
-                args = {}
-
-            handler = self._registry.get_tool_handler(name)
-            if not handler:
-                observation = f"Error: Unknown tool '{name}'"
-                self.memory.add(Message.tool(observation, tool_call_id=tc.id, name=name))
-                results.append(observation)
-                continue
-
-            # 透传少量上下文给安全/审计层
-            args = {**args, "agent_name": self.name, "user_clearance": "MEDIUM"}
-
-            # 为检索工具添加默认集合名称
-            if name == "retrieve" and "collection_name" not in args:
-                args["collection_name"] = "japan_shrimp"
-
-            try:
-                result = await handler(**args)
-                observation = json.dumps(result, ensure_ascii=False)
-
-                # 检查是否是需要后续处理的工具（检索或数据库查询）
-                if name in ["retrieve", "read_sql_query", "list_sql_tables", "get_tables_schema"]:
-                    has_retrieve_calls = True
-                    self._log.info(f"检测到数据获取工具调用({name})，将在后续生成自然语言回答")
-
-            except Exception as e:
-                observation = f"Error: {e}"
+            # 检查是否是需要后续处理的工具（检索或数据库查询）
+            if name in self.DATA_TOOLS and not observation.startswith("Error:"):
+                has_retrieve_calls = True
+                self._log.info(f"检测到数据获取工具调用({name})，将在后续生成自然语言回答")
 
             self.memory.add(Message.tool(observation, tool_call_id=tc.id, name=name))
             results.append(observation)
@@ -481,6 +610,43 @@ class MCPToolCallAgent(ReActAgent):
 
         return "\n\n".join(results)
 
+    def _tool_timeout(self, name: str) -> Optional[float]:
+        """工具超时：tools/config.json 中的 timeout_seconds 优先，否则用 tool_timeout_seconds；不超过请求剩余时间"""
+        config = self._registry.get_tool_config(name) or {}
+        timeout = config.get("timeout_seconds", self.tool_timeout_seconds)
+        return cap_timeout(self.cancel_token, float(timeout) if timeout else None)
+
+    async def _execute_tool_call(self, tc: ToolCall) -> str:
+        """执行单个工具调用并返回观察结果文本；未知工具、超时与异常都转为 Error 观察结果"""
+        name = tc.function.name
+        try:
+            args = json.loads(tc.function.arguments or "{}")
+        except Exception:
+            args = {}
+
+        handler = self._registry.get_tool_handler(name)
+        if not handler:
+            return f"Error: Unknown tool '{name}'"
+
+        # 透传少量上下文给安全/审计层
+        args = {**args, "agent_name": self.name, "user_clearance": "MEDIUM"}
+
+        # 为检索工具添加默认集合名称
+        if name == "retrieve" and "collection_name" not in args:
+            args["collection_name"] = "japan_shrimp"
+
+        timeout = self._tool_timeout(name)
+        try:
+            result = await asyncio.wait_for(handler(**args), timeout)
+            return json.dumps(result, ensure_ascii=False)
+        except asyncio.TimeoutError:
+            # 未设置超时时也可能由工具内部（aiohttp/MCP 客户端）抛出
+            limit = f"（{timeout:.1f}s）" if timeout else ""
+            self._log.warning(f"工具 {name} 执行超时{limit}")
+            return f"Error: 工具 {name} 执行超时{limit}"
+        except Exception as e:
+            return f"Error: {e}"
+
     def _has_sufficient_information(self) -> bool:
         """检查是否已经获得足够的信息来回答问题"""
         try:
@@ -494,7 +660,7 @@ class MCPToolCallAgent(ReActAgent):
                     return True
             
             # 检查是否已经进行了多轮工具调用（防止无限循环）
-            tool_call_count = len([m for m in self.messages if m.role == "tool"])
+            tool_call_count = self.memory.count("tool")
             if tool_call_count >= self.info_sufficient_threshold:  # 使用可配置的信息充足阈值
                 self._log.info(f"已进行{tool_call_count}次工具调用（阈值={self.info_sufficient_threshold}），认为信息充足")
                 return True
@@ -0,0 +1,149 @@
+# agents/memory.py
+"""
+Agent 对话记忆
+- messages 保存原始消息（工具结果保持原文，供整理最终回答、统计查询行数等使用）
+- 按角色的消息计数增量维护，count("tool") 为 O(1)，不必每步扫描整段历史
+- 发送给模型的 OpenAI 消息列表按消息增量序列化并缓存，每步只序列化新增的消息
+- 消息列表总 token 超过 MEMORY_TOKEN_BUDGET 时，从最早的工具结果开始替换为摘要（最近一轮工具结果保留原文），
+  每步的 prompt 大小不随会话变长而无限增长；已压缩的前缀不再变化
+"""
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from utils.context_packer import summarize_observation, token_counter
+from .core_schema import Message
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "12000"))
+# 每条消息的角色/分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class _WireEntry:
+    """一条已序列化的 OpenAI 消息；index 为对应的原始消息下标（补插的 assistant 消息为 None）"""
+    __slots__ = ("payload", "tokens", "index", "compacted")
+
+    def __init__(self, payload: Dict[str, Any], index: Optional[int]) -> None:
+        self.payload = payload
+        self.index = index
+        self.compacted = False
+        self.tokens = _payload_tokens(payload)
+
+
+def _payload_tokens(payload: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + token_counter.count(payload.get("content") or "")
+    if payload.get("tool_calls"):
+        tokens += token_counter.count(json.dumps(payload["tool_calls"], ensure_ascii=False))
+    return tokens
+
+
+class Memory:
+    def __init__(self, messages: Optional[List[Message]] = None, token_budget: int = MEMORY_TOKEN_BUDGET) -> None:
+        self.token_budget = token_budget
+        self._messages: List[Message] = []
+        self.messages = list(messages or [])
+
+    @property
+    def messages(self) -> List[Message]:
+        return self._messages
+
+    @messages.setter
+    def messages(self, value: List[Message]) -> None:
+        # `agent.messages += [...]` 会原地追加后再赋回同一个列表，此时只需增量处理新消息
+        if value is self._messages:
+            return
+        self._messages = value if isinstance(value, list) else list(value)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._counted = 0
+        self._counts: Dict[str, int] = {}
+        self._serialized = 0
+        self._wire: List[_WireEntry] = []
+        self._wire_tokens = 0
+        # 最近的消息处于工具调用批次中（带 tool_calls 的 assistant 消息及其后的 tool 消息）
+        self._in_tool_batch = False
+        # 最近一次带 tool_calls 的 assistant 消息在 _wire 中的位置，其后的工具结果不压缩
+        self._batch_start = 0
+        self._compact_cursor = 0
+        self.compacted = 0
+
+    def add(self, message: Message) -> None:
+        self._messages.append(message)
+
+    def _sync_counts(self) -> None:
+        if self._counted > len(self._messages):
+            # 消息列表被外部截短，重新统计
+            self._reset()
+        for message in self._messages[self._counted:]:
+            self._counts[message.role] = self._counts.get(message.role, 0) + 1
+        self._counted = len(self._messages)
+
+    def count(self, role: str) -> int:
+        """某一角色的消息条数"""
+        self._sync_counts()
+        return self._counts.get(role, 0)
+
+    def _append_wire(self, payload: Dict[str, Any], index: Optional[int]) -> None:
+        entry = _WireEntry(payload, index)
+        self._wire.append(entry)
+        self._wire_tokens += entry.tokens
+
+    def _serialize(self, index: int, fallback_tool_calls: Optional[List[Dict[str, Any]]]) -> None:
+        m = self._messages[index]
+        if m.role == "tool":
+            # 为满足 OpenAI 对 tool 消息的约束：必须紧随带有 tool_calls 的 assistant 消息之后
+            # 若历史消息中没有保存带 tool_calls 的 assistant，则用调用方给出的 tool_calls 补一条
+            if not self._in_tool_batch and fallback_tool_calls:
+                self._batch_start = len(self._wire)
+                self._append_wire({"role": "assistant", "content": None, "tool_calls": fallback_tool_calls}, None)
+                self._in_tool_batch = True
+            self._append_wire({"role": "tool", "content": m.content or "", "tool_call_id": m.tool_call_id}, index)
+        elif m.role == "assistant":
+            # 保留 assistant 消息上的 tool_calls，确保后续 tool 消息的 tool_call_id 能被正确匹配
+            payload: Dict[str, Any] = {"role": "assistant", "content": m.content or ""}
+            self._in_tool_batch = bool(m.tool_calls)
+            if m.tool_calls:
+                payload["tool_calls"] = m.tool_calls
+                self._batch_start = len(self._wire)
+            self._append_wire(payload, index)
+        elif m.role in ("user", "system"):
+            self._in_tool_batch = False
+            self._append_wire({"role": m.role, "content": m.content or ""}, index)
+
+    def _compact(self) -> None:
+        """从最早的工具结果开始替换为摘要，直到总 token 不超过预算；最近一轮的工具结果保留原文"""
+        while self._wire_tokens > self.token_budget and self._compact_cursor < self._batch_start:
+            entry = self._wire[self._compact_cursor]
+            self._compact_cursor += 1
+            if entry.payload["role"] != "tool" or entry.compacted:
+                continue
+            entry.compacted = True
+            summary = summarize_observation(self._messages[entry.index].name, entry.payload["content"])
+            payload = {**entry.payload, "content": summary}
+            tokens = _payload_tokens(payload)
+            if tokens >= entry.tokens:
+                continue
+            entry.payload = payload
+            self._wire_tokens += tokens - entry.tokens
+            entry.tokens = tokens
+            self.compacted += 1
+
+    def to_chat_messages(self, fallback_tool_calls: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        OpenAI Chat Completions 格式的消息列表（增量序列化，必要时压缩较早的工具结果）。
+        返回的字典与缓存共享，调用方不应修改。
+        """
+        if self._serialized > len(self._messages):
+            self._reset()
+        for index in range(self._serialized, len(self._messages)):
+            self._serialize(index, fallback_tool_calls)
+        self._serialized = len(self._messages)
+        self._compact()
+        return [entry.payload for entry in self._wire]
+
+    @property
+    def wire_tokens(self) -> int:
+        """最近一次 to_chat_messages() 结果的 token 数"""
+        return self._wire_tokens
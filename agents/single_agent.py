@@ -2,19 +2,26 @@
 """
 极简Agent - 固定执行两个工具，零中间层，最快速度
 执行流程：
-1. 使用小模型（gpt-4o-mini）快速生成SQL查询
+1. 生成SQL查询：常见传感器问题由本地模板直接生成（utils/sensor_sql.py），置信度低时才调用大模型
 2. 固定执行 retrieve 知识库检索
 3. 固定执行 read_query_for_sensor_readings 传感器数据查询（使用生成的SQL）
-4. 将所有结果拼接到prompt中，一次生成最终答案
+4. 将所有结果按 token 预算紧凑打包到prompt中（utils/context_packer.py），一次生成最终答案
+
+检索与"SQL生成 → 传感器查询"两条链路并发执行；全部基于 AsyncOpenAI，
+同步入口 run() 在常驻的后台事件循环中驱动 arun()，不再为每个请求新建事件循环。
+各阶段耗时通过 meta 事件（content.timings）上报并记录日志。
 """
 from __future__ import annotations
 import os
-import json
 import asyncio
-from typing import List, Dict, Any, Optional, Generator
-from openai import OpenAI
+import time
+from typing import List, Dict, Any, Optional, Generator, AsyncGenerator
 from ToolOrchestrator.client.client import MultiServerMCPClient
-from ToolOrchestrator.core.config import settings
+from utils.cancellation import CancellationToken, OperationCancelled, cap_timeout, run_cancellable
+from utils.client_pool import get_mcp_client, llm_client_pool
+from utils.context_packer import context_packer, token_counter
+from utils.event_loop import background_loop
+from utils.sensor_sql import SENSOR_SQL_MIN_CONFIDENCE, SENSOR_SQL_TEMPLATES_ENABLED, SqlPlan, plan_sensor_sql
 from utils.logger import get_logger
 from dotenv import load_dotenv
 load_dotenv()
@@ -29,6 +36,13 @@ class SingleAgent:
     - 将结果拼接到prompt中，一次性生成最终答案
     - 完全绕过ToolRegistry安全检查层，达到最快响应速度
     """
+
+    # 默认检索的知识库集合与返回片段数
+    DEFAULT_COLLECTION = "japan_shrimp"
+    DEFAULT_TOPK = 5
+    # 各阶段自身的超时上限（秒），带截止时间的请求再限制在剩余时间内
+    SQL_TIMEOUT_SECONDS = 20.0
+    ANSWER_TIMEOUT_SECONDS = 120.0
     
     def __init__(
         self,
@@ -48,7 +62,7 @@ class SingleAgent:
         api_key = os.environ.get("OPENAI_API_KEY") or os.environ.get("GPT_API_KEY")
         if not api_key:
             raise ValueError("未找到 OPENAI_API_KEY 或 GPT_API_KEY 环境变量")
-        self.client = OpenAI(api_key=api_key)
+        self._api_key = api_key
         
         # 配置
         self.model = model
@@ -60,28 +74,34 @@ class SingleAgent:
         
         self.system_prompt = system_prompt + default_prompt if system_prompt else default_prompt
         
-        # MCP客户端（直接调用，无安全检查）
+        # MCP客户端（直接调用，无安全检查），借用进程内共享实例
         self.mcp_client: Optional[MultiServerMCPClient] = None
         
         logger.info(f"SingleAgent 初始化完成，模型: {model}, 最大步数: {max_steps}")
+
+    @property
+    def async_client(self):
+        """从进程级客户端池借用当前事件循环上的 AsyncOpenAI 客户端，请求之间复用 keep-alive 连接"""
+        return llm_client_pool.get_async(api_key=self._api_key)
     
     async def initialize(self):
-        """异步初始化MCP客户端"""
+        """借用共享的MCP客户端（工具只在进程内首次使用时发现）"""
         if self.mcp_client is not None:
             return
-        
-        # 直接初始化MCP客户端
-        self.mcp_client = MultiServerMCPClient(settings.MCP_CLIENT_CONFIG)
-        await self.mcp_client.get_tools()
-        
-        logger.info("MCP客户端初始化完成，已准备直接调用工具")
+        self.mcp_client = await get_mcp_client()
     
-    async def _generate_sql(self, user_query: str) -> str:
+    @staticmethod
+    def _timeout_kwargs(timeout: float, cancel_token: Optional[CancellationToken]) -> Dict[str, float]:
+        """OpenAI 请求的超时参数：阶段上限与请求剩余时间取较小值"""
+        return {"timeout": cap_timeout(cancel_token, timeout)}
+
+    async def _generate_sql(self, user_query: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """
-        使用小模型快速生成SQL查询语句
+        模板未命中时使用大模型生成SQL查询语句
         
         Args:
             user_query: 用户查询
+            cancel_token: 取消令牌，其截止时间限制本次生成的超时
             
         Returns:
             SQL查询语句
@@ -110,10 +130,11 @@ sensor_readings表结构：
 SQL语句："""
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.async_client.chat.completions.create(
                 model=self.model, 
                 messages=[{"role": "user", "content": sql_prompt}],
-                max_completion_tokens=5000
+                max_completion_tokens=5000,
+                **self._timeout_kwargs(self.SQL_TIMEOUT_SECONDS, cancel_token)
             )
             
             sql_query = response.choices[0].message.content.strip()
@@ -127,64 +148,141 @@ SQL语句："""
             logger.error(f"SQL生成失败: {e}，使用默认查询")
             return "SELECT * FROM sensor_readings ORDER BY recorded_at DESC LIMIT 10"
     
-    def run(self, user_query: str, collection_name: str = "japan_shrimp", k: int = 5) -> Generator[Dict[str, Any], None, None]:
+    @staticmethod
+    def _template_sql(user_query: str) -> Optional[SqlPlan]:
+        """本地模板生成SQL；置信度不足或未启用时返回 None，由大模型生成"""
+        if not SENSOR_SQL_TEMPLATES_ENABLED:
+            return None
+        try:
+            plan = plan_sensor_sql(user_query)
+        except Exception as e:
+            logger.warning(f"SQL模板抽取失败，改用大模型生成: {e}")
+            return None
+        if plan.confidence < SENSOR_SQL_MIN_CONFIDENCE:
+            logger.info(f"SQL模板置信度不足({plan.template}, {plan.confidence})，改用大模型生成")
+            return None
+        return plan
+
+    @staticmethod
+    async def _timed(timings: Dict[str, float], stage: str, awaitable) -> Any:
+        """等待 awaitable 并把耗时（秒）记录到 timings[stage]"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = round(time.perf_counter() - started, 3)
+
+    async def _prepare(self, user_query: str, collection_name: str, k: int,
+                       cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """
-        执行查询任务（同步生成器）- 固定执行两个工具，然后拼接结果生成答案，流式返回。
+        准备阶段：检索知识库、生成并执行SQL，构造包含数据的增强prompt
+        cancel_token 被取消时抛出 OperationCancelled，排队中的检索与数据库查询随之停止
         """
-        import time
-        start_time = time.time()
-
-        async def _prepare() -> Dict[str, Any]:
-            # 确保工具已初始化
-            await self.initialize()
-
-            logger.info(f"开始处理查询: {user_query}")
-
-            # 步骤1&2: 并行执行SQL生成和知识库检索
-            logger.info("=== 步骤1&2: 并行执行SQL生成和知识库检索 ===")
-            sql_query, retrieve_result = await asyncio.gather(
-                self._generate_sql(user_query),
-                self.mcp_client.invoke("retrieve", {
-                    "collection_name": collection_name,
-                    "question": user_query,
-                    "k": k
-                })
-            )
-            logger.info(f"SQL生成完成: {sql_query}")
-            logger.info("知识库检索完成")
-
-            # 步骤3: 执行传感器数据查询
-            logger.info("=== 步骤3: 传感器数据查询 ===")
-            sensor_result = await self.mcp_client.invoke("read_query_for_sensor_readings", {
-                "table_queries": [
-                    {
-                        "query": sql_query
-                    }
-                ]
-            })
-            logger.info("传感器数据查询完成")
+        timings: Dict[str, float] = {}
+        sql_source = "llm"
+        started = time.perf_counter()
+        # 确保工具已初始化
+        await self._timed(timings, "initialize", self.initialize())
 
-            # 构造包含数据的增强prompt
-            enhanced_prompt = f"""请基于以下数据回答用户问题。
+        logger.info(f"开始处理查询: {user_query}")
 
-【用户问题】
-{user_query}
+        # 传感器查询只依赖生成的SQL，不等待检索：SQL生成 → 传感器查询 与 知识库检索 两条链路并发
+        async def _sensor_branch():
+            nonlocal sql_source
+            plan = self._template_sql(user_query)
+            if plan is not None:
+                # 模板命中：省去一次大模型调用
+                sql_query, sql_source = plan.sql, f"template:{plan.template}"
+                timings["sql_generation"] = 0.0
+            else:
+                sql_query = await self._timed(timings, "sql_generation", self._generate_sql(user_query, cancel_token))
+            logger.info(f"SQL生成完成({sql_source}): {sql_query}")
+            sensor_result = await self._timed(timings, "sensor_query", self.mcp_client.invoke(
+                "read_query_for_sensor_readings", {
+                    "table_queries": [
+                        {
+                            "query": sql_query
+                        }
+                    ]
+                }, cancel_token=cancel_token))
+            return sql_query, sensor_result
 
-【知识库检索结果】
-{json.dumps(retrieve_result, ensure_ascii=False, indent=2)}
+        logger.info("=== 并发执行: 知识库检索 | SQL生成 → 传感器数据查询 ===")
+        (sql_query, sensor_result), retrieve_result = await run_cancellable(asyncio.gather(
+            _sensor_branch(),
+            self._timed(timings, "retrieve", self.mcp_client.invoke("retrieve", {
+                "collection_name": collection_name,
+                "question": user_query,
+                "k": k
+            }, cancel_token=cancel_token)),
+        ), cancel_token)
+        sensor_rows = self._count_sensor_rows(sensor_result)
+        timings["prepare"] = round(time.perf_counter() - started, 3)
+        logger.info(f"知识库检索与传感器数据查询完成，共 {sensor_rows} 条记录，阶段耗时: {timings}")
 
-【传感器数据查询】
-查询结果: {json.dumps(sensor_result, ensure_ascii=False, indent=2)}
+        # 按 token 预算打包检索片段与传感器数据（紧凑表格、片段去重）
+        packed = context_packer.pack(user_query, retrieve_result, sensor_result)
+        logger.info(f"上下文打包完成: {packed.stats()}")
 
-请综合以上数据，给出简洁准确的回答。如果无关则忽略数据信息，直接回答用户问题。"""
+        return {
+            "enhanced_prompt": packed.text,
+            "context": packed.stats(),
+            "sensor_rows": sensor_rows,
+            "sql_source": sql_source,
+            "timings": timings
+        }
 
-            return {
-                "enhanced_prompt": enhanced_prompt
-            }
+    @staticmethod
+    def _count_sensor_rows(sensor_result: Any) -> int:
+        """统计传感器查询返回的记录数"""
+        if not isinstance(sensor_result, dict):
+            return 0
+        result = sensor_result.get("result") or {}
+        if not isinstance(result, dict):
+            return 0
+        return sum(len(item.get("rows") or []) for item in result.get("results", []) if isinstance(item, dict))
 
-        # 运行准备阶段（一次事件循环）
+    @staticmethod
+    def _meta_event(prep: Dict[str, Any]) -> Dict[str, Any]:
+        """准备阶段的元信息（不发送给客户端，供编排层判断答案缓存TTL等）"""
+        return {
+            "status": "meta",
+            "content": {"sensor_rows": prep["sensor_rows"], "sql_source": prep.get("sql_source"),
+                        "context": prep.get("context"), "timings": dict(prep["timings"])}
+        }
+
+    def _build_final_input(self, enhanced_prompt: str) -> List[Dict[str, str]]:
+        """构造最终答案生成的输入，并用本地分词器记录输入token数"""
+        system_tokens = token_counter.count(self.system_prompt)
+        user_tokens = token_counter.count(enhanced_prompt)
+        total_input_tokens = system_tokens + user_tokens
+        logger.info(f"最终答案生成 - 输入token({token_counter.name}): system={system_tokens}, user={user_tokens}, total={total_input_tokens}")
+
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": enhanced_prompt}
+        ]
+
+    def run(self, user_query: str, collection_name: str = DEFAULT_COLLECTION, k: int = DEFAULT_TOPK,
+            cancel_token: Optional[CancellationToken] = None) -> Generator[Dict[str, Any], None, None]:
+        """
+        执行查询任务（同步生成器）- 固定执行两个工具，然后拼接结果生成答案，流式返回。
+        在常驻的后台事件循环中驱动 arun()，事件格式相同。
+        cancel_token 被取消（客户端断开或超过截止时间）时停止检索/数据库查询并关闭 OpenAI 流，不再产出事件。
+        """
+        yield from background_loop.iterate(self.arun(user_query, collection_name, k, cancel_token), cancel_token)
+
+    async def arun(self, user_query: str, collection_name: str = DEFAULT_COLLECTION, k: int = DEFAULT_TOPK,
+                   cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        异步生成器版本，ASGI 服务直接使用，run() 在后台事件循环中驱动。
+        等待 OpenAI/检索/数据库期间只占用协程，不占用线程。
+        """
         try:
-            prep = asyncio.run(_prepare())
+            prep = await self._prepare(user_query, collection_name, k, cancel_token)
+        except OperationCancelled:
+            logger.info("请求已取消，终止准备阶段")
+            return
         except Exception as e:
             logger.error(f"准备阶段失败: {e}")
             yield {
@@ -193,52 +291,55 @@ SQL语句："""
             }
             return
 
-        enhanced_prompt = prep["enhanced_prompt"]
-
-        # 计算输入token数量（粗略估计）
-        def estimate_tokens(text: str) -> int:
-            chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-            other_chars = len(text) - chinese_chars
-            return int(chinese_chars / 2 + other_chars / 4)
-
-        system_tokens = estimate_tokens(self.system_prompt)
-        user_tokens = estimate_tokens(enhanced_prompt)
-        total_input_tokens = system_tokens + user_tokens
-        logger.info(f"最终答案生成 - 输入token估计: system={system_tokens}, user={user_tokens}, total={total_input_tokens}")
+        yield self._meta_event(prep)
+        final_input = self._build_final_input(prep["enhanced_prompt"])
+        timings = prep["timings"]
+        answer_started = time.perf_counter()
 
-        # 步骤4: 调用OpenAI生成最终答案（流式）
+        response = None
         try:
-            response = self.client.responses.create(
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            response = await self.async_client.responses.create(
                 model=self.model,
-                input=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": enhanced_prompt}
-                ],
-                stream=True
+                input=final_input,
+                stream=True,
+                **self._timeout_kwargs(self.ANSWER_TIMEOUT_SECONDS, cancel_token)
             )
 
-            for event in response:
+            delta_count = 0
+            async for event in response:
+                if cancel_token is not None and cancel_token.cancelled:
+                    logger.info(f"请求已取消，停止生成答案（已生成 {delta_count} 个增量）")
+                    return
                 if hasattr(event, "delta"):
-                    content = event.delta
-                    logger.info(f"流式答案: {content}")
+                    if delta_count == 0:
+                        timings["answer_first_token"] = round(time.perf_counter() - answer_started, 3)
+                    delta_count += 1
                     yield {
                         "status": "stream",
-                        "content": content
+                        "content": event.delta
                     }
+            timings["answer"] = round(time.perf_counter() - answer_started, 3)
+            logger.info(f"流式答案生成完成，共 {delta_count} 个增量，阶段耗时: {timings}")
+            yield {"status": "meta", "content": {"timings": timings}}
 
             yield {
                 "status": "final",
                 "content": "查询处理结束"
             }
+        except OperationCancelled:
+            logger.info("请求已取消，终止生成答案")
         except Exception as e:
             logger.error(f"OpenAI API 调用失败: {e}")
             yield {
                 "type": "error",
                 "content": f"抱歉，生成答案时出错: {e}"
             }
+        finally:
+            if response is not None:
+                await response.close()
     
     async def cleanup(self):
-        """清理资源"""
-        if self.mcp_client:
-            await self.mcp_client.close()
-            logger.info("MCP客户端已关闭")
+        """归还借用的客户端；共享客户端由进程生命周期管理，不在这里关闭"""
+        self.mcp_client = None
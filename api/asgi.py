@@ -0,0 +1,136 @@
+"""
+ASGI 入口（生产环境）
+- /sse/stream_qa 由原生异步路由处理：agent 以异步生成器运行，
+  每个等待 OpenAI/检索/数据库的流只占用一个协程，而不是一个 OS 线程
+- 其余路由（知识库管理、agent_config、/metrics）复用 Flask 应用，通过 WSGI 中间件挂载
+
+启动方式:
+    uvicorn api.asgi:app --host 0.0.0.0 --port 5001
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from agent_orchestrator import amain as arun_orchestrator
+from api.main import app as flask_app, initialize_models
+from api.rate_limit import check_request
+from api.routes.qa_sse import session_store, startup_pending
+from api.startup import startup
+from api.stream_runs import RunConflictError, resume_failed_frame, run_conflict_frame, stream_runs
+from api.sse_stream import (
+    SSE_HEADERS,
+    SIMULATED_AGENT_ENABLED,
+    SIMULATED_AGENT_TYPE,
+    asimulated_agent,
+    parse_stream_request,
+    sse_format,
+)
+
+logger = logging.getLogger("API_Server_ASGI")
+logger.setLevel(logging.INFO)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("ASGI 服务启动，后台并行初始化Embedding模型、集合、工具与队列...")
+    # 初始化在后台线程中进行，服务立即开始监听；就绪前 /ready 返回503、问答请求被拒绝
+    initialize_models(wait=False)
+    yield
+    logger.info("ASGI 服务已停止")
+
+
+app = FastAPI(
+    title="Camel Agent API",
+    description="流式问答与知识库管理服务",
+    lifespan=lifespan
+)
+
+
+def resolve_async_agent(agent_type: str):
+    """根据 agent_type 选择异步的 agent 事件生成函数"""
+    if SIMULATED_AGENT_ENABLED and agent_type == SIMULATED_AGENT_TYPE:
+        return asimulated_agent
+    agent_functions = {
+        'japan': arun_orchestrator,
+        'default': arun_orchestrator
+    }
+    return agent_functions.get(agent_type, agent_functions['default'])
+
+
+@app.api_route("/sse/stream_qa", methods=["GET", "POST"])
+async def stream_qa(request: Request):
+    try:
+        if request.method == "GET":
+            stream_request = parse_stream_request(dict(request.query_params))
+        else:  # POST
+            stream_request = parse_stream_request(await request.json())
+    except Exception as e:
+        logger.error(f"收到SSE请求失败{e}")
+        return JSONResponse({"error": "收到SSE请求失败"}, status_code=400)
+    session_id = stream_request.session_id
+    stream_request.last_event_id = request.headers.get("last-event-id") or stream_request.last_event_id
+
+    # 断线重连：从回放缓冲续传，agent 运行不受影响
+    if stream_request.last_event_id:
+        run, seq = stream_runs.find_resumable(stream_request.last_event_id, session_id)
+        if run is None:
+            logger.info(f"续传失败，消息不存在或已过期: {stream_request.last_event_id}")
+
+            async def resume_failed():
+                yield resume_failed_frame()
+            return StreamingResponse(resume_failed(), media_type="text/event-stream", headers=SSE_HEADERS)
+        logger.info(f"SSE续传 - Message ID: {run.message_id}, 从第 {seq} 帧之后继续")
+        return StreamingResponse(run.aiter_frames(seq), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    logger.info(f"收到SSE请求 - Session ID: {session_id}, Query: {stream_request.query}, Agent Type: {stream_request.agent_type}")
+
+    # 原生异步路由不经过 Flask 的 before_request，在此单独限流
+    decision = check_request(request.url.path, {"session_id": session_id}, request.headers,
+                             request.client.host if request.client else None)
+    if not decision.allowed:
+        async def rate_limited():
+            yield decision.sse_frame()
+        return StreamingResponse(rate_limited(), status_code=429, media_type="text/event-stream",
+                                 headers={**SSE_HEADERS, "Retry-After": decision.retry_after_header})
+
+    if startup_pending(stream_request):
+        logger.info(f"服务启动中，拒绝请求: status={startup.status()}")
+        return JSONResponse({"error": "服务启动中，请稍后重试", "startup": startup.status()}, status_code=503)
+
+    # 获取会话租约，会话正在进行中时拒绝；sqlite/socket 后端为阻塞调用，放到线程中执行
+    lease = await asyncio.to_thread(session_store.lease, session_id)
+    if lease is None:
+        logger.info(f"会话进行中，拒绝重复请求: {session_id}")
+
+        async def empty_gen():
+            yield sse_format('{"error": "会话已开启}')
+        return StreamingResponse(empty_gen(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    agent_function = resolve_async_agent(stream_request.agent_type)
+
+    # agent 以独立任务运行并写入回放缓冲，客户端断开时 Starlette 只取消消费者生成器，
+    # 宽限期内重连可续传，超过宽限期运行被取消；租约由运行持有、运行结束时释放
+    try:
+        run = stream_runs.create(stream_request, lease)
+    except RunConflictError as e:
+        logger.info(f"拒绝请求: {e}")
+        await asyncio.to_thread(lease.release)
+
+        async def conflict():
+            yield run_conflict_frame()
+        return StreamingResponse(conflict(), media_type="text/event-stream", headers=SSE_HEADERS)
+    run.start_task(agent_function(stream_request.query, stream_request.config, cancel_token=run.cancel_token))
+    return StreamingResponse(run.aiter_frames(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# 其余路由交给 Flask 应用处理（同步路由在线程池中执行）
+app.mount("/", WSGIMiddleware(flask_app))
+
+
+if __name__ == "__main__":
+    uvicorn.run("api.asgi:app", host="0.0.0.0", port=5001, log_level="info")
@@ -0,0 +1,44 @@
+"""
+知识库入库任务
+上传/建库/向量化接口通过 get_ingestion_service().submit() 登记任务后立即返回任务 id，
+进度通过 /jobs/<id>/events 查看。任务类型:
+- create_kb: 向量化知识库目录 data/raw_data/<kb_name> 下的全部文件
+- add_file: 向量化单个文件并写入 kb_name 集合
+"""
+import threading
+from typing import Optional
+
+from queue_rag.ingestion_jobs import IngestionJob, IngestionJobStore, IngestionService
+
+CREATE_KB = "create_kb"
+ADD_FILE = "add_file"
+
+_service: Optional[IngestionService] = None
+_service_lock = threading.Lock()
+
+
+def _create_kb(job: IngestionJob, progress) -> None:
+    from ToolOrchestrator.tools.kb_tools import create
+    if create(job.kb_name, progress=progress, start_at=job.checkpoint) is None:
+        raise RuntimeError(f"知识库集合创建失败: {job.kb_name}")
+
+
+def _add_file(job: IngestionJob, progress) -> None:
+    from ToolOrchestrator.tools.kb_tools import add_file
+    add_file(job.path, job.kb_name, progress=progress, start_at=job.checkpoint)
+
+
+def get_ingestion_service() -> IngestionService:
+    """进程内共享的入库服务；worker 在首次提交或启动步骤 ingestion 中启动"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = IngestionService(IngestionJobStore(), {CREATE_KB: _create_kb, ADD_FILE: _add_file})
+        return _service
+
+
+def submit_job(kind: str, kb_name: str, path: Optional[str] = None) -> IngestionJob:
+    service = get_ingestion_service()
+    job = service.submit(kind, kb_name, path)
+    service.start()
+    return job
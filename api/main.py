@@ -1,88 +1,164 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from api.routes.knowledge_base import knowledgebase
 from api.routes.qa_sse import sse
+from api.routes.metrics import metrics
+from api.routes.health import health
+from api.routes.jobs import jobs
+from api.ingestion import get_ingestion_service
+from api.rate_limit import check_request
+from api.sse_stream import SSE_HEADERS
+from api.startup import StartupStep, startup
 import logging
 import threading
 import os
-import asyncio
+import time
+from typing import List
 from models.model_manager import model_manager
 from models.collection_manager import collection_manager
-from queue_rag.queue_server import start_rag_service, is_running
+from queue_rag.queue_server import start_rag_service, is_running, run_in_queue
+from utils.context_packer import token_counter
+from utils.event_loop import background_loop
 from utils.global_tool_manager import async_initialize_global_tools
+from utils.schema_catalog import schema_catalog
+
+from utils.logger import setup_logging
 
 app = Flask(__name__)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 异步日志：格式化与写文件在后台线程完成，请求延迟不受日志量影响
+setup_logging()
 logger = logging.getLogger("API_Server")
 logger.setLevel(logging.INFO)
 
 # 注册路由
 app.register_blueprint(knowledgebase)
 app.register_blueprint(sse)
+app.register_blueprint(metrics)
+app.register_blueprint(health)
+app.register_blueprint(jobs)
+
+
+@app.before_request
+def _rate_limit():
+    """按路由的 session/client/global 令牌桶限流，超限时立即返回 429 与 Retry-After"""
+    params = dict(request.args)
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            params.update(body)
+    decision = check_request(request.path, params, request.headers, request.remote_addr)
+    if decision.allowed:
+        return None
+    headers = {"Retry-After": decision.retry_after_header}
+    if request.path.startswith("/sse/stream_qa"):
+        return Response(iter([decision.sse_frame()]), status=429, mimetype="text/event-stream",
+                        headers={**SSE_HEADERS, **headers})
+    return jsonify(decision.to_dict()), 429, headers
+
+
+# 预加载的知识库集合
+PRELOAD_COLLECTIONS = ["japan_shrimp", "bank", "all_data", "knowledge_base"]
+# 预热：在每个预加载集合中执行示例查询（加载 CUDA kernel、分词器缓存等一次性开销），完成后才报告就绪
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+STARTUP_WARMUP_QUERIES = [q for q in os.getenv("STARTUP_WARMUP_QUERIES", "养殖水温多少合适|溶解氧偏低怎么办").split("|") if q.strip()]
+
+
+def _init_embedding_model():
+    model_manager.initialize_embedding_model(model_path="models/multilingual-e5-large")
+
+
+def _init_vector_store():
+    model_manager.initialize_vector_client(persist_path="data/vector_data", vector_size=1024)
+
+
+def _init_collections():
+    collection_manager.initialize_collections(
+        persist_path="data/vector_data",
+        vector_size=1024,
+        preload_collections=PRELOAD_COLLECTIONS
+    )
+
+
+def _init_tools():
+    # 在共享的后台事件循环上初始化：MCP/aiohttp 客户端按事件循环缓存，须与之后的工具调用在同一个循环上创建
+    if not background_loop.run(async_initialize_global_tools()):
+        raise RuntimeError("全局MCP工具注册器初始化失败")
+
+
+def _start_queue():
+    if is_running():
+        logger.info("RAG队列服务已在运行，跳过启动")
+        return
+    logger.info("启动RAG队列服务（单线程，FIFO）...")
+    start_rag_service(num_workers=1)
+
+
+def _load_tokenizer():
+    """预先加载上下文打包用的本地分词器，避免首个请求付出编码表加载时间"""
+    logger.info(f"上下文分词器: {token_counter.name}")
+
+
+def _load_schema_catalog():
+    """读取数据库结构目录供 DataAgent 的系统提示使用，并开始定时刷新"""
+    loaded = background_loop.run(schema_catalog.refresh())
+    schema_catalog.start_scheduled_refresh()
+    if not loaded:
+        raise RuntimeError(f"数据库结构目录加载失败: {schema_catalog.last_error}")
+    return schema_catalog.stats()
+
+
+def _warm_up():
+    """在每个预加载集合中嵌入并检索示例查询；检索走RAG队列，与线上请求路径一致"""
+    timings = {}
+    for collection_name in PRELOAD_COLLECTIONS:
+        vectorstore = collection_manager.get_vectorstore(collection_name)
+        started = time.time()
+        for query in STARTUP_WARMUP_QUERIES:
+            run_in_queue(vectorstore.similarity_search, f"query: {query}", k=1)
+        timings[collection_name] = round(time.time() - started, 3)
+    logger.info(f"预热完成: {timings}")
+    return timings
+
+
+def _start_ingestion():
+    """启动入库 worker：已退出进程遗留的任务重新排队并从检查点续传"""
+    get_ingestion_service().start()
+
+
+def build_startup_steps() -> List[StartupStep]:
+    """启动步骤及其依赖：模型、向量库、工具、队列并行初始化，集合与预热在依赖就绪后执行"""
+    steps = [
+        StartupStep("embedding_model", _init_embedding_model),
+        StartupStep("vector_store", _init_vector_store),
+        StartupStep("collections", _init_collections, depends_on=("vector_store",)),
+        # MCP 工具注册器只被工具调用型 agent 使用，失败时服务降级运行
+        StartupStep("tools", _init_tools, required=False),
+        StartupStep("queue", _start_queue),
+        # 分词器不可用时退回按字符估算 token，不影响服务
+        StartupStep("tokenizer", _load_tokenizer, required=False),
+        # 结构目录加载失败时 DataAgent 退回用 list_sql_tables / get_tables_schema 了解表结构
+        StartupStep("schema_catalog", _load_schema_catalog, required=False),
+    ]
+    # 入库 worker 复用常驻的 Embedding 模型与RAG队列；失败时只影响上传向量化，问答不受影响
+    steps.append(StartupStep("ingestion", _start_ingestion, depends_on=("embedding_model", "collections", "queue"),
+                             required=False))
+    # 启用预热时预热是就绪的前提：预热失败则 /ready 不报告就绪，避免首批请求承担冷启动开销
+    if STARTUP_WARMUP_ENABLED and STARTUP_WARMUP_QUERIES:
+        steps.append(StartupStep("warmup", _warm_up, depends_on=("embedding_model", "collections", "queue")))
+    return steps
 
 
-def initialize_models():
-    """初始化全局Embedding模型管理器和集合管理器"""
-    # 初始化Embedding模型
-    try:
-        logger.info("开始初始化全局Embedding模型管理器...")
-        model_manager.initialize_models(
-            embedding_model_path="models/multilingual-e5-large",
-            vector_persist_path="data/vector_data",
-            vector_size=1024
-        )
-        logger.info("全局Embedding模型管理器初始化完成！")
-    except Exception as e:
-        logger.error(f"Embedding模型初始化失败: {e}")
-        # 可以选择继续运行（降级到传统模式）或退出
-        logger.warning("将使用传统模式（每次调用时加载embedding模型）")
-
-    # 初始化全局集合管理器
-    try:
-        logger.info("开始初始化全局集合管理器...")
-        collection_manager.initialize_collections(
-            persist_path="data/vector_data",
-            vector_size=1024,
-            preload_collections=["japan_shrimp", "bank", "all_data", "knowledge_base"]
-        )
-        logger.info("全局集合管理器初始化完成！")
-    except Exception as e:
-        logger.error(f"集合管理器初始化失败: {e}")
-        logger.warning("将使用传统模式（每次调用时创建集合连接）")
-
-    # 初始化全局MCP工具注册器
-    try:
-        logger.info("开始初始化全局MCP工具注册器...")
-        
-        # 在当前线程中创建新的事件循环来运行异步初始化
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            success = loop.run_until_complete(async_initialize_global_tools())
-            if success:
-                logger.info("全局MCP工具注册器初始化完成！")
-            else:
-                logger.error("全局MCP工具注册器初始化失败")
-        finally:
-            loop.close()
-            
-    except Exception as e:
-        logger.error(f"MCP工具注册器初始化失败: {e}")
-        logger.warning("将继续运行，但MCP工具功能可能不可用")
-
-    # 启动队列服务
-    try:
-        if not is_running():
-            logger.info("启动RAG队列服务（单线程，FIFO）...")
-            start_rag_service(num_workers=1)
-            logger.info("RAG队列服务启动完成")
-        else:
-            logger.info("RAG队列服务已在运行，跳过启动")
-    except Exception as e:
-        logger.error(f"RAG队列服务启动失败: {e}")
+def initialize_models(wait: bool = True) -> bool:
+    """
+    初始化Embedding模型、向量库、集合、MCP工具注册器与RAG队列，互不依赖的子系统并行初始化。
+    wait=False 时在后台启动并立即返回，进度通过 /ready 查询。返回是否已就绪。
+    """
+    if not startup.steps:
+        for step in build_startup_steps():
+            startup.add(step)
+    startup.start()
+    if wait:
+        return startup.wait()
+    return startup.ready
 
 # --- 启动服务 ---
 if __name__ == '__main__':
@@ -0,0 +1,262 @@
+"""
+令牌桶限流
+突发客户端会占满 RAG 队列，使唯一的 Embedding worker 无法公平服务其他请求。每条路由可配置三种维度的令牌桶:
+- session: 按 session_id
+- client: 按已登记的 API key（X-API-Key / Authorization，须在 RATE_LIMIT_API_KEYS 中），否则按客户端 IP：
+  默认为连接的对端地址；部署在反向代理之后时设置 RATE_LIMIT_TRUSTED_PROXIES 为可信代理层数，
+  从 X-Forwarded-For 右侧取对应一跳。客户端可随意伪造的请求头不能用作身份，否则每次换一个值就能得到新的桶
+- global: 路由全局
+
+请求须在所有适用的桶中都有令牌才放行，任一维度被限流时不扣减其他桶；被拒绝的请求立即返回 429 与 Retry-After。
+规则按路径前缀匹配（最长前缀优先），可用 RATE_LIMIT_RULES（JSON）覆盖，例如:
+    RATE_LIMIT_RULES='{"/sse/stream_qa": {"session": [0.5, 3], "client": [2, 10], "global": [20, 40]}}'
+每项为 [每秒补充令牌数, 桶容量]，null 表示不限制该维度。限流状态在进程内，多 worker 部署时 global 为每个进程的上限。
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from api.sse_stream import sse_format
+
+logger = logging.getLogger("rate_limit")
+logger.setLevel(logging.INFO)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# 进程内最多保留的桶数量，超出时淘汰最久未使用的
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+# 服务前方可信反向代理的层数；0 表示直接对外，忽略 X-Forwarded-For
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+# 已登记的 API key（逗号分隔）；只有登记过的 key 才作为客户端身份，未登记的按 IP 限流
+RATE_LIMIT_API_KEYS = frozenset(k.strip() for k in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if k.strip())
+
+SESSION = "session"
+CLIENT = "client"
+GLOBAL = "global"
+SCOPES = (SESSION, CLIENT, GLOBAL)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """每秒补充 rate 个令牌，最多积累 burst 个"""
+    rate: float
+    burst: float
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    prefix: str
+    session: Optional[Limit] = None
+    client: Optional[Limit] = None
+    global_: Optional[Limit] = None
+
+    def limits(self) -> List[Tuple[str, Limit]]:
+        scoped = ((SESSION, self.session), (CLIENT, self.client), (GLOBAL, self.global_))
+        return [(scope, limit) for scope, limit in scoped if limit is not None]
+
+
+DEFAULT_RULES = [
+    # 问答：每次请求都会排队检索并调用大模型
+    RouteLimit("/sse/stream_qa", session=Limit(0.5, 3), client=Limit(2, 10), global_=Limit(20, 40)),
+    # 知识库管理：上传与向量化占用 Embedding worker
+    RouteLimit("/knowledge_base/", client=Limit(1, 10), global_=Limit(5, 20)),
+]
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0.0
+    scope: Optional[str] = None
+    rule: Optional[str] = None
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "请求过于频繁，请稍后重试",
+            "scope": self.scope,
+            "retry_after": round(self.retry_after, 3),
+        }
+
+    def sse_frame(self) -> str:
+        """流式接口的拒绝帧，客户端按普通错误帧处理"""
+        return sse_format(json.dumps(self.to_dict(), ensure_ascii=False))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, limit: Limit, now: float):
+        self.tokens = float(limit.burst)
+        self.updated_at = now
+
+    def refill(self, limit: Limit, now: float) -> None:
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(float(limit.burst), self.tokens + elapsed * limit.rate)
+        self.updated_at = now
+
+    def wait_time(self, limit: Limit, cost: float) -> float:
+        """令牌足够时返回 0，否则返回补足所需的秒数"""
+        if self.tokens >= cost:
+            return 0.0
+        if limit.rate <= 0:
+            # 不补充令牌（桶耗尽后永久拒绝），按一小时提示重试
+            return 3600.0
+        return (cost - self.tokens) / limit.rate
+
+
+def _parse_limit(value: Any) -> Optional[Limit]:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return Limit(float(value["rate"]), float(value["burst"]))
+    rate, burst = value
+    return Limit(float(rate), float(burst))
+
+
+def parse_rules(raw: str) -> List[RouteLimit]:
+    """解析 RATE_LIMIT_RULES：{前缀: {"session": [rate, burst], "client": ..., "global": ...}}"""
+    rules = []
+    for prefix, scopes in json.loads(raw).items():
+        scopes = scopes or {}
+        rules.append(RouteLimit(
+            prefix,
+            session=_parse_limit(scopes.get(SESSION)),
+            client=_parse_limit(scopes.get(CLIENT)),
+            global_=_parse_limit(scopes.get(GLOBAL)),
+        ))
+    return rules
+
+
+def load_rules() -> List[RouteLimit]:
+    """默认规则，RATE_LIMIT_RULES 中出现的前缀覆盖同名默认规则"""
+    raw = os.getenv("RATE_LIMIT_RULES")
+    if not raw:
+        return list(DEFAULT_RULES)
+    try:
+        overrides = parse_rules(raw)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"RATE_LIMIT_RULES 解析失败，使用默认规则: {e}")
+        return list(DEFAULT_RULES)
+    prefixes = {rule.prefix for rule in overrides}
+    return [rule for rule in DEFAULT_RULES if rule.prefix not in prefixes] + overrides
+
+
+def client_identity(headers: Mapping[str, str], remote_addr: Optional[str],
+                    trusted_proxies: int = RATE_LIMIT_TRUSTED_PROXIES,
+                    api_keys: frozenset = RATE_LIMIT_API_KEYS) -> str:
+    """已登记的 API key 优先，其次为客户端 IP（只在可信代理之后才采信 X-Forwarded-For）"""
+    api_key = headers.get("X-API-Key")
+    if not api_key:
+        auth = headers.get("Authorization") or ""
+        api_key = auth[7:].strip() if auth.lower().startswith("bearer ") else None
+    if api_key and api_key in api_keys:
+        # 桶键与日志中不出现 key 原文
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    forwarded = headers.get("X-Forwarded-For")
+    if trusted_proxies > 0 and forwarded:
+        # 每层代理把其对端地址追加到末尾：最右侧 trusted_proxies 跳由可信代理写入，更左侧的可被客户端伪造
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return f"ip:{hops[-min(trusted_proxies, len(hops))]}"
+    return f"ip:{remote_addr or 'unknown'}"
+
+
+class RateLimiter:
+    """按路由规则检查并扣减令牌，线程安全"""
+
+    def __init__(self, rules: Optional[List[RouteLimit]] = None, enabled: bool = True,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        # 最长前缀优先
+        self.rules = sorted(rules if rules is not None else DEFAULT_RULES, key=lambda r: len(r.prefix), reverse=True)
+        self.enabled = enabled
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[Tuple[str, str, str], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._rejected: Dict[str, int] = {scope: 0 for scope in SCOPES}
+
+    def match(self, path: str) -> Optional[RouteLimit]:
+        for rule in self.rules:
+            if path.startswith(rule.prefix):
+                return rule
+        return None
+
+    def _bucket(self, key: Tuple[str, str, str], limit: Limit, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(limit, now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.refill(limit, now)
+        return bucket
+
+    def check(self, path: str, session_id: Optional[str] = None, client_id: Optional[str] = None,
+              cost: float = 1.0) -> RateLimitDecision:
+        if not self.enabled:
+            return RateLimitDecision(True)
+        rule = self.match(path)
+        if rule is None:
+            return RateLimitDecision(True)
+        identities = {SESSION: session_id, CLIENT: client_id, GLOBAL: "*"}
+        now = self._clock()
+        with self._lock:
+            buckets = []
+            for scope, limit in rule.limits():
+                identity = identities[scope]
+                if not identity:
+                    # 请求未提供 session_id 时只按 client/global 限流
+                    continue
+                buckets.append((scope, limit, self._bucket((rule.prefix, scope, identity), limit, now)))
+            waits = [(bucket.wait_time(limit, cost), scope) for scope, limit, bucket in buckets]
+            retry_after, scope = max(waits, default=(0.0, None))
+            if retry_after > 0:
+                self._rejected[scope] += 1
+                return RateLimitDecision(False, retry_after, scope, rule.prefix)
+            for _, _, bucket in buckets:
+                bucket.tokens -= cost
+            self._allowed += 1
+        return RateLimitDecision(True, rule=rule.prefix)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "allowed": self._allowed,
+                "rejected": dict(self._rejected),
+                "buckets": len(self._buckets),
+            }
+
+
+rate_limiter = RateLimiter(load_rules(), enabled=RATE_LIMIT_ENABLED)
+
+
+def check_request(path: str, params: Mapping[str, Any], headers: Mapping[str, str],
+                  remote_addr: Optional[str]) -> RateLimitDecision:
+    """
+    Flask 与 ASGI 共用的限流入口。断线重连（Last-Event-ID）只读取回放缓冲、不产生新的排队任务，不计入限流
+    """
+    if headers.get("Last-Event-ID") or params.get("last_event_id"):
+        return RateLimitDecision(True)
+    session_id = params.get("session_id")
+    decision = rate_limiter.check(path, str(session_id) if session_id else None, client_identity(headers, remote_addr))
+    if not decision.allowed:
+        logger.info(f"限流拒绝: path={path}, scope={decision.scope}, retry_after={decision.retry_after:.2f}s")
+    return decision
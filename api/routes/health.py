@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+import logging
+from api.startup import startup
+
+logger = logging.getLogger("api_health")
+logger.setLevel(logging.INFO)
+
+health = Blueprint("health", __name__)
+
+
+@health.route('/ready', methods=['GET'])
+def ready():
+    """就绪检查：返回各子系统（模型、向量库、集合、工具、队列、预热）的启动状态，未就绪时返回503"""
+    snapshot = startup.snapshot()
+    return jsonify(snapshot), (200 if startup.accepting_requests() else 503)
@@ -0,0 +1,54 @@
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import json
+import logging
+import time
+from api.ingestion import get_ingestion_service
+from api.sse_stream import SSE_HEADERS, format_event_id, parse_event_id, sse_format
+from api.stream_runs import HEARTBEAT_FRAME, SSE_HEARTBEAT_SECONDS
+
+logger = logging.getLogger("api_jobs")
+logger.setLevel(logging.INFO)
+
+jobs = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def job_urls(job_id: str) -> dict:
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+
+@jobs.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_ingestion_service().store.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"任务不存在: {job_id}"}), 404
+    return jsonify({"status": "success", "data": job.to_dict()})
+
+
+@jobs.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    任务进度 SSE 流：先回放 Last-Event-ID（或 ?last_event_id=）之后的事件，再推送新事件，任务结束后关闭。
+    帧 id 为 <job_id>:<序号>，断线重连可从断点继续。
+    """
+    store = get_ingestion_service().store
+    if store.get(job_id) is None:
+        return jsonify({"status": "error", "message": f"任务不存在: {job_id}"}), 404
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    parsed = parse_event_id(last_event_id)
+    seq = parsed[1] if parsed and parsed[0] == job_id else 0
+
+    def generate(seq):
+        while True:
+            # 先读状态再取事件：终态与结束事件在同一事务中写入，读到终态时结束事件一定能取到
+            job = store.get(job_id)
+            events = store.events_after(job_id, seq)
+            for seq, payload in events:
+                yield sse_format(json.dumps(payload, ensure_ascii=False), format_event_id(job_id, seq))
+            if job is None or job.finished:
+                return
+            if not events:
+                yield HEARTBEAT_FRAME
+                time.sleep(SSE_HEARTBEAT_SECONDS)
+
+    return Response(stream_with_context(generate(seq)), mimetype="text/event-stream", headers=SSE_HEADERS)
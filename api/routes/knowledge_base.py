@@ -8,7 +8,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("api_knowledgebase")
 logger.setLevel(logging.INFO)
-from ToolOrchestrator.tools.kb_tools import create, delete, add_file, deletefile
+from ToolOrchestrator.tools.kb_tools import delete, deletefile
+from api.ingestion import ADD_FILE, CREATE_KB, submit_job
+from api.routes.jobs import job_urls
 
 knowledgebase = Blueprint("knowledge_base", __name__, url_prefix="/knowledge_base")
 
@@ -61,35 +63,73 @@ def get_kb_list():
 # 支持解析的上传的文件格式
 allowed_file = lambda filename: '.' in filename and filename.rsplit('.', 1)[1].lower() in {'txt', 'pdf'}
 
+
+def _file_names() -> list:
+    """file_name 参数支持重复传参或逗号分隔"""
+    names = []
+    for value in request.args.getlist('file_name'):
+        names.extend(name.strip() for name in value.split(',') if name.strip())
+    return names
+
+
+def _jobs_response(jobs: list, message: str):
+    """入库任务已排队：立即返回任务 id，进度通过 /jobs/<id>/events 查看"""
+    return jsonify({
+        "status": "success",
+        "message": message,
+        "job_id": jobs[0].id if len(jobs) == 1 else None,
+        "job_ids": [job.id for job in jobs],
+        "jobs": [job_urls(job.id) for job in jobs],
+    }), 202
+
+
 @knowledgebase.route('/upload_file', methods=['POST'])
 def upload_file():
+    """
+    上传一个或多个文件（重复的 file 字段）；
+    带 kb_name 且 embed 不为 false 时，保存后为每个文件登记向量化任务
+    """
     UPLOAD_FOLDER = 'data/raw_data/uploads'
     ALLOWED_EXTENSIONS = {'txt', 'pdf'}
     # 检查文件是否存在
     if 'file' not in request.files:
         return jsonify({"status": "error", "message": "未找到文件字段"}), 400
-    file = request.files['file']
+    files = request.files.getlist('file')
     # 检查文件名
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({"status": "error", "message": "未选择文件"}), 400
     
     # 验证文件类型
-    if not (file and allowed_file(file.filename)):
+    invalid = [file.filename for file in files if not allowed_file(file.filename)]
+    if invalid:
         return jsonify({
             "status": "error",
-            "message": f"不支持的文件类型，允许: {', '.join(ALLOWED_EXTENSIONS)}"
+            "message": f"不支持的文件类型: {', '.join(invalid)}，允许: {', '.join(ALLOWED_EXTENSIONS)}"
         }), 400
     
+    kb_name = request.form.get('kb_name') or request.args.get('kb_name')
+    embed = (request.form.get('embed') or request.args.get('embed') or 'true').lower() not in ('0', 'false', 'no')
     try:
         # 保存文件
-        file.save(os.path.join(UPLOAD_FOLDER, file.filename))
-        
-        # 返回成功响应
-        return jsonify({
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        saved = []
+        for file in files:
+            path = os.path.join(UPLOAD_FOLDER, file.filename)
+            file.save(path)
+            saved.append({"filename": file.filename, "path": path, "url": f"/uploads/{file.filename}"})
+
+        result = {
             "status": "success",
-            "filename": file.filename,
-            "url": f"/uploads/{file.filename}"
-        }), 200
+            "filename": saved[0]["filename"],
+            "url": saved[0]["url"],
+            "files": saved,
+        }
+        if kb_name and embed:
+            jobs = [submit_job(ADD_FILE, kb_name, item["path"]) for item in saved]
+            result["job_ids"] = [job.id for job in jobs]
+            result["jobs"] = [job_urls(job.id) for job in jobs]
+            return jsonify(result), 202
+        return jsonify(result), 200
         
     except Exception as e:
         logger.error(f"文件上传失败: {str(e)}")
@@ -98,12 +138,24 @@ def upload_file():
             "message": "服务器处理文件失败"
         }), 500
 
+def _is_valid_kb_name(kb_name: str) -> bool:
+    """知识库名称只能是单个路径段，防止 ../ 等路径穿越"""
+    return (kb_name not in (".", "..") and "/" not in kb_name and "\\" not in kb_name
+            and os.path.basename(kb_name) == kb_name)
+
 @knowledgebase.route('/create_kb', methods=['GET'])
 def create_kb():
     kb_name = request.args.get('kb_name')
+    if not kb_name:
+        return jsonify({"status": "error", "message": "缺少 kb_name 参数"}), 400
+    if not _is_valid_kb_name(kb_name):
+        return jsonify({"status": "error", "message": f"无效的 kb_name: {kb_name}"}), 400
+    # 知识库由 data/raw_data/<kb_name> 下已上传的文件构建，目录不存在时不提交空任务
+    if not os.path.isdir(os.path.join("data/raw_data", kb_name)):
+        return jsonify({"status": "error", "message": f"知识库目录不存在: data/raw_data/{kb_name}"}), 404
     try:
-        create(kb_name)
-        return jsonify({"status": "success", "message": "知识库创建成功"}), 200
+        job = submit_job(CREATE_KB, kb_name)
+        return _jobs_response([job], "知识库创建任务已提交")
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -119,11 +171,17 @@ def delete_kb():
 @knowledgebase.route('/embedding_file', methods=['GET'])
 def embedding_file():
     # 需要对应知识库类别名称和文件路径
+    # file_name 可重复或逗号分隔，每个文件一个任务
     kb_name = request.args.get('kb_name')
-    file_name = request.args.get('file_name')
+    file_names = _file_names()
+    if not kb_name or not file_names:
+        return jsonify({"status": "error", "message": "缺少 kb_name 或 file_name 参数"}), 400
+    missing = [name for name in file_names if not os.path.isfile(name)]
+    if missing:
+        return jsonify({"status": "error", "message": f"文件不存在: {', '.join(missing)}"}), 404
     try:
-        add_file(file_name, kb_name)
-        return jsonify({"status": "success", "message": "文件向量化成功"}), 200
+        jobs = [submit_job(ADD_FILE, kb_name, name) for name in file_names]
+        return _jobs_response(jobs, "文件向量化任务已提交")
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
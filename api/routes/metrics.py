@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify
+import logging
+from api.rate_limit import rate_limiter
+from queue_rag.queue_server import get_metrics_snapshot
+from ToolOrchestrator.core.result_cache import tool_result_cache
+from ToolOrchestrator.tools.db_backend import db_pool_stats
+from utils.answer_cache import answer_cache
+from utils.client_pool import llm_client_pool, mcp_stats
+from utils.logger import get_logging_stats
+from utils.schema_catalog import schema_catalog
+
+logger = logging.getLogger("api_metrics")
+logger.setLevel(logging.INFO)
+
+metrics = Blueprint("metrics", __name__)
+
+
+@metrics.route('/metrics', methods=['GET'])
+def queue_metrics():
+    """返回RAG队列遥测：等待/服务时间分位数（按任务类型）与实时队列深度，以及异步日志积压/丢弃、答案缓存命中、限流拒绝、共享客户端连接复用、工具结果缓存命中、数据库结构目录状态与数据库连接池使用情况"""
+    return jsonify({
+        "status": "success",
+        "queue": get_metrics_snapshot(),
+        "logging": get_logging_stats(),
+        "answer_cache": answer_cache.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "clients": {"llm": llm_client_pool.stats(), "mcp": mcp_stats()},
+        "tool_cache": tool_result_cache.stats(),
+        "schema_catalog": schema_catalog.stats(),
+        "db_pool": db_pool_stats(),
+    })
@@ -1,10 +1,18 @@
-import os
-import time
 import json
 from flask import Response, request, jsonify, Blueprint
 import logging
 from agent_orchestrator import main as run_orchestrator
-import uuid
+from api.sse_stream import (
+    SSE_HEADERS,
+    SIMULATED_AGENT_ENABLED,
+    SIMULATED_AGENT_TYPE,
+    parse_stream_request,
+    simulated_agent,
+    sse_format,
+)
+from api.session_store import get_session_store
+from api.startup import startup
+from api.stream_runs import RunConflictError, resume_failed_frame, run_conflict_frame, stream_runs
 from models.model_manager import model_manager
 from queue_rag.queue_server import start_rag_service, is_running
 
@@ -13,13 +21,16 @@ logger.setLevel(logging.INFO)
 
 sse = Blueprint("sse", __name__, url_prefix="/sse")
 
-# 会话状态：防止同一会话并发执行
-ACTIVE_SESSIONS = set()
+# 会话租约：防止同一会话并发执行（多 worker 进程时通过 SESSION_STORE_BACKEND 共享）
+session_store = get_session_store()
 
 
 @sse.before_app_request
 def _ensure_global_models_initialized():
-    """确保全局 Embedding 模型与向量库在首个请求前初始化。"""
+    """确保全局 Embedding 模型与向量库在首个请求前初始化（未通过启动协调器初始化时的后备方案）。"""
+    if startup.started:
+        # 由启动协调器负责初始化，就绪前的请求由 /ready 与 startup_pending 处理
+        return
     try:
         if not model_manager.is_initialized():
             logger.info("检测到全局模型未初始化，开始初始化...")
@@ -50,215 +61,69 @@ def agent_config():
     config = json.load(open("config/config_description.json", "r", encoding="utf-8"))
     return jsonify(config)
 
-def sse_format(data: str):
-    """格式化成 SSE 数据格式"""
-    return f"data: {data}\n\n"
+def resolve_agent(agent_type: str):
+    """根据 agent_type 选择同步的 agent 事件生成函数"""
+    if SIMULATED_AGENT_ENABLED and agent_type == SIMULATED_AGENT_TYPE:
+        return simulated_agent
+    agent_functions = {
+        'japan': run_orchestrator,
+        'default': run_orchestrator
+    }
+    return agent_functions.get(agent_type, agent_functions['default'])
+
+def startup_pending(stream_request) -> bool:
+    """服务尚未就绪（模型/集合/队列/预热未完成）时拒绝新的问答；模拟 agent 不依赖这些子系统"""
+    if startup.accepting_requests():
+        return False
+    return not (SIMULATED_AGENT_ENABLED and stream_request.agent_type == SIMULATED_AGENT_TYPE)
 
 @sse.route('/stream_qa', methods=['GET', 'POST'])
 def stream():
     try:
         if request.method == 'GET':
             logger.info(f"收到SSE请求{request}")
-            message_id = request.args.get('message_id', str(uuid.uuid4()))
-            session_id = request.args.get('session_id', str(uuid.uuid4()))
-            query = request.args.get('query', '请介绍日本陆上养殖项目')
-            agent_type = request.args.get('agent_type', 'japan')
-            agent_config = json.loads(request.args.get('config', None))
-
+            stream_request = parse_stream_request(request.args.to_dict())
         else:  # POST
             logger.info(f"收到SSE请求{request.get_json()}")
-            data = request.get_json() or {}
-            message_id = data.get('message_id', str(uuid.uuid4()))
-            session_id = data.get('session_id', str(uuid.uuid4()))
-            query = data.get('query', '请介绍日本陆上养殖项目')
-            agent_type = data.get('agent_type', 'japan')
-            agent_config = json.loads(data.get('config', None))
+            stream_request = parse_stream_request(request.get_json() or {})
     except Exception as e:
         logger.error(f"收到SSE请求失败{e}")
         return jsonify({"error": "收到SSE请求失败"}), 400
-    logger.info(f"收到SSE请求 - Session ID: {session_id}, Query: {query}, Agent Type: {agent_type}")
+    session_id = stream_request.session_id
+    stream_request.last_event_id = request.headers.get("Last-Event-ID") or stream_request.last_event_id
+
+    # 断线重连：从回放缓冲续传，agent 运行不受影响
+    if stream_request.last_event_id:
+        run, seq = stream_runs.find_resumable(stream_request.last_event_id, session_id)
+        if run is None:
+            logger.info(f"续传失败，消息不存在或已过期: {stream_request.last_event_id}")
+            return Response(iter([resume_failed_frame()]), mimetype="text/event-stream", headers=SSE_HEADERS)
+        logger.info(f"SSE续传 - Message ID: {run.message_id}, 从第 {seq} 帧之后继续")
+        return Response(run.iter_frames(seq), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    logger.info(f"收到SSE请求 - Session ID: {session_id}, Query: {stream_request.query}, Agent Type: {stream_request.agent_type}")
+
+    if startup_pending(stream_request):
+        logger.info(f"服务启动中，拒绝请求: status={startup.status()}")
+        return jsonify({"error": "服务启动中，请稍后重试", "startup": startup.status()}), 503
     
-    # 检查会话是否正在进行中，避免并发执行
-    if session_id in ACTIVE_SESSIONS:
+    # 获取会话租约（原子操作），会话正在进行中时拒绝，避免并发执行
+    lease = session_store.lease(session_id)
+    if lease is None:
         logger.info(f"会话进行中，拒绝重复请求: {session_id}")
         def empty_gen():
             yield sse_format('{"error": "会话已开启}')
-        return Response(empty_gen(), mimetype="text/event-stream",
-                        headers={'Cache-Control': 'no-cache', 'Connection': 'close', 'Access-Control-Allow-Origin': '*'})
-    def generate():
-        # 标记会话为活动态
-        ACTIVE_SESSIONS.add(session_id)
-        final_sent = False
-        try:
-            # 发送开始消息
-            start_message = {
-                "session_id": session_id,
-                "timestamp": time.strftime('%H:%M:%S'),
-                "agent_type": agent_type,
-                "message_id": message_id,
-                "content": f"开始处理查询: '{query}'",
-                "data": {
-                    "status": "started"
-                }
-            }
-            json_data = json.dumps(start_message, ensure_ascii=False)
-            yield sse_format(json_data)
-            logger.info(f"发送初始消息: {json_data}")
-        except Exception as e:
-            logger.exception("发送初始消息失败")
-            error_data = json.dumps({"error": f"发送初始消息失败: {e}"}, ensure_ascii=False)
-            yield sse_format(error_data)
-            return
-        agent_functions = {
-            'japan': run_orchestrator,
-            'default': run_orchestrator
-        }
-        agent_function = agent_functions.get(agent_type, agent_functions['default'])
-
-        # 开始处理消息，发送过程信息和最终答案
-        try:    
-            config = agent_config
+        return Response(empty_gen(), mimetype="text/event-stream", headers=SSE_HEADERS)
 
-            for i, data in enumerate(agent_function(query, config)):
-                if not isinstance(data, dict):
-                    continue
-                
-                # 处理工具调用信息
-                """if data.get("type") == "tool_call":
-                    tool_message = {
-                        "session_id": session_id,
-                        "timestamp": time.strftime('%H:%M:%S'),
-                        "agent_type": agent_type,
-                        "message_id": message_id,
-                        "content": data.get("content", ""),
-                        "data": {
-                            "type": "tool_call",
-                            "step": data.get("step"),
-                            "tool_name": data.get("tool_name")
-                        }
-                    }
-                    json_data = json.dumps(tool_message, ensure_ascii=False)
-                    yield sse_format(json_data)
-                    logger.info(f"发送工具调用: {data.get('tool_name')}")
-                    continue
-                
-                # 处理思考信息
-                if data.get("type") == "thinking":
-                    thinking_message = {
-                        "session_id": session_id,
-                        "timestamp": time.strftime('%H:%M:%S'),
-                        "agent_type": agent_type,
-                        "message_id": message_id,
-                        "content": data.get("content", ""),
-                        "data": {
-                            "type": "thinking",
-                            "step": data.get("step")
-                        }
-                    }
-                    json_data = json.dumps(thinking_message, ensure_ascii=False)
-                    yield sse_format(json_data)
-                    logger.info(f"发送思考信息: {data.get('content', '')[:50]}...")
-                    continue"""
-                
-                # 处理答案
-                if data.get("status") == "stream":
-                    # 规范化 content，确保可被 json 序列化
-                    content = data.get("content", "")
-                    if not isinstance(content, (str, int, float, bool, type(None), dict, list)):
-                        try:
-                            # 优先提取文本增量或文本字段（OpenAI Responses 流事件）
-                            if hasattr(content, "delta"):
-                                content = getattr(content, "delta")
-                            elif hasattr(content, "text"):
-                                content = getattr(content, "text")
-                            # 尝试模型对象转字典/JSON
-                            elif hasattr(content, "model_dump"):
-                                content = content.model_dump()
-                            elif hasattr(content, "model_dump_json"):
-                                try:
-                                    content = json.loads(content.model_dump_json())
-                                except Exception:
-                                    content = str(content)
-                            elif hasattr(content, "to_dict"):
-                                content = content.to_dict()
-                            else:
-                                content = str(content)
-                        except Exception:
-                            content = str(content)
-                    stream_message = {
-                        "session_id": session_id,
-                        "timestamp": time.strftime('%H:%M:%S'),
-                        "agent_type": agent_type,
-                        "message_id": message_id,
-                        "content": content,
-                        "data": {
-                            "status": "stream"
-                        }
-                    }
-                    json_data = json.dumps(stream_message, ensure_ascii=False)
-                    yield sse_format(json_data)
-                    logger.info(f"发送流式答案: {json_data}")
-                elif data.get("status") == "final":
-                    final_message = {
-                        "session_id": session_id,
-                        "timestamp": time.strftime('%H:%M:%S'),
-                        "agent_type": agent_type,
-                        "message_id": message_id,
-                        "content": data.get("content", ""),
-                        "data": {
-                            "status": "completed"
-                        }
-                    }
-                    json_data = json.dumps(final_message, ensure_ascii=False)
-                    yield sse_format(json_data)
-                    logger.info(f"结束发送")
-                    final_sent = True
-                    break
-                elif data.get("status") == "error" or data.get("type") == "error":
-                    error_data = json.dumps({"error": data.get("content", "unknown error")}, ensure_ascii=False)
-                    yield sse_format(error_data)
-                    logger.info(f"发送错误: {error_data}")
-                    final_sent = True
-                    break
-        except Exception as e:
-            logger.exception("运行失败")
-            error_data = json.dumps({"error": f"运行失败: {e}"}, ensure_ascii=False)
-            yield sse_format(error_data)
-        # 若已发送最终答案，则直接结束连接，不再发送任何消息
-        if final_sent:
-            if session_id in ACTIVE_SESSIONS:
-                ACTIVE_SESSIONS.remove(session_id)
-            return
-        
-        # 如果没有发送最终答案，发送默认结束消息
-        try:
-            end_message = {
-                "session_id": session_id,
-                "timestamp": time.strftime('%H:%M:%S'),
-                "agent_type": agent_type,
-                "message_id": message_id,
-                "content": "查询处理结束",
-                "data": {
-                    "status": "completed",
-                    "answer": "处理完成，但未获得有效回答"
-                }
-            }
-            json_data = json.dumps(end_message, ensure_ascii=False)
-            yield sse_format(json_data)
-            logger.info(f"发送默认结束消息: {json_data}")
-        except Exception as e:
-            logger.exception("发送结束消息失败")
-            error_data = json.dumps({"error": f"发送结束消息失败: {e}"}, ensure_ascii=False)
-            yield sse_format(error_data)
-        finally:
-            # 清理会话状态
-            if session_id in ACTIVE_SESSIONS:
-                ACTIVE_SESSIONS.remove(session_id)
+    agent_function = resolve_agent(stream_request.agent_type)
 
-
-    return Response(generate(), mimetype="text/event-stream", 
-                   headers={
-                       'Cache-Control': 'no-cache',
-                       'Connection': 'close',
-                       'Access-Control-Allow-Origin': '*'
-                   })
+    # agent 在后台线程中运行并写入回放缓冲，租约由运行持有、运行结束时释放；
+    # 当前连接只是消费者，客户端断开后可携带 Last-Event-ID 重连续传
+    try:
+        run = stream_runs.create(stream_request, lease)
+    except RunConflictError as e:
+        logger.info(f"拒绝请求: {e}")
+        lease.release()
+        return Response(iter([run_conflict_frame()]), mimetype="text/event-stream", headers=SSE_HEADERS)
+    run.start_thread(agent_function(stream_request.query, stream_request.config, cancel_token=run.cancel_token))
+    return Response(run.iter_frames(), mimetype="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,434 @@
+"""
+会话租约存储
+保证同一 session_id 在所有 API worker 进程中同一时刻只有一个活动流。
+
+后端（环境变量 SESSION_STORE_BACKEND 选择）:
+- memory: 进程内字典，仅适用于单进程部署（默认）
+- sqlite: 多个进程共享同一个 SQLite 文件（SESSION_STORE_PATH）
+- socket: 本机 Unix socket 服务（SESSION_STORE_ADDRESS），首个连接不上的进程自动托管服务，
+          也可单独运行: python -m api.session_store serve
+
+租约带 TTL，由进程内的心跳线程按 TTL/3 周期续约；进程崩溃后租约在 TTL 到期后自动失效。
+"""
+import abc
+import json
+import logging
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("session_store")
+logger.setLevel(logging.INFO)
+
+DEFAULT_LEASE_TTL = float(os.getenv("SESSION_LEASE_TTL", "30"))
+DEFAULT_SQLITE_PATH = os.getenv("SESSION_STORE_PATH", "data/session_leases.db")
+DEFAULT_SOCKET_ADDRESS = os.getenv("SESSION_STORE_ADDRESS", "/tmp/japan_agent_sessions.sock")
+
+
+def new_owner_id() -> str:
+    """租约持有者标识：主机名 + 进程号 + 随机串"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+class SessionStore(abc.ABC):
+    """会话租约存储接口，所有方法均为原子操作"""
+
+    @abc.abstractmethod
+    def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        """会话没有未过期的租约时获取租约，返回是否成功"""
+
+    @abc.abstractmethod
+    def renew(self, session_id: str, owner: str, ttl: float) -> bool:
+        """续约，租约已不属于 owner（已过期被他人获取或已释放）时返回 False"""
+
+    @abc.abstractmethod
+    def release(self, session_id: str, owner: str) -> bool:
+        """释放 owner 持有的租约"""
+
+    @abc.abstractmethod
+    def is_active(self, session_id: str) -> bool:
+        """会话是否存在未过期的租约"""
+
+    def close(self) -> None:
+        pass
+
+    def lease(self, session_id: str, ttl: Optional[float] = None) -> Optional["SessionLease"]:
+        """获取租约并交给心跳线程续约；会话已被占用时返回 None"""
+        ttl = ttl or DEFAULT_LEASE_TTL
+        owner = new_owner_id()
+        if not self.acquire(session_id, owner, ttl):
+            return None
+        lease = SessionLease(self, session_id, owner, ttl)
+        _heartbeat.add(lease)
+        return lease
+
+
+class SessionLease:
+    """已获取的会话租约，release() 可重复调用"""
+
+    def __init__(self, store: SessionStore, session_id: str, owner: str, ttl: float):
+        self.store = store
+        self.session_id = session_id
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = False
+        self.renewed_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def renew(self) -> bool:
+        with self._lock:
+            if self._released:
+                return False
+            try:
+                ok = self.store.renew(self.session_id, self.owner, self.ttl)
+            except Exception as e:
+                # 存储暂时不可用时保留租约，下个周期重试
+                logger.warning(f"会话租约续约失败: {self.session_id}, {e}")
+                return True
+            if ok:
+                self.renewed_at = time.monotonic()
+            else:
+                self.lost = True
+                logger.warning(f"会话租约已丢失: {self.session_id}")
+            return ok
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        _heartbeat.discard(self)
+        try:
+            self.store.release(self.session_id, self.owner)
+        except Exception as e:
+            logger.warning(f"会话租约释放失败（将在TTL后过期）: {self.session_id}, {e}")
+
+
+class LeaseHeartbeat:
+    """进程内共享的心跳线程，为所有持有的租约续约"""
+
+    def __init__(self):
+        self._leases: Dict[int, SessionLease] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, lease: SessionLease) -> None:
+        with self._lock:
+            self._leases[id(lease)] = lease
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="session-lease-heartbeat", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def discard(self, lease: SessionLease) -> None:
+        with self._lock:
+            self._leases.pop(id(lease), None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                leases = list(self._leases.values())
+            interval = min((lease.ttl for lease in leases), default=DEFAULT_LEASE_TTL) / 3
+            # 新租约加入时提前唤醒，以便按更短的 TTL 重新计算间隔
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            now = time.monotonic()
+            for lease in leases:
+                if now - lease.renewed_at >= lease.ttl / 3 and not lease.renew():
+                    self.discard(lease)
+
+
+_heartbeat = LeaseHeartbeat()
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内存储（单进程部署或作为 socket 服务的后端）"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            current = self._leases.get(session_id)
+            if current and current[1] > now and current[0] != owner:
+                return False
+            self._leases[session_id] = (owner, now + ttl)
+            return True
+
+    def renew(self, session_id: str, owner: str, ttl: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            current = self._leases.get(session_id)
+            if not current or current[0] != owner:
+                return False
+            self._leases[session_id] = (owner, now + ttl)
+            return True
+
+    def release(self, session_id: str, owner: str) -> bool:
+        with self._lock:
+            current = self._leases.get(session_id)
+            if not current or current[0] != owner:
+                return False
+            del self._leases[session_id]
+            return True
+
+    def is_active(self, session_id: str) -> bool:
+        with self._lock:
+            current = self._leases.get(session_id)
+            return bool(current and current[1] > self._clock())
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite 存储：同一台机器上的多个 worker 进程共享一个数据库文件"""
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_leases ("
+                "session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        now = self._clock()
+        conn = self._connect()
+        # 仅当无租约或租约已过期（或本就属于 owner）时写入
+        cursor = conn.execute(
+            "INSERT INTO session_leases (session_id, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE session_leases.expires_at <= ? OR session_leases.owner = excluded.owner",
+            (session_id, owner, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def renew(self, session_id: str, owner: str, ttl: float) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE session_leases SET expires_at = ? WHERE session_id = ? AND owner = ?",
+            (self._clock() + ttl, session_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, session_id: str, owner: str) -> bool:
+        cursor = self._connect().execute(
+            "DELETE FROM session_leases WHERE session_id = ? AND owner = ?",
+            (session_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def is_active(self, session_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM session_leases WHERE session_id = ? AND expires_at > ?",
+            (session_id, self._clock()),
+        ).fetchone()
+        return row is not None
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class _LeaseRequestHandler(socketserver.StreamRequestHandler):
+    """socket 服务：每行一个 JSON 请求，每行一个 JSON 响应"""
+
+    def handle(self):
+        store: SessionStore = self.server.store
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request["op"]
+                if op == "is_active":
+                    result = store.is_active(request["session_id"])
+                elif op == "release":
+                    result = store.release(request["session_id"], request["owner"])
+                elif op in ("acquire", "renew"):
+                    result = getattr(store, op)(request["session_id"], request["owner"], float(request["ttl"]))
+                else:
+                    raise ValueError(f"未知操作: {op}")
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class SessionStoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """本机 Unix socket 租约服务，后端为进程内存储"""
+    daemon_threads = True
+
+    def __init__(self, address: str, store: Optional[SessionStore] = None):
+        self.store = store or InMemorySessionStore()
+        super().__init__(address, _LeaseRequestHandler)
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="session-store-server", daemon=True)
+        thread.start()
+        return thread
+
+
+class SocketSessionStore(SessionStore):
+    """
+    本机 socket 存储客户端
+    auto_serve=True 时，若服务不存在则由当前进程托管；托管进程退出后，其他进程会接管（租约随之清空）。
+    """
+
+    def __init__(self, address: str = DEFAULT_SOCKET_ADDRESS, auto_serve: bool = True, timeout: float = 5.0):
+        self.address = address
+        self.auto_serve = auto_serve
+        self.timeout = timeout
+        self._server: Optional[SessionStoreServer] = None
+        self._local = threading.local()
+
+    def _start_server(self) -> None:
+        try:
+            server = SessionStoreServer(self.address)
+        except OSError:
+            # 地址已存在：若无法连接说明是残留的 socket 文件，删除后重试
+            try:
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                probe.settimeout(self.timeout)
+                probe.connect(self.address)
+                probe.close()
+                return
+            except OSError:
+                pass
+            try:
+                os.unlink(self.address)
+            except FileNotFoundError:
+                pass
+            try:
+                server = SessionStoreServer(self.address)
+            except OSError:
+                # 其他进程抢先完成了托管
+                return
+        server.serve_in_background()
+        self._server = server
+        logger.info(f"会话租约服务由当前进程托管: {self.address}")
+
+    def _file(self):
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            stream = sock.makefile("rwb")
+            self._local.sock = sock
+            self._local.stream = stream
+        return stream
+
+    def _reset(self) -> None:
+        stream = getattr(self._local, "stream", None)
+        if stream is not None:
+            try:
+                stream.close()
+                self._local.sock.close()
+            except OSError:
+                pass
+        self._local.stream = None
+        self._local.sock = None
+
+    def _call(self, **request):
+        payload = json.dumps(request).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            try:
+                stream = self._file()
+                stream.write(payload)
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("租约服务连接已关闭")
+                response = json.loads(line)
+                if not response.get("ok"):
+                    raise RuntimeError(response.get("error"))
+                return response["result"]
+            except (OSError, ConnectionError):
+                self._reset()
+                if attempt:
+                    raise
+                if self.auto_serve:
+                    self._start_server()
+
+    def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        return self._call(op="acquire", session_id=session_id, owner=owner, ttl=ttl)
+
+    def renew(self, session_id: str, owner: str, ttl: float) -> bool:
+        return self._call(op="renew", session_id=session_id, owner=owner, ttl=ttl)
+
+    def release(self, session_id: str, owner: str) -> bool:
+        return self._call(op="release", session_id=session_id, owner=owner)
+
+    def is_active(self, session_id: str) -> bool:
+        return self._call(op="is_active", session_id=session_id)
+
+    def close(self) -> None:
+        self._reset()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    """根据配置创建存储后端"""
+    backend = (backend or os.getenv("SESSION_STORE_BACKEND", "memory")).lower()
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(DEFAULT_SQLITE_PATH)
+    if backend == "socket":
+        return SocketSessionStore(DEFAULT_SOCKET_ADDRESS)
+    raise ValueError(f"不支持的会话存储后端: {backend}")
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """获取进程内共享的会话存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_session_store()
+                logger.info(f"会话存储后端: {type(_store).__name__}")
+    return _store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="会话租约 socket 服务")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--address", default=DEFAULT_SOCKET_ADDRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.address):
+        os.unlink(args.address)
+    with SessionStoreServer(args.address) as server:
+        logger.info(f"会话租约服务已启动: {args.address}")
+        server.serve_forever()
@@ -0,0 +1,412 @@
+"""
+SSE 流式问答的公共逻辑
+- 解析 /sse/stream_qa 请求参数
+- 将 agent 事件（status: stream/final/error）转换为 SSE 数据帧
+同时被 Flask（api/routes/qa_sse.py）与 ASGI（api/asgi.py）两种服务端复用，保证两边输出格式一致。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from utils.cancellation import CancellationToken
+
+logger = logging.getLogger("api_qa_sse")
+logger.setLevel(logging.INFO)
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'close',
+    'Access-Control-Allow-Origin': '*'
+}
+
+DEFAULT_QUERY = '请介绍日本陆上养殖项目'
+
+# 压测用的模拟 agent（不调用 OpenAI / 检索），仅在显式开启时可用
+SIMULATED_AGENT_ENABLED = os.getenv("ENABLE_SIMULATED_AGENT", "false").lower() in ("1", "true", "yes")
+SIMULATED_AGENT_TYPE = "simulated"
+
+# 请求级截止时间（秒）：从请求创建起计时，覆盖 SQL 生成、检索排队、数据库查询、联网搜索与最终流式生成。
+# 请求可通过 deadline_seconds 参数或 config.deadline_seconds 调整，但不超过 REQUEST_DEADLINE_MAX_SECONDS
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "300"))
+
+
+def sse_format(data: str, event_id: Optional[str] = None):
+    """格式化成 SSE 数据格式，event_id 不为空时附带 id 字段（客户端重连时通过 Last-Event-ID 回传）"""
+    if event_id is None:
+        return f"data: {data}\n\n"
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+def format_event_id(message_id: str, seq: int) -> str:
+    """帧 id 格式: <message_id>:<序号>，序号在同一条消息内从 1 开始单调递增"""
+    return f"{message_id}:{seq}"
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析 Last-Event-ID，返回 (message_id, 序号)，格式不正确时返回 None"""
+    if not event_id:
+        return None
+    message_id, sep, seq = event_id.strip().rpartition(":")
+    if not sep or not message_id:
+        return None
+    try:
+        return message_id, int(seq)
+    except ValueError:
+        return None
+
+
+@dataclass
+class StreamRequest:
+    """/sse/stream_qa 的请求参数"""
+    message_id: str
+    session_id: str
+    query: str
+    agent_type: str
+    config: Optional[Dict[str, Any]]
+    # 断线重连时客户端回传的最后一帧 id（也可由 Last-Event-ID 请求头提供）
+    last_event_id: Optional[str] = None
+    # 请求级截止时间（秒），None 表示不限时
+    deadline_seconds: Optional[float] = REQUEST_DEADLINE_SECONDS
+
+
+def resolve_deadline_seconds(params: Dict[str, Any], config: Optional[Dict[str, Any]]) -> Optional[float]:
+    """截止时间优先级：请求参数 > config.deadline_seconds > REQUEST_DEADLINE_SECONDS；0 表示使用上限"""
+    raw = params.get('deadline_seconds')
+    if raw is None and isinstance(config, dict):
+        raw = config.get('deadline_seconds')
+    if raw is None:
+        seconds = REQUEST_DEADLINE_SECONDS
+    else:
+        try:
+            seconds = float(raw)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"deadline_seconds 解析失败: {e}") from e
+    if seconds <= 0:
+        seconds = REQUEST_DEADLINE_MAX_SECONDS
+    if REQUEST_DEADLINE_MAX_SECONDS > 0:
+        seconds = min(seconds, REQUEST_DEADLINE_MAX_SECONDS)
+    return seconds if seconds > 0 else None
+
+
+def parse_stream_request(params: Optional[Dict[str, Any]]) -> StreamRequest:
+    """
+    从 GET 查询参数或 POST JSON 中解析请求。config 为 JSON 字符串（也兼容直接传入字典）。
+    解析失败时抛出 ValueError。
+    """
+    params = params or {}
+    raw_config = params.get('config')
+    try:
+        if raw_config is None or isinstance(raw_config, dict):
+            config = raw_config
+        else:
+            config = json.loads(raw_config)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"config 解析失败: {e}") from e
+    return StreamRequest(
+        message_id=params.get('message_id') or str(uuid.uuid4()),
+        session_id=params.get('session_id') or str(uuid.uuid4()),
+        query=params.get('query') or DEFAULT_QUERY,
+        agent_type=params.get('agent_type') or 'japan',
+        config=config,
+        last_event_id=params.get('last_event_id'),
+        deadline_seconds=resolve_deadline_seconds(params, config),
+    )
+
+
+def normalize_content(content: Any) -> Any:
+    """规范化 content，确保可被 json 序列化"""
+    if isinstance(content, (str, int, float, bool, type(None), dict, list)):
+        return content
+    try:
+        # 优先提取文本增量或文本字段（OpenAI Responses 流事件）
+        if hasattr(content, "delta"):
+            return getattr(content, "delta")
+        if hasattr(content, "text"):
+            return getattr(content, "text")
+        # 尝试模型对象转字典/JSON
+        if hasattr(content, "model_dump"):
+            return content.model_dump()
+        if hasattr(content, "model_dump_json"):
+            try:
+                return json.loads(content.model_dump_json())
+            except Exception:
+                return str(content)
+        if hasattr(content, "to_dict"):
+            return content.to_dict()
+        return str(content)
+    except Exception:
+        return str(content)
+
+
+# 流式答案合并（coalescing）配置：缓冲的增量在超过间隔或字符数阈值时合并为一帧发送
+SSE_FLUSH_INTERVAL_MS = int(os.getenv("SSE_FLUSH_INTERVAL_MS", "50"))
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "64"))
+# 是否逐帧记录流式答案内容（默认关闭，只在结束时记录统计）
+SSE_LOG_STREAM_CONTENT = os.getenv("SSE_LOG_STREAM_CONTENT", "false").lower() in ("1", "true", "yes")
+
+
+class SSEFrameBuilder:
+    """
+    为单个请求构造 SSE 帧
+    - 消息外壳（session_id/agent_type/message_id）在请求开始时预先序列化，每帧只序列化 content
+    - 流式增量按时间间隔/字符数合并后再发送；首个增量立即发送，不影响首token延迟
+    - 每帧带单调递增的 id，用于断线重连后从回放缓冲续传
+    """
+
+    def __init__(self, request: StreamRequest,
+                 flush_interval_ms: Optional[int] = None,
+                 flush_chars: Optional[int] = None,
+                 log_stream_content: Optional[bool] = None):
+        self.request = request
+        self.flush_interval = (SSE_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000.0
+        self.flush_chars = SSE_FLUSH_CHARS if flush_chars is None else flush_chars
+        self.log_stream_content = SSE_LOG_STREAM_CONTENT if log_stream_content is None else log_stream_content
+
+        # 预序列化的消息外壳，字段顺序与原先的 json.dumps(dict) 保持一致
+        self._head = '{"session_id": ' + json.dumps(request.session_id, ensure_ascii=False) + ', "timestamp": "'
+        self._middle = ('", "agent_type": ' + json.dumps(request.agent_type, ensure_ascii=False)
+                        + ', "message_id": ' + json.dumps(request.message_id, ensure_ascii=False)
+                        + ', "content": ')
+        self._stream_tail = ', "data": {"status": "stream"}}'
+        self._timestamp_second = -1
+        self._timestamp = ""
+        self.last_seq = 0
+
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._last_flush = 0.0
+        self._sent_first_delta = False
+        self.stream_frames = 0
+        self.stream_deltas = 0
+        self.stream_chars = 0
+
+    def _now_timestamp(self) -> str:
+        """时间戳精确到秒，同一秒内复用已格式化的字符串"""
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_second = now
+            self._timestamp = time.strftime('%H:%M:%S', time.localtime(now))
+        return self._timestamp
+
+    def _sse(self, data: str) -> str:
+        self.last_seq += 1
+        return sse_format(data, format_event_id(self.request.message_id, self.last_seq))
+
+    def _envelope(self, content_json: str, data_json: str) -> str:
+        return self._head + self._now_timestamp() + self._middle + content_json + ', "data": ' + data_json + '}'
+
+    def _message(self, content: Any, data: Dict[str, Any]) -> str:
+        return self._envelope(json.dumps(content, ensure_ascii=False), json.dumps(data, ensure_ascii=False))
+
+    def _stream_frame(self, content: Any) -> str:
+        json_data = (self._head + self._now_timestamp() + self._middle
+                     + json.dumps(content, ensure_ascii=False) + self._stream_tail)
+        self.stream_frames += 1
+        if self.log_stream_content:
+            logger.info(f"发送流式答案: {json_data}")
+        return self._sse(json_data)
+
+    def start(self) -> str:
+        json_data = self._message(f"开始处理查询: '{self.request.query}'", {"status": "started"})
+        logger.info(f"发送初始消息: {json_data}")
+        return self._sse(json_data)
+
+    def error(self, message: str) -> str:
+        error_data = json.dumps({"error": message}, ensure_ascii=False)
+        logger.info(f"发送错误: {error_data}")
+        return self._sse(error_data)
+
+    def default_end(self) -> str:
+        json_data = self._message("查询处理结束", {
+            "status": "completed",
+            "answer": "处理完成，但未获得有效回答"
+        })
+        logger.info(f"发送默认结束消息: {json_data}")
+        return self._sse(json_data)
+
+    @property
+    def has_pending(self) -> bool:
+        """是否有尚未发送的缓冲增量"""
+        return bool(self._buffer)
+
+    def flush_due_in(self) -> float:
+        """距离按时间间隔必须发送缓冲内容还有多少秒（无缓冲时返回 0）"""
+        if not self._buffer:
+            return 0.0
+        return max(0.0, self._last_flush + self.flush_interval - time.monotonic())
+
+    def flush(self) -> Optional[str]:
+        """发送缓冲中的全部增量（合并为一帧）"""
+        if not self._buffer:
+            return None
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        return self._stream_frame(content)
+
+    def _add_delta(self, content: Any) -> Optional[str]:
+        self.stream_deltas += 1
+        if not isinstance(content, str):
+            # 非文本增量（如结构化对象）不参与合并，先发出缓冲内容再单独发送
+            flushed = self.flush() or ""
+            self._last_flush = time.monotonic()
+            return flushed + self._stream_frame(content)
+        if not content:
+            return None
+        self.stream_chars += len(content)
+        self._buffer.append(content)
+        self._buffered_chars += len(content)
+        if not self._sent_first_delta:
+            # 首个增量立即发送，保证首token延迟
+            self._sent_first_delta = True
+            return self.flush()
+        if (self._buffered_chars >= self.flush_chars
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            return self.flush()
+        return None
+
+    def _log_stream_summary(self) -> None:
+        logger.info(f"结束发送: {self.stream_deltas} 个增量合并为 {self.stream_frames} 帧, 共 {self.stream_chars} 字符")
+
+    def handle(self, event: Any) -> Tuple[Optional[str], bool]:
+        """
+        处理一个 agent 事件，返回 (SSE帧或None, 是否已结束)
+        返回的字符串可能包含多帧（先发送的缓冲增量 + 结束帧）
+        """
+        if not isinstance(event, dict):
+            return None, False
+        if event.get("status") == "stream":
+            return self._add_delta(normalize_content(event.get("content", ""))), False
+        if event.get("status") == "tool":
+            # 工具调用进度（DataAgent 流式运行），先发出缓冲的增量，保证顺序
+            pending = self.flush() or ""
+            return pending + self._sse(self._message(event.get("content", {}), {"status": "tool"})), False
+        if event.get("status") == "final":
+            pending = self.flush() or ""
+            json_data = self._message(event.get("content", ""), {"status": "completed"})
+            self._log_stream_summary()
+            return pending + self._sse(json_data), True
+        if event.get("status") == "error" or event.get("type") == "error":
+            pending = self.flush() or ""
+            return pending + self.error(event.get("content", "unknown error")), True
+        return None, False
+
+
+def iter_sse_frames(events: Iterator[Dict[str, Any]], builder: SSEFrameBuilder) -> Iterator[str]:
+    """同步版本：将 agent 事件流转换为 SSE 帧（用于 Flask/WSGI）"""
+    try:
+        yield builder.start()
+    except Exception as e:
+        logger.exception("发送初始消息失败")
+        yield builder.error(f"发送初始消息失败: {e}")
+        return
+
+    try:
+        for event in events:
+            frame, finished = builder.handle(event)
+            if frame:
+                yield frame
+            if finished:
+                return
+    except Exception as e:
+        logger.exception("运行失败")
+        pending = builder.flush()
+        if pending:
+            yield pending
+        yield builder.error(f"运行失败: {e}")
+
+    pending = builder.flush()
+    if pending:
+        yield pending
+    # 如果没有发送最终答案，发送默认结束消息
+    yield builder.default_end()
+
+
+async def aiter_sse_frames(events: AsyncIterator[Dict[str, Any]], builder: SSEFrameBuilder) -> AsyncIterator[str]:
+    """
+    异步版本：将 agent 异步事件流转换为 SSE 帧（用于 ASGI）
+    有缓冲增量时最多等待 flush 间隔，超时即发送，不必等到下一个增量到达
+    """
+    try:
+        yield builder.start()
+    except Exception as e:
+        logger.exception("发送初始消息失败")
+        yield builder.error(f"发送初始消息失败: {e}")
+        return
+
+    iterator = events.__aiter__()
+    next_event: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+            if builder.has_pending:
+                done, _ = await asyncio.wait({next_event}, timeout=builder.flush_due_in())
+                if not done:
+                    frame = builder.flush()
+                    if frame:
+                        yield frame
+                    continue
+            pending_event, next_event = next_event, None
+            try:
+                event = await pending_event
+            except StopAsyncIteration:
+                break
+            frame, finished = builder.handle(event)
+            if frame:
+                yield frame
+            if finished:
+                return
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception("运行失败")
+        pending = builder.flush()
+        if pending:
+            yield pending
+        yield builder.error(f"运行失败: {e}")
+    finally:
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
+
+    pending = builder.flush()
+    if pending:
+        yield pending
+    yield builder.default_end()
+
+
+# ---------------- 压测用模拟 agent ----------------
+
+SIMULATED_FIRST_TOKEN_SECONDS = float(os.getenv("SIMULATED_FIRST_TOKEN_SECONDS", "2.0"))
+SIMULATED_TOKEN_INTERVAL_SECONDS = float(os.getenv("SIMULATED_TOKEN_INTERVAL_SECONDS", "0.05"))
+SIMULATED_TOKENS = int(os.getenv("SIMULATED_TOKENS", "200"))
+
+
+def simulated_agent(query: str, config: Optional[Dict[str, Any]] = None,
+                    cancel_token: Optional[CancellationToken] = None) -> Iterator[Dict[str, Any]]:
+    """模拟一次大模型调用：先等待首token，再逐个输出token（同步，阻塞线程）"""
+    token = cancel_token or CancellationToken()
+    if token.wait(SIMULATED_FIRST_TOKEN_SECONDS):
+        return
+    for i in range(SIMULATED_TOKENS):
+        yield {"status": "stream", "content": f"{i} "}
+        if token.wait(SIMULATED_TOKEN_INTERVAL_SECONDS):
+            return
+    yield {"status": "final", "content": "查询处理结束"}
+
+
+async def asimulated_agent(query: str, config: Optional[Dict[str, Any]] = None,
+                           cancel_token: Optional[CancellationToken] = None) -> AsyncIterator[Dict[str, Any]]:
+    """simulated_agent 的异步版本：等待期间只占用协程，不占用线程（取消时由运行任务被取消来终止）"""
+    await asyncio.sleep(SIMULATED_FIRST_TOKEN_SECONDS)
+    for i in range(SIMULATED_TOKENS):
+        yield {"status": "stream", "content": f"{i} "}
+        await asyncio.sleep(SIMULATED_TOKEN_INTERVAL_SECONDS)
+    yield {"status": "final", "content": "查询处理结束"}
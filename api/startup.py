@@ -0,0 +1,210 @@
+"""
+服务启动协调器
+启动步骤按依赖关系并行执行：互不依赖的子系统（Embedding 模型、向量库连接、MCP 工具注册、RAG 队列）同时初始化，
+依赖它们的步骤（集合预加载、预热）在依赖就绪后立即开始。
+
+- 每个子系统的状态：pending / running / ready / failed / skipped（依赖失败时跳过）
+- 必需步骤（required=True）全部就绪即 ready 为 True，不等待非必需步骤：非必需步骤（如依赖外部数据库的结构目录）
+  在后台继续执行，执行中或失败时状态为 degraded，避免外部依赖缓慢时整个服务迟迟不能就绪
+- /ready 接口返回 snapshot()，负载均衡据此决定是否转发流量
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("Startup")
+logger.setLevel(logging.INFO)
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class StartupStep:
+    """一个启动步骤"""
+    name: str
+    func: Callable[[], Any]
+    depends_on: Tuple[str, ...] = ()
+    # 必需步骤失败时服务不就绪；非必需步骤失败只降级
+    required: bool = True
+    state: str = PENDING
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    detail: Any = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (READY, FAILED, SKIPPED)
+
+    def seconds(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return round((self.finished_at or time.time()) - self.started_at, 3)
+
+
+class StartupCoordinator:
+    """按依赖关系并行执行启动步骤，并记录每个子系统的状态"""
+
+    def __init__(self, steps: Optional[List[StartupStep]] = None, max_workers: int = 4):
+        self.steps: Dict[str, StartupStep] = {}
+        self.max_workers = max_workers
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        # 已就绪或全部步骤结束时置位，wait() 据此返回
+        self._settled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for step in steps or []:
+            self.add(step)
+
+    def add(self, step: StartupStep) -> None:
+        if self.started:
+            raise RuntimeError("启动已开始，不能再添加步骤")
+        self.steps[step.name] = step
+
+    @property
+    def started(self) -> bool:
+        return self.started_at is not None
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def ready(self) -> bool:
+        return self.started and all(s.state == READY for s in self.steps.values() if s.required)
+
+    @property
+    def _required_failed(self) -> bool:
+        return any(s.state in (FAILED, SKIPPED) for s in self.steps.values() if s.required)
+
+    def accepting_requests(self) -> bool:
+        """未使用协调器（如单元测试、脚本）或已就绪时接受业务请求"""
+        return not self.started or self.ready
+
+    # ---------- 执行 ----------
+
+    def start(self) -> None:
+        """在后台线程中执行全部步骤，立即返回"""
+        with self._lock:
+            if self.started:
+                return
+            self._check_dependencies()
+            self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run_all, name="StartupCoordinator", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待必需步骤全部就绪（非必需步骤可仍在执行）或全部步骤结束，返回是否就绪"""
+        self._settled.wait(timeout)
+        return self.ready
+
+    def run(self, timeout: Optional[float] = None) -> bool:
+        """执行全部步骤并等待结束（阻塞），返回是否就绪"""
+        self.start()
+        return self.wait(timeout)
+
+    def _check_dependencies(self) -> None:
+        for step in self.steps.values():
+            missing = [d for d in step.depends_on if d not in self.steps]
+            if missing:
+                raise ValueError(f"启动步骤 {step.name} 依赖未知步骤: {missing}")
+
+    def _runnable(self) -> List[StartupStep]:
+        runnable = []
+        for step in self.steps.values():
+            if step.state != PENDING:
+                continue
+            deps = [self.steps[d] for d in step.depends_on]
+            failed = [d.name for d in deps if d.state in (FAILED, SKIPPED)]
+            if failed:
+                step.state = SKIPPED
+                step.error = f"依赖未就绪: {', '.join(failed)}"
+                logger.warning(f"跳过启动步骤 {step.name}: {step.error}")
+            elif all(d.state == READY for d in deps):
+                runnable.append(step)
+        return runnable
+
+    def _execute(self, step: StartupStep) -> None:
+        step.started_at = time.time()
+        step.state = RUNNING
+        logger.info(f"启动步骤开始: {step.name}")
+        try:
+            step.detail = step.func()
+            step.state = READY
+            logger.info(f"启动步骤完成: {step.name} ({step.seconds()}s)")
+        except Exception as e:
+            step.error = str(e)
+            step.state = FAILED
+            logger.error(f"启动步骤失败: {step.name} ({step.seconds()}s): {e}")
+        finally:
+            step.finished_at = time.time()
+            if self.ready:
+                self._settled.set()
+
+    def _run_all(self) -> None:
+        running: Dict[Future, StartupStep] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup") as executor:
+                while True:
+                    # 跳过依赖失败的步骤可能使更多步骤变为可判定，循环直到没有新步骤
+                    for step in self._runnable():
+                        step.state = RUNNING
+                        running[executor.submit(self._execute, step)] = step
+                    if not running:
+                        break
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        running.pop(future)
+        finally:
+            for step in self.steps.values():
+                if step.state == PENDING:
+                    step.state = SKIPPED
+                    step.error = step.error or "未执行"
+            self.finished_at = time.time()
+            self._done.set()
+            self._settled.set()
+            logger.info(f"服务启动结束: status={self.status()}，耗时 {self.finished_at - self.started_at:.2f}s")
+
+    # ---------- 状态 ----------
+
+    def status(self) -> str:
+        if not self.started:
+            return "not_started"
+        if not self.ready:
+            return "failed" if self.finished or self._required_failed else "starting"
+        if any(s.state != READY for s in self.steps.values()):
+            return "degraded"
+        return "ready"
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "status": self.status(),
+            "elapsed_seconds": elapsed,
+            "subsystems": {
+                step.name: {
+                    "state": step.state,
+                    "required": step.required,
+                    "depends_on": list(step.depends_on),
+                    "seconds": step.seconds(),
+                    "error": step.error,
+                }
+                for step in self.steps.values()
+            },
+        }
+
+
+# 进程内唯一的启动协调器，步骤由 api/main.py 注册
+startup = StartupCoordinator()
@@ -0,0 +1,390 @@
+"""
+可续传的 SSE 流
+agent 运行（生产者）与 HTTP 连接（消费者）解耦：
+- 生产者把 SSE 帧写入按消息划分的有界回放缓冲，客户端断开不会中断 agent 运行
+- 客户端带 Last-Event-ID（<message_id>:<序号>）重连时，从缓冲中回放之后的帧并继续跟随直播
+- 会话租约由运行持有，运行结束才释放；已结束的运行保留一段时间以便迟到的重连取回结果
+- 所有连接都断开且在宽限期（SSE_DISCONNECT_GRACE_SECONDS）内没有重连时，取消运行的取消令牌，
+  agent 停止消费 OpenAI 流、跳过排队中的检索并中断数据库查询
+- 空闲时每 SSE_HEARTBEAT_SECONDS 发送一次注释帧，使 WSGI 服务端能尽快通过写失败发现客户端断开
+
+Flask 下生产者运行在后台线程中，ASGI 下运行在事件循环的任务中，两者共用同一套缓冲。
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from api.session_store import SessionLease
+from utils.cancellation import CLIENT_DISCONNECTED, DEADLINE_EXCEEDED_MESSAGE, CancellationToken
+from api.sse_stream import (
+    SSEFrameBuilder,
+    StreamRequest,
+    aiter_sse_frames,
+    iter_sse_frames,
+    parse_event_id,
+    sse_format,
+)
+
+logger = logging.getLogger("api_stream_runs")
+logger.setLevel(logging.INFO)
+
+# 每条消息保留的帧数上限（流式增量已合并，通常一条回答只有几十到几百帧）
+SSE_REPLAY_BUFFER_FRAMES = int(os.getenv("SSE_REPLAY_BUFFER_FRAMES", "2000"))
+# 运行结束后保留回放缓冲的秒数
+SSE_RUN_RETENTION_SECONDS = float(os.getenv("SSE_RUN_RETENTION_SECONDS", "300"))
+# 所有连接断开后，等待重连的宽限期；超时未重连则取消运行。
+# 须长于客户端的重连间隔（EventSource 默认约3秒，移动网络切换往往更久），否则续传时运行已被取消；
+# 代价是真正离开的客户端，其运行会多占用这段时间的 LLM/检索/数据库资源与会话租约
+SSE_DISCONNECT_GRACE_SECONDS = float(os.getenv("SSE_DISCONNECT_GRACE_SECONDS", "10"))
+# 空闲心跳间隔（秒）
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "0.5"))
+# 消费者等待新帧的最长时间（到时重新检查状态）
+_WAIT_SECONDS = 1.0
+
+HEARTBEAT_FRAME = ": ping\n\n"
+
+
+class ReplayGapError(Exception):
+    """请求续传的位置已被移出回放缓冲"""
+
+
+class RunConflictError(Exception):
+    """同一 message_id 已有未结束的运行"""
+
+
+def split_frames(chunk: str) -> List[Tuple[int, str]]:
+    """将帧生成器输出的字符串（可能包含多帧）拆分为 [(序号, 帧)]，无 id 的帧序号为 0"""
+    frames = []
+    for part in chunk.split("\n\n"):
+        if not part:
+            continue
+        seq = 0
+        if part.startswith("id: "):
+            id_line = part.split("\n", 1)[0]
+            try:
+                seq = int(id_line.rpartition(":")[2])
+            except ValueError:
+                seq = 0
+        frames.append((seq, part + "\n\n"))
+    return frames
+
+
+def _error_frame(message: str) -> str:
+    return sse_format(json.dumps({"error": message}, ensure_ascii=False))
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ReplayBuffer:
+    """单条消息的有界回放缓冲，支持线程与协程两种等待方式"""
+
+    def __init__(self, max_frames: int = SSE_REPLAY_BUFFER_FRAMES):
+        self._frames: Deque[Tuple[int, str]] = deque(maxlen=max_frames)
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.last_seq = 0
+        self.closed = False
+
+    def _notify(self) -> None:
+        # 调用方需持有 self._cond
+        self._cond.notify_all()
+        waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def append(self, chunk: str) -> None:
+        frames = split_frames(chunk)
+        if not frames:
+            return
+        with self._cond:
+            for seq, frame in frames:
+                self._frames.append((seq, frame))
+                if seq > self.last_seq:
+                    self.last_seq = seq
+            self._notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._notify()
+
+    def read_after(self, seq: int) -> List[Tuple[int, str]]:
+        """返回序号大于 seq 的 [(序号, 帧)]；若 seq 之后的帧已被移出缓冲则抛出 ReplayGapError"""
+        with self._cond:
+            if self._frames and seq + 1 < self._frames[0][0]:
+                raise ReplayGapError(f"续传位置 {seq} 早于缓冲中最早的帧 {self._frames[0][0]}")
+            return [item for item in self._frames if item[0] > seq]
+
+    def _has_news(self, seq: int) -> bool:
+        return self.closed or self.last_seq > seq
+
+    def wait(self, seq: int, timeout: float = _WAIT_SECONDS) -> bool:
+        """阻塞等待序号大于 seq 的帧或缓冲关闭"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._has_news(seq), timeout)
+
+    async def await_after(self, seq: int) -> None:
+        """协程等待序号大于 seq 的帧或缓冲关闭"""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._has_news(seq):
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        await future
+
+
+class StreamRun:
+    """一次 agent 运行：生产者写入回放缓冲，任意数量的消费者（连接）从缓冲读取"""
+
+    def __init__(self, stream_request: StreamRequest, lease: Optional[SessionLease] = None,
+                 builder: Optional[SSEFrameBuilder] = None):
+        self.request = stream_request
+        self.message_id = stream_request.message_id
+        self.session_id = stream_request.session_id
+        self.lease = lease
+        self.builder = builder or SSEFrameBuilder(stream_request)
+        self.buffer = ReplayBuffer()
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        # 客户端全部断开时取消，沿调用链传给 agent、RAG 队列与数据库工具
+        self.cancel_token = CancellationToken()
+        # 请求级截止时间从运行创建时开始计时，到期时令牌以 deadline_exceeded 原因取消
+        self.cancel_token.set_deadline(stream_request.deadline_seconds)
+        self.grace_seconds = SSE_DISCONNECT_GRACE_SECONDS
+        self._subscribers = 0
+        self._subscribers_lock = threading.Lock()
+        self._grace_timer: Optional[threading.Timer] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def _finish(self) -> None:
+        self.cancel_token.clear_deadline()
+        # 令牌取消后生产者不再写入帧（编排层在取消后输出的超时 error 事件到不了缓冲），由这里补上结束原因
+        if self.cancel_token.deadline_exceeded:
+            self.buffer.append(self.builder.error(DEADLINE_EXCEEDED_MESSAGE))
+        elif self.cancel_token.reason == CLIENT_DISCONNECTED:
+            # 供迟到的重连了解运行为何提前结束
+            self.buffer.append(self.builder.error("运行已取消：客户端已断开"))
+        self.buffer.close()
+        self.finished_at = time.time()
+        with self._subscribers_lock:
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+        if self.lease is not None:
+            self.lease.release()
+
+    # ---------- 断开检测 ----------
+
+    def _subscribe(self) -> None:
+        with self._subscribers_lock:
+            self._subscribers += 1
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+
+    def _unsubscribe(self) -> None:
+        with self._subscribers_lock:
+            self._subscribers -= 1
+            if self._subscribers > 0 or self.finished:
+                return
+            if self.grace_seconds > 0:
+                self._grace_timer = threading.Timer(self.grace_seconds, self._cancel_if_abandoned)
+                self._grace_timer.daemon = True
+                self._grace_timer.start()
+                return
+        self._cancel_if_abandoned()
+
+    def _cancel_if_abandoned(self) -> None:
+        with self._subscribers_lock:
+            self._grace_timer = None
+            if self._subscribers > 0 or self.finished:
+                return
+        if self.cancel_token.cancel(CLIENT_DISCONNECTED):
+            logger.info(f"客户端已断开且未重连，取消运行: {self.message_id}")
+
+    # ---------- 生产者 ----------
+
+    def _produce(self, events: Iterator[Dict[str, Any]]) -> None:
+        frames = iter_sse_frames(events, self.builder)
+        try:
+            for chunk in frames:
+                if self.cancel_token.cancelled:
+                    break
+                self.buffer.append(chunk)
+        except Exception:
+            logger.exception(f"流式运行异常: {self.message_id}")
+        finally:
+            # 关闭 agent 生成器，触发其清理逻辑（关闭 OpenAI 流等）
+            frames.close()
+            if hasattr(events, "close"):
+                events.close()
+            self._finish()
+
+    def start_thread(self, events: Iterator[Dict[str, Any]]) -> None:
+        """在后台线程中运行同步 agent（Flask）"""
+        self._thread = threading.Thread(target=self._produce, args=(events,),
+                                        name=f"sse-run-{self.message_id[:8]}", daemon=True)
+        self._thread.start()
+
+    async def _aproduce(self, events: AsyncIterator[Dict[str, Any]]) -> None:
+        try:
+            async for chunk in aiter_sse_frames(events, self.builder):
+                if self.cancel_token.cancelled:
+                    break
+                self.buffer.append(chunk)
+        except asyncio.CancelledError:
+            logger.info(f"流式运行被取消: {self.message_id}")
+            raise
+        except Exception:
+            logger.exception(f"流式运行异常: {self.message_id}")
+        finally:
+            self._finish()
+
+    def start_task(self, events: AsyncIterator[Dict[str, Any]]) -> None:
+        """
+        在当前事件循环中以任务运行异步 agent（ASGI）
+        任务不随单个连接断开而取消，只在取消令牌被取消（所有连接断开且未重连）时取消
+        """
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._aproduce(events))
+        self.cancel_token.add_callback(lambda: loop.call_soon_threadsafe(self._task.cancel))
+
+    # ---------- 消费者 ----------
+
+    def iter_frames(self, after_seq: int = 0) -> Iterator[str]:
+        """
+        同步读取序号大于 after_seq 的帧，直到运行结束
+        连接断开（生成器被关闭）时注销订阅，宽限期内无人重连则取消运行
+        """
+        self._subscribe()
+        try:
+            yield from self._iter_frames(after_seq)
+        finally:
+            self._unsubscribe()
+
+    def _iter_frames(self, after_seq: int) -> Iterator[str]:
+        seq = after_seq
+        while True:
+            try:
+                frames = self.buffer.read_after(seq)
+            except ReplayGapError as e:
+                logger.warning(f"无法续传: {self.message_id}, {e}")
+                yield _error_frame("续传失败：断线期间的内容已超出回放缓冲")
+                return
+            if frames:
+                seq = max(seq, frames[-1][0])
+                yield "".join(frame for _, frame in frames)
+                continue
+            if self.buffer.closed:
+                return
+            if not self.buffer.wait(seq, SSE_HEARTBEAT_SECONDS):
+                yield HEARTBEAT_FRAME
+
+    async def aiter_frames(self, after_seq: int = 0) -> AsyncIterator[str]:
+        """异步读取序号大于 after_seq 的帧，直到运行结束；Starlette 检测到断开时会取消该生成器"""
+        self._subscribe()
+        try:
+            async for chunk in self._aiter_frames(after_seq):
+                yield chunk
+        finally:
+            self._unsubscribe()
+
+    async def _aiter_frames(self, after_seq: int) -> AsyncIterator[str]:
+        seq = after_seq
+        while True:
+            try:
+                frames = self.buffer.read_after(seq)
+            except ReplayGapError as e:
+                logger.warning(f"无法续传: {self.message_id}, {e}")
+                yield _error_frame("续传失败：断线期间的内容已超出回放缓冲")
+                return
+            if frames:
+                seq = max(seq, frames[-1][0])
+                yield "".join(frame for _, frame in frames)
+                continue
+            if self.buffer.closed:
+                return
+            try:
+                await asyncio.wait_for(self.buffer.await_after(seq), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+
+
+class StreamRunRegistry:
+    """按 message_id 登记运行中与刚结束的运行，供 Last-Event-ID 重连查找"""
+
+    def __init__(self, retention_seconds: float = SSE_RUN_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._runs: Dict[str, StreamRun] = {}
+        self._lock = threading.Lock()
+
+    def create(self, stream_request: StreamRequest, lease: Optional[SessionLease] = None) -> StreamRun:
+        """
+        登记新的运行；同一 message_id 已有未结束的运行时抛出 RunConflictError
+        （替换会使原运行的订阅者与租约失去归属），已结束的运行可被替换
+        """
+        run = StreamRun(stream_request, lease=lease)
+        with self._lock:
+            self._evict_expired()
+            existing = self._runs.get(run.message_id)
+            if existing is not None and not existing.finished:
+                raise RunConflictError(f"消息正在生成中: {run.message_id}")
+            self._runs[run.message_id] = run
+        return run
+
+    def get(self, message_id: str) -> Optional[StreamRun]:
+        with self._lock:
+            self._evict_expired()
+            return self._runs.get(message_id)
+
+    def _evict_expired(self) -> None:
+        # 调用方需持有 self._lock
+        deadline = time.time() - self.retention_seconds
+        expired = [key for key, run in self._runs.items()
+                   if run.finished_at is not None and run.finished_at < deadline]
+        for key in expired:
+            del self._runs[key]
+
+    def find_resumable(self, last_event_id: Optional[str], session_id: str) -> Tuple[Optional[StreamRun], int]:
+        """
+        根据 Last-Event-ID 查找可续传的运行，返回 (运行, 已收到的序号)
+        Last-Event-ID 格式不正确、运行不存在/已过期或不属于请求的会话时运行为 None
+        （不区分后两种情况，避免通过猜测 message_id 探测或接入其他会话的回答）
+        """
+        position = parse_event_id(last_event_id)
+        if position is None:
+            return None, 0
+        message_id, seq = position
+        run = self.get(message_id)
+        if run is None or run.session_id != session_id:
+            return None, seq
+        return run, seq
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._runs)
+
+
+def resume_failed_frame() -> str:
+    return _error_frame("续传失败：消息不存在或已过期")
+
+
+def run_conflict_frame() -> str:
+    return _error_frame("该消息正在生成中，请携带 Last-Event-ID 续传或使用新的 message_id")
+
+
+stream_runs = StreamRunRegistry()
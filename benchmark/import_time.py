@@ -0,0 +1,118 @@
+"""
+入口模块导入耗时基准
+对每个入口模块在独立子进程中执行 `python -X importtime -c "import <模块>"`，统计：
+- 导入总耗时（顶层模块的累计时间）与子进程墙钟时间
+- 累计耗时最高的模块
+- 是否加载了重量级依赖（torch、langchain、qdrant_client、openai 等）
+
+重量级依赖已改为首次使用时导入（utils/lazy.py），轻量入口应远低于 1 秒且不加载重量级依赖:
+    python benchmark/import_time.py --label lazy
+    python benchmark/import_time.py --modules ToolOrchestrator.tools.kb_tools --top 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "ToolOrchestrator.tools.kb_tools",
+    "ToolOrchestrator.tools.db_tools",
+    "ToolOrchestrator.tools.web_search_tools",
+    "ToolOrchestrator.core.security",
+    "rag.lang_rag",
+    "models.collection_manager",
+    "run_stream_qa_cli",
+]
+
+HEAVY_MODULES = [
+    "torch", "transformers", "langchain", "langchain_core", "langchain_community",
+    "langchain_qdrant", "langchain_huggingface", "qdrant_client", "openai", "unstructured", "camel",
+]
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """解析 -X importtime 输出：import time: self [us] | cumulative | imported package"""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # 表头行
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append({"module": name.strip(), "self_us": self_us, "cumulative_us": cumulative_us, "depth": depth})
+    return records
+
+
+def measure_module(module: str, top: int) -> Dict[str, Any]:
+    """在独立子进程中导入模块，返回耗时报告"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    wall_seconds = time.perf_counter() - started
+    records = parse_importtime(proc.stderr)
+    loaded = {r["module"] for r in records}
+    top_level = [r for r in records if r["depth"] == 0]
+    error = None
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": error,
+        "wall_seconds": round(wall_seconds, 3),
+        "import_seconds": round(sum(r["cumulative_us"] for r in top_level) / 1e6, 3),
+        "modules_loaded": len(records),
+        "heavy_loaded": [m for m in HEAVY_MODULES if m in loaded],
+        "slowest": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 1)}
+            for r in sorted(records, key=lambda r: r["cumulative_us"], reverse=True)[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口模块导入耗时基准")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10, help="每个模块列出累计耗时最高的前 N 个子模块")
+    parser.add_argument("--label", default="current", help="结果标签，例如 eager / lazy")
+    args = parser.parse_args()
+
+    reports = []
+    for module in args.modules:
+        report = measure_module(module, args.top)
+        reports.append(report)
+        status = "OK" if report["ok"] else f"FAILED ({report['error']})"
+        heavy = ", ".join(report["heavy_loaded"]) or "-"
+        print(f"{module:45s} import={report['import_seconds']:.3f}s wall={report['wall_seconds']:.3f}s "
+              f"modules={report['modules_loaded']:4d} heavy={heavy} {status}")
+
+    results_dir = os.path.join(PROJECT_ROOT, "benchmark", "results")
+    os.makedirs(results_dir, exist_ok=True)
+    output_file = os.path.join(results_dir, f"import_time_{args.label}.json")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "label": args.label,
+            "python": sys.version.split()[0],
+            "modules": reports,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
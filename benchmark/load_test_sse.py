@@ -0,0 +1,191 @@
+"""
+/sse/stream_qa 并发流压测
+同时打开 N 个 SSE 流，统计首帧/首token延迟、完成数与错误数；
+若提供 --server-pid，则采样服务进程的 RSS 与线程数，计算每个流占用的内存。
+
+为了只测量服务端本身的并发能力（不消耗 OpenAI 额度），服务端需开启模拟 agent：
+    ENABLE_SIMULATED_AGENT=true
+
+改造前（Werkzeug 开发服务器，每个流占用一个线程）:
+    ENABLE_SIMULATED_AGENT=true python api/main.py
+    python benchmark/load_test_sse.py --label flask --server-pid <pid> --concurrency 50 200 500
+
+改造后（ASGI，每个流占用一个协程）:
+    ENABLE_SIMULATED_AGENT=true uvicorn api.asgi:app --port 5001
+    python benchmark/load_test_sse.py --label asgi --server-pid <pid> --concurrency 50 200 500 1000 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+
+def read_process_status(pid: Optional[int]) -> Dict[str, Optional[int]]:
+    """读取 /proc/<pid>/status 中的 RSS(KB) 与线程数（仅Linux）"""
+    status = {"rss_kb": None, "threads": None}
+    if not pid:
+        return status
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    status["rss_kb"] = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    status["threads"] = int(line.split()[1])
+    except OSError:
+        pass
+    return status
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return round(values[rank], 4)
+
+
+async def open_stream(session: aiohttp.ClientSession, base_url: str, agent_type: str,
+                      counters: Dict[str, int], timeout: float) -> Dict[str, Any]:
+    """打开一个 SSE 流并读取到结束"""
+    params = {
+        "session_id": str(uuid.uuid4()),
+        "agent_type": agent_type,
+        "query": "压测问题",
+        "config": json.dumps({"mode": "single"}),
+    }
+    result: Dict[str, Any] = {"ok": False, "first_frame": None, "first_token": None, "frames": 0}
+    start = time.perf_counter()
+    try:
+        async with session.get(f"{base_url.rstrip('/')}/sse/stream_qa", params=params,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                result["error"] = f"HTTP {response.status}"
+                return result
+            counters["open"] += 1
+            counters["peak"] = max(counters["peak"], counters["open"])
+            try:
+                async for raw in response.content:
+                    line = raw.decode("utf-8", errors="ignore").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    result["frames"] += 1
+                    elapsed = time.perf_counter() - start
+                    if result["first_frame"] is None:
+                        result["first_frame"] = elapsed
+                    try:
+                        data = json.loads(line[5:].strip())
+                    except json.JSONDecodeError:
+                        continue
+                    if "error" in data:
+                        result["error"] = data["error"]
+                        return result
+                    status = data.get("data", {}).get("status")
+                    if status == "stream" and result["first_token"] is None:
+                        result["first_token"] = elapsed
+                    if status == "completed":
+                        result["ok"] = True
+                        return result
+            finally:
+                counters["open"] -= 1
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["total"] = time.perf_counter() - start
+    return result
+
+
+async def run_level(base_url: str, agent_type: str, concurrency: int, server_pid: Optional[int],
+                    timeout: float) -> Dict[str, Any]:
+    baseline = read_process_status(server_pid)
+    counters = {"open": 0, "peak": 0}
+    samples: List[Dict[str, Optional[int]]] = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [asyncio.create_task(open_stream(session, base_url, agent_type, counters, timeout))
+                 for _ in range(concurrency)]
+
+        # 在流进行期间持续采样服务端内存/线程
+        while not all(t.done() for t in tasks):
+            status = read_process_status(server_pid)
+            status["open_streams"] = counters["open"]
+            samples.append(status)
+            await asyncio.sleep(0.2)
+        results = [t.result() for t in tasks]
+
+    peak_sample = max(samples, key=lambda s: s.get("open_streams") or 0, default={})
+    rss_delta_kb = None
+    if baseline["rss_kb"] is not None and peak_sample.get("rss_kb") is not None:
+        rss_delta_kb = peak_sample["rss_kb"] - baseline["rss_kb"]
+    peak_open = counters["peak"]
+    first_tokens = [r["first_token"] for r in results if r.get("first_token") is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.get("error"):
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "completed": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "peak_open_streams": peak_open,
+        "first_token_p50": percentile(first_tokens, 50),
+        "first_token_p95": percentile(first_tokens, 95),
+        "total_p95": percentile([r["total"] for r in results], 95),
+        "server_baseline": baseline,
+        "server_peak": peak_sample,
+        "rss_per_stream_kb": round(rss_delta_kb / peak_open, 2) if rss_delta_kb is not None and peak_open else None,
+        "errors": errors,
+    }
+
+
+async def main_async(args) -> Dict[str, Any]:
+    levels = []
+    for concurrency in args.concurrency:
+        print(f"并发流数: {concurrency} ...")
+        level = await run_level(args.base_url, args.agent_type, concurrency, args.server_pid, args.timeout)
+        print(
+            f"  完成 {level['completed']}/{concurrency}，峰值同时在线 {level['peak_open_streams']}，"
+            f"首token p50={level['first_token_p50']}s p95={level['first_token_p95']}s，"
+            f"每流内存={level['rss_per_stream_kb']}KB，服务端线程={level['server_peak'].get('threads')}"
+        )
+        levels.append(level)
+        # 等待服务端回收上一轮资源
+        await asyncio.sleep(args.cooldown)
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "label": args.label,
+        "base_url": args.base_url,
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 并发流压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5001")
+    parser.add_argument("--agent-type", default="simulated", help="服务端需设置 ENABLE_SIMULATED_AGENT=true")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--server-pid", type=int, default=None, help="服务进程 PID，用于采样内存与线程数")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--cooldown", type=float, default=3.0)
+    parser.add_argument("--label", default="asgi", help="结果标签，例如 flask / asgi")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+
+    results_dir = "benchmark/results"
+    os.makedirs(results_dir, exist_ok=True)
+    output_file = os.path.join(results_dir, f"load_test_sse_{args.label}.json")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+传感器 SQL 模板命中率报告
+对问题集中的每个问题运行本地槽位抽取（utils/sensor_sql.py），统计：
+- 命中率：置信度不低于阈值、无需调用大模型生成 SQL 的问题占比（即节省的 LLM 往返次数）
+- 各模板（default / latest / aggregate / trend / readings / recent）的分布
+- 回退到大模型的问题及原因槽位，便于补充词表
+
+    python benchmark/sql_template_hit_rate.py
+    python benchmark/sql_template_hit_rate.py --questions my_questions.json --min-confidence 0.8 --verbose
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from utils.sensor_sql import SENSOR_SQL_MIN_CONFIDENCE, plan_sensor_sql  # noqa: E402
+
+DEFAULT_QUESTIONS = os.path.join(PROJECT_ROOT, "benchmark", "南美白对虾问题集.json")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """问题集格式：[{"id": ..., "query": ...}, ...]"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [{"id": item.get("id", i + 1), "query": item["query"]} for i, item in enumerate(json.load(f))]
+
+
+def evaluate(questions: List[Dict[str, Any]], min_confidence: float) -> Dict[str, Any]:
+    details = []
+    for item in questions:
+        plan = plan_sensor_sql(item["query"])
+        intent = plan.intent
+        details.append({
+            "id": item["id"],
+            "query": item["query"],
+            "hit": plan.confidence >= min_confidence,
+            "template": plan.template,
+            "confidence": plan.confidence,
+            "types": intent.types,
+            "time_range": intent.time_range.label if intent.time_range else None,
+            "aggregations": intent.aggregations,
+            "sql": plan.sql,
+        })
+    hits = [d for d in details if d["hit"]]
+    total = len(details)
+    return {
+        "total": total,
+        "hits": len(hits),
+        "hit_rate": round(len(hits) / total, 3) if total else 0.0,
+        # 与传感器相关（识别出传感器类型）的问题中的命中率
+        "sensor_questions": sum(1 for d in details if d["types"]),
+        "sensor_hits": sum(1 for d in hits if d["types"]),
+        "templates": dict(Counter(d["template"] for d in hits)),
+        "fallbacks": [{"id": d["id"], "query": d["query"], "template": d["template"],
+                       "confidence": d["confidence"]} for d in details if not d["hit"]],
+        "details": details,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器 SQL 模板命中率报告")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="问题集 JSON 文件")
+    parser.add_argument("--min-confidence", type=float, default=SENSOR_SQL_MIN_CONFIDENCE)
+    parser.add_argument("--verbose", action="store_true", help="逐条打印模板与SQL")
+    args = parser.parse_args()
+
+    report = evaluate(load_questions(args.questions), args.min_confidence)
+    if args.verbose:
+        for d in report["details"]:
+            mark = "HIT " if d["hit"] else "LLM "
+            print(f"{mark}{d['id']:>4} {d['template']:9s} {d['confidence']:.2f} {d['query'][:40]!r}\n      {d['sql']}")
+    print(f"问题数: {report['total']}  命中: {report['hits']}  命中率: {report['hit_rate']:.1%}  "
+          f"(传感器问题 {report['sensor_hits']}/{report['sensor_questions']})")
+    print(f"模板分布: {report['templates']}")
+    for item in report["fallbacks"]:
+        print(f"回退到大模型: #{item['id']} {item['template']} {item['confidence']:.2f} {item['query'][:50]!r}")
+
+    results_dir = os.path.join(PROJECT_ROOT, "benchmark", "results")
+    os.makedirs(results_dir, exist_ok=True)
+    output_file = os.path.join(results_dir, "sql_template_hit_rate.json")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "questions": os.path.relpath(args.questions, PROJECT_ROOT),
+            "min_confidence": args.min_confidence,
+            **report,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
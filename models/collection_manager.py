@@ -3,14 +3,16 @@
 负责管理向量数据库集合的创建、缓存和访问
 解决Qdrant并发访问问题，支持动态加载不同集合
 """
+from __future__ import annotations
 import logging
 import threading
 from typing import Optional, Dict, Any, Set
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
-from langchain_qdrant import QdrantVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
 from models.model_manager import model_manager
+from utils.lazy import lazy_import
+
+Distance = lazy_import("qdrant_client.http.models", "Distance")
+VectorParams = lazy_import("qdrant_client.http.models", "VectorParams")
+QdrantVectorStore = lazy_import("langchain_qdrant", "QdrantVectorStore")
 
 logger = logging.getLogger("CollectionManager")
 logger.setLevel(logging.INFO)
@@ -38,6 +40,9 @@ class CollectionManager:
                     self.available_collections: Set[str] = set()
                     self.vector_size = 1024
                     self.persist_path = "data/vector_data"
+                    # 集合内容版本号（进程内），集合内容变更时递增，用于使答案缓存失效
+                    self._versions: Dict[str, int] = {}
+                    self._version_lock = threading.Lock()
                     self._initialized = True
                     logger.info("全局集合管理器初始化完成")
     
@@ -56,20 +61,14 @@ class CollectionManager:
             self.persist_path = persist_path
             self.vector_size = vector_size
             
-            # 获取全局模型管理器的客户端
+            # 获取全局模型管理器的客户端；预加载集合只需要客户端，embedding模型可以稍后就绪
             try:
-                if model_manager.is_initialized():
-                    self.client = model_manager.get_qdrant_client()
-                    self.embedding_model = model_manager.get_embedding_model()
-                    logger.info("使用全局模型管理器的客户端和embedding模型")
-                else:
-                    logger.warning("全局模型管理器未初始化，集合管理器将延迟初始化")
-                    self.client = None
-                    self.embedding_model = None
+                self.client = model_manager.get_qdrant_client()
+                logger.info("使用全局模型管理器的向量数据库客户端")
             except Exception as e:
-                logger.error(f"获取全局模型管理器资源失败: {e}")
+                logger.warning(f"向量数据库客户端未就绪，集合管理器将延迟初始化: {e}")
                 self.client = None
-                self.embedding_model = None
+            self.embedding_model = model_manager.embedding_model
             
             # 预加载指定的集合
             if preload_collections:
@@ -84,14 +83,16 @@ class CollectionManager:
             logger.info("全局集合管理器初始化完成！")
     
     def _ensure_client_ready(self):
-        """确保客户端和模型已准备就绪"""
-        if self.client is None or self.embedding_model is None:
-            if model_manager.is_initialized():
-                self.client = model_manager.get_qdrant_client()
-                self.embedding_model = model_manager.get_embedding_model()
-                logger.info("延迟初始化：获取全局模型管理器资源")
-            else:
-                raise RuntimeError("全局模型管理器未初始化，无法获取客户端和embedding模型")
+        """确保向量数据库客户端已准备就绪"""
+        if self.client is None:
+            self.client = model_manager.get_qdrant_client()
+            logger.info("延迟初始化：获取全局向量数据库客户端")
+
+    def _ensure_embedding_ready(self):
+        """确保embedding模型已准备就绪（创建向量存储实例时需要）"""
+        if self.embedding_model is None:
+            self.embedding_model = model_manager.get_embedding_model()
+            logger.info("延迟初始化：获取全局embedding模型")
     
     def _ensure_collection_exists(self, collection_name: str) -> bool:
         """确保集合存在，如果不存在则创建"""
@@ -123,6 +124,7 @@ class CollectionManager:
             
             # 确保集合存在
             self._ensure_collection_exists(collection_name)
+            self._ensure_embedding_ready()
             
             # 创建新的向量存储实例
             logger.info(f"创建向量存储实例: {collection_name}")
@@ -171,6 +173,18 @@ class CollectionManager:
                 logger.error(f"删除集合失败: {collection_name}, 错误: {e}")
                 return False
     
+    def get_collection_version(self, collection_name: str) -> int:
+        """获取集合内容版本号"""
+        return self._versions.get(collection_name, 0)
+
+    def bump_collection_version(self, collection_name: str) -> int:
+        """集合内容发生变更（增删文档、删除集合）后调用，返回新版本号"""
+        with self._version_lock:
+            version = self._versions.get(collection_name, 0) + 1
+            self._versions[collection_name] = version
+        logger.info(f"集合版本更新: {collection_name} -> {version}")
+        return version
+
     def list_collections(self) -> list:
         """列出所有可用集合"""
         with self._lock:
@@ -2,16 +2,21 @@
 全局Embedding模型管理器
 负责在API服务启动时加载embedding模型，并提供全局访问接口
 只管理本地部署的embedding模型，不管理远程API的LLM模型
+torch/langchain/qdrant_client 在首次加载模型或连接向量库时才导入
 """
+from __future__ import annotations
 import logging
-import torch
 import gc
 from typing import Optional, Dict, Any
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
-from langchain_qdrant import QdrantVectorStore
 from dotenv import load_dotenv
+from utils.lazy import lazy_import
+
+torch = lazy_import("torch")
+HuggingFaceEmbeddings = lazy_import("langchain_huggingface", "HuggingFaceEmbeddings")
+QdrantClient = lazy_import("qdrant_client", "QdrantClient")
+Distance = lazy_import("qdrant_client.http.models", "Distance")
+VectorParams = lazy_import("qdrant_client.http.models", "VectorParams")
+QdrantVectorStore = lazy_import("langchain_qdrant", "QdrantVectorStore")
 
 load_dotenv()
 
@@ -70,10 +75,21 @@ class ModelManager:
         
         logger.info("全局Embedding模型管理器初始化完成！")
     
+    def initialize_embedding_model(self, model_path: str = "models/multilingual-e5-large", device: str = "auto"):
+        """只加载 Embedding 模型，可与向量数据库连接并行初始化"""
+        if self.is_initialized():
+            logger.info("Embedding 模型已加载，跳过重复初始化")
+            return
+        self._clear_gpu_memory()
+        self._initialize_embedding_model(model_path, device)
+
+    def initialize_vector_client(self, persist_path: str = "data/vector_data", vector_size: int = 1024):
+        """只打开向量数据库连接，可与 Embedding 模型加载并行初始化"""
+        self._initialize_vector_clients(persist_path, vector_size)
+
     def _clear_gpu_memory(self):
         """清理GPU显存"""
         try:
-            import torch
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
                 gc.collect()
@@ -96,7 +112,6 @@ class ModelManager:
                 logger.info("强制使用GPU运行embedding模型")
             else:  # auto
                 # 自动检测：优先GPU，显存不足时使用CPU
-                import torch
                 if torch.cuda.is_available():
                     try:
                         # 检查显存是否足够
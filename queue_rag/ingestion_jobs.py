@@ -0,0 +1,368 @@
+"""
+知识库入库任务队列
+上传/向量化接口只登记任务并立即返回任务 id，解析、切分、向量化与写入由后台 worker 完成：
+- 任务与进度事件持久化在 SQLite（INGEST_JOB_DB_PATH），多个 API 进程共享同一个文件
+- worker 在 API 进程内运行，复用常驻的 Embedding 模型，向量化批次通过 RAG 队列与检索请求串行
+- 每写入一批文本块记录一次检查点；进程重启后，心跳超时的运行中任务重新排队并从检查点续传
+  （文本块 id 是确定性的，重复写入同一批只会覆盖）
+- 失败的任务最多重试 INGEST_MAX_ATTEMPTS 次
+
+任务状态: queued → running → succeeded / failed
+进度事件: {"type": "status"|"progress", "stage": "parse"|"chunk"|"embed"|"upsert", "done": n, "total": m, ...}
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ingestion_jobs")
+logger.setLevel(logging.INFO)
+
+DEFAULT_DB_PATH = os.getenv("INGEST_JOB_DB_PATH", "data/ingestion_jobs.sqlite3")
+# 运行中的任务超过该时间没有心跳即视为所在进程已退出，重新排队
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "60"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1.0"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    kind: str
+    kb_name: str
+    path: Optional[str]
+    status: str
+    stage: Optional[str]
+    done: int
+    total: int
+    checkpoint: int
+    attempts: int
+    error: Optional[str]
+    owner: Optional[str]
+    heartbeat_at: Optional[float]
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("owner")
+        data.pop("heartbeat_at")
+        return data
+
+
+_COLUMNS = ("id, kind, kb_name, path, status, stage, done, total, checkpoint, attempts, error, "
+            "owner, heartbeat_at, created_at, updated_at")
+
+
+class IngestionJobStore:
+    """SQLite 任务存储，所有方法均为原子操作"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, kb_name TEXT NOT NULL, path TEXT, "
+            "status TEXT NOT NULL, stage TEXT, done INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+            "checkpoint INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "owner TEXT, heartbeat_at REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, created_at REAL NOT NULL, payload TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ingestion_jobs_status ON ingestion_jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row) -> Optional[IngestionJob]:
+        return IngestionJob(*row) if row else None
+
+    def _add_event(self, conn: sqlite3.Connection, job_id: str, payload: Dict[str, Any]) -> int:
+        seq = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM ingestion_events WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT INTO ingestion_events (job_id, seq, created_at, payload) VALUES (?, ?, ?, ?)",
+            (job_id, seq, self._clock(), json.dumps(payload, ensure_ascii=False)),
+        )
+        return seq
+
+    def _atomic(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在 BEGIN IMMEDIATE 事务中执行：多个进程同时领取任务时只有一个能成功"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def create(self, kind: str, kb_name: str, path: Optional[str] = None) -> IngestionJob:
+        job_id = uuid.uuid4().hex
+        now = self._clock()
+
+        def _create(conn):
+            conn.execute(
+                "INSERT INTO ingestion_jobs (id, kind, kb_name, path, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, kb_name, path, QUEUED, now, now),
+            )
+            self._add_event(conn, job_id, {"type": "status", "status": QUEUED})
+
+        self._atomic(_create)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        row = self._connect().execute(
+            f"SELECT {_COLUMNS} FROM ingestion_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row)
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[IngestionJob]:
+        if status:
+            rows = self._connect().execute(
+                f"SELECT {_COLUMNS} FROM ingestion_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                (status, limit),
+            ).fetchall()
+        else:
+            rows = self._connect().execute(
+                f"SELECT {_COLUMNS} FROM ingestion_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim_next(self, owner: str) -> Optional[IngestionJob]:
+        """领取最早排队的任务并标记为运行中，没有排队任务时返回 None"""
+        now = self._clock()
+
+        def _claim(conn):
+            row = conn.execute(
+                "SELECT id, checkpoint FROM ingestion_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, owner = ?, heartbeat_at = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (RUNNING, owner, now, now, row[0]),
+            )
+            self._add_event(conn, row[0], {"type": "status", "status": RUNNING, "resume_from": row[1]})
+            return row[0]
+
+        job_id = self._atomic(_claim)
+        return self.get(job_id) if job_id else None
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE ingestion_jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = ?",
+            (self._clock(), job_id, owner, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def update_progress(self, job_id: str, stage: str, done: int, total: int) -> int:
+        """记录进度并追加进度事件；upsert 阶段的已完成数即续传检查点。返回事件序号"""
+        now = self._clock()
+
+        def _update(conn):
+            if stage == "upsert":
+                conn.execute(
+                    "UPDATE ingestion_jobs SET stage = ?, done = ?, total = ?, checkpoint = ?, heartbeat_at = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (stage, done, total, done, now, now, job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE ingestion_jobs SET stage = ?, done = ?, total = ?, heartbeat_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (stage, done, total, now, now, job_id),
+                )
+            return self._add_event(conn, job_id, {"type": "progress", "stage": stage, "done": done, "total": total})
+
+        return self._atomic(_update)
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        status = FAILED if error else SUCCEEDED
+
+        def _finish(conn):
+            conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, error = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (status, error, self._clock(), job_id),
+            )
+            self._add_event(conn, job_id, {"type": "status", "status": status, "error": error})
+
+        self._atomic(_finish)
+
+    def retry(self, job_id: str, error: str) -> None:
+        """失败后重新排队，保留检查点"""
+        def _retry(conn):
+            conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, error = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (QUEUED, error, self._clock(), job_id),
+            )
+            self._add_event(conn, job_id, {"type": "status", "status": QUEUED, "error": error})
+
+        self._atomic(_retry)
+
+    def requeue_stale(self, stale_seconds: float = INGEST_JOB_STALE_SECONDS) -> int:
+        """把心跳超时的运行中任务重新排队（其所在进程已退出），返回重新排队的任务数"""
+        cutoff = self._clock() - stale_seconds
+
+        def _requeue(conn):
+            rows = conn.execute(
+                "SELECT id FROM ingestion_jobs WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (RUNNING, cutoff),
+            ).fetchall()
+            for (job_id,) in rows:
+                conn.execute(
+                    "UPDATE ingestion_jobs SET status = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                    (QUEUED, self._clock(), job_id),
+                )
+                self._add_event(conn, job_id, {"type": "status", "status": QUEUED, "error": "worker 已退出，重新排队"})
+            return len(rows)
+
+        return self._atomic(_requeue)
+
+    def add_event(self, job_id: str, payload: Dict[str, Any]) -> int:
+        return self._atomic(lambda conn: self._add_event(conn, job_id, payload))
+
+    def events_after(self, job_id: str, seq: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM ingestion_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, seq),
+        ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# handler(job, progress)：执行任务，progress(stage, done, total) 上报进度；续传位置为 job.checkpoint
+JobHandler = Callable[[IngestionJob, Callable[[str, int, int], None]], Any]
+
+
+class IngestionService:
+    """入库任务的提交入口与后台 worker"""
+
+    def __init__(self, store: IngestionJobStore, handlers: Dict[str, JobHandler],
+                 max_attempts: int = INGEST_MAX_ATTEMPTS, poll_interval: float = INGEST_POLL_SECONDS,
+                 stale_seconds: float = INGEST_JOB_STALE_SECONDS):
+        self.store = store
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, kind: str, kb_name: str, path: Optional[str] = None) -> IngestionJob:
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job = self.store.create(kind, kb_name, path)
+        logger.info(f"入库任务已排队: {job.id} ({kind}, {kb_name}, {path})")
+        self._wakeup.set()
+        return job
+
+    def start(self) -> None:
+        """启动 worker（可重复调用）；启动前把已退出进程遗留的运行中任务重新排队"""
+        with self._lock:
+            if self.running:
+                return
+            requeued = self.store.requeue_stale(self.stale_seconds)
+            if requeued:
+                logger.info(f"重新排队 {requeued} 个中断的入库任务")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next(self.owner)
+                if job is None:
+                    self.store.requeue_stale(self.stale_seconds)
+            except Exception as e:
+                logger.error(f"领取入库任务失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: IngestionJob) -> None:
+        """执行一个已领取的任务，执行期间由心跳线程续约"""
+        stop_heartbeat = threading.Event()
+
+        def _heartbeat():
+            while not stop_heartbeat.wait(self.stale_seconds / 3):
+                self.store.heartbeat(job.id, self.owner)
+
+        heartbeat = threading.Thread(target=_heartbeat, name=f"ingestion-heartbeat-{job.id[:8]}", daemon=True)
+        heartbeat.start()
+
+        def progress(stage: str, done: int, total: int) -> None:
+            self.store.update_progress(job.id, stage, done, total)
+
+        logger.info(f"开始入库任务: {job.id} (第 {job.attempts} 次, 从第 {job.checkpoint} 个文本块开始)")
+        try:
+            self.handlers[job.kind](job, progress)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if job.attempts < self.max_attempts:
+                logger.warning(f"入库任务失败，重新排队: {job.id}, {error}")
+                self.store.retry(job.id, error)
+            else:
+                logger.error(f"入库任务失败: {job.id}, {error}")
+                self.store.finish(job.id, error)
+        else:
+            logger.info(f"入库任务完成: {job.id}")
+            self.store.finish(job.id)
+        finally:
+            stop_heartbeat.set()
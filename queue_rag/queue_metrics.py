@@ -0,0 +1,172 @@
+"""
+RAG队列遥测
+记录每个任务的入队/开始/完成时间戳，按任务类型维护滚动直方图（等待时间与服务时间的 p50/p95/p99），
+并提供实时的队列深度指标，用于判断延迟来自排队还是来自 Embedding 推理，从而确定生产环境的 worker 数量。
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# 每种任务类型保留的滚动样本数量
+DEFAULT_WINDOW_SIZE = 1024
+# 快照中保留的最近任务记录数量
+DEFAULT_RECENT_SIZE = 50
+# 快照中输出的分位数
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算分位数，输入必须已排序"""
+    if not sorted_values:
+        return None
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+class RollingHistogram:
+    """固定窗口的滚动直方图，只保留最近 window_size 个样本"""
+
+    def __init__(self, window_size: int = DEFAULT_WINDOW_SIZE):
+        self._samples: Deque[float] = deque(maxlen=window_size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        values = sorted(self._samples)
+        result: Dict[str, Any] = {
+            "count": self.count,
+            "window": len(values),
+            "mean": round(self.total / self.count, 6) if self.count else None,
+            "max": round(self.max, 6) if self.count else None,
+        }
+        for pct in PERCENTILES:
+            value = percentile(values, pct)
+            result[f"p{pct}"] = round(value, 6) if value is not None else None
+        return result
+
+
+class QueueMetrics:
+    """
+    队列指标收集器（线程安全）
+    - 按任务类型统计等待时间（入队→开始）与服务时间（开始→完成）
+    - 实时深度：队列中等待的任务数 + 正在执行的任务数
+    """
+
+    def __init__(self, window_size: int = DEFAULT_WINDOW_SIZE, recent_size: int = DEFAULT_RECENT_SIZE):
+        self._lock = threading.Lock()
+        self._window_size = window_size
+        self._wait: Dict[str, RollingHistogram] = {}
+        self._service: Dict[str, RollingHistogram] = {}
+        self._completed: Dict[str, int] = {}
+        self._failed: Dict[str, int] = {}
+        self._cancelled: Dict[str, int] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent_size)
+        self._queued = 0
+        self._in_flight = 0
+        self._max_depth = 0
+
+    def _histogram(self, store: Dict[str, RollingHistogram], task_type: str) -> RollingHistogram:
+        hist = store.get(task_type)
+        if hist is None:
+            hist = store[task_type] = RollingHistogram(self._window_size)
+        return hist
+
+    def record_enqueue(self) -> None:
+        with self._lock:
+            self._queued += 1
+            depth = self._queued + self._in_flight
+            if depth > self._max_depth:
+                self._max_depth = depth
+
+    def record_start(self) -> None:
+        with self._lock:
+            self._queued = max(0, self._queued - 1)
+            self._in_flight += 1
+
+    def record_cancelled(self, task_type: str) -> None:
+        """记录一个出队时已被取消而跳过执行的任务"""
+        with self._lock:
+            self._queued = max(0, self._queued - 1)
+            self._cancelled[task_type] = self._cancelled.get(task_type, 0) + 1
+
+    def record_finish(
+        self,
+        task_type: str,
+        request_id: str,
+        enqueued_at: float,
+        started_at: float,
+        finished_at: float,
+        ok: bool = True,
+    ) -> None:
+        """
+        记录一个已完成的任务。时间戳均为 time.time() 的墙钟时间。
+        """
+        wait = max(0.0, started_at - enqueued_at)
+        service = max(0.0, finished_at - started_at)
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._histogram(self._wait, task_type).add(wait)
+            self._histogram(self._service, task_type).add(service)
+            counter = self._completed if ok else self._failed
+            counter[task_type] = counter.get(task_type, 0) + 1
+            self._recent.append({
+                "request_id": request_id,
+                "task_type": task_type,
+                "enqueued_at": enqueued_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "wait_seconds": round(wait, 6),
+                "service_seconds": round(service, 6),
+                "ok": ok,
+            })
+
+    def snapshot(self, queue_size: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        返回指标快照。
+        queue_size: 若提供，使用队列的真实 qsize() 作为等待深度（比计数更准确）
+        """
+        with self._lock:
+            queued = self._queued if queue_size is None else queue_size
+            task_types = sorted(set(self._wait) | set(self._service) | set(self._cancelled))
+            tasks = {
+                task_type: {
+                    "completed": self._completed.get(task_type, 0),
+                    "failed": self._failed.get(task_type, 0),
+                    "cancelled": self._cancelled.get(task_type, 0),
+                    "wait_seconds": self._histogram(self._wait, task_type).snapshot(),
+                    "service_seconds": self._histogram(self._service, task_type).snapshot(),
+                }
+                for task_type in task_types
+            }
+            return {
+                "timestamp": time.time(),
+                "depth": {
+                    "queued": queued,
+                    "in_flight": self._in_flight,
+                    "total": queued + self._in_flight,
+                    "max": self._max_depth,
+                },
+                "workers": workers,
+                "tasks": tasks,
+                "recent": list(self._recent),
+            }
+
+    def reset(self) -> None:
+        """清空所有统计（不影响正在运行的任务计数）"""
+        with self._lock:
+            self._wait.clear()
+            self._service.clear()
+            self._completed.clear()
+            self._failed.clear()
+            self._cancelled.clear()
+            self._recent.clear()
+            self._max_depth = self._queued + self._in_flight
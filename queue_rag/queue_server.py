@@ -3,8 +3,10 @@ import threading
 import time
 import uuid
 from typing import Any, Callable, Dict, List, Optional, Tuple
-from concurrent.futures import Future
+from concurrent.futures import CancelledError, Future, InvalidStateError
 import logging
+from queue_rag.queue_metrics import QueueMetrics
+from utils.cancellation import CancellationToken, OperationCancelled, cap_timeout
 logger = logging.getLogger("queue_server")
 logger.setLevel(logging.INFO)
 
@@ -32,6 +34,31 @@ errors_storage: Dict[str, BaseException] = {}
 _workers: List[threading.Thread] = []
 _running_lock = threading.Lock()
 
+# 队列遥测：等待时间/服务时间直方图与深度指标
+queue_metrics = QueueMetrics()
+
+
+def _resolve_future(future: Optional[Future], result: Any = None, error: Optional[BaseException] = None) -> None:
+    """设置 future 的结果或异常；future 已被调用方取消时忽略"""
+    if future is None or future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _task_type_of(task_callable: Callable[..., Any]) -> str:
+    """任务类型：优先使用 callable 上的 task_type 属性，否则使用函数名"""
+    task_type = getattr(task_callable, "task_type", None)
+    if task_type:
+        return str(task_type)
+    return getattr(task_callable, "__name__", type(task_callable).__name__)
+
+
 class RAGWorker(threading.Thread):
     """
     RAG队列管理的工作线程，负责从队列中取出请求并执行 RAG 推理。
@@ -62,27 +89,53 @@ class RAGWorker(threading.Thread):
                 task_args: Tuple[Any, ...] = request_data.get('args', ())
                 task_kwargs: Dict[str, Any] = request_data.get('kwargs', {})
                 future: Optional[Future] = request_data.get('future')
+                cancel_token: Optional[CancellationToken] = request_data.get('cancel_token')
+
+                # 调用方已放弃（客户端断开）的任务直接跳过，不占用 worker
+                if (future is not None and future.cancelled()) or (cancel_token is not None and cancel_token.cancelled):
+                    queue_metrics.record_cancelled(request_data.get('task_type', 'unknown'))
+                    _resolve_future(future, error=OperationCancelled(cancel_token.reason if cancel_token else None))
+                    logger.info(f"{self.name} 跳过已取消的请求 ID: {request_id}")
+                    continue
 
+                request_data['started_at'] = time.time()
+                queue_metrics.record_start()
                 logger.info(f"{self.name} 正在处理请求 ID: {request_id}")
 
                 # 执行实际的任务逻辑（例如：RAG 检索/推理）
                 result = task_callable(*task_args, **task_kwargs)
-                logger.info(f"{self.name} 完成请求 ID: {request_id}")
+                request_data['finished_at'] = time.time()
+                request_data['ok'] = True
+                logger.info(
+                    f"{self.name} 完成请求 ID: {request_id} "
+                    f"(等待 {request_data['started_at'] - request_data['enqueued_at']:.3f}s, "
+                    f"执行 {request_data['finished_at'] - request_data['started_at']:.3f}s)"
+                )
 
                 # 将结果存储起来，以便主服务可以检索
                 results_storage[request_id] = result
-                if future is not None and not future.done():
-                    future.set_result(result)
+                _resolve_future(future, result=result)
 
             except Exception as e:
+                request_data.setdefault('finished_at', time.time())
+                request_data['ok'] = False
                 request_id = request_data.get('request_id')
                 errors_storage[request_id] = e
                 future = request_data.get('future')
-                if future is not None and not future.done():
-                    future.set_exception(e)
+                _resolve_future(future, error=e)
                 logger.error(f"Error in {self.name}: {e}")
                 # 在实际应用中，你可能需要更详细的错误处理和日志记录
             finally:
+                # 记录遥测数据（仅对已开始执行的任务）
+                if 'started_at' in request_data:
+                    queue_metrics.record_finish(
+                        task_type=request_data.get('task_type', 'unknown'),
+                        request_id=request_data.get('request_id'),
+                        enqueued_at=request_data.get('enqueued_at', request_data['started_at']),
+                        started_at=request_data['started_at'],
+                        finished_at=request_data.get('finished_at', time.time()),
+                        ok=request_data.get('ok', False),
+                    )
                 # 标记任务完成，通知队列可以处理下一个任务
                 request_queue.task_done()
 
@@ -133,6 +186,13 @@ def stop_rag_service(workers: Optional[List[threading.Thread]] = None):
     _workers.clear()
     logger.info("RAG 服务已停止。")
 
+def _enqueue(request_data: Dict[str, Any]) -> None:
+    """记录入队时间戳与任务类型后放入队列"""
+    request_data['task_type'] = _task_type_of(request_data['callable'])
+    request_data['enqueued_at'] = time.time()
+    queue_metrics.record_enqueue()
+    request_queue.put(request_data)
+
 # 外部调用提交任务到队列的主函数
 
 def submit_task(task_callable: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
@@ -148,14 +208,16 @@ def submit_task(task_callable: Callable[..., Any], *args: Any, **kwargs: Any) ->
         'kwargs': kwargs,
     }
     logger.info(f"提交任务 ID: {request_id} 到队列。")
-    request_queue.put(request_data)
+    _enqueue(request_data)
     return request_id
 
 # 外部调用提交任务到队列的主函数
-def submit_task_future(task_callable: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[str, Future]:
+def submit_task_future(task_callable: Callable[..., Any], *args: Any,
+                       cancel_token: Optional[CancellationToken] = None, **kwargs: Any) -> Tuple[str, Future]:
     """
     提交一个通用任务到队列，并返回 (request_id, future)。
     由工作线程在完成后设置 future 的结果或异常。
+    cancel_token 被取消时，尚未执行的任务会被跳过，等待中的 future 立即被取消。
     """
     request_id = str(uuid.uuid4())
     future: Future = Future()
@@ -165,9 +227,14 @@ def submit_task_future(task_callable: Callable[..., Any], *args: Any, **kwargs:
         'args': args,
         'kwargs': kwargs,
         'future': future,
+        'cancel_token': cancel_token,
     }
+    if cancel_token is not None:
+        cancel_token.add_callback(future.cancel)
+        # 任务结束（完成、出错或取消）后注销回调，避免长期存活的令牌上回调不断累积
+        future.add_done_callback(lambda _: cancel_token.remove_callback(future.cancel))
     logger.info(f"提交任务(带Future) ID: {request_id} 到队列。")
-    request_queue.put(request_data)
+    _enqueue(request_data)
     return request_id, future
 
 # 外部调用获取任务结果的主函数
@@ -187,22 +254,41 @@ def get_task_result(request_id: str, timeout: Optional[float] = None) -> Any:
         time.sleep(0.05)
 
 # 外部调用便捷方法：提交任务并同步等待结果返回的主函数
-def run_in_queue(task_callable: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+def run_in_queue(task_callable: Callable[..., Any], *args: Any, timeout: Optional[float] = None,
+                 cancel_token: Optional[CancellationToken] = None, **kwargs: Any) -> Any:
     """
     便捷方法：提交任务并同步等待结果返回。
+    cancel_token 被取消时立即抛出 OperationCancelled，队列中的任务不再执行；
+    令牌带截止时间时，等待时间不超过剩余时间。
     """
     if not is_running():
         # 默认单线程以保证 GPU 推理串行化
         start_rag_service(num_workers=1)
-    request_id, future = submit_task_future(task_callable, *args, **kwargs)
-    return future.result(timeout=timeout)
+    timeout = cap_timeout(cancel_token, timeout)
+    request_id, future = submit_task_future(task_callable, *args, cancel_token=cancel_token, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except CancelledError:
+        raise OperationCancelled(cancel_token.reason if cancel_token else None)
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(future.cancel)
 
-def run_in_queue_async(task_callable: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[str, Future]:
+def run_in_queue_async(task_callable: Callable[..., Any], *args: Any,
+                       cancel_token: Optional[CancellationToken] = None, **kwargs: Any) -> Tuple[str, Future]:
     """
     非阻塞提交：返回 (request_id, future)。调用方可在稍后 future.result() 或添加回调。
     """
     if not is_running():
         start_rag_service(num_workers=1)
-    return submit_task_future(task_callable, *args, **kwargs)
-
+    return submit_task_future(task_callable, *args, cancel_token=cancel_token, **kwargs)
 
+# 外部调用获取队列遥测快照的主函数
+def get_metrics_snapshot() -> Dict[str, Any]:
+    """
+    返回队列遥测快照：按任务类型的等待/服务时间分位数、实时深度与最近任务记录。
+    """
+    return queue_metrics.snapshot(
+        queue_size=request_queue.qsize(),
+        workers=sum(1 for w in _workers if w.is_alive()),
+    )
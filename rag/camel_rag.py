@@ -11,15 +11,18 @@ CamelRAG - 基于CAMEL框架的手动向量化处理工具
 import json
 import time
 from embeddings import chunk_data_by_title, chunk_data_for_log
-from camel.embeddings import SentenceTransformerEncoder
-from camel.storages import QdrantStorage
-from camel.retrievers import VectorRetriever
 import os
-from transformers import AutoTokenizer
 import logging
-import torch
 import gc
 from typing import Optional, List, Dict, Any, Callable
+from utils.lazy import lazy_import
+
+# camel/transformers/torch 在创建 CamelRAG 时才导入
+SentenceTransformerEncoder = lazy_import("camel.embeddings", "SentenceTransformerEncoder")
+QdrantStorage = lazy_import("camel.storages", "QdrantStorage")
+VectorRetriever = lazy_import("camel.retrievers", "VectorRetriever")
+AutoTokenizer = lazy_import("transformers", "AutoTokenizer")
+torch = lazy_import("torch")
 
 logger = logging.getLogger("Camel_RAG")
 logger.setLevel(logging.INFO)
@@ -1,34 +1,51 @@
 # knowledge_base.py
+from __future__ import annotations
 import os
 from typing import List
-from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredFileLoader, DirectoryLoader
-from langchain.text_splitter import TokenTextSplitter
-from langchain_qdrant import QdrantVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 import logging
-import torch
 import gc
+import hashlib
 import shutil
-from uuid import uuid4
-from langchain_community.chat_models import ChatOpenAI
-from typing import List
-import logging
-from openai import OpenAI
+from uuid import NAMESPACE_URL, uuid5
 import json
 import dotenv
 from models.model_manager import model_manager
 from models.collection_manager import collection_manager
 from queue_rag.queue_server import run_in_queue, run_in_queue_async
 from concurrent.futures import Future
-from typing import Tuple
+from typing import Callable, Optional, Tuple
+from utils.cancellation import CancellationToken
+from utils.client_pool import llm_client_pool
+from utils.lazy import lazy_import
+from utils.logger import payload
+
+# 重量级依赖延迟到首次使用时导入，导入本模块（如网关列出工具）不再加载 torch/langchain/unstructured
+torch = lazy_import("torch")
+Document = lazy_import("langchain_core.documents", "Document")
+UnstructuredFileLoader = lazy_import("langchain_community.document_loaders", "UnstructuredFileLoader")
+DirectoryLoader = lazy_import("langchain_community.document_loaders", "DirectoryLoader")
+TokenTextSplitter = lazy_import("langchain.text_splitter", "TokenTextSplitter")
+QdrantVectorStore = lazy_import("langchain_qdrant", "QdrantVectorStore")
+HuggingFaceEmbeddings = lazy_import("langchain_huggingface", "HuggingFaceEmbeddings")
+QdrantClient = lazy_import("qdrant_client", "QdrantClient")
+Distance = lazy_import("qdrant_client.http.models", "Distance")
+VectorParams = lazy_import("qdrant_client.http.models", "VectorParams")
 dotenv.load_dotenv()
 
 logger = logging.getLogger("Langchain_RAG")
 logger.setLevel(logging.INFO)
 
+# 入库时每批向量化/写入的文本块数；每批单独进入RAG队列，检索请求可在批次之间插队
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+
+# 入库进度回调: (阶段 parse/chunk/embed/upsert, 已完成数, 总数)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def _report(progress: Optional[ProgressCallback], stage: str, done: int, total: int) -> None:
+    if progress is not None:
+        progress(stage, done, total)
+
 class LangRAG:
     """
     知识库类可操作功能：
@@ -144,20 +161,62 @@ class LangRAG:
             embedding=self.embeddings,
         )
 
-    def initialize_from_folder(self, folder_path: str):
-        """首次构建知识库：从文件夹加载所有文档"""
-        loader = DirectoryLoader(folder_path)
+    def _chunk_id(self, source: str, index: int, text: str) -> str:
+        """确定性的文本块 id：同一文件重复入库（或任务中断后续传）时覆盖而不是产生重复数据"""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return str(uuid5(NAMESPACE_URL, f"{self.collection_name}:{source}:{index}:{digest}"))
 
-        docs = loader.load()
-        logger.info(f"使用loader的docs{docs}")
+    def _split_with_ids(self, docs: List[Document]) -> Tuple[List[Document], List[str]]:
+        """切分文档，为每个文本块生成确定性 id 并写入 metadata.chunk_id"""
         splitter = TokenTextSplitter(
             chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
         )
         chunks = splitter.split_documents(docs)
-        logger.info(f"加载 {len(docs)} 个文档 → 切分为 {len(chunks)} 个文本块")
-        logger.info(f"使用split的chunks{chunks}")
-        self.vectorstore.add_documents(chunks)
+        ids = []
+        counters = {}
+        for chunk in chunks:
+            source = chunk.metadata.get("source", "")
+            index = counters.get(source, 0)
+            counters[source] = index + 1
+            chunk_id = self._chunk_id(source, index, chunk.page_content)
+            chunk.metadata["chunk_id"] = chunk_id
+            ids.append(chunk_id)
+        return chunks, ids
+
+    def _upsert_chunks(self, chunks: List[Document], ids: List[str],
+                       progress: Optional[ProgressCallback] = None, start_at: int = 0) -> None:
+        """分批向量化并写入，跳过前 start_at 个已写入的文本块（任务续传）"""
+        total = len(chunks)
+        if start_at:
+            logger.info("从第 %d/%d 个文本块续传", start_at, total)
+        for start in range(min(start_at, total), total, INGEST_BATCH_SIZE):
+            end = min(start + INGEST_BATCH_SIZE, total)
+            _report(progress, "embed", start, total)
+            run_in_queue(self.vectorstore.add_documents, chunks[start:end], ids=ids[start:end])
+            _report(progress, "upsert", end, total)
+
+    def _ingest(self, docs: List[Document], progress: Optional[ProgressCallback] = None, start_at: int = 0) -> int:
+        chunks, ids = self._split_with_ids(docs)
+        logger.info("加载 %d 个文档 → 切分为 %d 个文本块", len(docs), len(chunks))
+        logger.debug("使用split的chunks: %s", payload(chunks))
+        _report(progress, "chunk", len(chunks), len(chunks))
+        self._upsert_chunks(chunks, ids, progress, start_at)
+        collection_manager.bump_collection_version(self.collection_name)
+        return len(chunks)
+
+    def _load_folder(self, folder_path: str, progress: Optional[ProgressCallback] = None) -> List[Document]:
+        _report(progress, "parse", 0, 1)
+        docs = DirectoryLoader(folder_path).load()
+        logger.debug("使用loader的docs: %s", payload(docs))
+        _report(progress, "parse", 1, 1)
+        return docs
+
+    def initialize_from_folder(self, folder_path: str, progress: Optional[ProgressCallback] = None,
+                               start_at: int = 0) -> int:
+        """首次构建知识库：从文件夹加载所有文档，返回写入的文本块数"""
+        count = self._ingest(self._load_folder(folder_path, progress), progress, start_at)
         logger.info("知识库构建完成！")
+        return count
         
     def delete_collection(self, raw_data_path: str):
         """删除知识库,包括删除向量知识库以及原文件夹"""
@@ -174,6 +233,8 @@ class LangRAG:
             self.client.delete_collection(self.collection_name)
             logger.info(f"知识库{self.collection_name}删除完成")
         
+        collection_manager.bump_collection_version(self.collection_name)
+
         # 删除原始文件夹
         if os.path.exists(raw_data_path):
             shutil.rmtree(f"{raw_data_path}")
@@ -186,43 +247,26 @@ class LangRAG:
     #=================可添加到知识库的文档类型 txt pdf xlsx docx csv ========
     # UnstructuredLoader支持txt html pad im
 
-    def add_folder(self, folder_path: str):
-        loader = DirectoryLoader(folder_path)
-
-        docs = loader.load()
-        logger.info(f"使用loader的docs{docs}")
-        splitter = TokenTextSplitter(
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-        )
-        chunks = splitter.split_documents(docs)
-        logger.info(f"加载 {len(docs)} 个文档 → 切分为 {len(chunks)} 个文本块")
-        logger.info(f"使用split的chunks{chunks}")
-        self.vectorstore.add_documents(chunks)
+    def add_folder(self, folder_path: str, progress: Optional[ProgressCallback] = None, start_at: int = 0) -> int:
+        count = self._ingest(self._load_folder(folder_path, progress), progress, start_at)
         logger.info("知识库文件夹添加完成")
+        return count
 
-    def add_file(self, file_name: str):
-        # 获取文件名
+    def add_file(self, file_name: str, progress: Optional[ProgressCallback] = None, start_at: int = 0) -> int:
+        """
+        解析、切分并写入单个文件，返回写入的文本块数
+        progress 接收 parse/chunk/embed/upsert 进度；start_at 为已写入的文本块数（任务续传）
+        """
+        _report(progress, "parse", 0, 1)
         loader = UnstructuredFileLoader(file_name)
         docs = loader.load()
-        logger.info(f"使用loader的docs{docs}")
-        splitter = TokenTextSplitter(
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-        )
-        id_chunks = []
-        chunks = splitter.split_documents(docs)
-        ids = [str(uuid4()) for _ in range(len(chunks))]
-        for i,chunk in enumerate(chunks):
-            id_chunks.append(Document(
-                page_content=chunk.page_content,
-                metadata={
-                    "source": file_name,
-                    "chunk_id": ids[i]
-                }
-            ))
-        logger.info(f"加载 {len(docs)} 个文档 → 切分为 {len(chunks)} 个文本块")
-        logger.info(f"使用split的chunks{id_chunks}")
-        self.vectorstore.add_documents(id_chunks,ids=ids)
+        logger.debug("使用loader的docs: %s", payload(docs))
+        _report(progress, "parse", 1, 1)
+        # 只保留来源文件名，chunk_id 由 _split_with_ids 写入
+        docs = [Document(page_content=doc.page_content, metadata={"source": file_name}) for doc in docs]
+        count = self._ingest(docs, progress, start_at)
         logger.info("知识库文件添加完成")
+        return count
 
     def delete_file(self, file_name: str):
         # 先查出 file_id 对应的所有 chunk id
@@ -236,6 +280,7 @@ class LangRAG:
 
         # 批量删除
         self.vectorstore.delete(ids=chunk_ids_to_delete)
+        collection_manager.bump_collection_version(self.collection_name)
         logger.info(f"文件{file_name}在向量知识库中删除完成")
 
     def rerank(self, query: str, results: List[Document], k: int = 5) -> List[Document]:
@@ -277,7 +322,7 @@ class LangRAG:
     只输出 JSON格式，不要额外文字。
     """
 
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = llm_client_pool.get(api_key=os.getenv("OPENAI_API_KEY"))
         schema = {
             "name": "rerank_response",
             "schema": {
@@ -313,7 +358,7 @@ class LangRAG:
 
         scores_list = json.loads(response.choices[0].message.content)["results"]
 
-        logger.info(f"重排序结果: {scores_list}")
+        logger.info("重排序结果: %s", payload(scores_list))
         scored_docs = sorted(scores_list, key=lambda x: x["score"], reverse=True)
 
         # 根据重排序结果重新组织Document对象
@@ -329,16 +374,16 @@ class LangRAG:
         return reranked_documents[:k]
 
 
-    def retrieve(self, query: str, k: int = 5) -> List[Document]:
-        """检索最相关的文档片段"""
-        logger.info(f"检索中: '{query}' (top-{k})")
+    def retrieve(self, query: str, k: int = 5, cancel_token: Optional[CancellationToken] = None) -> List[Document]:
+        """检索最相关的文档片段；cancel_token 被取消时队列中的检索任务不再执行"""
+        logger.info("检索中: '%s' (top-%d)", query, k)
         query = f"query: {query}"
         # 将相似度检索放入队列串行执行，确保 GPU/Embedding 串行化
         def _do_search(text: str, top_k: int):
             return self.vectorstore.similarity_search(text, k=top_k)
 
-        retrieve_results = run_in_queue(_do_search, query, k)
-        logger.info(f"检索到相关片段:{retrieve_results}")
+        retrieve_results = run_in_queue(_do_search, query, k, cancel_token=cancel_token)
+        logger.info("检索到 %d 个相关片段: %s", len(retrieve_results), payload(retrieve_results))
         #rerank_results = self.rerank(query, retrieve_results, k)
         #logger.info(f"重排序后相关片段 {rerank_results} ")
         return retrieve_results
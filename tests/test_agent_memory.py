@@ -0,0 +1,98 @@
+"""
+Agent 对话记忆测试：增量计数、增量序列化与按 token 预算压缩工具结果
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv", reason="需要 python-dotenv")
+pytest.importorskip("openai", reason="需要 openai")
+
+from agents.core_schema import Message
+from agents.memory import Memory
+
+
+def _rows(n):
+    return [{"id": i, "type_name": "水温", "value": 25 + i / 10, "recorded_at": f"2025-06-15 {i % 24:02d}:00:00"}
+            for i in range(n)]
+
+
+def _observation(n):
+    return json.dumps({"status": "ok", "result": {"results": [{"query": "q", "rows": _rows(n)}]}}, ensure_ascii=False)
+
+
+def _call(call_id, name="read_sql_query"):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": "{}"}}
+
+
+def _tool_turn(memory, call_ids, rows=200):
+    memory.add(Message(role="assistant", content="[tools] executing", tool_calls=[_call(c) for c in call_ids]))
+    for call_id in call_ids:
+        memory.add(Message.tool(_observation(rows), tool_call_id=call_id, name="read_sql_query"))
+
+
+class TestMemory:
+
+    def test_counts_follow_appends(self):
+        memory = Memory([Message.system("s"), Message.user("q")])
+        assert memory.count("tool") == 0
+        _tool_turn(memory, ["a", "b"], rows=1)
+        assert memory.count("tool") == 2
+        # agent.messages += [...] 原地追加后赋回同一列表
+        messages = memory.messages
+        messages += [Message.user("继续")]
+        memory.messages = messages
+        assert memory.count("user") == 2
+        memory.messages = [Message.user("新对话")]
+        assert memory.count("tool") == 0 and memory.count("user") == 1
+
+    def test_incremental_serialization_reuses_prefix(self):
+        memory = Memory([Message.user("q")])
+        first = memory.to_chat_messages()
+        _tool_turn(memory, ["a"], rows=1)
+        second = memory.to_chat_messages()
+        assert second[0] is first[0]
+        assert [m["role"] for m in second] == ["user", "assistant", "tool"]
+        assert second[2]["tool_call_id"] == "a"
+
+    def test_parallel_tool_results_follow_one_assistant(self):
+        memory = Memory([Message.user("q")])
+        _tool_turn(memory, ["a", "b", "c"], rows=1)
+        msgs = memory.to_chat_messages(fallback_tool_calls=[_call("x")])
+        assert [m["role"] for m in msgs] == ["user", "assistant", "tool", "tool", "tool"]
+
+    def test_fallback_assistant_inserted_once(self):
+        memory = Memory([Message.user("q"), Message.tool("{}", tool_call_id="a"), Message.tool("{}", tool_call_id="b")])
+        msgs = memory.to_chat_messages(fallback_tool_calls=[_call("a"), _call("b")])
+        assert [m["role"] for m in msgs] == ["user", "assistant", "tool", "tool"]
+        assert msgs[1]["tool_calls"][1]["id"] == "b"
+
+    def test_old_tool_results_compacted_to_budget(self):
+        memory = Memory([Message.system("s"), Message.user("q")], token_budget=6000)
+        sizes = []
+        for turn in range(6):
+            _tool_turn(memory, [f"c{turn}"])
+            msgs = memory.to_chat_messages()
+            sizes.append(memory.wire_tokens)
+        # 最近一轮的工具结果保留原文，较早的替换为摘要
+        assert msgs[-1]["content"] == memory.messages[-1].content
+        compacted = [m for m in msgs[:-1] if m["role"] == "tool"]
+        assert all(m["content"].startswith("[已压缩的工具结果] read_sql_query: 查询返回 200 行") for m in compacted)
+        assert memory.compacted == 5
+        # 超出预算后每轮只增加一条摘要的大小，而不是一整份原始结果
+        assert max(sizes) <= 6000
+        assert all(later - earlier < 100 for earlier, later in zip(sizes[1:], sizes[2:]))
+        # 原始消息保持原文
+        assert json.loads(memory.messages[3].content)["status"] == "ok"
+
+    def test_under_budget_keeps_raw_results(self):
+        memory = Memory([Message.user("q")], token_budget=10 ** 6)
+        for turn in range(3):
+            _tool_turn(memory, [f"c{turn}"])
+        msgs = memory.to_chat_messages()
+        assert memory.compacted == 0
+        assert all(json.loads(m["content"])["status"] == "ok" for m in msgs if m["role"] == "tool")
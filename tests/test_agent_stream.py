@@ -0,0 +1,149 @@
+"""
+MCPToolCallAgent 流式运行（run_stream）测试
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv", reason="需要 python-dotenv")
+pytest.importorskip("openai", reason="需要 openai")
+
+from agents.mcp_toolcall_agent import MCPToolCallAgent
+from utils.cancellation import CancellationToken
+
+
+def _chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def _tool_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class FakeStream:
+    def __init__(self, chunks, latency=0.0):
+        self.chunks = chunks
+        self.latency = latency
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.latency)
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    """每次调用按顺序返回一个流；非流式调用返回完整消息"""
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.kwargs = []
+
+    async def create(self, **kwargs):
+        self.kwargs.append(kwargs)
+        stream = self.streams.pop(0)
+        if kwargs.get("stream"):
+            return stream
+        text = "".join(c.choices[0].delta.content or "" for c in stream.chunks)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text, tool_calls=None))])
+
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    def _make(completions, observation="{}"):
+        agent = MCPToolCallAgent()
+        agent._tools_param_cache = []
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        monkeypatch.setattr(MCPToolCallAgent, "_client", property(lambda self: client))
+
+        async def _execute(tc):
+            return observation
+
+        agent._execute_tool_call = _execute
+        return agent
+
+    return _make
+
+
+async def _collect(agen):
+    return [event async for event in agen]
+
+
+class TestRunStream:
+
+    def test_tool_progress_then_answer_deltas(self, make_agent):
+        rows = json.dumps({"status": "ok", "result": {"results": [{"query": "q", "rows": [{"v": 1}, {"v": 2}]}]}})
+        completions = FakeCompletions([
+            FakeStream([_chunk(tool_calls=[_tool_delta(0, "c1", "read_sql_query", '{"sql": ')]),
+                        _chunk(tool_calls=[_tool_delta(0, arguments='"SELECT 1"}')])]),
+            FakeStream([_chunk("水温"), _chunk("正常")]),
+        ])
+        agent = make_agent(completions, observation=rows)
+
+        events = asyncio.run(_collect(agent.run_stream("水温正常吗")))
+
+        assert [e["status"] for e in events] == ["tool", "tool", "stream", "stream", "meta", "final"]
+        assert events[0]["content"] == {"name": "read_sql_query", "state": "started"}
+        assert events[1]["content"]["state"] == "finished"
+        assert "".join(e["content"] for e in events if e["status"] == "stream") == "水温正常"
+        assert events[4]["content"]["sensor_rows"] == 2
+        # 流式拼装的工具调用参数完整
+        assistant = [m for m in agent.messages if m.role == "assistant" and m.tool_calls][0]
+        assert assistant.tool_calls[0]["function"]["arguments"] == '{"sql": "SELECT 1"}'
+        assert all(kw["stream"] for kw in completions.kwargs)
+
+    def test_first_delta_before_stream_finishes(self, make_agent):
+        agent = make_agent(FakeCompletions([FakeStream([_chunk("第一"), _chunk("第二")], latency=0.2)]))
+
+        async def _first():
+            agen = agent.run_stream("你好")
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            first = await agen.__anext__()
+            elapsed = loop.time() - started
+            await agen.aclose()
+            return first, elapsed
+
+        first, elapsed = asyncio.run(_first())
+        assert first == {"status": "stream", "content": "第一"}
+        assert elapsed < 0.35
+
+    def test_non_streamed_answer_sent_whole(self, make_agent):
+        agent = make_agent(FakeCompletions([FakeStream([])]))
+
+        async def _fail(**kwargs):
+            return None
+
+        agent._chat_completion = _fail
+        events = asyncio.run(_collect(agent.run_stream("你好")))
+        assert events[0] == {"status": "stream", "content": MCPToolCallAgent.LLM_UNAVAILABLE_MESSAGE}
+        assert events[-1]["status"] == "final"
+
+    def test_cancelled_run_stops_without_final(self, make_agent):
+        agent = make_agent(FakeCompletions([FakeStream([_chunk("a"), _chunk("b"), _chunk("c")], latency=0.05)]))
+        token = CancellationToken()
+
+        async def _run():
+            events = []
+            async for event in agent.run_stream("你好", cancel_token=token):
+                events.append(event)
+                token.cancel("client_disconnected")
+            return events
+
+        events = asyncio.run(_run())
+        assert events == [{"status": "stream", "content": "a"}]
+        assert agent._event_queue is None
@@ -0,0 +1,85 @@
+"""
+完整答案缓存测试
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.answer_cache import AnswerCache, AnswerRecorder, make_cache_key, normalize_query
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _recorded(deltas, sensor_rows=0, final=True, error=False):
+    recorder = AnswerRecorder()
+    recorder.observe({"status": "meta", "content": {"sensor_rows": sensor_rows}})
+    for delta in deltas:
+        recorder.observe({"status": "stream", "content": delta})
+    if error:
+        recorder.observe({"type": "error", "content": "失败"})
+    if final:
+        recorder.observe({"status": "final", "content": "查询处理结束"})
+    return recorder
+
+
+class TestCacheKey:
+    """缓存键测试"""
+
+    def test_normalize_query(self):
+        assert normalize_query("  水温  多少？ ") == "水温 多少"
+        assert normalize_query("ＰＨ值是多少?") == normalize_query("ph值是多少")
+
+    def test_key_depends_on_fields(self):
+        fields = {"model": "gpt-4.1", "collection_version": 0}
+        assert make_cache_key("水温多少？", fields) == make_cache_key("水温多少", dict(fields))
+        assert make_cache_key("水温多少", fields) != make_cache_key("水温多少", {**fields, "collection_version": 1})
+        assert make_cache_key("水温多少", fields) != make_cache_key("水温多少", {**fields, "model": "gpt-4o-mini"})
+
+
+class TestAnswerCache:
+    """缓存读写测试"""
+
+    def test_replay_hit(self):
+        cache = AnswerCache()
+        assert cache.put("k", _recorded(["你", "好"]))
+        events = list(cache.get("k").replay())
+        assert events == [
+            {"status": "stream", "content": "你"},
+            {"status": "stream", "content": "好"},
+            {"status": "final", "content": "查询处理结束"},
+        ]
+        assert cache.stats()["hits"] == 1
+
+    def test_incomplete_or_failed_runs_not_cached(self):
+        cache = AnswerCache()
+        assert not cache.put("a", _recorded(["x"], final=False))
+        assert not cache.put("b", _recorded(["x"], error=True))
+        assert not cache.put("c", _recorded([]))
+        assert cache.get("a") is None and cache.get("b") is None and cache.get("c") is None
+
+    def test_sensor_answers_expire_sooner(self):
+        clock = FakeClock()
+        cache = AnswerCache(ttl_seconds=3600, sensor_ttl_seconds=60, clock=clock)
+        cache.put("plain", _recorded(["x"]))
+        cache.put("sensor", _recorded(["y"], sensor_rows=5))
+        clock.now += 61
+        assert cache.get("sensor") is None
+        assert cache.get("plain") is not None
+        clock.now += 3600
+        assert cache.get("plain") is None
+
+    def test_lru_eviction(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("a", _recorded(["1"]))
+        cache.put("b", _recorded(["2"]))
+        cache.get("a")
+        cache.put("c", _recorded(["3"]))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
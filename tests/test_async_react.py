@@ -0,0 +1,128 @@
+"""
+ReAct agent 异步 LLM 调用与退避测试
+"""
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv", reason="需要 python-dotenv")
+openai = pytest.importorskip("openai", reason="需要 openai")
+httpx = pytest.importorskip("httpx", reason="需要 httpx")
+
+from agents.core_schema import AgentState, Message
+from agents.mcp_toolcall_agent import MCPToolCallAgent
+from utils.cancellation import CancellationToken, OperationCancelled
+
+
+def _response(content):
+    message = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeCompletions:
+    """依次返回/抛出 outcomes 中的结果，每次调用先异步等待 latency 秒"""
+
+    def __init__(self, outcomes, latency=0.0):
+        self.outcomes = list(outcomes)
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    def _make(completions):
+        agent = MCPToolCallAgent()
+        agent._tools_param_cache = []
+        agent.initial_retry_backoff_seconds = 0.05
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        monkeypatch.setattr(MCPToolCallAgent, "_client", property(lambda self: client))
+        agent.messages = [Message.user("水温多少合适")]
+        return agent
+
+    return _make
+
+
+class TestAsyncReAct:
+
+    def test_agents_interleave_on_one_loop(self, make_agent):
+        agents = [make_agent(FakeCompletions([_response("回答")], latency=0.3)) for _ in range(3)]
+
+        async def _run_all():
+            return await asyncio.gather(*(agent.think() for agent in agents))
+
+        started = time.perf_counter()
+        assert asyncio.run(_run_all()) == [False, False, False]
+        # 三个 agent 的模型调用重叠，而不是串行累加
+        assert time.perf_counter() - started < 0.6
+        assert all(agent.state == AgentState.FINISHED for agent in agents)
+
+    def test_backoff_does_not_block_loop(self, make_agent):
+        agent = make_agent(FakeCompletions([_timeout_error(), _timeout_error(), _response("回答")]))
+        ticks = []
+
+        async def _ticker():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        async def _run():
+            ticker = asyncio.ensure_future(_ticker())
+            try:
+                return await agent.think()
+            finally:
+                ticker.cancel()
+
+        assert asyncio.run(_run()) is False
+        assert agent.messages[-1].content == "回答"
+        # 退避期间事件循环照常调度其他协程
+        assert len(ticks) >= 5
+
+    def test_retry_delay_jitter(self, make_agent):
+        agent = make_agent(FakeCompletions([_response("回答")]))
+        agent.initial_retry_backoff_seconds = 1.0
+        delays = [agent._retry_delay(2) for _ in range(50)]
+        assert all(2.0 <= d <= 3.0 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_retries_exhausted_falls_back(self, make_agent):
+        completions = FakeCompletions([_timeout_error()])
+        agent = make_agent(completions)
+        agent.max_retries = 2
+        assert asyncio.run(agent.think()) is False
+        assert completions.calls == 3
+        assert agent.messages[-1].content == MCPToolCallAgent.LLM_UNAVAILABLE_MESSAGE
+        assert agent.state == AgentState.FINISHED
+
+    def test_cancel_during_backoff(self, make_agent):
+        agent = make_agent(FakeCompletions([_timeout_error()]))
+        agent.initial_retry_backoff_seconds = 5
+        agent.cancel_token = CancellationToken()
+
+        async def _run():
+            asyncio.get_running_loop().call_later(0.05, agent.cancel_token.cancel)
+            await agent.think()
+
+        started = time.perf_counter()
+        with pytest.raises(OperationCancelled):
+            asyncio.run(_run())
+        assert time.perf_counter() - started < 1
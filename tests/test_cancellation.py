@@ -0,0 +1,282 @@
+"""
+客户端断开取消测试（取消令牌、RAG 队列跳过、流式运行取消）
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.session_store import InMemorySessionStore
+from api import sse_stream
+from api.sse_stream import SSEFrameBuilder, parse_stream_request, simulated_agent
+from api.stream_runs import StreamRunRegistry, split_frames
+from queue_rag import queue_server
+from utils.cancellation import DEADLINE_EXCEEDED, DEADLINE_EXCEEDED_MESSAGE, CancellationToken, OperationCancelled, cap_timeout, run_cancellable
+
+
+class TestCancellationToken:
+    """取消令牌测试"""
+
+    def test_callbacks_run_once(self):
+        token = CancellationToken()
+        calls = []
+        token.add_callback(lambda: calls.append("a"))
+        assert token.cancel("client_disconnected")
+        assert not token.cancel("again")
+        assert calls == ["a"] and token.reason == "client_disconnected"
+        # 已取消时注册的回调立即执行
+        token.add_callback(lambda: calls.append("b"))
+        assert calls == ["a", "b"]
+        with pytest.raises(OperationCancelled):
+            token.raise_if_cancelled()
+
+    def test_removed_callback_not_called(self):
+        token = CancellationToken()
+        calls = []
+        callback = lambda: calls.append(1)
+        token.add_callback(callback)
+        token.remove_callback(callback)
+        token.cancel()
+        assert calls == []
+
+    def test_run_cancellable_from_other_thread(self):
+        token = CancellationToken()
+        cleaned = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            finally:
+                cleaned.append(True)
+
+        async def scenario():
+            threading.Timer(0.05, token.cancel).start()
+            await run_cancellable(slow(), token)
+
+        started = time.time()
+        with pytest.raises(OperationCancelled):
+            asyncio.run(scenario())
+        assert time.time() - started < 2
+        assert cleaned == [True]
+
+    def test_run_cancellable_without_token(self):
+        async def value():
+            return 7
+
+        assert asyncio.run(run_cancellable(value(), None)) == 7
+
+
+class TestDeadline:
+    """请求级截止时间测试"""
+
+    def test_deadline_cancels_token(self):
+        token = CancellationToken()
+        token.set_deadline(0.05)
+        assert 0 < token.remaining() <= 0.05
+        assert token.cap_timeout(30) <= 0.05
+        assert token.cap_timeout(0.01) == 0.01
+        assert token.wait(2)
+        assert token.deadline_exceeded and token.reason == DEADLINE_EXCEEDED
+
+    def test_clear_deadline(self):
+        token = CancellationToken()
+        token.set_deadline(0.05)
+        token.clear_deadline()
+        assert token.remaining() is None
+        assert not token.wait(0.1)
+        assert cap_timeout(None, 5) == 5 and cap_timeout(token, None) is None
+
+    def test_queue_wait_bounded_by_deadline(self):
+        release = threading.Event()
+        queue_server.run_in_queue_async(lambda: release.wait(5))
+        token = CancellationToken()
+        token.set_deadline(0.1)
+        started = time.time()
+        try:
+            with pytest.raises((OperationCancelled, TimeoutError)):
+                queue_server.run_in_queue(lambda: "late", cancel_token=token)
+            assert time.time() - started < 2
+        finally:
+            release.set()
+
+    def test_resolve_deadline_seconds(self):
+        assert parse_stream_request({}).deadline_seconds == sse_stream.REQUEST_DEADLINE_SECONDS
+        assert parse_stream_request({"deadline_seconds": "5"}).deadline_seconds == 5
+        assert parse_stream_request({"config": {"deadline_seconds": 7}}).deadline_seconds == 7
+        assert parse_stream_request({"deadline_seconds": 10 ** 6}).deadline_seconds == sse_stream.REQUEST_DEADLINE_MAX_SECONDS
+        with pytest.raises(ValueError):
+            parse_stream_request({"deadline_seconds": "soon"})
+
+    def test_stream_run_stops_at_deadline(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "d1", "deadline_seconds": "0.1"})
+        run = registry.create(req)
+        run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+        run.start_thread(simulated_agent("q", {}, cancel_token=run.cancel_token))
+        frames = "".join(run.iter_frames())
+        assert run.cancel_token.deadline_exceeded
+        assert "客户端已断开" not in frames
+        # 超时错误帧是最后一帧，且只出现一次
+        assert frames.count(DEADLINE_EXCEEDED_MESSAGE) == 1
+        assert DEADLINE_EXCEEDED_MESSAGE in split_frames(frames)[-1][1]
+
+    def test_async_stream_run_reports_deadline(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "d2", "deadline_seconds": "0.1"})
+
+        async def slow_agent():
+            yield {"type": "stream", "content": "部分回答"}
+            await asyncio.sleep(5)
+            yield {"type": "final", "content": "不应到达"}
+
+        async def _run():
+            run = registry.create(req)
+            run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+            run.start_task(slow_agent())
+            return "".join([chunk async for chunk in run.aiter_frames()])
+
+        frames = asyncio.run(_run())
+        assert "不应到达" not in frames
+        assert DEADLINE_EXCEEDED_MESSAGE in split_frames(frames)[-1][1]
+
+
+class TestQueueCancellation:
+    """RAG 队列取消测试"""
+
+    def test_cancelled_task_is_skipped(self):
+        started = threading.Event()
+        release = threading.Event()
+        executed = []
+
+        def blocker():
+            started.set()
+            release.wait(5)
+
+        def retrieve_task():
+            executed.append(True)
+            return "docs"
+
+        queue_server.queue_metrics.reset()
+        # 占住 worker，使后续任务停留在队列中
+        queue_server.run_in_queue_async(blocker)
+        assert started.wait(5)
+
+        token = CancellationToken()
+        result = {}
+
+        def caller():
+            try:
+                queue_server.run_in_queue(retrieve_task, cancel_token=token, timeout=5)
+            except OperationCancelled as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=caller)
+        thread.start()
+        time.sleep(0.05)
+        token.cancel("client_disconnected")
+        thread.join(2)
+        assert isinstance(result.get("error"), OperationCancelled)
+
+        release.set()
+        deadline = time.time() + 2
+        while queue_server.get_metrics_snapshot()["tasks"].get("retrieve_task", {}).get("cancelled", 0) < 1:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert executed == []
+
+    def test_async_submit_deregisters_callback(self):
+        token = CancellationToken()
+        for _ in range(3):
+            _, future = queue_server.run_in_queue_async(lambda: "ok", cancel_token=token)
+            assert future.result(5) == "ok"
+        # 完成回调在 worker 线程中设置结果之后执行
+        deadline = time.time() + 2
+        while token._callbacks:
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+
+class TestStreamRunCancellation:
+    """流式运行在客户端断开后取消"""
+
+    def test_run_cancelled_after_grace(self):
+        store = InMemorySessionStore()
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "c1", "session_id": "cs1"})
+        run = registry.create(req, lease=store.lease("cs1"))
+        run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+        run.grace_seconds = 0.05
+        run.start_thread(simulated_agent("q", {}, cancel_token=run.cancel_token))
+
+        consumer = run.iter_frames()
+        next(consumer)
+        consumer.close()
+
+        deadline = time.time() + 3
+        while not run.finished:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert run.cancel_token.reason == "client_disconnected"
+        assert not store.is_active("cs1")
+        # 迟到的重连能看到运行被取消
+        tail = "".join(run.iter_frames(0))
+        assert "运行已取消" in tail
+
+    def test_reconnect_within_grace_keeps_running(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "c2"})
+        run = registry.create(req)
+        run.grace_seconds = 0.5
+        gate = threading.Event()
+
+        def events():
+            gate.wait(5)
+            yield {"status": "stream", "content": "x"}
+            yield {"status": "final", "content": "done"}
+
+        run.start_thread(events())
+        consumer = run.iter_frames()
+        next(consumer)
+        consumer.close()
+        # 宽限期内重连
+        resumed = run.iter_frames()
+        gate.set()
+        frames = "".join(resumed)
+        assert not run.cancel_token.cancelled
+        assert '"completed"' in frames
+
+    def test_async_run_cancelled_after_grace(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "c3"})
+        cleaned = []
+
+        async def agen():
+            try:
+                yield {"status": "stream", "content": "0"}
+                await asyncio.sleep(5)
+                yield {"status": "final", "content": "done"}
+            finally:
+                cleaned.append(True)
+
+        async def scenario():
+            run = registry.create(req)
+            run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+            run.grace_seconds = 0.05
+            run.start_task(agen())
+            consumer = run.aiter_frames()
+            await consumer.__anext__()
+            await consumer.aclose()
+            deadline = time.time() + 3
+            while not run.finished:
+                assert time.time() < deadline
+                await asyncio.sleep(0.01)
+            return run
+
+        run = asyncio.run(scenario())
+        assert run.cancel_token.cancelled
+        assert cleaned == [True]
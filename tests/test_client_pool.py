@@ -0,0 +1,95 @@
+"""
+共享客户端池测试
+"""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.client_pool import ConnectionStats, LLMClientPool
+
+
+class FakeClient:
+    def __init__(self, base_url, api_key):
+        self.base_url = base_url
+        self.api_key = api_key
+
+
+def _pool():
+    return LLMClientPool(sync_factory=FakeClient, async_factory=FakeClient)
+
+
+class TestLLMClientPool:
+    """LLM 客户端池测试"""
+
+    def test_reuses_client_per_base_and_key(self):
+        pool = _pool()
+        first = pool.get(api_key="k1")
+        assert pool.get(api_key="k1") is first
+        assert pool.get(api_key="k2") is not first
+        assert pool.get(base_url="https://proxy.example/v1", api_key="k1") is not first
+        stats = pool.stats()
+        assert stats["created"] == 3 and stats["borrowed"] == 1
+
+    def test_concurrent_borrow_creates_one_client(self):
+        pool = _pool()
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(pool.get(api_key="k"))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(c) for c in clients}) == 1
+        assert pool.stats()["created"] == 1
+
+    def test_async_clients_are_per_event_loop(self):
+        pool = _pool()
+
+        async def borrow():
+            return pool.get_async(api_key="k"), pool.get_async(api_key="k")
+
+        a1, a2 = asyncio.run(borrow())
+        b1, _ = asyncio.run(borrow())
+        assert a1 is a2
+        assert b1 is not a1
+
+    def test_key_is_not_stored_in_plain_text(self):
+        pool = _pool()
+        pool.get(api_key="secret-key")
+        assert all("secret-key" not in str(key) for key in pool._sync)
+
+
+class TestConnectionStats:
+    """连接复用统计测试"""
+
+    def test_counts_new_and_reused_connections(self):
+        stats = ConnectionStats()
+        first = stats.start_request()
+        for name in ("connection.connect_tcp.started", "connection.connect_tcp.complete",
+                     "connection.start_tls.started", "connection.start_tls.complete",
+                     "http11.send_request_headers.started"):
+            stats.observe(first, name)
+        for _ in range(3):
+            # 复用已有连接：没有 connect_tcp 事件
+            stats.observe(stats.start_request(), "http11.send_request_headers.started")
+
+        snapshot = stats.snapshot()
+        assert snapshot["requests"] == 4
+        assert snapshot["new_connections"] == 1
+        assert snapshot["reused_requests"] == 3
+        assert snapshot["setup_seconds"] >= 0
+        assert snapshot["estimated_saved_seconds"] >= 0
+
+    def test_async_hook_installs_trace(self):
+        stats = ConnectionStats()
+
+        class Request:
+            extensions = {}
+
+        request = Request()
+        asyncio.run(stats.async_hook(request))
+        asyncio.run(request.extensions["trace"]("connection.connect_tcp.started", {}))
+        asyncio.run(request.extensions["trace"]("connection.connect_tcp.complete", {}))
+        assert stats.snapshot()["new_connections"] == 1
@@ -0,0 +1,171 @@
+"""
+上下文打包测试
+"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.context_packer import (
+    KB, SENSOR, ContextPacker, TokenCounter, context_priority, dedupe_chunks, estimate_tokens, render_rows,
+    summarize_observation,
+)
+
+
+class EstimateCounter(TokenCounter):
+    """固定按字符估算，测试结果不依赖是否安装 tiktoken"""
+
+    name = "estimate"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+def _rows(n, type_name="PH"):
+    return [{"id": 1000 + i, "sensor_id": 3, "value": 7.5 + i / 100, "recorded_at": f"2025-06-15T{i % 24:02d}:00:00",
+             "type_name": type_name, "description": "PH", "unit": ""} for i in range(n)]
+
+
+def _sensor_result(rows, query="SELECT * FROM sensor_readings"):
+    return {"status": "ok", "result": {"results": [{"query": query, "rows": rows}]}}
+
+
+def _retrieve_result(chunks):
+    return {"status": "ok", "result": {"chunks": chunks}}
+
+
+CHUNKS = [
+    {"text": "循环水养殖系统通过物理过滤去除残饵和粪便。" * 10, "source": "手册.pdf", "chunk_id": "a"},
+    {"text": "生物过滤依靠硝化细菌将氨氮转化为硝酸盐。" * 10, "source": "手册.pdf", "chunk_id": "b"},
+    {"text": "循环水养殖系统通过物理过滤去除残饵和粪便。" * 10, "source": "手册.pdf", "chunk_id": "a"},
+    {"text": "pH 应保持在 7.5 到 8.5 之间，过低时可加入碳酸氢钠。" * 5, "source": "ESG.docx", "chunk_id": "c"},
+]
+
+
+class TestRenderRows:
+    """传感器行紧凑渲染测试"""
+
+    def test_constant_columns_hoisted(self):
+        header, lines = render_rows(_rows(3))
+        assert header.splitlines()[0] == "共同字段: sensor_id=3, type_name=PH, description=PH, unit="
+        assert header.splitlines()[1] == "value | recorded_at"
+        assert lines[0] == "7.5 | 2025-06-15 00:00:00"
+        # 主键不输出
+        assert "1000" not in header + "".join(lines)
+
+    def test_single_row_keeps_all_columns(self):
+        header, lines = render_rows(_rows(1))
+        assert "共同字段" not in header
+        assert header == "sensor_id | value | recorded_at | type_name | description | unit"
+        assert len(lines) == 1
+
+    def test_empty(self):
+        assert render_rows([]) == ("（无记录）", [])
+
+
+class TestDedupeChunks:
+    """检索片段去重测试"""
+
+    def test_duplicate_chunk_id_and_text(self):
+        kept = dedupe_chunks(CHUNKS)
+        assert len(kept) == 3
+        assert [c["source"] for c in kept] == ["手册.pdf", "手册.pdf", "ESG.docx"]
+
+    def test_contained_chunk_dropped(self):
+        kept = dedupe_chunks([{"text": "ABCDEFGH" * 5, "source": "x"}, {"text": "CDEFGH", "source": "y"}])
+        assert len(kept) == 1
+
+    def test_overlapping_chunks_merged(self):
+        first = "第一段内容" * 5 + "重叠部分的文字内容用于检测切分"
+        second = "重叠部分的文字内容用于检测切分" + "第二段内容" * 5
+        kept = dedupe_chunks([{"text": first, "source": "s"}, {"text": second, "source": "s"}], min_overlap=10)
+        assert kept == [{"text": first + "第二段内容" * 5, "source": "s"}]
+
+    def test_overlap_from_other_source_not_merged(self):
+        first = "A" * 10 + "overlap-text-123456"
+        second = "overlap-text-123456" + "B" * 10
+        assert len(dedupe_chunks([{"text": first, "source": "s"}, {"text": second, "source": "t"}], 10)) == 2
+
+
+class TestContextPacker:
+    """预算与优先级测试"""
+
+    def test_priority_by_intent(self):
+        assert context_priority("过去24小时pH最低是多少") == SENSOR
+        assert context_priority("pH的检测方法") == KB
+        assert context_priority("什么是循环水养殖") == KB
+
+    def test_fewer_tokens_than_json(self):
+        retrieve, sensor = _retrieve_result(CHUNKS), _sensor_result(_rows(100))
+        packer = ContextPacker(budget=100000, counter=EstimateCounter())
+        packed = packer.pack("过去4天pH变化", retrieve, sensor)
+        assert packed.sensor_rows_included == 100
+        assert packed.kb_chunks_included == 3
+        original = (json.dumps(retrieve, ensure_ascii=False, indent=2)
+                    + json.dumps(sensor, ensure_ascii=False, indent=2))
+        assert packed.tokens < estimate_tokens(original) * 0.6
+
+    def test_budget_respected_sensor_first(self):
+        packer = ContextPacker(budget=800, counter=EstimateCounter())
+        packed = packer.pack("过去4天pH变化", _retrieve_result(CHUNKS), _sensor_result(_rows(100)))
+        assert packed.priority == SENSOR
+        assert packed.tokens <= 800
+        assert 0 < packed.sensor_rows_included < 100
+        assert "因长度限制未列出" in packed.text
+        # 最新的行在前，截断时保留
+        assert "7.5 | 2025-06-15 00:00:00" in packed.text
+
+    def test_budget_respected_kb_first(self):
+        packer = ContextPacker(budget=500, counter=EstimateCounter())
+        packed = packer.pack("什么是生物过滤", _retrieve_result(CHUNKS), _sensor_result(_rows(100)))
+        assert packed.priority == KB
+        assert packed.tokens <= 500
+        assert packed.kb_chunks_included >= 1
+        assert packed.text.index("[1] 来源: 手册.pdf") < packed.text.index("【传感器数据查询】")
+
+    def test_unused_budget_goes_to_other_section(self):
+        packer = ContextPacker(budget=3000, counter=EstimateCounter())
+        packed = packer.pack("什么是生物过滤", _retrieve_result(CHUNKS[:1]), _sensor_result(_rows(100)))
+        assert packed.kb_chunks_included == 1
+        # 知识库只用了少量预算，传感器数据使用剩余部分（超过 30% 的份额）
+        assert packed.sensor_rows_included == 100
+
+    def test_errors_rendered(self):
+        packer = ContextPacker(counter=EstimateCounter())
+        packed = packer.pack("水温", {"status": "error", "reason": "超时"}, {"result": {"error": "数据库连接失败"}})
+        assert "（检索出错: 超时）" in packed.text
+        assert "（查询出错: 数据库连接失败）" in packed.text
+
+    def test_stats(self):
+        packer = ContextPacker(counter=EstimateCounter())
+        stats = packer.pack("水温", _retrieve_result(CHUNKS), _sensor_result(_rows(5))).stats()
+        assert stats["kb_chunks"] == 4
+        assert stats["kb_chunks_kept"] == 3
+        assert stats["sensor_rows"] == 5
+        assert stats["tokenizer"] == "estimate"
+
+
+class TestSummarizeObservation:
+    """对话记忆中较早工具结果的摘要"""
+
+    def test_query_rows(self):
+        summary = summarize_observation("read_sql_query", json.dumps(_sensor_result(_rows(50)), ensure_ascii=False))
+        assert summary.startswith("[已压缩的工具结果] read_sql_query: 查询返回 50 行")
+        assert "type_name=PH" in summary
+        assert len(summary) < 300
+
+    def test_truncated_query_keeps_continuation(self):
+        result = _sensor_result(_rows(5))
+        result["result"]["results"][0].update(truncated=True, total_rows_estimate=1200, continuation="tok")
+        summary = summarize_observation("read_sql_query", json.dumps(result, ensure_ascii=False))
+        assert "查询返回 5 行（已截断，共约 1200 行，续页令牌 tok）" in summary
+
+    def test_chunks_keep_sources(self):
+        summary = summarize_observation("retrieve", json.dumps(_retrieve_result(CHUNKS), ensure_ascii=False))
+        assert "4 个片段" in summary and "手册.pdf, ESG.docx" in summary
+
+    def test_plain_text_truncated(self):
+        summary = summarize_observation("list_sql_tables", "sensor_readings " * 100, max_chars=50)
+        assert "（原文 1599 字符）" in summary
+        assert summarize_observation("x", "短结果") == "[已压缩的工具结果] x: 短结果"
@@ -0,0 +1,215 @@
+# tests/test_db_backend.py
+"""
+数据库连接池、SQLite 后端与查询结果截断/续页测试（本地 SQLite 文件，结构与 dataprocess/csv_sql.py 相同）
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ToolOrchestrator.tools import db_tools
+from ToolOrchestrator.tools.db_backend import (QueryTimeout, SQLiteBackend, create_db_backend, db_pool_stats,
+                                                set_db_backend)
+from utils.cancellation import CancellationToken, OperationCancelled
+from utils.schema_catalog import parse_tables
+
+SLOW_QUERY = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+              "SELECT COUNT(*) FROM c WHERE x < 0")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "sensor_data.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE sensor_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        oxygen_saturation REAL,
+        water_level REAL,
+        ph REAL,
+        ph_temp REAL,
+        turbidity REAL,
+        turbidity_temp REAL
+    )
+    """)
+    conn.executemany("INSERT INTO sensor_data (timestamp, ph, water_level) VALUES (?, ?, ?)",
+                     [(f"2025-06-13 {h:02d}:00:00", 7 + h / 100, 100 + h) for h in range(24)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def backend(db_path):
+    backend = SQLiteBackend(db_path, max_size=2)
+    set_db_backend(backend)
+    yield backend
+    asyncio.run(backend.close())
+    set_db_backend(None)
+
+
+class TestSQLiteTools:
+
+    def test_list_tables_and_schema(self, backend):
+        assert asyncio.run(db_tools.list_sql_tables()) == {"tables": ["sensor_data"]}
+        schema = asyncio.run(db_tools.get_tables_schema(["sensor_data"]))["schemas"]["sensor_data"]
+        assert schema[0][:4] == ["id", "INTEGER", "YES", "PRI"]
+        assert [row[0] for row in schema][-1] == "turbidity_temp"
+
+    def test_read_queries_one_failure_does_not_affect_others(self, backend):
+        result = asyncio.run(db_tools.read_query_for_sensor_readings([
+            {"query": "SELECT timestamp, ph FROM sensor_data ORDER BY id LIMIT 2"},
+            {"query": "SELECT * FROM missing_table"},
+            {"query": "SELECT COUNT(*) AS n FROM sensor_data"},
+        ]))["results"]
+        assert result[0]["rows"] == [{"timestamp": "2025-06-13 00:00:00", "ph": 7.0},
+                                     {"timestamp": "2025-06-13 01:00:00", "ph": 7.01}]
+        assert "missing_table" in result[1]["error"]
+        assert result[2]["rows"] == [{"n": 24}]
+
+    def test_describe_database_feeds_schema_catalog(self, backend):
+        tables = parse_tables(asyncio.run(db_tools.describe_database()))
+        assert tables[0].name == "sensor_data" and tables[0].rows == 24
+        assert tables[0].columns[0].render() == "id integer PK"
+
+    def test_read_only(self, backend):
+        result = asyncio.run(db_tools.read_sql_query([{"query": "DELETE FROM sensor_data"}]))["results"]
+        assert "readonly" in result[0]["error"]
+
+    def test_missing_database_reported_as_error(self, tmp_path):
+        set_db_backend(SQLiteBackend(str(tmp_path / "missing.db")))
+        try:
+            assert "数据库连接失败" in asyncio.run(db_tools.list_sql_tables())["error"]
+        finally:
+            set_db_backend(None)
+
+
+class TestConnectionPool:
+
+    def test_connections_reused(self, backend):
+        for _ in range(3):
+            asyncio.run(db_tools.list_sql_tables())
+        stats = db_pool_stats()
+        assert stats["backend"] == "sqlite"
+        assert stats["acquired"] == 3 and stats["created"] == 1
+        assert stats["in_use"] == 0 and stats["free"] == 1
+
+    def test_concurrent_acquires_bounded_by_max_size(self, backend):
+        async def _run():
+            async def _one():
+                async with backend.connection() as conn:
+                    await asyncio.sleep(0.01)
+                    return await conn.fetch("SELECT 1 AS x")
+            return await asyncio.gather(*[_one() for _ in range(4)])
+
+        assert asyncio.run(_run()) == [[{"x": 1}]] * 4
+        stats = backend.stats()
+        # 超出 max_size 的请求等待连接归还
+        assert stats["max_in_use"] == 2 and stats["in_use"] == 0
+        assert stats["created"] == 2 and stats["free"] == 2 and stats["max_wait_ms"] > 0
+
+    def test_health_check_on_idle_connection(self, db_path):
+        backend = SQLiteBackend(db_path, ping_idle_seconds=0)
+
+        async def _run():
+            for _ in range(2):
+                async with backend.connection() as conn:
+                    await conn.fetch("SELECT 1")
+
+        asyncio.run(_run())
+        assert backend.stats()["health_checks"] == 1
+        asyncio.run(backend.close())
+
+    def test_query_timeout_discards_connection(self, db_path):
+        backend = SQLiteBackend(db_path, query_timeout=0.2)
+
+        async def _run():
+            async with backend.connection() as conn:
+                with pytest.raises(QueryTimeout):
+                    await conn.fetch(SLOW_QUERY)
+                assert conn.broken
+
+        asyncio.run(_run())
+        stats = backend.stats()
+        assert stats["timeouts"] == 1 and stats["discarded"] == 1 and stats["free"] == 0
+
+    def test_cancelled_token_stops_query(self, backend):
+        token = CancellationToken()
+        token.cancel()
+        with pytest.raises(OperationCancelled):
+            asyncio.run(db_tools.read_query_for_sensor_readings([{"query": "SELECT 1"}], cancel_token=token))
+        assert backend.stats()["in_use"] == 0
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_db_backend("oracle")
+
+
+def _read(backend, queries, max_rows=10, tool_name="read_query_for_sensor_readings"):
+    return asyncio.run(db_tools._run_read_queries(tool_name, queries, max_rows=max_rows))["results"]
+
+
+class TestRowCap:
+
+    def test_small_result_not_truncated(self, backend):
+        entry = _read(backend, [{"query": "SELECT id FROM sensor_data LIMIT 3"}])[0]
+        assert len(entry["rows"]) == 3 and "truncated" not in entry and "continuation" not in entry
+
+    def test_truncated_result_pages_through_continuation(self, backend):
+        query = "SELECT id, ph FROM sensor_data ORDER BY id"
+        first = _read(backend, [{"query": query}])[0]
+        assert [r["id"] for r in first["rows"]] == list(range(1, 11))
+        assert first["truncated"] and first["total_rows_estimate"] == 24
+        second = _read(backend, [{"continuation": first["continuation"]}])[0]
+        assert [r["id"] for r in second["rows"]] == list(range(11, 21))
+        assert second["offset"] == 10 and second["query"] == query
+        last = _read(backend, [{"continuation": second["continuation"]}])[0]
+        assert [r["id"] for r in last["rows"]] == [21, 22, 23, 24]
+        assert "truncated" not in last and "continuation" not in last
+
+    def test_continuation_bound_to_tool(self, backend):
+        first = _read(backend, [{"query": "SELECT id FROM sensor_data"}], tool_name="read_sql_query")[0]
+        entry = _read(backend, [{"continuation": first["continuation"]}])[0]
+        assert "续页令牌无效" in entry["error"]
+
+    def test_sqlite_connection_reused_after_truncation(self, backend):
+        _read(backend, [{"query": "SELECT id FROM sensor_data LIMIT 3"}])
+        assert backend.stats()["discarded"] == 0
+        # SQLite 游标关闭即可释放未读结果，连接继续复用
+        _read(backend, [{"query": "SELECT id FROM sensor_data"}])
+        assert backend.stats()["discarded"] == 0 and backend.stats()["in_use"] == 0
+
+
+class TestResultConversion:
+
+    def test_columnwise_conversion(self):
+        rows = [(1, Decimal("7.25"), datetime(2025, 6, 13, 8), b"ok", None),
+                (2, None, datetime(2025, 6, 13, 9), b"x", "a")]
+        records = db_tools.rows_to_records(["id", "ph", "recorded_at", "flag", "note"], rows)
+        assert records == [
+            {"id": 1, "ph": 7.25, "recorded_at": "2025-06-13T08:00:00", "flag": "ok", "note": None},
+            {"id": 2, "ph": None, "recorded_at": "2025-06-13T09:00:00", "flag": "x", "note": "a"},
+        ]
+
+    def test_duplicate_columns_kept(self):
+        assert db_tools.rows_to_records(["id", "id"], [(1, 2)]) == [{"id": 1, "id_2": 2}]
+        assert db_tools.rows_to_records(["id"], []) == []
+
+    def test_continuation_store_expiry(self):
+        now = [1000.0]
+        store = db_tools.ContinuationStore(ttl_seconds=60, max_entries=2, clock=lambda: now[0])
+        token = store.issue("read_sql_query", "SELECT 1", 500, None)
+        assert store.resolve("read_sql_query", token) == ("SELECT 1", 500, None)
+        now[0] += 61
+        assert store.resolve("read_sql_query", token) is None
+        tokens = [store.issue("read_sql_query", f"SELECT {i}", 0, 1) for i in range(3)]
+        assert store.resolve("read_sql_query", tokens[0]) is None
+        assert store.resolve("read_sql_query", tokens[2]) == ("SELECT 2", 0, 1)
@@ -0,0 +1,107 @@
+"""
+常驻后台事件循环测试
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cancellation import CancellationToken, OperationCancelled
+from utils.event_loop import BackgroundEventLoop
+
+
+class TestBackgroundEventLoop:
+    """后台事件循环测试"""
+
+    def test_loop_is_shared_across_calls(self):
+        loop = BackgroundEventLoop("test-loop")
+
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = loop.run(current_loop())
+        assert loop.run(current_loop()) is first
+        assert first is loop.loop
+
+    def test_concurrent_callers_overlap(self):
+        loop = BackgroundEventLoop("test-loop")
+        results = []
+
+        def call():
+            results.append(loop.run(asyncio.sleep(0.2, result="ok")))
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == ["ok"] * 5
+        assert time.perf_counter() - started < 0.8
+
+    def test_run_raises_on_cancel(self):
+        loop = BackgroundEventLoop("test-loop")
+        token = CancellationToken()
+        cleaned = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                cleaned.set()
+
+        threading.Timer(0.1, token.cancel, args=("client_disconnected",)).start()
+        with pytest.raises(OperationCancelled):
+            loop.run(slow(), token)
+        assert cleaned.wait(1)
+
+    def test_iterate_async_generator(self):
+        loop = BackgroundEventLoop("test-loop")
+
+        async def numbers():
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i
+
+        assert list(loop.iterate(numbers())) == [0, 1, 2]
+
+    def test_iterate_stops_on_cancel_and_runs_cleanup(self):
+        loop = BackgroundEventLoop("test-loop")
+        token = CancellationToken()
+        closed = threading.Event()
+
+        async def stream():
+            try:
+                yield "first"
+                await asyncio.sleep(10)
+                yield "never"
+            finally:
+                closed.set()
+
+        items = []
+        for item in loop.iterate(stream(), token):
+            items.append(item)
+            threading.Timer(0.1, token.cancel, args=("client_disconnected",)).start()
+        assert items == ["first"]
+        assert closed.wait(1)
+
+    def test_early_close_closes_async_generator(self):
+        loop = BackgroundEventLoop("test-loop")
+        closed = threading.Event()
+
+        async def stream():
+            try:
+                while True:
+                    yield "x"
+            finally:
+                closed.set()
+
+        gen = loop.iterate(stream())
+        assert next(gen) == "x"
+        gen.close()
+        assert closed.wait(1)
@@ -0,0 +1,182 @@
+"""
+入库任务队列测试
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queue_rag.ingestion_jobs import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    IngestionJobStore,
+    IngestionService,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestIngestionJobStore:
+    """SQLite 任务存储测试"""
+
+    def test_create_and_claim(self, tmp_path):
+        store = IngestionJobStore(str(tmp_path / "jobs.db"))
+        first = store.create("add_file", "kb", "a.txt")
+        store.create("add_file", "kb", "b.txt")
+        assert first.status == QUEUED
+
+        claimed = store.claim_next("worker-1")
+        assert claimed.id == first.id
+        assert claimed.status == RUNNING and claimed.attempts == 1
+        assert store.claim_next("worker-2").path == "b.txt"
+        assert store.claim_next("worker-3") is None
+
+    def test_claim_is_exclusive_across_instances(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        IngestionJobStore(path).create("add_file", "kb", "a.txt")
+        claimed = []
+
+        def _claim():
+            job = IngestionJobStore(path).claim_next(threading.current_thread().name)
+            if job is not None:
+                claimed.append(job.id)
+
+        threads = [threading.Thread(target=_claim) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(claimed) == 1
+
+    def test_progress_sets_checkpoint_and_events(self, tmp_path):
+        store = IngestionJobStore(str(tmp_path / "jobs.db"))
+        job = store.create("add_file", "kb", "a.txt")
+        store.claim_next("w")
+        store.update_progress(job.id, "embed", 0, 10)
+        assert store.get(job.id).checkpoint == 0
+        store.update_progress(job.id, "upsert", 4, 10)
+        current = store.get(job.id)
+        assert (current.stage, current.done, current.total, current.checkpoint) == ("upsert", 4, 10, 4)
+
+        events = store.events_after(job.id)
+        assert [seq for seq, _ in events] == [1, 2, 3, 4]
+        assert events[-1][1] == {"type": "progress", "stage": "upsert", "done": 4, "total": 10}
+        assert [seq for seq, _ in store.events_after(job.id, 2)] == [3, 4]
+
+    def test_stale_running_job_is_requeued_with_checkpoint(self, tmp_path):
+        clock = FakeClock()
+        store = IngestionJobStore(str(tmp_path / "jobs.db"), clock=clock)
+        job = store.create("add_file", "kb", "a.txt")
+        store.claim_next("dead-worker")
+        store.update_progress(job.id, "upsert", 6, 10)
+
+        clock.now += 10
+        assert store.requeue_stale(60) == 0
+        clock.now += 100
+        assert store.requeue_stale(60) == 1
+
+        resumed = store.claim_next("new-worker")
+        assert resumed.id == job.id
+        assert resumed.checkpoint == 6 and resumed.attempts == 2
+
+    def test_heartbeat_keeps_job_alive(self, tmp_path):
+        clock = FakeClock()
+        store = IngestionJobStore(str(tmp_path / "jobs.db"), clock=clock)
+        job = store.create("add_file", "kb", "a.txt")
+        store.claim_next("w")
+        clock.now += 50
+        assert store.heartbeat(job.id, "w")
+        assert not store.heartbeat(job.id, "other")
+        clock.now += 50
+        assert store.requeue_stale(60) == 0
+
+
+class TestIngestionService:
+    """后台 worker 测试"""
+
+    def _service(self, tmp_path, handlers, **kwargs):
+        store = IngestionJobStore(str(tmp_path / "jobs.db"))
+        return IngestionService(store, handlers, poll_interval=0.05, **kwargs)
+
+    def test_runs_job_and_reports_progress(self, tmp_path):
+        def handler(job, progress):
+            progress("parse", 1, 1)
+            progress("chunk", 3, 3)
+            for done in (2, 3):
+                progress("embed", done - 2, 3)
+                progress("upsert", done, 3)
+
+        service = self._service(tmp_path, {"add_file": handler})
+        service.start()
+        try:
+            job = service.submit("add_file", "kb", "a.txt")
+            assert _wait_for(lambda: service.store.get(job.id).finished)
+        finally:
+            service.stop(timeout=2)
+
+        finished = service.store.get(job.id)
+        assert finished.status == SUCCEEDED and finished.checkpoint == 3
+        payloads = [payload for _, payload in service.store.events_after(job.id)]
+        assert payloads[0]["status"] == QUEUED and payloads[-1]["status"] == SUCCEEDED
+        assert [p["stage"] for p in payloads if p["type"] == "progress"] == \
+            ["parse", "chunk", "embed", "upsert", "embed", "upsert"]
+
+    def test_failed_job_is_retried_from_checkpoint(self, tmp_path):
+        seen = []
+
+        def handler(job, progress):
+            seen.append(job.checkpoint)
+            progress("upsert", job.checkpoint + 2, 6)
+            if job.attempts < 3:
+                raise RuntimeError("embedding 失败")
+
+        service = self._service(tmp_path, {"add_file": handler}, max_attempts=3)
+        service.start()
+        try:
+            job = service.submit("add_file", "kb", "a.txt")
+            assert _wait_for(lambda: service.store.get(job.id).finished)
+        finally:
+            service.stop(timeout=2)
+        assert seen == [0, 2, 4]
+        assert service.store.get(job.id).status == SUCCEEDED
+
+    def test_gives_up_after_max_attempts(self, tmp_path):
+        def handler(job, progress):
+            raise RuntimeError("文件无法解析")
+
+        service = self._service(tmp_path, {"add_file": handler}, max_attempts=2)
+        service.start()
+        try:
+            job = service.submit("add_file", "kb", "bad.pdf")
+            assert _wait_for(lambda: service.store.get(job.id).finished)
+        finally:
+            service.stop(timeout=2)
+        failed = service.store.get(job.id)
+        assert failed.status == FAILED and failed.attempts == 2
+        assert failed.error == "文件无法解析"
+
+    def test_unknown_kind_is_rejected(self, tmp_path):
+        service = self._service(tmp_path, {"add_file": lambda job, progress: None})
+        with pytest.raises(ValueError):
+            service.submit("unknown", "kb")
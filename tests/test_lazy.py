@@ -0,0 +1,69 @@
+"""
+延迟导入测试
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.import_time import parse_importtime
+from utils.lazy import lazy_import
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_after_import(module: str, candidates):
+    code = (
+        f"import sys, {module}\n"
+        f"print(','.join(m for m in {list(candidates)!r} if m in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return [m for m in proc.stdout.strip().split(",") if m]
+
+
+class TestLazyImport:
+    """延迟导入代理测试"""
+
+    def test_module_proxy(self):
+        proxy = lazy_import("json")
+        assert not proxy.loaded
+        assert proxy.dumps({"a": 1}) == '{"a": 1}'
+        assert proxy.loaded
+
+    def test_attribute_proxy_is_callable(self):
+        OrderedDict = lazy_import("collections", "OrderedDict")
+        assert list(OrderedDict([("x", 1)]).keys()) == ["x"]
+        assert OrderedDict.fromkeys("ab") == {"a": None, "b": None}
+
+    def test_missing_dependency_fails_on_first_use(self):
+        proxy = lazy_import("module_that_does_not_exist")
+        with pytest.raises(ImportError):
+            proxy.anything
+
+    def test_db_tools_does_not_import_driver(self):
+        assert _loaded_after_import("ToolOrchestrator.tools.db_tools", ["aiomysql"]) == []
+
+    @pytest.mark.skipif(importlib.util.find_spec("dotenv") is None, reason="需要 python-dotenv")
+    def test_kb_tools_does_not_import_heavy_dependencies(self):
+        heavy = ["torch", "langchain_core", "langchain_qdrant", "qdrant_client", "openai"]
+        assert _loaded_after_import("ToolOrchestrator.tools.kb_tools", heavy) == []
+
+
+class TestImportTimeReport:
+    """导入耗时报告解析测试"""
+
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   _json\n"
+            "import time:       300 |        420 | json\n"
+        )
+        records = parse_importtime(stderr)
+        assert [r["module"] for r in records] == ["_json", "json"]
+        assert records[0]["depth"] == 1 and records[1]["depth"] == 0
+        assert records[1]["cumulative_us"] == 420
@@ -0,0 +1,133 @@
+"""
+异步/采样日志测试
+"""
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import logger as log_module
+from utils.logger import (
+    AsyncQueueHandler,
+    PayloadFilter,
+    configure_payload_logging,
+    get_logging_stats,
+    payload,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+@pytest.fixture
+def logging_env(tmp_path, monkeypatch):
+    """在临时目录中初始化日志，结束后恢复根日志器"""
+    monkeypatch.chdir(tmp_path)
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    saved_policies = {k: dict(v) for k, v in log_module._payload_policies.items()}
+    yield tmp_path
+    shutdown_logging()
+    root.handlers[:] = saved_handlers
+    root.setLevel(saved_level)
+    log_module._payload_policies.clear()
+    log_module._payload_policies.update(saved_policies)
+
+
+class TestPayload:
+    """payload 截断测试"""
+
+    def test_short_value_unchanged(self):
+        assert str(payload("abc")) == "abc"
+        assert str(payload([1, 2])) == "[1, 2]"
+
+    def test_long_value_truncated(self):
+        text = str(payload(list(range(10000)), max_chars=50))
+        assert "已截断" in text
+        assert len(text) < 200
+
+    def test_long_string_truncated(self):
+        text = str(payload("x" * 5000, max_chars=100))
+        assert text.startswith("x" * 100)
+        assert "原长度 5000" in text
+
+
+class TestPayloadFilter:
+    """按日志器采样测试"""
+
+    def _record(self, name, *args):
+        return logging.LogRecord(name, logging.INFO, __file__, 1, "msg %s", args, None)
+
+    def test_sampling_per_logger(self, logging_env):
+        configure_payload_logging("sampled", sample_every=3)
+        flt = PayloadFilter()
+        kept = [flt.filter(self._record("sampled", payload("x"))) for _ in range(9)]
+        assert kept.count(True) == 3
+        assert flt.sampled_out == 6
+        # 不含 payload 的记录与未配置的日志器不受影响
+        assert all(flt.filter(self._record("sampled", "plain")) for _ in range(5))
+        assert all(flt.filter(self._record("other", payload("x"))) for _ in range(5))
+
+    def test_logger_max_chars_applied(self, logging_env):
+        configure_payload_logging("short", max_chars=10)
+        item = payload("y" * 100)
+        PayloadFilter().filter(self._record("short", item))
+        assert item.max_chars == 10
+
+    def test_decision_made_once_per_record(self, logging_env):
+        configure_payload_logging("twice", sample_every=2)
+        flt = PayloadFilter()
+        record = self._record("twice", payload("x"))
+        assert flt.filter(record) is True
+        # 同一记录经过第二个处理器时不再计数
+        assert flt.filter(record) is True
+        assert flt.filter(self._record("twice", payload("x"))) is False
+
+
+class TestAsyncLogging:
+    """后台线程写日志测试"""
+
+    def test_formatting_happens_off_caller_thread(self, logging_env):
+        setup_logging(async_mode=True)
+        caller = threading.get_ident()
+        seen = []
+
+        class Probe:
+            def __repr__(self):
+                seen.append(threading.get_ident())
+                return "probe"
+
+        logging.getLogger("probe").info("value: %s", payload(Probe()))
+        shutdown_logging()
+
+        assert seen and caller not in seen
+        content = (logging_env / "logs" / "app.log").read_text(encoding="utf-8")
+        assert "value: probe" in content
+
+    def test_exception_text_preserved(self, logging_env):
+        setup_logging(async_mode=True)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("exc").error("失败", exc_info=True)
+        shutdown_logging()
+        content = (logging_env / "logs" / "app.log").read_text(encoding="utf-8")
+        assert "ValueError: boom" in content
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        import queue
+        handler = AsyncQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("drop", logging.INFO, __file__, 1, "m", None, None)
+        handler.handle(record)
+        handler.handle(record)
+        assert handler.dropped == 1
+
+    def test_stats(self, logging_env):
+        setup_logging(async_mode=True)
+        stats = get_logging_stats()
+        assert stats["async"] is True and stats["dropped"] == 0
+        shutdown_logging()
+        assert get_logging_stats()["async"] is False
@@ -0,0 +1,155 @@
+"""
+MCPToolCallAgent 同一轮工具调用并发执行测试
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dotenv", reason="需要 python-dotenv")
+pytest.importorskip("openai", reason="需要 openai")
+
+from agents.core_schema import AgentState
+from agents.mcp_toolcall_agent import MCPToolCallAgent, ToolCall
+from utils.cancellation import CancellationToken, OperationCancelled
+
+
+class FakeRegistry:
+    """按工具名返回睡眠指定时间的处理器，并记录并发度"""
+
+    def __init__(self, delays, configs=None):
+        self.delays = delays
+        self.configs = configs or {}
+        self.running = 0
+        self.max_running = 0
+
+    def get_tool_config(self, name):
+        return self.configs.get(name)
+
+    def get_tool_handler(self, name):
+        if name not in self.delays:
+            return None
+
+        async def handler(**kwargs):
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(self.delays[name])
+            finally:
+                self.running -= 1
+            return {"status": "ok", "result": {"tool": name}}
+
+        return handler
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return MCPToolCallAgent()
+
+
+def _calls(*names):
+    return [ToolCall(f"call_{i}", name, json.dumps({"question": "q"})) for i, name in enumerate(names)]
+
+
+def _tool_messages(agent):
+    return [m for m in agent.messages if m.role == "tool"]
+
+
+class TestParallelToolCalls:
+
+    def test_turn_takes_as_long_as_slowest_tool(self, agent):
+        agent._registry = FakeRegistry({"retrieve": 0.3, "get_tables_schema": 0.3, "list_sql_tables": 0.3})
+        agent.tool_calls = _calls("retrieve", "get_tables_schema", "list_sql_tables")
+        started = time.perf_counter()
+        assert asyncio.run(agent.act()) == "[tools_executed]"
+        assert time.perf_counter() - started < 0.6
+        assert agent._registry.max_running == 3
+
+    def test_observations_in_call_order(self, agent):
+        agent._registry = FakeRegistry({"retrieve": 0.2, "get_tables_schema": 0.0})
+        agent.tool_calls = _calls("retrieve", "get_tables_schema")
+        asyncio.run(agent.act())
+        messages = _tool_messages(agent)
+        assert [m.tool_call_id for m in messages] == ["call_0", "call_1"]
+        assert json.loads(messages[0].content)["result"]["tool"] == "retrieve"
+
+    def test_concurrency_limit(self, agent):
+        agent.max_parallel_tool_calls = 2
+        agent._registry = FakeRegistry({"retrieve": 0.05})
+        agent.tool_calls = _calls(*["retrieve"] * 5)
+        asyncio.run(agent.act())
+        assert agent._registry.max_running == 2
+        assert len(_tool_messages(agent)) == 5
+
+    def test_per_tool_timeout(self, agent):
+        agent._registry = FakeRegistry({"retrieve": 5, "list_sql_tables": 0},
+                                       configs={"retrieve": {"timeout_seconds": 0.1}})
+        agent.tool_calls = _calls("retrieve", "list_sql_tables")
+        started = time.perf_counter()
+        asyncio.run(agent.act())
+        assert time.perf_counter() - started < 1
+        timed_out, ok = _tool_messages(agent)
+        assert timed_out.content.startswith("Error: 工具 retrieve 执行超时")
+        assert json.loads(ok.content)["status"] == "ok"
+
+    def test_internal_timeout_without_configured_limit(self, agent):
+        class TimingOutRegistry(FakeRegistry):
+            def get_tool_handler(self, name):
+                if name != "web_search":
+                    return super().get_tool_handler(name)
+
+                async def handler(**kwargs):
+                    # 如 aiohttp/MCP 客户端自身的超时
+                    raise asyncio.TimeoutError()
+                return handler
+
+        agent.tool_timeout_seconds = None
+        agent._registry = TimingOutRegistry({"retrieve": 0})
+        agent.tool_calls = _calls("web_search", "retrieve")
+        asyncio.run(agent.act())
+        timed_out, ok = _tool_messages(agent)
+        assert timed_out.content == "Error: 工具 web_search 执行超时"
+        assert json.loads(ok.content)["status"] == "ok"
+
+    def test_unknown_tool_keeps_its_slot(self, agent):
+        agent._registry = FakeRegistry({"retrieve": 0})
+        agent.tool_calls = _calls("missing_tool", "retrieve")
+        asyncio.run(agent.act())
+        messages = _tool_messages(agent)
+        assert messages[0].content == "Error: Unknown tool 'missing_tool'"
+        assert messages[1].tool_call_id == "call_1"
+
+    def test_finish_status(self, agent):
+        registry = FakeRegistry({"web_search": 0})
+        original = registry.get_tool_handler
+
+        def handler_with_finish(name):
+            async def handler(**kwargs):
+                return {"status": "finish"}
+            return handler if name == "web_search" else original(name)
+
+        registry.get_tool_handler = handler_with_finish
+        agent._registry = registry
+        agent.tool_calls = _calls("web_search")
+        asyncio.run(agent.act())
+        assert agent.state == AgentState.FINISHED
+
+    def test_cancellation_stops_turn(self, agent):
+        agent._registry = FakeRegistry({"retrieve": 5})
+        agent.tool_calls = _calls("retrieve")
+        agent.cancel_token = CancellationToken()
+
+        async def _run():
+            asyncio.get_running_loop().call_later(0.05, agent.cancel_token.cancel)
+            await agent.act()
+
+        started = time.perf_counter()
+        with pytest.raises(OperationCancelled):
+            asyncio.run(_run())
+        assert time.perf_counter() - started < 1
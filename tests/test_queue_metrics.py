@@ -0,0 +1,95 @@
+# tests/test_queue_metrics.py
+"""
+RAG队列遥测单元测试
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queue_rag.queue_metrics import QueueMetrics, RollingHistogram, percentile
+from queue_rag import queue_server
+
+
+class TestRollingHistogram:
+    """滚动直方图测试"""
+
+    def test_percentile_nearest_rank(self):
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 51.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([], 50) is None
+
+    def test_window_is_bounded(self):
+        hist = RollingHistogram(window_size=10)
+        for i in range(100):
+            hist.add(float(i))
+        snap = hist.snapshot()
+        assert snap["count"] == 100
+        assert snap["window"] == 10
+        # 只保留最近的10个样本
+        assert snap["p50"] >= 90.0
+        assert snap["max"] == 99.0
+
+
+class TestQueueMetrics:
+    """队列指标测试"""
+
+    def test_wait_and_service_split(self):
+        metrics = QueueMetrics()
+        metrics.record_enqueue()
+        metrics.record_start()
+        metrics.record_finish("search", "r1", enqueued_at=100.0, started_at=102.0, finished_at=102.5)
+
+        snap = metrics.snapshot()
+        task = snap["tasks"]["search"]
+        assert task["completed"] == 1
+        assert task["wait_seconds"]["p50"] == pytest.approx(2.0)
+        assert task["service_seconds"]["p50"] == pytest.approx(0.5)
+        assert snap["recent"][0]["request_id"] == "r1"
+
+    def test_depth_gauge(self):
+        metrics = QueueMetrics()
+        metrics.record_enqueue()
+        metrics.record_enqueue()
+        metrics.record_start()
+
+        depth = metrics.snapshot()["depth"]
+        assert depth == {"queued": 1, "in_flight": 1, "total": 2, "max": 2}
+
+    def test_failed_tasks_counted_separately(self):
+        metrics = QueueMetrics()
+        metrics.record_enqueue()
+        metrics.record_start()
+        metrics.record_finish("embed", "r2", 0.0, 1.0, 2.0, ok=False)
+        task = metrics.snapshot()["tasks"]["embed"]
+        assert task["failed"] == 1
+        assert task["completed"] == 0
+
+
+class TestQueueServerTelemetry:
+    """队列服务遥测集成测试"""
+
+    def test_run_in_queue_records_task_type(self):
+        def sample_task(value):
+            time.sleep(0.01)
+            return value * 2
+
+        queue_server.queue_metrics.reset()
+        assert queue_server.run_in_queue(sample_task, 21, timeout=5) == 42
+
+        # worker 在设置 future 结果后才写入遥测，稍作等待
+        deadline = time.time() + 2
+        snapshot = queue_server.get_metrics_snapshot()
+        while "sample_task" not in snapshot["tasks"] and time.time() < deadline:
+            time.sleep(0.01)
+            snapshot = queue_server.get_metrics_snapshot()
+
+        task = snapshot["tasks"]["sample_task"]
+        assert task["completed"] == 1
+        assert task["service_seconds"]["p50"] >= 0.01
+        assert snapshot["workers"] >= 1
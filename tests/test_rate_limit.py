@@ -0,0 +1,129 @@
+"""
+令牌桶限流测试
+"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.rate_limit import (
+    CLIENT,
+    GLOBAL,
+    SESSION,
+    Limit,
+    RateLimiter,
+    RouteLimit,
+    client_identity,
+    parse_rules,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _limiter(clock, **limits):
+    return RateLimiter([RouteLimit("/sse/stream_qa", **limits)], clock=clock)
+
+
+class TestRateLimiter:
+    """令牌桶限流器测试"""
+
+    def test_burst_then_reject_with_retry_after(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, session=Limit(0.5, 2))
+        assert limiter.check("/sse/stream_qa", "s1").allowed
+        assert limiter.check("/sse/stream_qa", "s1").allowed
+        decision = limiter.check("/sse/stream_qa", "s1")
+        assert not decision.allowed
+        assert decision.scope == SESSION
+        assert decision.retry_after == 2.0
+        assert decision.retry_after_header == "2"
+
+        clock.now += 2
+        assert limiter.check("/sse/stream_qa", "s1").allowed
+
+    def test_sessions_are_independent(self):
+        limiter = _limiter(FakeClock(), session=Limit(1, 1))
+        assert limiter.check("/sse/stream_qa", "s1").allowed
+        assert not limiter.check("/sse/stream_qa", "s1").allowed
+        assert limiter.check("/sse/stream_qa", "s2").allowed
+
+    def test_rejection_does_not_consume_other_buckets(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, session=Limit(1, 1), global_=Limit(1, 2))
+        assert limiter.check("/sse/stream_qa", "s1").allowed
+        # s1 被会话桶拒绝，全局桶不扣减，s2 仍可通过
+        assert not limiter.check("/sse/stream_qa", "s1").allowed
+        assert limiter.check("/sse/stream_qa", "s2").allowed
+        decision = limiter.check("/sse/stream_qa", "s3")
+        assert not decision.allowed and decision.scope == GLOBAL
+
+    def test_client_limit_applies_across_sessions(self):
+        limiter = _limiter(FakeClock(), session=Limit(1, 5), client=Limit(1, 2))
+        assert limiter.check("/sse/stream_qa", "a", "ip:1.2.3.4").allowed
+        assert limiter.check("/sse/stream_qa", "b", "ip:1.2.3.4").allowed
+        decision = limiter.check("/sse/stream_qa", "c", "ip:1.2.3.4")
+        assert not decision.allowed and decision.scope == CLIENT
+        assert limiter.check("/sse/stream_qa", "d", "ip:5.6.7.8").allowed
+
+    def test_unmatched_route_and_disabled_limiter(self):
+        limiter = _limiter(FakeClock(), global_=Limit(0, 0))
+        assert limiter.check("/ready").allowed
+        assert not limiter.check("/sse/stream_qa").allowed
+        limiter.enabled = False
+        assert limiter.check("/sse/stream_qa").allowed
+
+    def test_longest_prefix_wins(self):
+        limiter = RateLimiter([
+            RouteLimit("/knowledge_base/", global_=Limit(0, 0)),
+            RouteLimit("/knowledge_base/api/", global_=Limit(1, 1)),
+        ], clock=FakeClock())
+        assert limiter.check("/knowledge_base/api/get_knowledge_base_list").allowed
+        assert not limiter.check("/knowledge_base/upload_file").allowed
+
+    def test_lru_eviction_bounds_memory(self):
+        limiter = RateLimiter([RouteLimit("/sse/stream_qa", session=Limit(1, 1))], max_keys=3, clock=FakeClock())
+        for i in range(10):
+            limiter.check("/sse/stream_qa", f"s{i}")
+        assert limiter.stats()["buckets"] == 3
+
+    def test_rejection_frame_is_json(self):
+        limiter = _limiter(FakeClock(), global_=Limit(1, 0))
+        frame = limiter.check("/sse/stream_qa").sse_frame()
+        assert frame.startswith("data: ") and frame.endswith("\n\n")
+        payload = json.loads(frame[len("data: "):])
+        assert payload["scope"] == GLOBAL and payload["retry_after"] == 1.0
+
+
+class TestRuleConfig:
+    """规则解析与客户端识别测试"""
+
+    def test_parse_rules(self):
+        rules = parse_rules('{"/sse/stream_qa": {"session": [0.5, 3], "client": null, "global": {"rate": 10, "burst": 20}}}')
+        assert rules == [RouteLimit("/sse/stream_qa", session=Limit(0.5, 3), global_=Limit(10, 20))]
+
+    def test_client_identity(self):
+        keys = frozenset({"k1", "t1"})
+        key_id = client_identity({"X-API-Key": "k1"}, "1.1.1.1", api_keys=keys)
+        assert key_id.startswith("key:") and "k1" not in key_id
+        assert client_identity({"Authorization": "Bearer t1"}, "1.1.1.1", api_keys=keys).startswith("key:")
+        assert client_identity({}, "1.1.1.1") == "ip:1.1.1.1"
+
+    def test_spoofed_headers_do_not_create_new_buckets(self):
+        # 未登记的 key 与不可信的 X-Forwarded-For 都被忽略，按对端地址限流
+        assert client_identity({"X-API-Key": "random-1"}, "1.1.1.1") == "ip:1.1.1.1"
+        assert client_identity({"Authorization": "Bearer random-2"}, "1.1.1.1") == "ip:1.1.1.1"
+        assert client_identity({"X-Forwarded-For": "9.9.9.9"}, "1.1.1.1") == "ip:1.1.1.1"
+
+    def test_forwarded_for_behind_trusted_proxies(self):
+        # 客户端伪造的首跳 6.6.6.6 不被采信，取可信代理写入的那一跳
+        headers = {"X-Forwarded-For": "6.6.6.6, 9.9.9.9"}
+        assert client_identity(headers, "10.0.0.1", trusted_proxies=1) == "ip:9.9.9.9"
+        assert client_identity(headers, "10.0.0.1", trusted_proxies=2) == "ip:6.6.6.6"
+        assert client_identity({"X-Forwarded-For": "9.9.9.9"}, "10.0.0.1", trusted_proxies=3) == "ip:9.9.9.9"
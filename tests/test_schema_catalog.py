@@ -0,0 +1,99 @@
+# tests/test_schema_catalog.py
+"""
+数据库结构目录测试
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ToolOrchestrator.core.result_cache import tool_result_cache
+from utils.context_packer import token_counter
+from utils.schema_catalog import SchemaCatalog, parse_tables
+
+
+def _description(extra_column=False):
+    readings = [{"name": "id", "type": "bigint", "key": "PRI"}, {"name": "sensor_id", "type": "int", "key": "MUL"},
+                {"name": "value", "type": "DECIMAL(10,2)", "key": ""},
+                {"name": "recorded_at", "type": "datetime", "key": ""}]
+    if extra_column:
+        readings.append({"name": "quality", "type": "tinyint", "key": ""})
+    return {"tables": [
+        {"name": "logs", "rows": 50, "columns": [{"name": "id", "type": "int", "key": "PRI"},
+                                                {"name": "message", "type": "text", "key": ""}]},
+        {"name": "sensor_readings", "rows": 1234567, "columns": readings},
+        {"name": "sensor_types", "rows": 8, "columns": [{"name": "id", "type": "int", "key": "PRI"},
+                                                       {"name": "type_name", "type": "varchar(64)", "key": ""}]},
+        {"name": "sensors", "rows": 40000, "columns": [{"name": "id", "type": "int", "key": "PRI"}]},
+    ]}
+
+
+class FakeLoader:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _catalog(loader, **kwargs):
+    kwargs.setdefault("priority_tables", ["sensor_readings", "sensor_types"])
+    return SchemaCatalog(loader=loader, enabled=True, **kwargs)
+
+
+class TestSchemaCatalog:
+
+    def test_parse_and_render(self):
+        table = parse_tables(_description())[1]
+        assert table.render() == ("sensor_readings（约 123万 行）: id bigint PK, sensor_id int, "
+                                  "value decimal(10,2), recorded_at datetime")
+
+    def test_digest_orders_priority_then_rows(self):
+        catalog = _catalog(FakeLoader(_description()))
+        assert catalog.digest() == ""
+        assert asyncio.run(catalog.refresh())
+        names = [line.split("（")[0] for line in catalog.digest(10 ** 6).splitlines()]
+        assert names == ["sensor_readings", "sensor_types", "sensors", "logs"]
+
+    def test_digest_respects_token_budget(self):
+        catalog = _catalog(FakeLoader(_description()))
+        asyncio.run(catalog.refresh())
+        first = catalog.tables[1].render()
+        budget = token_counter.count(first) + 20
+        digest = catalog.digest(budget)
+        lines = digest.splitlines()
+        assert lines[0] == first
+        assert token_counter.count(digest) <= budget
+        rendered = {t.render() for t in catalog.tables}
+        assert len([line for line in lines if line in rendered]) < len(rendered)
+        assert all(line in rendered or line.startswith("其余表") for line in lines)
+
+    def test_failed_refresh_keeps_previous_snapshot(self):
+        catalog = _catalog(FakeLoader(_description(), {"error": "数据库连接失败"}))
+        assert asyncio.run(catalog.refresh())
+        digest = catalog.digest()
+        assert not asyncio.run(catalog.refresh())
+        assert catalog.digest() == digest
+        assert catalog.stats()["last_error"] == "数据库连接失败"
+
+    def test_ensure_loaded_backs_off_after_failure(self):
+        loader = FakeLoader(RuntimeError("down"))
+        catalog = _catalog(loader)
+        assert not asyncio.run(catalog.ensure_loaded())
+        assert not asyncio.run(catalog.ensure_loaded())
+        assert loader.calls == 1
+
+    def test_schema_change_invalidates_tool_cache(self):
+        catalog = _catalog(FakeLoader(_description(), _description(extra_column=True)))
+        asyncio.run(catalog.refresh())
+        tool_result_cache.put("get_tables_schema", {"table_names": ["sensor_readings"]}, {"status": "ok", "result": {}}, 60)
+        asyncio.run(catalog.refresh())
+        assert not tool_result_cache.get("get_tables_schema", {"table_names": ["sensor_readings"]})[0]
+        assert "quality tinyint" in catalog.digest()
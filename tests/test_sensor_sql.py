@@ -0,0 +1,133 @@
+"""
+传感器 SQL 模板快速路径测试
+"""
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sensor_sql import DEFAULT_SQL, MAX_ROWS, extract_intent, extract_time_range, plan_sensor_sql
+
+TODAY = date(2025, 6, 15)
+
+
+def _plan(question):
+    return plan_sensor_sql(question, today=TODAY)
+
+
+class TestIntentExtraction:
+    """槽位抽取测试"""
+
+    def test_sensor_types_from_vocabulary(self):
+        assert extract_intent("溶解氧和水温").types == ["dissolved_oxygen_aturation", "temperature"]
+        assert extract_intent("DO=5.2 mg/L，pH 7.5").types == ["dissolved_oxygen_aturation", "PH"]
+        assert extract_intent("浑浊度升到44 NTU").types == ["turbidity"]
+        assert extract_intent("液位正常吗").types == ["liquid_level"]
+        # 英文简称按词边界匹配
+        assert extract_intent("how do I do this").types == []
+
+    def test_compatibility_characters_normalized(self):
+        # 问题集中含康熙部首“⽔”
+        assert extract_intent("冬天⽔温怎么办").types == ["temperature"]
+
+    def test_unsupported_metrics(self):
+        intent = extract_intent("当前氨氮=0.32，亚硝酸盐=0.27")
+        assert intent.types == []
+        assert intent.unsupported == ["氨氮", "亚硝酸盐"]
+
+    def test_relative_time_ranges(self):
+        assert extract_time_range("过去48小时", TODAY).start == "NOW() - INTERVAL 48 HOUR"
+        assert extract_time_range("最近三天", TODAY).start == "NOW() - INTERVAL 3 DAY"
+        assert extract_time_range("近十二小时", TODAY).start == "NOW() - INTERVAL 12 HOUR"
+        assert extract_time_range("3天内", TODAY).start == "NOW() - INTERVAL 3 DAY"
+        yesterday = extract_time_range("昨天", TODAY)
+        assert (yesterday.start, yesterday.end) == ("CURDATE() - INTERVAL 1 DAY", "CURDATE()")
+        assert extract_time_range("今天", TODAY).where() == "recorded_at >= CURDATE()"
+        assert extract_time_range("水温多少合适", TODAY) is None
+
+    def test_dates(self):
+        full = extract_time_range("2024年5月1日", TODAY)
+        assert full.where() == "recorded_at >= '2024-05-01' AND recorded_at < '2024-05-02'"
+        assert extract_time_range("2024-13-40", TODAY) is None
+        # 未写年份且在今天之后按去年处理
+        assert extract_time_range("12月3日", TODAY).start == "'2024-12-03'"
+        assert extract_time_range("6月1号", TODAY).start == "'2025-06-01'"
+
+    def test_aggregations(self):
+        assert extract_intent("最高和最低水温").aggregations == ["max", "min"]
+        assert extract_intent("平均pH").aggregations == ["avg"]
+
+    def test_threshold_ignores_spread(self):
+        assert extract_intent("溶解氧低于5的记录").threshold == ("<", 5.0)
+        assert extract_intent("水温波动超过4°C").threshold is None
+
+
+class TestPlans:
+    """模板选择与置信度测试"""
+
+    def test_latest(self):
+        plan = _plan("当前溶解氧是多少")
+        assert plan.template == "latest"
+        assert plan.confidence >= 0.9
+        assert "MAX(recorded_at)" in plan.sql
+        assert "type_name IN ('dissolved_oxygen_aturation')" in plan.sql
+
+    def test_aggregate_over_period(self):
+        plan = _plan("过去48小时溶解氧最低是多少")
+        assert plan.template == "aggregate"
+        assert "MIN(value) AS min_value" in plan.sql
+        assert "MAX(value)" not in plan.sql
+        assert "recorded_at >= NOW() - INTERVAL 48 HOUR" in plan.sql
+
+    def test_aggregate_defaults_to_last_day(self):
+        plan = _plan("水温最高是多少")
+        assert plan.template == "aggregate"
+        assert plan.confidence == 0.75
+        assert "INTERVAL 24 HOUR" in plan.sql
+
+    def test_readings_on_date(self):
+        plan = _plan("2024年5月1日的pH读数")
+        assert plan.template == "readings"
+        assert "recorded_at >= '2024-05-01' AND recorded_at < '2024-05-02'" in plan.sql
+
+    def test_trend_buckets(self):
+        hourly = _plan("最近三天液位变化趋势")
+        assert hourly.template == "trend"
+        assert "%H:00" in hourly.sql
+        daily = _plan("最近两周水温每天的平均值")
+        assert daily.template == "trend"
+        assert "DATE(recorded_at) AS period" in daily.sql
+
+    def test_threshold(self):
+        plan = _plan("今天溶解氧低于5的记录")
+        assert plan.template == "readings"
+        assert "value < 5" in plan.sql
+
+    def test_unrelated_question_uses_default(self):
+        plan = _plan("什么是循环水养殖系统")
+        assert plan.sql == DEFAULT_SQL
+        assert plan.confidence >= 0.8
+
+    def test_knowledge_question_about_metric(self):
+        assert _plan("pH的检测方法").sql == DEFAULT_SQL
+
+    def test_low_confidence_falls_back(self):
+        assert _plan("对比今天和昨天的温度").confidence < 0.7
+        assert _plan("过去三天最高的是哪个指标").confidence < 0.7
+        assert _plan("溶解氧和pH低于6的记录").confidence < 0.7
+
+    def test_row_limit(self):
+        for question in ("当前水温", "昨天的水温数据", "最近一个月浊度趋势", "pH最高值", "水温"):
+            limit = int(_plan(question).sql.rsplit("LIMIT", 1)[1])
+            assert limit <= MAX_ROWS
+
+    def test_sql_never_contains_question_text(self):
+        plan = _plan("当前水温'; DROP TABLE sensor_readings; --")
+        assert "DROP" not in plan.sql
+
+    def test_to_dict(self):
+        data = _plan("今天浊度平均值").to_dict()
+        assert data["template"] == "aggregate"
+        assert data["intent"]["types"] == ["turbidity"]
+        assert data["intent"]["time_range"]["label"] == "今天"
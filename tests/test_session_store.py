@@ -0,0 +1,139 @@
+"""
+会话租约存储测试
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.session_store import (
+    InMemorySessionStore,
+    SQLiteSessionStore,
+    SocketSessionStore,
+    create_session_store,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestInMemorySessionStore:
+    """进程内存储测试"""
+
+    def test_acquire_rejects_second_owner(self):
+        store = InMemorySessionStore()
+        assert store.acquire("s1", "a", 30)
+        assert not store.acquire("s1", "b", 30)
+        assert store.is_active("s1")
+        assert store.release("s1", "a")
+        assert not store.is_active("s1")
+        assert store.acquire("s1", "b", 30)
+
+    def test_expired_lease_can_be_taken_over(self):
+        clock = FakeClock()
+        store = InMemorySessionStore(clock=clock)
+        assert store.acquire("s1", "a", 10)
+        clock.now += 11
+        assert not store.is_active("s1")
+        assert store.acquire("s1", "b", 10)
+        # 原持有者既不能续约也不能释放他人的租约
+        assert not store.renew("s1", "a", 10)
+        assert not store.release("s1", "a")
+        assert store.is_active("s1")
+
+    def test_renew_extends_lease(self):
+        clock = FakeClock()
+        store = InMemorySessionStore(clock=clock)
+        store.acquire("s1", "a", 10)
+        clock.now += 8
+        assert store.renew("s1", "a", 10)
+        clock.now += 8
+        assert store.is_active("s1")
+
+
+class TestSQLiteSessionStore:
+    """SQLite 存储测试：两个实例模拟两个 worker 进程"""
+
+    def test_shared_between_instances(self, tmp_path):
+        path = str(tmp_path / "leases.db")
+        clock = FakeClock()
+        worker_a = SQLiteSessionStore(path, clock=clock)
+        worker_b = SQLiteSessionStore(path, clock=clock)
+        try:
+            assert worker_a.acquire("s1", "a", 10)
+            assert not worker_b.acquire("s1", "b", 10)
+            assert worker_b.is_active("s1")
+            clock.now += 11
+            assert worker_b.acquire("s1", "b", 10)
+            assert not worker_a.renew("s1", "a", 10)
+            assert worker_b.release("s1", "b")
+            assert not worker_a.is_active("s1")
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+
+class TestSocketSessionStore:
+    """本机 socket 存储测试"""
+
+    def test_first_client_hosts_server(self):
+        # Unix socket 路径长度有限，使用较短的临时目录
+        with tempfile.TemporaryDirectory() as directory:
+            address = os.path.join(directory, "s.sock")
+            host = SocketSessionStore(address)
+            other = SocketSessionStore(address, auto_serve=False)
+            try:
+                assert host.acquire("s1", "a", 10)
+                assert not other.acquire("s1", "b", 10)
+                assert other.is_active("s1")
+                assert host.release("s1", "a")
+                assert other.acquire("s1", "b", 10)
+            finally:
+                other.close()
+                host.close()
+
+    def test_stale_socket_file_is_replaced(self):
+        with tempfile.TemporaryDirectory() as directory:
+            address = os.path.join(directory, "s.sock")
+            open(address, "w").close()
+            store = SocketSessionStore(address)
+            try:
+                assert store.acquire("s1", "a", 10)
+            finally:
+                store.close()
+
+
+class TestSessionLease:
+    """租约对象与心跳续约测试"""
+
+    def test_lease_and_release(self):
+        store = InMemorySessionStore()
+        lease = store.lease("s1", ttl=10)
+        assert lease is not None
+        assert store.lease("s1", ttl=10) is None
+        lease.release()
+        lease.release()
+        assert not store.is_active("s1")
+
+    def test_heartbeat_keeps_lease_alive(self):
+        store = InMemorySessionStore()
+        lease = store.lease("s1", ttl=0.3)
+        try:
+            time.sleep(0.8)
+            assert store.is_active("s1")
+            assert not lease.lost
+        finally:
+            lease.release()
+
+    def test_create_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_session_store("redis")
@@ -0,0 +1,162 @@
+# tests/test_sse_stream.py
+"""
+SSE 帧构造单元测试（Flask 与 ASGI 共用的流式逻辑）
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.sse_stream import SSEFrameBuilder, aiter_sse_frames, iter_sse_frames, parse_stream_request
+
+
+def _payloads(frames):
+    """从 SSE 帧中取出 data 部分的 JSON"""
+    payloads = []
+    for frame in frames:
+        for line in frame.splitlines():
+            if line.startswith("data: "):
+                payloads.append(json.loads(line[len("data: "):]))
+    return payloads
+
+
+class TestParseStreamRequest:
+    """请求参数解析测试"""
+
+    def test_defaults(self):
+        req = parse_stream_request({})
+        assert req.query
+        assert req.agent_type == "japan"
+        assert req.session_id and req.message_id
+        assert req.config is None
+
+    def test_config_json_string(self):
+        req = parse_stream_request({"config": json.dumps({"mode": "single"}), "session_id": "s1"})
+        assert req.config == {"mode": "single"}
+        assert req.session_id == "s1"
+
+    def test_invalid_config(self):
+        with pytest.raises(ValueError):
+            parse_stream_request({"config": "{not json"})
+
+
+class TestFrames:
+    """事件 → SSE 帧转换测试"""
+
+    def test_stream_then_final(self):
+        req = parse_stream_request({"query": "pH", "session_id": "s", "message_id": "m"})
+        events = [{"status": "stream", "content": "你"}, {"status": "stream", "content": "好"},
+                  {"status": "final", "content": "查询处理结束"}]
+        payloads = _payloads(iter_sse_frames(iter(events), SSEFrameBuilder(req)))
+
+        statuses = [p["data"]["status"] for p in payloads]
+        assert statuses == ["started", "stream", "stream", "completed"]
+        assert "".join(p["content"] for p in payloads if p["data"]["status"] == "stream") == "你好"
+        assert all(p["message_id"] == "m" for p in payloads)
+
+    def test_error_event_stops_stream(self):
+        req = parse_stream_request({})
+        events = [{"type": "error", "content": "boom"}, {"status": "stream", "content": "late"}]
+        payloads = _payloads(iter_sse_frames(iter(events), SSEFrameBuilder(req)))
+        assert payloads[-1] == {"error": "boom"}
+
+    def test_tool_progress_frame(self):
+        req = parse_stream_request({"message_id": "m"})
+        tool = {"name": "read_sql_query", "state": "finished", "elapsed": 0.2}
+        events = [{"status": "tool", "content": tool}, {"status": "meta", "content": {"sensor_rows": 3}},
+                  {"status": "stream", "content": "答"}, {"status": "final", "content": "查询处理结束"}]
+        payloads = _payloads(iter_sse_frames(iter(events), SSEFrameBuilder(req)))
+
+        assert [p["data"]["status"] for p in payloads] == ["started", "tool", "stream", "completed"]
+        assert payloads[1]["content"] == tool
+
+    def test_missing_final_sends_default_end(self):
+        req = parse_stream_request({})
+        payloads = _payloads(iter_sse_frames(iter([]), SSEFrameBuilder(req)))
+        assert payloads[-1]["data"]["status"] == "completed"
+
+    def test_async_frames_match_sync(self):
+        req = parse_stream_request({"session_id": "s", "message_id": "m"})
+        events = [{"status": "stream", "content": "a"}, {"status": "final", "content": "done"}]
+
+        async def agen():
+            for event in events:
+                yield event
+
+        async def collect():
+            return [frame async for frame in aiter_sse_frames(agen(), SSEFrameBuilder(req))]
+
+        async_payloads = _payloads(asyncio.run(collect()))
+        sync_payloads = _payloads(iter_sse_frames(iter(events), SSEFrameBuilder(req)))
+        for p in async_payloads + sync_payloads:
+            p.pop("timestamp", None)
+        assert async_payloads == sync_payloads
+
+
+class TestCoalescing:
+    """流式增量合并测试"""
+
+    def test_envelope_matches_json_dumps(self):
+        req = parse_stream_request({"session_id": "会话", "message_id": "m", "agent_type": "japan"})
+        builder = SSEFrameBuilder(req)
+        frame, _ = builder.handle({"status": "stream", "content": "含\"引号\"的内容"})
+        payload = _payloads([frame])[0]
+        assert payload == {
+            "session_id": "会话",
+            "timestamp": payload["timestamp"],
+            "agent_type": "japan",
+            "message_id": "m",
+            "content": "含\"引号\"的内容",
+            "data": {"status": "stream"},
+        }
+        assert list(payload.keys()) == ["session_id", "timestamp", "agent_type", "message_id", "content", "data"]
+
+    def test_deltas_are_merged_without_losing_content(self):
+        req = parse_stream_request({})
+        builder = SSEFrameBuilder(req, flush_interval_ms=60_000, flush_chars=10)
+        deltas = [str(i % 10) for i in range(95)]
+        events = [{"status": "stream", "content": d} for d in deltas] + [{"status": "final", "content": "end"}]
+        payloads = _payloads(iter_sse_frames(iter(events), builder))
+
+        stream_payloads = [p for p in payloads if p["data"]["status"] == "stream"]
+        assert "".join(p["content"] for p in stream_payloads) == "".join(deltas)
+        # 首个增量单独立即发送，其余按10个字符合并
+        assert stream_payloads[0]["content"] == "0"
+        assert len(stream_payloads) < len(deltas) / 5
+        assert builder.stream_deltas == len(deltas)
+
+    def test_non_text_content_is_not_merged(self):
+        req = parse_stream_request({})
+        builder = SSEFrameBuilder(req, flush_interval_ms=60_000, flush_chars=1000)
+        events = [{"status": "stream", "content": "a"}, {"status": "stream", "content": "b"},
+                  {"status": "stream", "content": {"k": 1}}, {"status": "final", "content": ""}]
+        payloads = _payloads(iter_sse_frames(iter(events), builder))
+        contents = [p["content"] for p in payloads if p["data"]["status"] == "stream"]
+        assert contents == ["a", "b", {"k": 1}]
+
+    def test_async_flushes_on_interval(self):
+        req = parse_stream_request({})
+        builder = SSEFrameBuilder(req, flush_interval_ms=20, flush_chars=1000)
+
+        async def slow_agen():
+            yield {"status": "stream", "content": "first"}
+            yield {"status": "stream", "content": "second"}
+            # 上游停顿期间，缓冲的 "second" 应按间隔发送而不是等到结束
+            await asyncio.sleep(0.3)
+            yield {"status": "final", "content": "done"}
+
+        async def collect():
+            frames = []
+            start = asyncio.get_running_loop().time()
+            async for frame in aiter_sse_frames(slow_agen(), builder):
+                frames.append((asyncio.get_running_loop().time() - start, frame))
+            return frames
+
+        frames = asyncio.run(collect())
+        second = [t for t, f in frames if '"second"' in f]
+        assert second and second[0] < 0.2
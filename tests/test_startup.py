@@ -0,0 +1,124 @@
+"""
+服务启动协调器测试
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.startup import FAILED, READY, SKIPPED, StartupCoordinator, StartupStep
+
+
+def _sleep(seconds, log=None, name=None):
+    def step():
+        if log is not None:
+            log.append(("start", name, time.time()))
+        time.sleep(seconds)
+        if log is not None:
+            log.append(("end", name, time.time()))
+    return step
+
+
+def _fail():
+    raise RuntimeError("boom")
+
+
+class TestStartupCoordinator:
+    """启动协调器测试"""
+
+    def test_independent_steps_run_concurrently(self):
+        coordinator = StartupCoordinator([
+            StartupStep("a", _sleep(0.2)),
+            StartupStep("b", _sleep(0.2)),
+            StartupStep("c", _sleep(0.2)),
+        ])
+        started = time.time()
+        assert coordinator.run(timeout=5)
+        assert time.time() - started < 0.5
+        assert coordinator.status() == "ready"
+
+    def test_dependencies_respected(self):
+        log = []
+        coordinator = StartupCoordinator([
+            StartupStep("model", _sleep(0.05, log, "model")),
+            StartupStep("collections", _sleep(0.01, log, "collections")),
+            StartupStep("warmup", _sleep(0.01, log, "warmup"), depends_on=("model", "collections")),
+        ])
+        assert coordinator.run(timeout=5)
+        events = {(kind, name): t for kind, name, t in log}
+        assert events[("start", "warmup")] >= events[("end", "model")]
+        assert events[("start", "warmup")] >= events[("end", "collections")]
+
+    def test_failed_dependency_skips_dependents(self):
+        coordinator = StartupCoordinator([
+            StartupStep("vector_store", _fail),
+            StartupStep("collections", _sleep(0), depends_on=("vector_store",)),
+            StartupStep("warmup", _sleep(0), depends_on=("collections",), required=False),
+        ])
+        assert not coordinator.run(timeout=5)
+        snapshot = coordinator.snapshot()
+        assert snapshot["status"] == "failed"
+        assert snapshot["subsystems"]["vector_store"]["state"] == FAILED
+        assert snapshot["subsystems"]["vector_store"]["error"] == "boom"
+        assert snapshot["subsystems"]["collections"]["state"] == SKIPPED
+        assert snapshot["subsystems"]["warmup"]["state"] == SKIPPED
+
+    def test_optional_failure_degrades(self):
+        coordinator = StartupCoordinator([
+            StartupStep("queue", _sleep(0)),
+            StartupStep("tools", _fail, required=False),
+        ])
+        assert coordinator.run(timeout=5)
+        assert coordinator.status() == "degraded"
+        assert coordinator.accepting_requests()
+
+    def test_not_ready_while_starting(self):
+        gate = threading.Event()
+        coordinator = StartupCoordinator([StartupStep("warmup", lambda: gate.wait(5))])
+        assert coordinator.accepting_requests()
+        coordinator.start()
+        assert not coordinator.accepting_requests()
+        assert coordinator.snapshot()["status"] == "starting"
+        gate.set()
+        assert coordinator.wait(5)
+        assert coordinator.snapshot()["subsystems"]["warmup"]["state"] == READY
+
+    def test_ready_without_waiting_for_optional_steps(self):
+        gate = threading.Event()
+        coordinator = StartupCoordinator([
+            StartupStep("queue", _sleep(0)),
+            StartupStep("schema_catalog", lambda: gate.wait(5), required=False),
+        ])
+        started = time.time()
+        assert coordinator.run(timeout=5)
+        assert time.time() - started < 1
+        assert coordinator.accepting_requests()
+        # 非必需步骤仍在执行时为 degraded，结束后为 ready
+        assert coordinator.status() == "degraded" and not coordinator.finished
+        gate.set()
+        coordinator._done.wait(5)
+        assert coordinator.status() == "ready"
+
+    def test_required_failure_reported_before_optional_steps_finish(self):
+        gate = threading.Event()
+        coordinator = StartupCoordinator([
+            StartupStep("vector_store", _fail),
+            StartupStep("schema_catalog", lambda: gate.wait(5), required=False),
+        ])
+        coordinator.start()
+        deadline = time.time() + 5
+        while coordinator.steps["vector_store"].state != FAILED:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert coordinator.status() == "failed" and not coordinator.ready
+        gate.set()
+        assert not coordinator.wait(5)
+
+    def test_unknown_dependency_rejected(self):
+        coordinator = StartupCoordinator([StartupStep("a", _sleep(0), depends_on=("missing",))])
+        with pytest.raises(ValueError):
+            coordinator.start()
@@ -0,0 +1,171 @@
+"""
+可续传 SSE 流测试（回放缓冲 + Last-Event-ID）
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.session_store import InMemorySessionStore
+from api.sse_stream import SSEFrameBuilder, parse_event_id, parse_stream_request
+from api.stream_runs import ReplayBuffer, ReplayGapError, RunConflictError, StreamRunRegistry, split_frames
+
+
+def _frames(chunks):
+    """[(id, payload)]"""
+    result = []
+    for chunk in chunks:
+        for _, frame in split_frames(chunk):
+            event_id, data = None, None
+            for line in frame.splitlines():
+                if line.startswith("id: "):
+                    event_id = line[len("id: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+            if data is not None:
+                result.append((event_id, data))
+    return result
+
+
+def _events(count, gate=None):
+    for i in range(count):
+        if gate is not None and i == count // 2:
+            gate.wait(5)
+        yield {"status": "stream", "content": f"{i},"}
+    yield {"status": "final", "content": "结束"}
+
+
+class TestEventIds:
+    """帧 id 测试"""
+
+    def test_ids_are_monotonic(self):
+        req = parse_stream_request({"message_id": "m1"})
+        builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+        registry = StreamRunRegistry()
+        run = registry.create(req)
+        run.builder = builder
+        run.start_thread(_events(5))
+        frames = _frames(run.iter_frames())
+        seqs = [parse_event_id(event_id)[1] for event_id, _ in frames]
+        assert seqs == list(range(1, len(frames) + 1))
+        assert all(parse_event_id(event_id)[0] == "m1" for event_id, _ in frames)
+
+    def test_parse_event_id(self):
+        assert parse_event_id("a:b:12") == ("a:b", 12)
+        assert parse_event_id("bad") is None
+        assert parse_event_id("m:x") is None
+        assert parse_event_id(None) is None
+
+
+class TestReplayBuffer:
+    """回放缓冲测试"""
+
+    def test_read_after_and_gap(self):
+        buffer = ReplayBuffer(max_frames=3)
+        for seq in range(1, 6):
+            buffer.append(f"id: m:{seq}\ndata: {seq}\n\n")
+        assert [seq for seq, _ in buffer.read_after(3)] == [4, 5]
+        assert [seq for seq, _ in buffer.read_after(2)] == [3, 4, 5]
+        with pytest.raises(ReplayGapError):
+            buffer.read_after(1)
+
+    def test_wait_wakes_on_append(self):
+        buffer = ReplayBuffer()
+        threading.Timer(0.05, buffer.append, args=("id: m:1\ndata: x\n\n",)).start()
+        assert buffer.wait(0, timeout=2)
+
+
+class TestResume:
+    """断线重连续传测试"""
+
+    def test_sync_disconnect_and_resume(self):
+        store = InMemorySessionStore()
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "m2", "session_id": "s2"})
+        gate = threading.Event()
+        run = registry.create(req, lease=store.lease("s2"))
+        run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+        run.start_thread(_events(10, gate))
+
+        # 第一个连接读取部分帧后断开（运行在 gate 处暂停）
+        consumer = run.iter_frames()
+        first = _frames([next(consumer)])
+        consumer.close()
+        last_id = first[-1][0]
+        gate.set()
+
+        # 运行不受断开影响，租约在运行结束前一直被持有
+        resumed_run, seq = registry.find_resumable(last_id, "s2")
+        assert resumed_run is run
+        rest = _frames(resumed_run.iter_frames(seq))
+        assert parse_event_id(rest[0][0])[1] == seq + 1
+        contents = "".join(d["content"] for _, d in first + rest if d.get("data", {}).get("status") == "stream")
+        assert contents == "".join(f"{i}," for i in range(10))
+        assert rest[-1][1]["data"]["status"] == "completed"
+        assert run.finished and not store.is_active("s2")
+
+    def test_async_run_continues_after_consumer_cancelled(self):
+        req = parse_stream_request({"message_id": "m3"})
+        registry = StreamRunRegistry()
+
+        async def agen():
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                yield {"status": "stream", "content": f"{i}"}
+            yield {"status": "final", "content": "done"}
+
+        async def scenario():
+            run = registry.create(req)
+            run.builder = SSEFrameBuilder(req, flush_interval_ms=0, flush_chars=1)
+            run.start_task(agen())
+            consumer = run.aiter_frames()
+            first = await consumer.__anext__()
+            await consumer.aclose()
+            seq = parse_event_id(_frames([first])[-1][0])[1]
+            rest = [chunk async for chunk in run.aiter_frames(seq)]
+            return first, rest, run
+
+        first, rest, run = asyncio.run(scenario())
+        frames = _frames([first] + rest)
+        assert frames[-1][1]["data"]["status"] == "completed"
+        assert "".join(d["content"] for _, d in frames if d["data"]["status"] == "stream") == "01234"
+        assert run.finished
+
+    def test_unknown_and_expired_runs(self):
+        registry = StreamRunRegistry(retention_seconds=0.01)
+        assert registry.find_resumable("missing:3", "s") == (None, 3)
+        assert registry.find_resumable("garbage", "s") == (None, 0)
+        req = parse_stream_request({"message_id": "m4"})
+        run = registry.create(req)
+        run.start_thread(iter([{"status": "final", "content": ""}]))
+        list(run.iter_frames())
+        time.sleep(0.05)
+        assert registry.get("m4") is None
+
+    def test_resume_requires_same_session(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "m5", "session_id": "owner"})
+        run = registry.create(req)
+        assert registry.find_resumable("m5:1", "owner") == (run, 1)
+        # 知道 message_id 的其他会话无法接入
+        assert registry.find_resumable("m5:1", "intruder") == (None, 1)
+
+    def test_create_rejects_in_flight_message_id(self):
+        registry = StreamRunRegistry()
+        req = parse_stream_request({"message_id": "m6", "session_id": "a"})
+        gate = threading.Event()
+        run = registry.create(req)
+        run.start_thread(_events(1, gate))
+        with pytest.raises(RunConflictError):
+            registry.create(parse_stream_request({"message_id": "m6", "session_id": "b"}))
+        assert registry.get("m6") is run
+        gate.set()
+        list(run.iter_frames())
+        # 已结束的运行可被同一 message_id 的新运行替换
+        assert registry.create(req) is registry.get("m6")
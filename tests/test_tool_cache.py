@@ -0,0 +1,139 @@
+# tests/test_tool_cache.py
+"""
+确定性工具结果缓存测试
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ToolOrchestrator.core.result_cache import ToolResultCache, canonical_arguments, is_cacheable_result
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+OK = {"status": "ok", "result": {"tables": ["sensor_readings", "sensor_types"]}}
+CACHEABLE = {"cacheable": True, "cache_ttl_seconds": 60}
+# DataAgent 调用工具时附带的内部参数
+AGENT = {"agent_name": "data-agent", "user_clearance": "MEDIUM"}
+
+
+class TestToolResultCache:
+
+    def test_canonical_arguments(self):
+        assert canonical_arguments({"b": 1, "a": [" x "]}) == canonical_arguments({"a": ["x"], "b": 1})
+        assert canonical_arguments({"a": ["x", "y"]}) != canonical_arguments({"a": ["y", "x"]})
+
+    def test_only_successful_results_cached(self):
+        assert is_cacheable_result(OK)
+        assert not is_cacheable_result({"status": "error", "reason": "x"})
+        assert not is_cacheable_result({"status": "ok", "result": {"error": "数据库连接失败"}})
+
+    def test_ttl_and_hit_rate(self):
+        clock = FakeClock()
+        cache = ToolResultCache(clock=clock)
+        ttl = cache.ttl_for(CACHEABLE)
+        assert ttl == 60
+        assert cache.ttl_for({"cacheable": False}) == 0
+        assert cache.get("list_sql_tables", {}) == (False, None)
+        assert cache.put("list_sql_tables", {}, OK, ttl)
+        hit, value = cache.get("list_sql_tables", {})
+        assert hit and value == OK
+        # 返回副本，修改不影响缓存
+        value["result"]["tables"].append("x")
+        assert cache.get("list_sql_tables", {})[1] == OK
+        clock.now += 61
+        assert cache.get("list_sql_tables", {}) == (False, None)
+        stats = cache.stats()["tools"]["list_sql_tables"]
+        assert stats["hits"] == 2 and stats["misses"] == 2 and stats["hit_rate"] == 0.5
+
+    def test_disabled_cache(self):
+        assert ToolResultCache(enabled=False).ttl_for(CACHEABLE) == 0
+
+    def test_invalidate_by_tool(self):
+        cache = ToolResultCache()
+        cache.put("list_sql_tables", {}, OK, 60)
+        cache.put("get_tables_schema", {"table_names": ["a"]}, OK, 60)
+        assert cache.invalidate(["list_sql_tables"]) == 1
+        assert not cache.get("list_sql_tables", {})[0]
+        assert cache.get("get_tables_schema", {"table_names": ["a"]})[0]
+        assert cache.invalidate() == 1
+        assert cache.stats()["entries"] == 0
+
+    def test_lru_eviction(self):
+        cache = ToolResultCache(max_entries=2)
+        for name in ("a", "b", "c"):
+            cache.put("get_tables_schema", {"table_names": [name]}, OK, 60)
+        assert not cache.get("get_tables_schema", {"table_names": ["a"]})[0]
+        assert cache.get("get_tables_schema", {"table_names": ["c"]})[0]
+
+
+class FakeMCPClient:
+    def __init__(self, result=OK):
+        self.result = result
+        self.calls = 0
+
+    async def invoke(self, tool_name, args):
+        self.calls += 1
+        return self.result
+
+
+@pytest.fixture
+def registry():
+    pytest.importorskip("aiohttp", reason="需要 aiohttp")
+    from ToolOrchestrator.core.registry import ToolRegistry
+
+    def _make(client, config=None):
+        reg = ToolRegistry({}, mcp_client=client, result_cache=ToolResultCache())
+        for name in ("list_sql_tables", "get_tables_schema"):
+            reg._tools[name] = {"name": name, **(config or CACHEABLE), "handler": reg._create_secure_handler(name)}
+        return reg
+
+    return _make
+
+
+class TestRegistryCache:
+
+    def test_second_call_served_from_cache(self, registry):
+        client = FakeMCPClient()
+        reg = registry(client)
+        for _ in range(3):
+            result = asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+            assert result == OK
+        assert client.calls == 1
+        assert reg.result_cache.stats()["tools"]["list_sql_tables"]["hits"] == 2
+
+    def test_security_checked_on_cache_hit(self, registry):
+        reg = registry(FakeMCPClient())
+        asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+        denied = asyncio.run(reg.call_tool("list_sql_tables", {"agent_name": "unknown_agent"}))
+        assert denied["status"] == "error"
+
+    def test_errors_not_cached_and_invalidation(self, registry):
+        client = FakeMCPClient({"status": "ok", "result": {"error": "数据库连接失败"}})
+        reg = registry(client)
+        asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+        client.result = OK
+        asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+        asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+        assert client.calls == 2
+        assert reg.invalidate_cache(["list_sql_tables"]) == 1
+        asyncio.run(reg.call_tool("list_sql_tables", dict(AGENT)))
+        assert client.calls == 3
+
+    def test_not_cacheable_tool_always_invoked(self, registry):
+        client = FakeMCPClient()
+        reg = registry(client, config={"cacheable": False})
+        for _ in range(2):
+            asyncio.run(reg.call_tool("get_tables_schema", {**AGENT, "table_names": ["a"]}))
+        assert client.calls == 2
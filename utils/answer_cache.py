@@ -0,0 +1,165 @@
+"""
+完整答案缓存
+缓存 agent 的流式答案增量，重复问题直接回放，不再经过 SQL 生成、检索、数据库查询与大模型生成。
+
+- 键：规范化后的问题 + 影响答案的配置字段 + 知识库集合版本号（集合增删文档后自动失效）
+- TTL：普通答案 ANSWER_CACHE_TTL_SECONDS；使用了传感器数据的答案 ANSWER_CACHE_SENSOR_TTL_SECONDS（数据随时间变化）
+- 容量：LRU，最多 ANSWER_CACHE_MAX_ENTRIES 条
+- 只缓存正常结束（收到 final 事件）的答案，出错或中途断开的运行不会写入
+
+缓存为进程内缓存，多 worker 部署时每个进程各自缓存。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SENSOR_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_SENSOR_TTL_SECONDS", "60"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "?？。.!！~～ "
+
+
+def normalize_query(query: str) -> str:
+    """规范化问题：全角转半角、合并空白、转小写、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", query or "")
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def make_cache_key(query: str, fields: Dict[str, Any]) -> str:
+    """根据规范化问题与配置字段（含集合版本号）生成缓存键"""
+    raw = json.dumps({"query": normalize_query(query), "fields": fields},
+                     ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    """一条缓存的答案"""
+    deltas: List[Any]
+    final_content: Any
+    used_sensor_data: bool
+    created_at: float
+    expires_at: float
+    hits: int = 0
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """按原事件格式回放答案"""
+        for delta in self.deltas:
+            yield {"status": "stream", "content": delta}
+        yield {"status": "final", "content": self.final_content}
+
+
+@dataclass
+class AnswerRecorder:
+    """旁路记录一次运行输出的事件，运行正常结束后写入缓存"""
+    deltas: List[Any] = field(default_factory=list)
+    final_content: Any = None
+    completed: bool = False
+    failed: bool = False
+    used_sensor_data: bool = False
+
+    def observe(self, event: Any) -> None:
+        if not isinstance(event, dict):
+            return
+        status = event.get("status")
+        if status == "stream":
+            self.deltas.append(event.get("content", ""))
+        elif status == "meta":
+            meta = event.get("content") or {}
+            if meta.get("sensor_rows"):
+                self.used_sensor_data = True
+        elif status == "final":
+            self.completed = True
+            self.final_content = event.get("content", "")
+        elif status == "error" or event.get("type") == "error":
+            self.failed = True
+
+
+class AnswerCache:
+    """线程安全的 LRU + TTL 答案缓存"""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 sensor_ttl_seconds: float = ANSWER_CACHE_SENSOR_TTL_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sensor_ttl_seconds = sensor_ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, recorder: AnswerRecorder) -> bool:
+        """写入一次运行的结果，只有正常结束且有内容的运行会被缓存"""
+        if not recorder.completed or recorder.failed or not recorder.deltas:
+            return False
+        ttl = self.sensor_ttl_seconds if recorder.used_sensor_data else self.ttl_seconds
+        if ttl <= 0:
+            return False
+        now = self._clock()
+        entry = CachedAnswer(
+            deltas=list(recorder.deltas),
+            final_content=recorder.final_content,
+            used_sensor_data=recorder.used_sensor_data,
+            created_at=now,
+            expires_at=now + ttl,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stores += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,176 @@
+"""
+取消令牌
+客户端断开后，由 SSE 层取消令牌，令牌沿调用链传递给 agent、RAG 队列任务与数据库工具：
+- 同步代码通过 token.cancelled / raise_if_cancelled() 检查
+- 队列中尚未执行的任务在被取出时跳过
+- 协程通过 run_cancellable() 在令牌取消时立即放弃等待并取消内部任务
+
+令牌也可携带请求级截止时间（set_deadline）：到期时令牌以 DEADLINE_EXCEEDED 原因自动取消，
+各阶段通过 cap_timeout() 将自身的超时限制在剩余时间内，重试前通过 remaining() 判断是否还有预算。
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("cancellation")
+
+# 取消原因
+CLIENT_DISCONNECTED = "client_disconnected"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+# 请求超过截止时间时返回给客户端的错误信息
+DEADLINE_EXCEEDED_MESSAGE = "抱歉，请求处理超时，请稍后重试或缩小问题范围。"
+
+
+class OperationCancelled(Exception):
+    """操作因令牌取消而终止"""
+
+
+class CancellationToken:
+    """线程安全的取消令牌，可在任意线程中取消，回调在取消线程中执行"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+        self.reason: Optional[str] = None
+        # 截止时间（time.monotonic() 时钟），None 表示不限时
+        self.deadline: Optional[float] = None
+        self._deadline_timer: Optional[threading.Timer] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def deadline_exceeded(self) -> bool:
+        return self.reason == DEADLINE_EXCEEDED
+
+    def set_deadline(self, seconds: Optional[float]) -> None:
+        """设置从现在起 seconds 秒后的截止时间，到期自动取消；None 或非正数表示不限时"""
+        self.clear_deadline()
+        if not seconds or seconds <= 0:
+            return
+        timer = threading.Timer(seconds, self.cancel, args=(DEADLINE_EXCEEDED,))
+        timer.daemon = True
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.deadline = time.monotonic() + seconds
+            self._deadline_timer = timer
+        timer.start()
+
+    def clear_deadline(self) -> None:
+        """取消截止时间（运行结束后调用，避免计时线程滞留）"""
+        with self._lock:
+            timer, self._deadline_timer = self._deadline_timer, None
+            self.deadline = None
+        if timer is not None:
+            timer.cancel()
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的剩余秒数（不小于 0）；未设置截止时间返回 None"""
+        deadline = self.deadline
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def cap_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """将阶段自身的超时限制在剩余时间内；两者都未设置时返回 None"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """取消令牌，重复取消返回 False"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            timer, self._deadline_timer = self._deadline_timer, None
+        if timer is not None:
+            timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"取消回调执行失败: {e}")
+        return True
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待令牌被取消，可用作可中断的 sleep；返回是否已取消"""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], Any]) -> None:
+        """注册取消回调；令牌已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+
+def cap_timeout(token: Optional[CancellationToken], timeout: Optional[float]) -> Optional[float]:
+    """token 可为 None 的 CancellationToken.cap_timeout()"""
+    return token.cap_timeout(timeout) if token is not None else timeout
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+async def run_cancellable(awaitable: Awaitable[Any], token: Optional[CancellationToken]) -> Any:
+    """
+    等待 awaitable，令牌取消时立即取消内部任务并抛出 OperationCancelled。
+    token 为 None 时等同于直接 await。
+    """
+    if token is None:
+        return await awaitable
+    token.raise_if_cancelled()
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(awaitable)
+    cancelled = loop.create_future()
+
+    def _on_cancel():
+        loop.call_soon_threadsafe(_wake, cancelled)
+
+    token.add_callback(_on_cancel)
+    try:
+        await asyncio.wait({task, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        token.remove_callback(_on_cancel)
+        if not cancelled.done():
+            cancelled.cancel()
+
+    if task.done():
+        return task.result()
+    task.cancel()
+    try:
+        # 等待内部任务完成清理（例如关闭数据库连接）
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    raise OperationCancelled(token.reason)
@@ -0,0 +1,206 @@
+"""
+进程级共享客户端
+- LLM 客户端池：按 (API base, API key) 复用 OpenAI / AsyncOpenAI 客户端，底层 httpx 连接池开启 keep-alive 并限制连接数，
+  请求之间复用 TCP/TLS 连接，不再为每个请求新建连接池。AsyncOpenAI 绑定事件循环，按事件循环分别缓存。
+- MCP 客户端：进程内共享一个 MultiServerMCPClient，工具模块与 tools/config.json 只加载一次。
+
+连接复用效果通过 httpx trace 统计（/metrics 的 clients 字段）：新建连接数、连接建立（TCP + TLS）耗时、
+复用已有连接的请求数，以及按平均建连耗时估算的节省时间。
+
+    client = llm_client_pool.get(api_key=api_key)
+    async_client = llm_client_pool.get_async(api_key=api_key)   # 需在事件循环中调用
+    mcp_client = await get_mcp_client()
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.lazy import lazy_import
+
+openai = lazy_import("openai")
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger("client_pool")
+
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "50"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_SECONDS = float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "60"))
+
+
+class ConnectionStats:
+    """根据 httpx trace 事件统计连接建立与复用"""
+
+    _PHASES = ("connection.connect_tcp", "connection.start_tls")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.setup_seconds = 0.0
+
+    def start_request(self) -> Dict[str, float]:
+        with self._lock:
+            self.requests += 1
+        return {}
+
+    def observe(self, state: Dict[str, float], event_name: str) -> None:
+        """state 为单个请求的计时状态；connect_tcp 完成即视为新建了一个连接"""
+        phase, _, step = event_name.rpartition(".")
+        if phase not in self._PHASES:
+            return
+        if step == "started":
+            state[phase] = time.perf_counter()
+        elif step == "complete" and phase in state:
+            elapsed = time.perf_counter() - state.pop(phase)
+            with self._lock:
+                self.setup_seconds += elapsed
+                if phase == "connection.connect_tcp":
+                    self.new_connections += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            avg_setup = self.setup_seconds / self.new_connections if self.new_connections else 0.0
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_requests": reused,
+                "setup_seconds": round(self.setup_seconds, 3),
+                "avg_setup_ms": round(avg_setup * 1000, 1),
+                "estimated_saved_seconds": round(reused * avg_setup, 3),
+            }
+
+    # httpx 事件钩子：为每个请求挂上 trace 回调
+    def sync_hook(self, request) -> None:
+        state = self.start_request()
+        request.extensions["trace"] = lambda name, info: self.observe(state, name)
+
+    async def async_hook(self, request) -> None:
+        state = self.start_request()
+
+        async def trace(name, info):
+            self.observe(state, name)
+
+        request.extensions["trace"] = trace
+
+
+def _key_digest(api_key: Optional[str]) -> str:
+    """池键只保存 API key 的摘要"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class LLMClientPool:
+    """按 (API base, API key) 复用的 OpenAI 客户端池"""
+
+    def __init__(self, sync_factory: Optional[Callable[..., Any]] = None,
+                 async_factory: Optional[Callable[..., Any]] = None):
+        self.connections = ConnectionStats()
+        self._sync_factory = sync_factory or self._create_sync
+        self._async_factory = async_factory or self._create_async
+        self._lock = threading.Lock()
+        self._sync: Dict[Tuple[str, str], Any] = {}
+        # AsyncOpenAI 的 httpx.AsyncClient 不能跨事件循环使用，按事件循环分别缓存，事件循环回收后随之释放
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], Any]]" = \
+            weakref.WeakKeyDictionary()
+        self.created = 0
+        self.borrowed = 0
+        self.create_seconds = 0.0
+
+    @staticmethod
+    def _resolve(base_url: Optional[str], api_key: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        base_url = base_url or os.environ.get("OPENAI_BASE_URL") or None
+        api_key = api_key or os.environ.get("OPENAI_API_KEY") or os.environ.get("GPT_API_KEY")
+        return base_url, api_key
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_POOL_KEEPALIVE_SECONDS,
+        )
+
+    def _create_sync(self, base_url: Optional[str], api_key: Optional[str]):
+        http_client = openai.DefaultHttpxClient(
+            limits=self._limits(), event_hooks={"request": [self.connections.sync_hook]}
+        )
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    def _create_async(self, base_url: Optional[str], api_key: Optional[str]):
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=self._limits(), event_hooks={"request": [self.connections.async_hook]}
+        )
+        return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    def _borrow(self, cache: Dict[Tuple[str, str], Any], factory: Callable[..., Any],
+                base_url: Optional[str], api_key: Optional[str]) -> Any:
+        base_url, api_key = self._resolve(base_url, api_key)
+        key = (base_url or "", _key_digest(api_key))
+        with self._lock:
+            client = cache.get(key)
+            if client is not None:
+                self.borrowed += 1
+                return client
+            started = time.perf_counter()
+            client = factory(base_url, api_key)
+            self.create_seconds += time.perf_counter() - started
+            self.created += 1
+            cache[key] = client
+            logger.info(f"创建共享LLM客户端: base_url={base_url or 'default'}")
+            return client
+
+    def get(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        """借用同步 OpenAI 客户端（线程安全，可在多个请求线程间共享）"""
+        return self._borrow(self._sync, self._sync_factory, base_url, api_key)
+
+    def get_async(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None):
+        """借用当前事件循环上的 AsyncOpenAI 客户端"""
+        loop = loop or asyncio.get_running_loop()
+        with self._lock:
+            cache = self._async.get(loop)
+            if cache is None:
+                cache = self._async[loop] = {}
+        return self._borrow(cache, self._async_factory, base_url, api_key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = {
+                "created": self.created,
+                "borrowed": self.borrowed,
+                "create_ms": round(self.create_seconds * 1000, 1),
+            }
+        clients["connections"] = self.connections.snapshot()
+        return clients
+
+
+llm_client_pool = LLMClientPool()
+
+_mcp_client = None
+_mcp_lock = threading.Lock()
+
+
+async def get_mcp_client():
+    """进程内共享的 MultiServerMCPClient，首次调用时发现工具"""
+    global _mcp_client
+    client = _mcp_client
+    if client is not None:
+        return client
+    from ToolOrchestrator.client.client import MultiServerMCPClient
+    from ToolOrchestrator.core.config import settings
+    candidate = MultiServerMCPClient(settings.MCP_CLIENT_CONFIG)
+    await candidate.get_tools()
+    with _mcp_lock:
+        if _mcp_client is None:
+            _mcp_client = candidate
+            logger.info("共享MCP客户端初始化完成")
+        return _mcp_client
+
+
+def mcp_stats() -> Dict[str, Any]:
+    client = _mcp_client
+    return {"initialized": client is not None, "tools": len(client.tools) if client is not None else 0}
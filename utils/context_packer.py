@@ -0,0 +1,385 @@
+"""
+按 token 预算打包最终答案的上下文
+原先检索片段与传感器行以 json.dumps(indent=2) 原样拼入 prompt：每行重复的键名、缩进与 100 行数据使输入 token 膨胀，
+首 token 延迟随之变长。这里：
+- 传感器行渲染为紧凑表格：列名只出现一次，所有行取值相同的列（type_name、unit 等）提到表头
+- 检索片段去重：相同 chunk、被其他片段包含的片段直接去掉，同一来源首尾重叠（切分 overlap）的片段合并
+- 用本地分词器（tiktoken，CONTEXT_TOKENIZER_ENCODING）计数，不可用时退回按字符估算
+- 整体控制在 CONTEXT_TOKEN_BUDGET 内：按问题意图决定知识库与传感器数据谁优先，
+  优先方先取 CONTEXT_PRIMARY_SHARE 的预算，另一方使用剩余部分，未用完的预算再还给优先方
+
+    packed = context_packer.pack(question, retrieve_result, sensor_result)
+    packed.text, packed.tokens, packed.stats()
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.lazy import lazy_import
+from utils.sensor_sql import extract_intent
+
+tiktoken = lazy_import("tiktoken")
+
+logger = logging.getLogger("context_packer")
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_PRIMARY_SHARE = float(os.getenv("CONTEXT_PRIMARY_SHARE", "0.7"))
+# gpt-4.1 / gpt-4o 系列使用 o200k_base
+CONTEXT_TOKENIZER_ENCODING = os.getenv("CONTEXT_TOKENIZER_ENCODING", "o200k_base")
+# 片段首尾重叠达到该字符数才视为切分 overlap 并合并
+CHUNK_MIN_OVERLAP = int(os.getenv("CHUNK_MIN_OVERLAP", "20"))
+
+# 主键对回答没有信息量
+OMIT_COLUMNS = ("id",)
+
+KB = "kb"
+SENSOR = "sensor"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计：中文约 2 字符 1 token，其他约 4 字符 1 token"""
+    chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
+    other_chars = len(text) - chinese_chars
+    return int(chinese_chars / 2 + other_chars / 4)
+
+
+class TokenCounter:
+    """本地分词器计数；tiktoken 未安装或编码文件加载失败时按字符估算"""
+
+    def __init__(self, encoding_name: str = CONTEXT_TOKENIZER_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(f"本地分词器不可用，按字符估算token数: {e}")
+                    self._loaded = True
+        return self._encoding
+
+    @property
+    def name(self) -> str:
+        return f"tiktoken:{self.encoding_name}" if self._load() is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        encoding = self._load()
+        if encoding is None:
+            return estimate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+token_counter = TokenCounter()
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    text = str(value)
+    # ISO 时间去掉 “T”，与数据库展示一致
+    if len(text) >= 19 and text[10:11] == "T" and text[4:5] == "-":
+        text = text[:10] + " " + text[11:]
+    return text.replace("|", "/").replace("\n", " ")
+
+
+def render_rows(rows: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+    """
+    返回 (表头, 数据行列表)：取值全部相同的列提到表头，其余列组成 “|” 分隔的表格。
+    数据行单独返回，便于按预算截断。
+    """
+    if not rows:
+        return "（无记录）", []
+    columns = [c for c in rows[0].keys() if c not in OMIT_COLUMNS] or list(rows[0].keys())
+    constant, varying = [], []
+    for column in columns:
+        values = {_format_value(row.get(column)) for row in rows}
+        (constant if len(values) == 1 and len(rows) > 1 else varying).append(column)
+    header_lines = []
+    if constant:
+        header_lines.append("共同字段: " + ", ".join(f"{c}={_format_value(rows[0].get(c))}" for c in constant))
+    header_lines.append(" | ".join(varying))
+    lines = [" | ".join(_format_value(row.get(c)) for c in varying) for row in rows]
+    return "\n".join(header_lines), lines
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _overlap(left: str, right: str, min_overlap: int) -> int:
+    """left 的结尾与 right 的开头重叠的字符数（不足 min_overlap 时为 0）"""
+    for size in range(min(len(left), len(right)) - 1, min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def dedupe_chunks(chunks: List[Dict[str, Any]], min_overlap: int = CHUNK_MIN_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    按检索顺序去重：相同 chunk_id / 相同文本、被已保留片段包含的片段丢弃；
+    同一来源首尾重叠的相邻切分片段合并为一段（保留排名靠前的位置）。
+    """
+    kept: List[Dict[str, Any]] = []
+    seen_ids = set()
+    for chunk in chunks:
+        if not isinstance(chunk, dict):
+            continue
+        chunk_id = chunk.get("chunk_id")
+        text = _normalize_text(chunk.get("text", ""))
+        if not text or (chunk_id is not None and chunk_id in seen_ids):
+            continue
+        if chunk_id is not None:
+            seen_ids.add(chunk_id)
+        merged = False
+        for item in kept:
+            if text in item["text"]:
+                merged = True
+                break
+            if item["text"] in text:
+                item["text"] = text
+                merged = True
+                break
+            if item.get("source") != chunk.get("source"):
+                continue
+            size = _overlap(item["text"], text, min_overlap)
+            if size:
+                item["text"] = item["text"] + text[size:]
+                merged = True
+                break
+            size = _overlap(text, item["text"], min_overlap)
+            if size:
+                item["text"] = text + item["text"][size:]
+                merged = True
+                break
+        if not merged:
+            kept.append({"text": text, "source": chunk.get("source") or "未知文件"})
+    return kept
+
+
+def _kb_chunks(retrieve_result: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """从 retrieve 工具返回值中取出片段列表与错误信息"""
+    if not isinstance(retrieve_result, dict):
+        return [], None
+    if retrieve_result.get("status") == "error":
+        return [], str(retrieve_result.get("reason") or "检索失败")
+    result = retrieve_result.get("result", retrieve_result)
+    if not isinstance(result, dict):
+        return [], None
+    return list(result.get("chunks") or []), result.get("error")
+
+
+def _sensor_results(sensor_result: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """从 read_query_for_sensor_readings 返回值中取出各查询结果与错误信息"""
+    if not isinstance(sensor_result, dict):
+        return [], None
+    if sensor_result.get("status") == "error":
+        return [], str(sensor_result.get("reason") or "查询失败")
+    result = sensor_result.get("result", sensor_result)
+    if not isinstance(result, dict):
+        return [], None
+    return [item for item in result.get("results") or [] if isinstance(item, dict)], result.get("error")
+
+
+# 压缩后的工具结果中保留的原文长度（非 JSON 结果）与示例行数
+OBSERVATION_SUMMARY_CHARS = int(os.getenv("OBSERVATION_SUMMARY_CHARS", "200"))
+OBSERVATION_SUMMARY_ROWS = 2
+
+
+def summarize_observation(name: Optional[str], content: str,
+                          max_chars: int = OBSERVATION_SUMMARY_CHARS) -> str:
+    """
+    把一条工具结果压缩为简短摘要（用于对话记忆中较早的工具结果）：
+    检索结果保留片段数与来源，查询结果保留行数、列名与前几行，其他结果截断原文。
+    """
+    label = f"[已压缩的工具结果] {name or 'tool'}"
+    try:
+        data = json.loads(content)
+    except (ValueError, TypeError):
+        data = None
+    chunks, kb_error = _kb_chunks(data)
+    results, sensor_error = _sensor_results(data)
+    if chunks:
+        sources = list(dict.fromkeys(str(c.get("source") or "未知文件") for c in chunks if isinstance(c, dict)))
+        return f"{label}: 检索到 {len(chunks)} 个片段，来源: {', '.join(sources)}"
+    if results:
+        parts = []
+        for item in results:
+            rows = item.get("rows") or []
+            if item.get("error"):
+                parts.append(f"查询出错: {item['error']}")
+            elif not rows:
+                parts.append("查询无数据")
+            else:
+                header, lines = render_rows(rows[:OBSERVATION_SUMMARY_ROWS])
+                *constant, columns = header.split("\n")
+                returned = f"查询返回 {len(rows)} 行"
+                if item.get("truncated"):
+                    total = item.get("total_rows_estimate")
+                    estimate = f"共约 {total} 行，" if total is not None else ""
+                    returned += f"（已截断，{estimate}续页令牌 {item.get('continuation')}）"
+                parts.append("；".join([returned, *constant, f"列: {columns}",
+                                       "示例: " + " / ".join(lines)]))
+        return f"{label}: " + "\n".join(parts)
+    error = kb_error or sensor_error
+    if error:
+        return f"{label}: 出错: {error}"
+    text = " ".join((content or "").split())
+    if len(text) <= max_chars:
+        return f"{label}: {text}"
+    return f"{label}: {text[:max_chars]}…（原文 {len(text)} 字符）"
+
+
+@dataclass
+class Section:
+    """可按预算截断的段落：header 必须保留，items 按顺序（重要性递减）尽量放入"""
+    name: str
+    header: str
+    items: List[str] = field(default_factory=list)
+    separator: str = "\n"
+    omitted_note: str = "（另有 {n} 条因长度限制未列出）"
+    included: int = 0
+
+    def render(self, count: Optional[int] = None) -> str:
+        count = len(self.items) if count is None else count
+        parts = [self.header] + self.items[:count] if self.header else self.items[:count]
+        text = self.separator.join(parts)
+        if count < len(self.items):
+            text += "\n" + self.omitted_note.format(n=len(self.items) - count)
+        return text
+
+
+def _fit(section: Section, budget: int, counter: Callable[[str], int]) -> Tuple[int, int]:
+    """预算内最多能放入的条目数（二分查找）及对应 token 数；header 总是保留"""
+    best, best_tokens = 0, counter(section.render(0))
+    low, high = 1, len(section.items)
+    while low <= high:
+        mid = (low + high) // 2
+        tokens = counter(section.render(mid))
+        if tokens <= budget:
+            best, best_tokens = mid, tokens
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best, best_tokens
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    priority: str
+    budget: int
+    tokenizer: str
+    kb_chunks: int = 0
+    kb_chunks_kept: int = 0
+    kb_chunks_included: int = 0
+    sensor_rows: int = 0
+    sensor_rows_included: int = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "priority": self.priority,
+            "tokenizer": self.tokenizer,
+            "kb_chunks": self.kb_chunks,
+            "kb_chunks_kept": self.kb_chunks_kept,
+            "kb_chunks_included": self.kb_chunks_included,
+            "sensor_rows": self.sensor_rows,
+            "sensor_rows_included": self.sensor_rows_included,
+        }
+
+
+def context_priority(question: str) -> str:
+    """明确查询数据（带时间、聚合、最新值等）的传感器问题优先传感器数据，其余优先知识库"""
+    intent = extract_intent(question)
+    return SENSOR if intent.types and intent.wants_data else KB
+
+
+class ContextPacker:
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, primary_share: float = CONTEXT_PRIMARY_SHARE,
+                 counter: Optional[TokenCounter] = None):
+        self.budget = budget
+        self.primary_share = primary_share
+        self.counter = counter or token_counter
+
+    def _kb_section(self, retrieve_result: Any) -> Tuple[Section, int, int]:
+        chunks, error = _kb_chunks(retrieve_result)
+        kept = dedupe_chunks(chunks)
+        items = [f"[{i}] 来源: {chunk['source']}\n{chunk['text']}" for i, chunk in enumerate(kept, 1)]
+        header = f"（检索出错: {error}）" if error else ("" if items else "（无相关片段）")
+        return Section(KB, header, items, separator="\n\n"), len(chunks), len(kept)
+
+    def _sensor_section(self, sensor_result: Any) -> Tuple[Section, int]:
+        results, error = _sensor_results(sensor_result)
+        if error or not results:
+            return Section(SENSOR, f"（查询出错: {error}）" if error else "（无查询结果）"), 0
+        headers, items = [], []
+        # 通常只有一条查询；多条查询时只有最后一条的数据行参与截断，其余整段保留
+        for index, item in enumerate(results):
+            lines = [f"SQL: {item.get('query', '')}"]
+            if item.get("error"):
+                lines.append(f"（执行出错: {item['error']}）")
+                headers.append("\n".join(lines))
+                continue
+            header, rows = render_rows(item.get("rows") or [])
+            lines.append(header)
+            if index < len(results) - 1:
+                headers.append("\n".join(lines + rows))
+            else:
+                headers.append("\n".join(lines))
+                items = rows
+        rows_total = sum(len(item.get("rows") or []) for item in results)
+        return Section(SENSOR, "\n\n".join(headers), items,
+                       omitted_note="（另有 {n} 行因长度限制未列出）"), rows_total
+
+    def pack(self, question: str, retrieve_result: Any, sensor_result: Any,
+             priority: Optional[str] = None) -> PackedContext:
+        priority = priority or context_priority(question)
+        kb, kb_total, kb_kept = self._kb_section(retrieve_result)
+        sensor, rows_total = self._sensor_section(sensor_result)
+        count = self.counter.count
+
+        template = self.render(question, "", "")
+        available = max(0, self.budget - count(template))
+        primary, secondary = (sensor, kb) if priority == SENSOR else (kb, sensor)
+        # 优先方先取份额；另一方用剩余预算；优先方再用另一方没用完的预算
+        first, first_tokens = _fit(primary, int(available * self.primary_share), count)
+        second, second_tokens = _fit(secondary, max(0, available - first_tokens), count)
+        first, _ = _fit(primary, max(0, available - second_tokens), count)
+        primary.included, secondary.included = first, second
+
+        text = self.render(question, kb.render(kb.included), sensor.render(sensor.included))
+        return PackedContext(
+            text=text, tokens=count(text), priority=priority, budget=self.budget, tokenizer=self.counter.name,
+            kb_chunks=kb_total, kb_chunks_kept=kb_kept, kb_chunks_included=kb.included,
+            sensor_rows=rows_total, sensor_rows_included=sensor.included,
+        )
+
+    @staticmethod
+    def render(question: str, kb_text: str, sensor_text: str) -> str:
+        return f"""请基于以下数据回答用户问题。
+
+【用户问题】
+{question}
+
+【知识库检索结果】
+{kb_text}
+
+【传感器数据查询】
+{sensor_text}
+
+请综合以上数据，给出简洁准确的回答。如果无关则忽略数据信息，直接回答用户问题。"""
+
+
+context_packer = ContextPacker()
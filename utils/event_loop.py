@@ -0,0 +1,117 @@
+"""
+常驻后台事件循环
+同步调用方（Flask 请求线程中的 agent）不再为每个请求 asyncio.run() 新建事件循环：
+协程统一提交到一个后台线程中长期运行的事件循环，AsyncOpenAI 连接池、数据库连接等绑定事件循环的资源可跨请求复用。
+
+    result = background_loop.run(coro, cancel_token)
+    for event in background_loop.iterate(async_gen, cancel_token):
+        ...
+
+令牌取消时，正在等待的协程在事件循环中被取消（CancelledError 传入协程，finally 中的清理照常执行）。
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+from utils.cancellation import CancellationToken, OperationCancelled
+
+logger = logging.getLogger("event_loop")
+
+_DONE = object()
+
+
+async def _await(awaitable: Awaitable[Any]) -> Any:
+    return await awaitable
+
+
+async def _anext(agen: AsyncIterator[Any]) -> Any:
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+
+class BackgroundEventLoop:
+    """在守护线程中运行的事件循环，首次使用时启动"""
+
+    def __init__(self, name: str = "background-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=_run, name=self.name, daemon=True)
+                thread.start()
+                started.wait()
+                self._loop, self._thread = loop, thread
+                logger.info(f"后台事件循环已启动: {self.name}")
+            return self._loop
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, awaitable: Awaitable[Any]) -> concurrent.futures.Future:
+        """提交到后台事件循环，返回线程安全的 Future"""
+        return asyncio.run_coroutine_threadsafe(_await(awaitable), self.loop)
+
+    def _wait(self, future: concurrent.futures.Future, cancel_token: Optional[CancellationToken],
+              timeout: Optional[float]) -> Any:
+        if self.in_loop_thread():
+            future.cancel()
+            raise RuntimeError("不能在后台事件循环线程中同步等待协程")
+        if cancel_token is not None:
+            cancel_token.add_callback(future.cancel)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.CancelledError:
+            raise OperationCancelled(cancel_token.reason if cancel_token else None)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(future.cancel)
+
+    def run(self, awaitable: Awaitable[Any], cancel_token: Optional[CancellationToken] = None,
+            timeout: Optional[float] = None) -> Any:
+        """在后台事件循环中执行并同步等待结果；令牌取消时抛出 OperationCancelled"""
+        return self._wait(self.submit(awaitable), cancel_token, timeout)
+
+    def iterate(self, agen: AsyncIterator[Any], cancel_token: Optional[CancellationToken] = None) -> Iterator[Any]:
+        """
+        以同步生成器的方式逐项驱动异步生成器。
+        令牌取消时取消当前等待并结束迭代；调用方提前关闭时在事件循环中关闭异步生成器。
+        """
+        try:
+            while True:
+                try:
+                    item = self._wait(asyncio.run_coroutine_threadsafe(_anext(agen), self.loop), cancel_token, None)
+                except OperationCancelled:
+                    return
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                try:
+                    self.submit(aclose()).result(timeout=5)
+                except Exception as e:
+                    logger.debug(f"关闭异步生成器失败: {e}")
+
+
+background_loop = BackgroundEventLoop("agent-loop")
@@ -8,6 +8,7 @@ import asyncio
 from typing import Optional
 from ToolOrchestrator.core.registry import ToolRegistry
 from ToolOrchestrator.core.config import settings
+from utils.client_pool import get_mcp_client
 
 logger = logging.getLogger("GlobalToolManager")
 
@@ -46,8 +47,9 @@ class GlobalToolManager:
         try:
             logger.info("开始初始化全局MCP工具注册器...")
             
-            # 创建ToolRegistry实例
-            self._registry = ToolRegistry(mcp_client_config=settings.MCP_CLIENT_CONFIG)
+            # 创建ToolRegistry实例，与 SingleAgent 共用进程内的 MCP 客户端
+            self._registry = ToolRegistry(mcp_client_config=settings.MCP_CLIENT_CONFIG,
+                                          mcp_client=await get_mcp_client())
             
             # 初始化连接和加载工具配置
             await self._registry.initialize_connections()
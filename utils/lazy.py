@@ -0,0 +1,59 @@
+"""
+延迟导入
+重量级依赖（torch、langchain、qdrant_client、openai、unstructured 等）在首次使用时才导入，
+命令行工具、网关 list_tools、单元测试等轻量入口导入模块时不再付出这部分开销。
+
+    torch = lazy_import("torch")
+    QdrantVectorStore = lazy_import("langchain_qdrant", "QdrantVectorStore")
+
+代理在首次访问属性或被调用时完成导入，之后直接转发；依赖缺失时在首次使用处抛出 ImportError。
+代理不是真正的类，不能用于 isinstance() 或 except 子句，此类用法请在函数内直接导入。
+"""
+import importlib
+import threading
+from typing import Any, Optional
+
+_MISSING = object()
+
+
+class LazyImport:
+    """模块或模块属性的延迟导入代理"""
+
+    __slots__ = ("_module_name", "_attr", "_target", "_lock")
+
+    def __init__(self, module_name: str, attr: Optional[str] = None):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = _MISSING
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not _MISSING
+
+    def resolve(self) -> Any:
+        """完成导入并返回真实对象"""
+        target = self._target
+        if target is _MISSING:
+            with self._lock:
+                if self._target is _MISSING:
+                    module = importlib.import_module(self._module_name)
+                    self._target = getattr(module, self._attr) if self._attr else module
+                target = self._target
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        name = f"{self._module_name}.{self._attr}" if self._attr else self._module_name
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy {name} ({state})>"
+
+
+def lazy_import(module_name: str, attr: Optional[str] = None) -> Any:
+    """返回模块（或模块中的属性）的延迟导入代理"""
+    return LazyImport(module_name, attr)
@@ -3,7 +3,7 @@
 简洁日志配置 - 显示模块名
 
 使用方法:
-    from utils.logger import setup_logging, get_logger
+    from utils.logger import setup_logging, get_logger, payload
 
     # 在main.py或项目启动时调用一次
     setup_logging()
@@ -11,26 +11,184 @@
     # 在任何模块中使用
     logger = get_logger(__name__)
     logger.info("这条日志会显示模块名")
+
+    # 大对象（检索结果、查询结果、文档列表）使用 payload 包装并以 %s 惰性格式化：
+    # 格式化在后台写日志线程中进行，且按日志器截断/采样，不会拖慢请求
+    logger.info("检索到相关片段: %s", payload(results))
+
+异步日志:
+    默认启用（LOG_ASYNC=true）。业务线程只把日志记录放入有界队列，
+    格式化与写控制台/文件由后台 QueueListener 线程完成；队列满时丢弃并计数，绝不阻塞请求。
+
+环境变量:
+    LOG_ASYNC                 是否启用异步日志，默认 true
+    LOG_QUEUE_SIZE            异步日志队列容量，默认 10000
+    LOG_PAYLOAD_MAX_CHARS     payload 默认最大输出字符数，默认 2000
+    LOG_PAYLOAD_SAMPLING      按日志器采样 payload 日志，格式 "name=N,name2=M"，表示每 N 条保留 1 条
 """
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import reprlib
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Any, Dict, Optional
 
+DEFAULT_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+DEFAULT_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
 
-def setup_logging(console_level="INFO", file_level="DEBUG"):
-    """设置全局日志配置"""
 
-    # 创建logs目录（如果不存在）
-    Path("logs").mkdir(exist_ok=True)
+def _parse_sampling(value: str) -> Dict[str, int]:
+    """解析 "name=N,name2=M" 形式的采样配置"""
+    sampling: Dict[str, int] = {}
+    for item in (value or "").split(","):
+        name, sep, every = item.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            sampling[name.strip()] = max(1, int(every))
+        except ValueError:
+            continue
+    return sampling
 
-    # 配置根日志器
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
 
-    # 清除现有处理器
-    root_logger.handlers.clear()
+# 按日志器名配置的 payload 策略: {logger_name: {"max_chars": int, "sample_every": int}}
+_payload_policies: Dict[str, Dict[str, int]] = {
+    name: {"sample_every": every}
+    for name, every in _parse_sampling(os.getenv("LOG_PAYLOAD_SAMPLING", "")).items()
+}
+_policy_lock = threading.Lock()
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["AsyncQueueHandler"] = None
+_payload_filter: Optional["PayloadFilter"] = None
+
+
+class Payload:
+    """
+    大对象日志包装
+    只在真正输出时（后台写日志线程中）才生成文本，并限制长度与容器展开数量。
+    """
+    __slots__ = ("obj", "max_chars")
+
+    _repr = reprlib.Repr()
+    _repr.maxlist = 20
+    _repr.maxdict = 20
+    _repr.maxtuple = 20
+    _repr.maxset = 20
+    _repr.maxlevel = 4
+    _repr.maxstring = 500
+    _repr.maxother = 500
+
+    def __init__(self, obj: Any, max_chars: Optional[int] = None):
+        self.obj = obj
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        max_chars = self.max_chars or DEFAULT_PAYLOAD_MAX_CHARS
+        obj = self.obj
+        text = obj if isinstance(obj, str) else self._repr.repr(obj)
+        if len(text) > max_chars:
+            size = f", 共 {len(obj)} 项" if hasattr(obj, "__len__") and not isinstance(obj, str) else ""
+            text = f"{text[:max_chars]}...<已截断, 原长度 {len(text)} 字符{size}>"
+        return text
+
+    __repr__ = __str__
+
+
+def payload(obj: Any, max_chars: Optional[int] = None) -> Payload:
+    """包装需要输出到日志的大对象"""
+    return Payload(obj, max_chars)
+
+
+def configure_payload_logging(name: str, max_chars: Optional[int] = None,
+                              sample_every: Optional[int] = None) -> None:
+    """
+    配置某个日志器的 payload 策略
+    max_chars: 该日志器 payload 最大输出字符数
+    sample_every: 每 N 条包含 payload 的日志只保留 1 条
+    """
+    with _policy_lock:
+        policy = _payload_policies.setdefault(name, {})
+        if max_chars is not None:
+            policy["max_chars"] = max_chars
+        if sample_every is not None:
+            policy["sample_every"] = max(1, sample_every)
+
+
+class PayloadFilter(logging.Filter):
+    """对包含 payload 参数的日志记录按日志器采样，并应用日志器的截断长度"""
+
+    def __init__(self):
+        super().__init__()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # 同步模式下同一条记录会经过多个处理器，只做一次采样决定
+        decided = getattr(record, "_payload_keep", None)
+        if decided is not None:
+            return decided
+        keep = self._decide(record)
+        record._payload_keep = keep
+        return keep
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        args = record.args
+        if not args or not isinstance(args, tuple):
+            return True
+        payloads = [arg for arg in args if isinstance(arg, Payload)]
+        if not payloads:
+            return True
+        policy = _payload_policies.get(record.name)
+        if not policy:
+            return True
+        every = policy.get("sample_every", 1)
+        if every > 1:
+            with self._lock:
+                count = self._counters.get(record.name, 0)
+                self._counters[record.name] = count + 1
+                if count % every:
+                    self.sampled_out += 1
+                    return False
+        max_chars = policy.get("max_chars")
+        if max_chars:
+            for item in payloads:
+                if item.max_chars is None:
+                    item.max_chars = max_chars
+        return True
+
 
+class AsyncQueueHandler(QueueHandler):
+    """
+    非阻塞队列处理器
+    - 不在业务线程中格式化消息（标准 QueueHandler 会先 format），只处理异常堆栈
+    - 队列满时丢弃日志并计数
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # 异常堆栈引用栈帧，必须在当前线程转换为文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _build_handlers(console_level: str, file_level: str):
     # 控制台处理器 - 显示模块名
     console = logging.StreamHandler()
     console.setLevel(getattr(logging, console_level.upper()))
@@ -38,7 +196,6 @@ def setup_logging(console_level="INFO", file_level="DEBUG"):
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%H:%M:%S'
     ))
-    root_logger.addHandler(console)
 
     # 文件处理器 - 包含详细信息
     file_handler = RotatingFileHandler(
@@ -51,7 +208,42 @@ def setup_logging(console_level="INFO", file_level="DEBUG"):
     file_handler.setFormatter(logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
     ))
-    root_logger.addHandler(file_handler)
+    return [console, file_handler]
+
+
+def setup_logging(console_level="INFO", file_level="DEBUG", async_mode: Optional[bool] = None,
+                  queue_size: Optional[int] = None):
+    """设置全局日志配置"""
+    global _listener, _queue_handler, _payload_filter
+
+    if async_mode is None:
+        async_mode = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+
+    # 创建logs目录（如果不存在）
+    Path("logs").mkdir(exist_ok=True)
+
+    # 配置根日志器
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+
+    # 清除现有处理器（重复调用时先停止旧的后台线程）
+    shutdown_logging()
+    root_logger.handlers.clear()
+
+    handlers = _build_handlers(console_level, file_level)
+    payload_filter = _payload_filter = PayloadFilter()
+
+    if async_mode:
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size or DEFAULT_QUEUE_SIZE)
+        _queue_handler = AsyncQueueHandler(log_queue)
+        _queue_handler.addFilter(payload_filter)
+        root_logger.addHandler(_queue_handler)
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            handler.addFilter(payload_filter)
+            root_logger.addHandler(handler)
 
     # 降低第三方库日志级别
     for lib in ['openai', 'httpx', 'urllib3', 'uvicorn']:
@@ -60,6 +252,35 @@ def setup_logging(console_level="INFO", file_level="DEBUG"):
     logging.info("日志系统初始化完成")
 
 
+def shutdown_logging():
+    """停止后台写日志线程，并写出队列中剩余的日志"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    """异步日志运行状态：队列积压与丢弃数量"""
+    sampled_out = _payload_filter.sampled_out if _payload_filter is not None else 0
+    if _queue_handler is None:
+        return {"async": False, "sampled_out": sampled_out}
+    return {
+        "async": True,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": sampled_out,
+    }
+
+
+atexit.register(shutdown_logging)
+
+
 def get_logger(name):
     """获取指定模块的日志器"""
-    return logging.getLogger(name)
\ No newline at end of file
+    return logging.getLogger(name)
@@ -0,0 +1,218 @@
+"""
+数据库结构目录
+DataAgent 原先需要依次调用 list_sql_tables → get_tables_schema → read_sql_query，真正的数据返回前要经过
+三轮串行的“大模型 + 工具”往返。这里在服务启动时（及之后按 SCHEMA_CATALOG_REFRESH_SECONDS 定时）读取一次
+information_schema，保存各表的字段、类型与行数估计，并按 token 预算渲染成紧凑的结构摘要放入系统提示，
+模型第一轮即可直接编写 SQL。
+
+    await schema_catalog.refresh()
+    schema_catalog.digest()    # "sensor_readings（约 120万 行）: id bigint PK, sensor_id int, ..."
+
+- 摘要按 SCHEMA_CATALOG_PRIORITY_TABLES 优先，其余表按行数从多到少；放不下的表只列出表名
+- 结构发生变化时使 list_sql_tables / get_tables_schema 的工具结果缓存失效
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.context_packer import token_counter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA_CATALOG_ENABLED = os.getenv("SCHEMA_CATALOG_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEMA_CATALOG_REFRESH_SECONDS = float(os.getenv("SCHEMA_CATALOG_REFRESH_SECONDS", "3600"))
+SCHEMA_DIGEST_TOKEN_BUDGET = int(os.getenv("SCHEMA_DIGEST_TOKEN_BUDGET", "800"))
+SCHEMA_CATALOG_PRIORITY_TABLES = [t.strip() for t in os.getenv(
+    "SCHEMA_CATALOG_PRIORITY_TABLES", "sensor_readings,sensor_types").split(",") if t.strip()]
+# 未加载成功时，两次按需加载之间的最短间隔（秒），避免数据库不可用时每个请求都去连接
+SCHEMA_CATALOG_RETRY_SECONDS = float(os.getenv("SCHEMA_CATALOG_RETRY_SECONDS", "60"))
+
+# 结构变化后需要失效的工具结果缓存
+SCHEMA_TOOLS = ("list_sql_tables", "get_tables_schema")
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    type: str
+    key: str = ""
+
+    def render(self) -> str:
+        text = f"{self.name} {self.type.lower()}"
+        return text + " PK" if self.key == "PRI" else text
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: List[ColumnInfo] = field(default_factory=list)
+    # information_schema 中的行数估计（InnoDB 为近似值）
+    rows: Optional[int] = None
+
+    def render(self) -> str:
+        rows = f"（约 {_format_rows(self.rows)} 行）" if self.rows is not None else ""
+        return f"{self.name}{rows}: " + ", ".join(c.render() for c in self.columns)
+
+
+def _format_rows(rows: int) -> str:
+    if rows >= 100_000_000:
+        return f"{rows / 100_000_000:.1f}亿"
+    if rows >= 10_000:
+        return f"{rows / 10_000:.0f}万"
+    return str(rows)
+
+
+def parse_tables(description: Dict[str, Any]) -> List[TableInfo]:
+    """解析 db_tools.describe_database() 的返回值"""
+    if not isinstance(description, dict) or description.get("error"):
+        raise RuntimeError((description or {}).get("error") or "数据库结构为空")
+    tables = []
+    for item in description.get("tables") or []:
+        columns = [ColumnInfo(str(c["name"]), str(c.get("type") or ""), str(c.get("key") or ""))
+                   for c in item.get("columns") or []]
+        rows = item.get("rows")
+        tables.append(TableInfo(str(item["name"]), columns, int(rows) if rows is not None else None))
+    return tables
+
+
+async def _describe_database() -> Dict[str, Any]:
+    # 延迟导入：只有加载结构目录时才需要数据库工具
+    from ToolOrchestrator.tools.db_tools import describe_database
+    return await describe_database()
+
+
+class SchemaCatalog:
+    """进程内共享的数据库结构目录"""
+
+    def __init__(self, loader: Callable[[], Awaitable[Dict[str, Any]]] = _describe_database,
+                 refresh_seconds: float = SCHEMA_CATALOG_REFRESH_SECONDS,
+                 token_budget: int = SCHEMA_DIGEST_TOKEN_BUDGET,
+                 priority_tables: Optional[List[str]] = None,
+                 enabled: bool = SCHEMA_CATALOG_ENABLED,
+                 clock: Callable[[], float] = time.time):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.token_budget = token_budget
+        self.priority_tables = SCHEMA_CATALOG_PRIORITY_TABLES if priority_tables is None else priority_tables
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tables: Optional[List[TableInfo]] = None
+        self._fingerprint: Optional[str] = None
+        self._digests: Dict[int, str] = {}
+        self.refreshed_at: Optional[float] = None
+        self._last_attempt: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.refreshes = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._tables is not None
+
+    @property
+    def tables(self) -> List[TableInfo]:
+        return list(self._tables or [])
+
+    async def refresh(self) -> bool:
+        """重新读取数据库结构；失败时保留上一次的结果，返回是否成功"""
+        if not self.enabled:
+            return False
+        self._last_attempt = self._clock()
+        try:
+            tables = parse_tables(await self._loader())
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"加载数据库结构失败: {e}")
+            return False
+        fingerprint = hashlib.sha256(json.dumps([t.render() for t in tables], ensure_ascii=False,
+                                                sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            changed = self._fingerprint is not None and fingerprint != self._fingerprint
+            self._tables = tables
+            self._fingerprint = fingerprint
+            self._digests.clear()
+            self.refreshed_at = self._clock()
+            self.last_error = None
+            self.refreshes += 1
+        if changed:
+            from ToolOrchestrator.core.result_cache import tool_result_cache
+            tool_result_cache.invalidate(SCHEMA_TOOLS)
+            logger.info("数据库结构已变化，已失效表结构工具的结果缓存")
+        logger.info(f"数据库结构目录已更新: {len(tables)} 张表")
+        return True
+
+    async def ensure_loaded(self) -> bool:
+        """尚未加载时按需加载一次（例如未经服务启动流程直接运行 agent）；失败后 SCHEMA_CATALOG_RETRY_SECONDS 内不再重试"""
+        if self.loaded or not self.enabled:
+            return self.loaded
+        if self._last_attempt is not None and self._clock() - self._last_attempt < SCHEMA_CATALOG_RETRY_SECONDS:
+            return False
+        return await self.refresh()
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self.refresh()
+
+    def start_scheduled_refresh(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """在后台事件循环上每隔 refresh_seconds 刷新一次"""
+        if not self.enabled or self.refresh_seconds <= 0 or self._refresh_task is not None:
+            return
+        if loop is None:
+            from utils.event_loop import background_loop
+            loop = background_loop.loop
+        def _start():
+            self._refresh_task = loop.create_task(self._refresh_forever())
+        loop.call_soon_threadsafe(_start)
+
+    def digest(self, token_budget: Optional[int] = None) -> str:
+        """按 token 预算渲染结构摘要；尚未加载时返回空字符串"""
+        budget = self.token_budget if token_budget is None else token_budget
+        with self._lock:
+            tables = self._tables
+            cached = self._digests.get(budget)
+        if not tables:
+            return ""
+        if cached is not None:
+            return cached
+        priority = {name: i for i, name in enumerate(self.priority_tables)}
+        ordered = sorted(tables, key=lambda t: (priority.get(t.name, len(priority)), -(t.rows or 0), t.name))
+        lines, omitted, used = [], [], 0
+        for table in ordered:
+            line = table.render()
+            # 含换行符
+            tokens = token_counter.count(line) + 1
+            if used + tokens <= budget:
+                lines.append(line)
+                used += tokens
+            else:
+                omitted.append(table.name)
+        if omitted:
+            tail = "其余表（结构可用 get_tables_schema 查看）: " + ", ".join(omitted)
+            if used + token_counter.count(tail) + 1 <= budget:
+                lines.append(tail)
+        text = "\n".join(lines)
+        with self._lock:
+            if self._tables is tables:
+                self._digests[budget] = text
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "loaded": self.loaded,
+            "tables": len(self._tables or []),
+            "refreshed_at": self.refreshed_at,
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
+
+
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,348 @@
+"""
+传感器 SQL 模板快速路径
+大部分传感器问题只有几种形态：某类传感器的最新值、一段时间内的最高/最低/平均、某天的读数、一段时间内的变化趋势。
+本模块在本地抽取意图槽位（传感器类型、时间范围、聚合方式、阈值），填充参数化 SQL 模板，
+置信度足够时直接使用，省去一次大模型 SQL 生成调用；置信度低时由调用方回退到大模型。
+
+    plan = plan_sensor_sql("过去48小时溶解氧最低是多少")
+    if plan.confidence >= SENSOR_SQL_MIN_CONFIDENCE:
+        sql = plan.sql
+
+模板中的类型名、日期与数值均来自固定词表或经过解析校验，不会把用户原文拼入 SQL。
+SQL 为 MySQL 方言（与 read_query_for_sensor_readings 的数据库一致），返回行数不超过 100。
+"""
+import os
+import re
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+SENSOR_SQL_TEMPLATES_ENABLED = os.getenv("SENSOR_SQL_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+# 低于该置信度时回退到大模型生成 SQL
+SENSOR_SQL_MIN_CONFIDENCE = float(os.getenv("SENSOR_SQL_MIN_CONFIDENCE", "0.7"))
+
+TABLE = "sensor_readings"
+MAX_ROWS = 100
+RECENT_ROWS = 10
+COLUMNS = "sensor_id, type_name, description, value, unit, recorded_at"
+# 与大模型提示词中“与传感器无关”时的约定查询一致
+DEFAULT_SQL = f"SELECT * FROM {TABLE} ORDER BY recorded_at DESC LIMIT {RECENT_ROWS}"
+
+# type_name -> 同义词（中文描述、常见简称）；英文简称单独按词边界匹配
+SENSOR_VOCABULARY: Dict[str, Tuple[str, ...]] = {
+    "dissolved_oxygen_aturation": ("溶解氧", "溶氧", "含氧量", "氧饱和"),
+    "liquid_level": ("液位", "水位"),
+    "PH": ("酸碱度", "ph值"),
+    "temperature": ("温度", "水温"),
+    "turbidity": ("浊度", "浑浊"),
+}
+_ENGLISH_ALIASES: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("dissolved_oxygen_aturation", re.compile(r"(?<![A-Za-z])DO(?![A-Za-z])")),
+    ("PH", re.compile(r"(?<![A-Za-z])ph(?![A-Za-z])", re.IGNORECASE)),
+    ("turbidity", re.compile(r"(?<![A-Za-z])NTU(?![A-Za-z])", re.IGNORECASE)),
+)
+# 传感器表中没有的水质指标：只问这些指标时查询不到数据
+UNSUPPORTED_METRICS = ("氨氮", "亚硝酸盐", "硝酸盐", "盐度", "碱度", "总氮", "电导率", "摄食量", "气温")
+
+LATEST_WORDS = ("当前", "现在", "目前", "最新", "实时", "此刻", "刚才")
+DATA_WORDS = ("数据", "读数", "数值", "记录", "监测值", "传感器", "曲线")
+AGGREGATE_WORDS = {
+    "max": ("最高", "最大", "峰值"),
+    "min": ("最低", "最小", "谷值"),
+    "avg": ("平均", "均值"),
+}
+# 只决定模板形态，不单独表示要查数据（“正常范围”“水质变化”多为知识问题）
+STATS_WORDS = ("波动", "范围", "统计", "极差")
+TREND_WORDS = ("趋势", "走势", "变化", "上升", "下降", "升高", "降低")
+HOURLY_WORDS = ("每小时", "按小时", "逐小时")
+DAILY_WORDS = ("每天", "每日", "按天", "逐日")
+KNOWLEDGE_WORDS = ("什么", "为什么", "怎么", "如何", "方法", "原理", "原因", "应该", "是否需要",
+                   "合适", "适宜", "标准", "影响", "建议", "措施", "操作")
+# 模板无法表达的问法（对比、相关性、排名等），交给大模型
+COMPLEX_WORDS = ("对比", "比较", "相关", "同比", "环比", "差值", "排名", "排序", "哪个传感器", "哪个池")
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUMBER = r"(\d+|[零一二两三四五六七八九十]+)"
+_UNITS = {
+    "分钟": ("MINUTE", 1 / 60), "小时": ("HOUR", 1), "钟头": ("HOUR", 1),
+    "天": ("DAY", 24), "日": ("DAY", 24), "周": ("WEEK", 168), "星期": ("WEEK", 168),
+    "礼拜": ("WEEK", 168), "月": ("MONTH", 720),
+}
+_UNIT_PATTERN = "(分钟|小时|钟头|天|日|周|星期|礼拜|月)"
+_RELATIVE_RE = re.compile(r"(?:过去|最近|近|前)\s*" + _NUMBER + r"\s*个?\s*" + _UNIT_PATTERN)
+_WITHIN_RE = re.compile(_NUMBER + r"\s*个?\s*" + _UNIT_PATTERN + r"\s*(?:内|以内|之内)")
+_FULL_DATE_RE = re.compile(r"(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*[日号]?")
+_MONTH_DAY_RE = re.compile(r"(?<!\d)(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]")
+_THRESHOLD_RE = re.compile(r"(低于|小于|不足|少于|高于|大于|超过|多于|<=|>=|<|>)\s*(\d+(?:\.\d+)?)")
+_THRESHOLD_OPS = {"低于": "<", "小于": "<", "不足": "<", "少于": "<", "<": "<", "<=": "<=",
+                  "高于": ">", "大于": ">", "超过": ">", "多于": ">", ">": ">", ">=": ">="}
+# “波动超过4°C”“温差大于2”描述的是变化幅度，不是读数阈值
+_SPREAD_CONTEXT = ("波动", "变化", "幅", "差")
+
+
+def _parse_number(text: str) -> Optional[int]:
+    """阿拉伯数字或不超过 99 的中文数字"""
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        if len(ones) > 1 or (tens and tens not in _CN_DIGITS) or (ones and ones not in _CN_DIGITS):
+            return None
+        return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+    if len(text) == 1 and text in _CN_DIGITS:
+        return _CN_DIGITS[text]
+    return None
+
+
+def normalize_question(question: str) -> str:
+    """全角/兼容字符（如康熙部首“⽔”）统一为常规字符"""
+    return unicodedata.normalize("NFKC", question or "").strip()
+
+
+@dataclass
+class TimeRange:
+    """时间范围：start/end 为 SQL 表达式（左闭右开），span_hours 用于选择趋势的分桶粒度"""
+    label: str
+    start: str
+    end: Optional[str] = None
+    span_hours: float = 24.0
+
+    def where(self) -> str:
+        clause = f"recorded_at >= {self.start}"
+        if self.end:
+            clause += f" AND recorded_at < {self.end}"
+        return clause
+
+
+@dataclass
+class SensorIntent:
+    """从问题中抽取的槽位"""
+    types: List[str] = field(default_factory=list)
+    unsupported: List[str] = field(default_factory=list)
+    time_range: Optional[TimeRange] = None
+    aggregations: List[str] = field(default_factory=list)
+    latest: bool = False
+    data_words: bool = False
+    trend: bool = False
+    stats: bool = False
+    bucket: Optional[str] = None
+    threshold: Optional[Tuple[str, float]] = None
+    knowledge: bool = False
+    complex: bool = False
+
+    @property
+    def wants_data(self) -> bool:
+        """问题明确要求查询数据（而不仅是提到某个指标）"""
+        return bool(self.time_range or self.aggregations or self.latest or self.data_words or self.threshold)
+
+
+@dataclass
+class SqlPlan:
+    sql: str
+    template: str
+    confidence: float
+    intent: SensorIntent
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"sql": self.sql, "template": self.template, "confidence": self.confidence,
+                "intent": asdict(self.intent)}
+
+
+def _find_types(text: str) -> List[str]:
+    lowered = text.lower()
+    found = []
+    for type_name, synonyms in SENSOR_VOCABULARY.items():
+        if any(word in lowered for word in synonyms):
+            found.append(type_name)
+    for type_name, pattern in _ENGLISH_ALIASES:
+        if type_name not in found and pattern.search(text):
+            found.append(type_name)
+    return found
+
+
+def _shift_day(days: int) -> str:
+    return "CURDATE()" if days == 0 else f"CURDATE() - INTERVAL {days} DAY"
+
+
+def _date_range(day: date, label: str) -> TimeRange:
+    return TimeRange(label, f"'{day.isoformat()}'", f"'{(day + timedelta(days=1)).isoformat()}'", 24.0)
+
+
+def extract_time_range(text: str, today: Optional[date] = None) -> Optional[TimeRange]:
+    """相对时间（今天/昨天/过去N小时/N天内/本周/本月）与具体日期"""
+    today = today or date.today()
+    for pattern in (_RELATIVE_RE, _WITHIN_RE):
+        match = pattern.search(text)
+        if match:
+            amount = _parse_number(match.group(1))
+            if amount:
+                unit, hours = _UNITS[match.group(2)]
+                return TimeRange(match.group(0), f"NOW() - INTERVAL {amount} {unit}", None, amount * hours)
+    match = _FULL_DATE_RE.search(text)
+    if match:
+        try:
+            day = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            day = None
+        if day is not None:
+            return _date_range(day, match.group(0))
+    match = _MONTH_DAY_RE.search(text)
+    if match:
+        try:
+            day = date(today.year, int(match.group(1)), int(match.group(2)))
+        except ValueError:
+            day = None
+        if day is not None:
+            if day > today and not (day.month == 2 and day.day == 29):
+                # 未写年份且日期在今天之后，按去年处理
+                day = day.replace(year=day.year - 1)
+            return _date_range(day, match.group(0))
+    for words, days in ((("前天",), 2), (("昨天", "昨日", "昨晚"), 1), (("今天", "今日", "今晚"), 0)):
+        for word in words:
+            if word in text:
+                end = _shift_day(days - 1) if days else None
+                return TimeRange(word, _shift_day(days), end, 24.0)
+    if any(word in text for word in ("本周", "这周", "这个星期", "本星期")):
+        return TimeRange("本周", "CURDATE() - INTERVAL WEEKDAY(CURDATE()) DAY", None, 168.0)
+    if any(word in text for word in ("本月", "这个月")):
+        return TimeRange("本月", "DATE_FORMAT(CURDATE(), '%Y-%m-01')", None, 720.0)
+    return None
+
+
+def _extract_threshold(text: str) -> Optional[Tuple[str, float]]:
+    for match in _THRESHOLD_RE.finditer(text):
+        context = text[max(0, match.start() - 4):match.start()]
+        if any(word in context for word in _SPREAD_CONTEXT):
+            continue
+        return _THRESHOLD_OPS[match.group(1)], float(match.group(2))
+    return None
+
+
+def extract_intent(question: str, today: Optional[date] = None) -> SensorIntent:
+    text = normalize_question(question)
+    time_range = extract_time_range(text, today)
+    # “最近”后面没有数量时表示最新值
+    latest = any(word in text for word in LATEST_WORDS) or ("最近" in text and (
+        time_range is None or not time_range.label.startswith("最近")))
+    bucket = "hour" if any(w in text for w in HOURLY_WORDS) else "day" if any(w in text for w in DAILY_WORDS) else None
+    return SensorIntent(
+        types=_find_types(text),
+        unsupported=[word for word in UNSUPPORTED_METRICS if word in text and not (
+            # “亚硝酸盐”中也包含“硝酸盐”
+            word == "硝酸盐" and text.count("硝酸盐") == text.count("亚硝酸盐"))],
+        time_range=time_range,
+        aggregations=[agg for agg, words in AGGREGATE_WORDS.items() if any(w in text for w in words)],
+        latest=latest,
+        data_words=any(word in text for word in DATA_WORDS),
+        trend=any(word in text for word in TREND_WORDS) or bucket is not None,
+        stats=any(word in text for word in STATS_WORDS),
+        bucket=bucket,
+        threshold=_extract_threshold(text),
+        knowledge=any(word in text for word in KNOWLEDGE_WORDS),
+        complex=any(word in text for word in COMPLEX_WORDS),
+    )
+
+
+def _where(intent: SensorIntent, with_time: bool = True) -> str:
+    clauses = []
+    if intent.types:
+        clauses.append("type_name IN ({})".format(", ".join(f"'{t}'" for t in intent.types)))
+    if with_time and intent.time_range is not None:
+        clauses.append(intent.time_range.where())
+    if intent.threshold is not None:
+        op, value = intent.threshold
+        clauses.append(f"value {op} {value:g}")
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+def _latest_sql(intent: SensorIntent) -> str:
+    """每种类型最新一次记录（同一时刻多个传感器时全部返回）"""
+    return (
+        f"SELECT s.{COLUMNS.replace(', ', ', s.')} FROM {TABLE} s JOIN ("
+        f"SELECT type_name, MAX(recorded_at) AS recorded_at FROM {TABLE}{_where(intent)} GROUP BY type_name"
+        f") t ON s.type_name = t.type_name AND s.recorded_at = t.recorded_at "
+        f"ORDER BY s.type_name LIMIT {MAX_ROWS}"
+    )
+
+
+def _aggregate_sql(intent: SensorIntent) -> str:
+    aggregations = intent.aggregations or ["min", "max", "avg"]
+    columns = ", ".join(f"{agg.upper()}(value) AS {agg}_value" for agg in ("min", "max", "avg") if agg in aggregations)
+    return (
+        f"SELECT type_name, description, unit, {columns}, COUNT(*) AS readings "
+        f"FROM {TABLE}{_where(intent)} GROUP BY type_name, description, unit LIMIT {MAX_ROWS}"
+    )
+
+
+def _trend_sql(intent: SensorIntent) -> str:
+    span = intent.time_range.span_hours if intent.time_range else 24.0
+    bucket = intent.bucket or ("hour" if span <= 72 else "day")
+    period = "DATE_FORMAT(recorded_at, '%Y-%m-%d %H:00')" if bucket == "hour" else "DATE(recorded_at)"
+    return (
+        f"SELECT type_name, {period} AS period, AVG(value) AS avg_value, MIN(value) AS min_value, "
+        f"MAX(value) AS max_value, COUNT(*) AS readings FROM {TABLE}{_where(intent)} "
+        f"GROUP BY type_name, period ORDER BY period DESC LIMIT {MAX_ROWS}"
+    )
+
+
+def _readings_sql(intent: SensorIntent, limit: int) -> str:
+    return f"SELECT {COLUMNS} FROM {TABLE}{_where(intent)} ORDER BY recorded_at DESC LIMIT {limit}"
+
+
+def plan_sensor_sql(question: str, today: Optional[date] = None) -> SqlPlan:
+    """
+    抽取槽位并选择模板，返回 SQL 与置信度。
+    置信度：槽位齐全的数据问题 0.9；聚合缺时间范围时按最近 24 小时 0.75；只提到指标没有查询意图 0.7；
+    与传感器无关 0.85；有聚合/阈值/时间条件但识别不出传感器类型、多类型阈值或对比类问法 ≤0.5（应回退到大模型）。
+    """
+    intent = extract_intent(question, today)
+
+    if not intent.types:
+        if not intent.wants_data or intent.unsupported:
+            # 与传感器无关，或只涉及表中没有的指标（氨氮、盐度等），与大模型的约定查询一致
+            return SqlPlan(DEFAULT_SQL, "default", 0.85 if not intent.wants_data else 0.8, intent)
+        if intent.complex or intent.aggregations or intent.threshold:
+            return SqlPlan(_readings_sql(intent, MAX_ROWS), "readings", 0.4, intent)
+        if intent.latest:
+            return SqlPlan(_latest_sql(intent), "latest", 0.75, intent)
+        if intent.time_range is None:
+            # 只提到“数据/传感器”，约定查询即为全部类型的最近记录
+            return SqlPlan(DEFAULT_SQL, "default", 0.7, intent)
+        return SqlPlan(_readings_sql(intent, MAX_ROWS), "readings", 0.5, intent)
+
+    if intent.complex:
+        return SqlPlan(_readings_sql(intent, MAX_ROWS), "readings", 0.4, intent)
+    if intent.threshold is not None and len(intent.types) > 1:
+        # 一个阈值对应多个指标时无法确定作用于哪个
+        return SqlPlan(_readings_sql(intent, MAX_ROWS), "readings", 0.5, intent)
+
+    if not intent.wants_data:
+        if intent.knowledge:
+            return SqlPlan(DEFAULT_SQL, "default", 0.8, intent)
+        return SqlPlan(_readings_sql(intent, RECENT_ROWS), "recent", 0.7, intent)
+
+    confidence = 0.9
+    if intent.bucket:
+        template, sql = "trend", None
+    elif intent.aggregations or (intent.stats and intent.time_range):
+        template, sql = "aggregate", None
+        if intent.time_range is None:
+            confidence = 0.75
+    elif intent.latest and intent.threshold is None:
+        template, sql = "latest", _latest_sql(intent)
+    elif intent.trend and intent.time_range:
+        template, sql = "trend", None
+    elif intent.time_range is not None or intent.threshold is not None:
+        template, sql = "readings", _readings_sql(intent, MAX_ROWS)
+    else:
+        template, sql = "recent", _readings_sql(intent, RECENT_ROWS)
+        confidence = 0.75
+
+    if template in ("aggregate", "trend") and intent.time_range is None:
+        intent.time_range = TimeRange("默认最近24小时", "NOW() - INTERVAL 24 HOUR", None, 24.0)
+    if template == "aggregate":
+        sql = _aggregate_sql(intent)
+    elif template == "trend":
+        sql = _trend_sql(intent)
+    return SqlPlan(sql, template, confidence, intent)